@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+# -*- coding: utf-8 -*-
+"""
+Cloud IP Lookup - Benchmark of the database build: time and peak RSS of update_ip_ranges()
+
+Usage: python3 benchmarks/bench_build.py [--source database|synthetic] [--networks 200000] [--repeat 3] [--package-dir DIR]
+
+The feeds are written once and served by the local feed server (no internet): with --source database (the default)
+they have the networks of the cloudiplookup.dat.gz of the package, the real provider mix, in the format of each
+provider (see write_database_feeds() in feed_server.py); with --source synthetic they have --networks random networks.
+Each build runs update_ip_ranges(use_cache=False) in a new process and the median of --repeat runs is printed:
+
+    seconds     time of update_ip_ranges(): download from localhost, parse, sort, encode and save the files
+    peak        peak RSS of the process (ru_maxrss) and its increase over the RSS after the import, in MiB
+
+Use --package-dir to measure another checkout of the package (ex: a previous release) with the same feeds.
+"""
+import os, sys, json, tempfile, subprocess
+from statistics import median
+from argparse import ArgumentParser
+sys.path.insert(0,os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import cloudiplookup.cloudiplookup as cloudiplookup
+from feed_server import FeedServer, write_database_feeds, write_synthetic_feeds, write_info_file
+
+CODE = """import sys, json, resource
+sys.path.insert(0,sys.argv[1])
+from time import perf_counter
+import cloudiplookup.cloudiplookup as c
+c.DATA_DIR = sys.argv[2]
+startRSS = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+startTime = perf_counter()
+if c.update_ip_ranges(use_cache=False) != 0:
+    raise Exception("update_ip_ranges() failed")
+seconds = perf_counter()-startTime
+peakRSS = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+scale = 1 if sys.platform == 'darwin' else 1024
+print(json.dumps([seconds,peakRSS*scale/1048576,(peakRSS-startRSS)*scale/1048576]))
+"""
+
+def measure(package_dir,data_dir,repeat):
+    """Runs *repeat* builds, each one in a new process, returns the median of (seconds, peak RSS, increase of RSS)"""
+    runs = [json.loads(subprocess.check_output([sys.executable,"-c",CODE,package_dir,data_dir]))
+            for _ in range(repeat)]
+    return [median(run[pos] for run in runs) for pos in range(3)]
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Benchmark of the database build of Cloud IP Lookup")
+    parser.add_argument("--source",dest="source",choices=['database','synthetic'],default='database',help="Networks of the feeds: the database of the package or random networks.")
+    parser.add_argument("--networks",dest="networks",type=int,default=200000,help="Number of networks of the synthetic feeds.")
+    parser.add_argument("--seed",dest="seed",type=int,default=42,help="Seed of the synthetic feeds.")
+    parser.add_argument("--repeat",dest="repeat",type=int,default=3,help="Number of builds, each one in a new process.")
+    parser.add_argument("--package-dir",dest="package_dir",default=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        help="Directory with the cloudiplookup package to measure.")
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tempDir:
+        feedsDir, dataDir = os.path.join(tempDir,'feeds'), os.path.join(tempDir,'data')
+        if args.source == 'database':
+            cloudiplookup.DATA_DIR = os.path.dirname(os.path.abspath(cloudiplookup.__file__))
+            database = cloudiplookup.CloudIPLookup()._db
+            write_database_feeds(feedsDir,database)
+            name = f"database of the package, {len(database):,d} networks"
+        else:
+            write_synthetic_feeds(feedsDir,networks=args.networks,seed=args.seed)
+            name = f"synthetic feeds, {args.networks:,d} networks"
+        with FeedServer(feedsDir) as server:
+            write_info_file(dataDir,server.base_url)
+            seconds, peakRSS, buildRSS = measure(args.package_dir,dataDir,args.repeat)
+        print(f"{name}: update_ip_ranges() {seconds:7.3f} sec - peak RSS {peakRSS:7.1f} MiB (+{buildRSS:.1f} MiB over the import)",flush=True)
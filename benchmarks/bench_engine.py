@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+# -*- coding: utf-8 -*-
+"""
+Cloud IP Lookup - Benchmark of the search engines: binary search ('bisect') and multibit tries ('trie')
+
+Usage: python3 benchmarks/bench_engine.py [--count 1000000] [--data-dir /var/lib/cloudiplookup/]
+
+For each engine and strides: the load time, the memory of the tries and the lookups/sec of find_ipv4(), find_ipv6()
+and lookup_code() with the IP addresses of bench_lookup_many.py. Use the real database (the default data directory
+or cloudiplookup/cloudiplookup.dat.gz of the repository), the synthetic feeds spread the networks over all the space
+and make the tries much bigger than with the real providers.
+"""
+import os, sys
+from time import perf_counter
+from argparse import ArgumentParser
+sys.path.insert(0,os.path.dirname(os.path.abspath(__file__)))
+from bench_lookup_many import cloudiplookup, random_ips, run
+
+ENGINES = [("bisect",{'engine':'bisect'}),
+           ("trie (20,6,6), the default",{'engine':'trie'}),
+           ("trie (16,8,8)",{'engine':'trie','trie_strides':(16,8,8)}),
+           ("trie (16,8) + slices",{'engine':'trie','trie_strides':(16,8)}),
+           ("trie DIR-24-8 (24,8)",{'engine':'trie','trie_strides':(24,8)}),
+           ("trie (20,6,6) + IPv6 (16,8)",{'engine':'trie','trie_ipv6_strides':(16,8)})]
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Benchmark of the search engines of CloudIPLookup")
+    parser.add_argument("--count",dest="count",type=int,default=1000000,help="Number of IP addresses to lookup.")
+    parser.add_argument("--data-dir",dest="data_dir",default=cloudiplookup.DATA_DIR,help="Directory of the cloudiplookup.dat.gz file.")
+    args = parser.parse_args()
+    cloudiplookup.DATA_DIR = args.data_dir
+    ips = random_ips(cloudiplookup.CloudIPLookup(verbose=True),args.count)
+    ipv4 = [cloudiplookup.parse_ip(ipaddr) for ipaddr in ips if ':' not in ipaddr]
+    ipv6 = [cloudiplookup.parse_ip(ipaddr) for ipaddr in ips if ':' in ipaddr]
+    expected = None
+    for name,options in ENGINES:
+        startTime = perf_counter()
+        iplookup = cloudiplookup.CloudIPLookup(**options)
+        loadTime = perf_counter()-startTime
+        trieMemory = sum(size for column,size in iplookup._db.memory_usage().items() if column.startswith("trie."))
+        print(f"{name}: loaded in {loadTime:.3f} sec, tries using {trieMemory/1048576:.2f} MiB",flush=True)
+        find_ipv4, find_ipv6 = iplookup._db.find_ipv4, iplookup._db.find_ipv6
+        run(f"   find_ipv4() x {len(ipv4):,d}",lambda: [find_ipv4(iplong) for iplong in ipv4],len(ipv4))
+        run(f"   find_ipv6() x {len(ipv6):,d}",lambda: [find_ipv6(hi,lo) for hi,lo in ipv6],len(ipv6))
+        run(f"   lookup_code() x {len(ips):,d}",lambda: [iplookup.lookup_code(ipaddr) for ipaddr in ips],len(ips))
+        ##──── All engines must return the same rows ─────────────────────────────────────────────────────────────────────────────────
+        rows = [iplookup.lookup_code(ipaddr) for ipaddr in ips]
+        if expected is None:
+            expected = rows
+        elif rows != expected:
+            raise Exception(f"{name} returned different rows than bisect")
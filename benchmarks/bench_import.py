@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+# -*- coding: utf-8 -*-
+"""
+Cloud IP Lookup - Benchmark of the process startup: import time, CloudIPLookup() and first lookup
+
+Usage: python3 benchmarks/bench_import.py [--repeat 10] [--data-dir /var/lib/cloudiplookup/]
+
+Each measure runs in a new process, the median of --repeat runs is printed (in milliseconds):
+
+    import      import cloudiplookup, and the number of modules it added to sys.modules
+    init        CloudIPLookup(), eager or lazy=True, with the dat.gz file or use_mmap=True
+    first       the first lookup(), that loads the database in lazy mode
+    total       import + init + first, what a short-lived job pays before its first answer
+
+The 'import only' rows exit without a lookup, like a job that had nothing to search: the lazy mode never loads the
+database. The 'import the updater' row shows the cost that "import cloudiplookup" does not pay anymore.
+"""
+import os, sys, json, subprocess
+from statistics import median
+from argparse import ArgumentParser
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import cloudiplookup.cloudiplookup as cloudiplookup
+
+CODE = """import sys
+from time import perf_counter
+startModules, startTime = len(sys.modules), perf_counter()
+import cloudiplookup.cloudiplookup as c
+importTime, modules = perf_counter()-startTime, len(sys.modules)-startModules
+c.DATA_DIR = sys.argv[1]
+init = first = 0.0
+if sys.argv[2] == 'updater':
+    startTime = perf_counter()
+    import cloudiplookup.updater
+    init = perf_counter()-startTime
+elif sys.argv[2] != 'none':
+    startTime = perf_counter()
+    iplookup = c.CloudIPLookup(use_mmap=('mmap' in sys.argv[2]),lazy=('lazy' in sys.argv[2]))
+    init = perf_counter()-startTime
+    if sys.argv[3] == 'lookup':
+        startTime = perf_counter()
+        iplookup.lookup('52.94.1.1')
+        first = perf_counter()-startTime
+import json
+print(json.dumps([importTime,modules,init,first]))
+"""
+
+SCENARIOS = [("import only",'none','exit'),
+             ("import the updater",'updater','exit'),
+             ("eager, import only",'gz','exit'),
+             ("lazy, import only",'gz-lazy','exit'),
+             ("eager + first lookup",'gz','lookup'),
+             ("lazy + first lookup",'gz-lazy','lookup'),
+             ("eager mmap + first lookup",'mmap','lookup'),
+             ("lazy mmap + first lookup",'mmap-lazy','lookup')]
+
+def measure(data_dir,mode,action,repeat):
+    """Runs the scenario in *repeat* new processes, returns the median of each measure"""
+    runs = [json.loads(subprocess.check_output([sys.executable,"-c",CODE,data_dir,mode,action],cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+            for _ in range(repeat)]
+    return [median(run[pos] for run in runs) for pos in range(4)]
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Benchmark of the startup of Cloud IP Lookup")
+    parser.add_argument("--repeat",dest="repeat",type=int,default=10,help="Number of processes started for each scenario.")
+    parser.add_argument("--data-dir",dest="data_dir",default=cloudiplookup.DATA_DIR,help="Directory of the cloudiplookup.dat.gz and cloudiplookup.dat.bin files.")
+    args = parser.parse_args()
+    hasBinary = os.path.isfile(os.path.join(args.data_dir,cloudiplookup.BINARY_FILE_NAME))
+    for name,mode,action in SCENARIOS:
+        if 'mmap' in mode and not hasBinary:
+            print(f"{name.ljust(32,'.')}: skipped, there is no {cloudiplookup.BINARY_FILE_NAME} in {args.data_dir}",flush=True)
+            continue
+        importTime, modules, init, first = measure(args.data_dir,mode,action,args.repeat)
+        print(f"{name.ljust(32,'.')}: import {importTime*1000:7.2f} ms ({modules:3.0f} modules) - init {init*1000:7.2f} ms - "
+              f"first {first*1000:7.2f} ms - total {(importTime+init+first)*1000:7.2f} ms",flush=True)
@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+# -*- coding: utf-8 -*-
+"""
+Cloud IP Lookup - Benchmark of the fast path CloudIPLookup.lookup_code() / is_cloud() against CloudIPLookup.lookup()
+
+Usage: python3 benchmarks/bench_lookup_code.py [--count 1000000] [--data-dir /var/lib/cloudiplookup/]
+
+Uses the same list of IP addresses of bench_lookup_many.py.
+"""
+import os, sys
+from argparse import ArgumentParser
+sys.path.insert(0,os.path.dirname(os.path.abspath(__file__)))
+from bench_lookup_many import cloudiplookup, random_ips, run
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Benchmark of CloudIPLookup.lookup_code()")
+    parser.add_argument("--count",dest="count",type=int,default=1000000,help="Number of IP addresses to lookup.")
+    parser.add_argument("--data-dir",dest="data_dir",default=cloudiplookup.DATA_DIR,help="Directory of the cloudiplookup.dat.gz file.")
+    args = parser.parse_args()
+    cloudiplookup.DATA_DIR = args.data_dir
+    iplookup = cloudiplookup.CloudIPLookup(verbose=True)
+    ips = random_ips(iplookup,args.count)
+    run("lookup() loop",lambda: [iplookup.lookup(ipaddr) for ipaddr in ips],args.count)
+    run("lookup() loop + cidr + elapsed_time",lambda: [(result.cidr,result.elapsed_time) for result in map(iplookup.lookup,ips)],args.count)
+    run("lookup_code() loop",lambda: [iplookup.lookup_code(ipaddr) for ipaddr in ips],args.count)
+    run("lookup_provider_code() loop",lambda: [iplookup.lookup_provider_code(ipaddr) for ipaddr in ips],args.count)
+    run("is_cloud() loop",lambda: [iplookup.is_cloud(ipaddr) for ipaddr in ips],args.count)
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+# -*- coding: utf-8 -*-
+"""
+Cloud IP Lookup - Benchmark of CloudIPLookup.lookup_many() against a loop of CloudIPLookup.lookup()
+
+Usage: python3 benchmarks/bench_lookup_many.py [--count 1000000] [--data-dir /var/lib/cloudiplookup/]
+
+The list of IP addresses has 50% of random IPv4 addresses (mostly misses), 40% of IPv4 addresses that belong
+to the networks of the database and 10% of IPv6 addresses.
+"""
+import os, sys, random
+from time import perf_counter
+from argparse import ArgumentParser
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import cloudiplookup.cloudiplookup as cloudiplookup
+
+def random_ips(iplookup,count,seed=42):
+    random.seed(seed)
+    db = iplookup._db
+    totalIPv6 = len(db) - db.totalIPv4
+    ips = []
+    for _ in range(count):
+        dice = random.random()
+        if dice < 0.5:
+            ips.append(cloudiplookup.int_to_ipv4(random.getrandbits(32)))
+        elif dice < 0.9:
+            row = random.randrange(db.totalIPv4)
+            ips.append(cloudiplookup.int_to_ipv4(random.randint(db.ipv4FirstIP[row],db.ipv4LastIP[row])))
+        else:
+            pos = random.randrange(totalIPv6)
+            ips.append(cloudiplookup.hilo_to_ipv6(db.ipv6FirstHi[pos],random.randint(db.ipv6FirstLo[pos],db.ipv6LastLo[pos] if db.ipv6LastHi[pos] == db.ipv6FirstHi[pos] else 0xFFFFFFFFFFFFFFFF)))
+    return ips
+
+def run(name,function,count):
+    startTime = perf_counter()
+    function()
+    elapsed = perf_counter()-startTime
+    print(f"{name.ljust(40,'.')}: {elapsed:9.3f} sec - {int(count/elapsed):>10,d} lookups/sec",flush=True)
+    return elapsed
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Benchmark of CloudIPLookup.lookup_many()")
+    parser.add_argument("--count",dest="count",type=int,default=1000000,help="Number of IP addresses to lookup.")
+    parser.add_argument("--data-dir",dest="data_dir",default=cloudiplookup.DATA_DIR,help="Directory of the cloudiplookup.dat.gz file.")
+    args = parser.parse_args()
+    cloudiplookup.DATA_DIR = args.data_dir
+    iplookup = cloudiplookup.CloudIPLookup(verbose=True)
+    ips = random_ips(iplookup,args.count)
+    scalar = run("lookup() loop",lambda: [iplookup.lookup(ipaddr) for ipaddr in ips],args.count)
+    run("lookup_many() pure python",lambda: iplookup.lookup_many(ips,use_numpy=False),args.count)
+    if cloudiplookup._import_numpy() is not None:
+        run("lookup_many() numpy",lambda: iplookup.lookup_many(ips,use_numpy=True),args.count)
+    else:
+        print("numpy is not installed, skipping lookup_many() numpy")
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+# -*- coding: utf-8 -*-
+"""
+Cloud IP Lookup - Load test of the HTTP service (cloudiplookup serve) on localhost
+
+Usage: python3 benchmarks/bench_serve.py [--connections 32] [--requests 20000] [--batch-size 1000] [--url http://127.0.0.1:8090]
+                                         [--data-dir /var/lib/cloudiplookup/]
+
+Without --url, a server is started in another process on a free port and stopped at the end. Each connection is
+kept alive and sends its requests one after the other: first GET /lookup/<ipaddr>, then POST /lookup with batches
+of --batch-size IP addresses. The requests/sec and the latency percentiles seen by the clients are printed, followed
+by the counters of GET /stats.
+"""
+import os, sys, json, time, socket, asyncio, subprocess
+from time import perf_counter
+from argparse import ArgumentParser
+from urllib.parse import urlsplit
+sys.path.insert(0,os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import cloudiplookup.cloudiplookup as cloudiplookup
+from bench_lookup_many import random_ips
+
+async def request(reader,writer,method,path,body=b""):
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(body)}\r\n\r\n".encode('latin-1')+body)
+    head = await reader.readuntil(b"\r\n\r\n")
+    length = int(head.lower().split(b"content-length:",1)[1].split(b"\r\n",1)[0])
+    return int(head.split(b" ",2)[1]), await reader.readexactly(length)
+
+async def client(host,port,jobs,latencies):
+    reader, writer = await asyncio.open_connection(host,port)
+    while jobs:
+        method, path, body = jobs.pop()
+        startTime = perf_counter()
+        status, _ = await request(reader,writer,method,path,body)
+        latencies.append(perf_counter()-startTime)
+        if status != 200:
+            raise Exception(f"{method} {path} returned HTTP {status}")
+    writer.close()
+
+async def run(name,host,port,jobs,connections,ips_per_request):
+    latencies, total = [], len(jobs)
+    startTime = perf_counter()
+    await asyncio.gather(*[client(host,port,jobs,latencies) for _ in range(connections)])
+    elapsed = perf_counter()-startTime
+    latencies.sort()
+    percentile = lambda p: latencies[min(len(latencies)-1,int(len(latencies)*p))]*1000
+    print(f"{name.ljust(40,'.')}: {elapsed:9.3f} sec - {int(total/elapsed):>8,d} requests/sec - {int(total*ips_per_request/elapsed):>10,d} IPs/sec - "
+          f"latency p50 {percentile(0.50):.2f} ms, p95 {percentile(0.95):.2f} ms, p99 {percentile(0.99):.2f} ms",flush=True)
+
+def wait_server(host,port,timeout=30):
+    deadline = time.time()+timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection((host,port),timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise Exception(f"The server did not start at {host}:{port}")
+
+async def main(args,host,port,ips):
+    singleJobs = [('GET',f"/lookup/{ips[pos % len(ips)]}",b"") for pos in range(args.requests)]
+    await run(f"GET /lookup/<ipaddr> x {args.connections} conn",host,port,singleJobs,args.connections,1)
+    batches = max(1,args.requests // max(1,args.batch_size) * 10)
+    batchJobs = [('POST',"/lookup",json.dumps(ips[pos*args.batch_size % len(ips):][:args.batch_size]).encode()) for pos in range(batches)]
+    await run(f"POST /lookup ({args.batch_size} IPs) x {args.connections} conn",host,port,batchJobs,args.connections,args.batch_size)
+    reader, writer = await asyncio.open_connection(host,port)
+    _, body = await request(reader,writer,'GET',"/stats")
+    writer.close()
+    stats = json.loads(body)
+    for endpoint,counter in stats['endpoints'].items():
+        if counter['requests'] > 0:
+            print(f"server {endpoint.ljust(33,'.')}: {counter['requests']:>8,d} requests, {counter['errors']} errors, {counter['ips']:,d} IPs, "
+                  f"latency avg {counter['latency_avg']*1000:.3f} ms, max {counter['latency_max']*1000:.3f} ms")
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Load test of cloudiplookup serve")
+    parser.add_argument("--connections",dest="connections",type=int,default=32,help="Concurrent keep-alive connections.")
+    parser.add_argument("--requests",dest="requests",type=int,default=20000,help="Number of GET /lookup/<ipaddr> requests.")
+    parser.add_argument("--batch-size",dest="batch_size",type=int,default=1000,help="IP addresses in each POST /lookup request.")
+    parser.add_argument("--url",dest="url",default=None,help="Url of a running server. Default: starts a server on a free port.")
+    parser.add_argument("--data-dir",dest="data_dir",default=cloudiplookup.DATA_DIR,help="Directory of the cloudiplookup.dat.gz file.")
+    args = parser.parse_args()
+    cloudiplookup.DATA_DIR = args.data_dir
+    ips = random_ips(cloudiplookup.CloudIPLookup(),max(args.requests,args.batch_size*10))
+    server = None
+    if args.url is None:
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1',0))
+            host, port = sock.getsockname()
+        code = f"import sys, cloudiplookup.cloudiplookup as c; c.DATA_DIR = {args.data_dir!r}; sys.argv[1:] = ['serve','--port','{port}']; c.main_function()"
+        server = subprocess.Popen([sys.executable,"-c",code],cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    else:
+        host, port = urlsplit(args.url).hostname, urlsplit(args.url).port or 80
+    try:
+        wait_server(host,port)
+        asyncio.run(main(args,host,port,ips))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+# -*- coding: utf-8 -*-
+"""
+Cloud IP Lookup - Reproducible benchmark suite, no internet needed
+
+Usage: python3 benchmarks/bench_suite.py [--networks 50000] [--ipv6-ratio 0.3] [--lookups 200000] [--seed 42] [--output results.json]
+
+Writes synthetic feeds of all providers in their real formats (see write_synthetic_feeds() in feed_server.py), serves
+them with the local feed server and builds the database with update_ip_ranges(), through the real update_ip_ranges_*
+parsers. Then measures:
+
+    build       time of update_ip_ranges(), number of networks, size of cloudiplookup.dat.gz and cloudiplookup.dat.bin
+    load        time and RSS to load the database (dat.gz and mmap), each one in a new process, median of --repeat runs
+    lookups     lookups/sec of lookup() and lookup_code(), and the p50/p99 latency of lookup(), for the mixes:
+                hit (IPv4 inside the networks), miss (random IPv4) and ipv6 (90% IPv6 inside the networks)
+    prefilter   the counters of the negative prefilter after a lookup() of each IP address of the mixes, counted by a
+                CloudIPLookup(stats=True) apart from the timed lookups (see CloudIPLookup.prefilter_info())
+
+The results are printed (or saved with --output) in json, to compare releases with the same parameters and seed.
+"""
+import os, sys, json, random, platform, tempfile, subprocess
+from time import perf_counter
+from datetime import datetime
+from statistics import median
+from argparse import ArgumentParser
+sys.path.insert(0,os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import cloudiplookup.cloudiplookup as cloudiplookup
+from feed_server import FeedServer, write_synthetic_feeds, write_info_file
+
+def random_ip_in_row(rng,db,row):
+    if row < db.totalIPv4:
+        return cloudiplookup.int_to_ipv4(rng.randint(db.ipv4FirstIP[row],db.ipv4LastIP[row]))
+    pos = row - db.totalIPv4
+    lastLo = db.ipv6LastLo[pos] if db.ipv6LastHi[pos] == db.ipv6FirstHi[pos] else 0xFFFFFFFFFFFFFFFF
+    return cloudiplookup.hilo_to_ipv6(db.ipv6FirstHi[pos],rng.randint(db.ipv6FirstLo[pos],lastLo))
+
+def lookup_mix(db,mix,count,seed):
+    """Returns *count* IP addresses of the *mix* hit, miss or ipv6"""
+    rng = random.Random(seed)
+    totalIPv6 = len(db) - db.totalIPv4
+    ips = []
+    for _ in range(count):
+        if mix == 'hit' or (mix == 'ipv6' and (rng.random() >= 0.9 or totalIPv6 == 0)):
+            ips.append(random_ip_in_row(rng,db,rng.randrange(db.totalIPv4)))
+        elif mix == 'miss':
+            ips.append(cloudiplookup.int_to_ipv4(rng.getrandbits(32)))
+        else:
+            ips.append(random_ip_in_row(rng,db,db.totalIPv4+rng.randrange(totalIPv6)))
+    return ips
+
+def measure_lookups(iplookup,ips):
+    lookup, lookup_code = iplookup.lookup, iplookup.lookup_code
+    startTime = perf_counter()
+    for ipaddr in ips:
+        lookup(ipaddr)
+    lookupSeconds = perf_counter()-startTime
+    startTime = perf_counter()
+    for ipaddr in ips:
+        lookup_code(ipaddr)
+    lookupCodeSeconds = perf_counter()-startTime
+    latencies = []
+    for ipaddr in ips:
+        startTime = perf_counter()
+        lookup(ipaddr)
+        latencies.append(perf_counter()-startTime)
+    latencies.sort()
+    return {'count':len(ips),
+            'found_ratio':round(sum(1 for ipaddr in ips if lookup_code(ipaddr) >= 0)/len(ips),4),
+            'lookup_per_sec':int(len(ips)/lookupSeconds),
+            'lookup_code_per_sec':int(len(ips)/lookupCodeSeconds),
+            'lookup_p50_us':round(latencies[len(latencies)//2]*1e6,3),
+            'lookup_p99_us':round(latencies[min(len(latencies)-1,int(len(latencies)*0.99))]*1e6,3)}
+
+def measure_load(data_dir,mode,repeat):
+    """Loads the database in a new process *repeat* times, returns the median of the load time and RSS"""
+    code = ("import sys, json; from time import perf_counter; import cloudiplookup.cloudiplookup as c; c.DATA_DIR = sys.argv[1]; "
+            "startMem = c.get_mem_usage(); startTime = perf_counter(); iplookup = c.CloudIPLookup(use_mmap=(sys.argv[2] == 'mmap')); "
+            "print(json.dumps({'seconds':perf_counter()-startTime,'rss_mib':c.get_mem_usage()-startMem,'process_rss_mib':c.get_mem_usage()}))")
+    runs = [json.loads(subprocess.check_output([sys.executable,"-c",code,data_dir,mode],cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+            for _ in range(repeat)]
+    return {key:round(median(run[key] for run in runs),6) for key in runs[0]}
+
+def run_suite(args)->dict:
+    results = {'version':cloudiplookup.__version__,'python':platform.python_version(),'platform':platform.platform(),
+               'date':datetime.now().isoformat(timespec='seconds'),
+               'parameters':{'networks':args.networks,'ipv6_ratio':args.ipv6_ratio,'lookups':args.lookups,'seed':args.seed,'repeat':args.repeat}}
+    with tempfile.TemporaryDirectory() as tempDir:
+        feedsDir, dataDir = os.path.join(tempDir,'feeds'), os.path.join(tempDir,'data')
+        write_synthetic_feeds(feedsDir,networks=args.networks,ipv6_ratio=args.ipv6_ratio,seed=args.seed)
+        cloudiplookup.DATA_DIR = dataDir
+        with FeedServer(feedsDir) as server:
+            write_info_file(dataDir,server.base_url)
+            startTime = perf_counter()
+            if cloudiplookup.update_ip_ranges(use_cache=False) != 0:
+                raise Exception("update_ip_ranges() failed")
+            buildSeconds = perf_counter()-startTime
+        iplookup = cloudiplookup.CloudIPLookup()
+        results['build'] = {'seconds':round(buildSeconds,6),'networks':len(iplookup._db),
+                            'gz_bytes':os.path.getsize(os.path.join(dataDir,cloudiplookup.OUTPUT_FILE_NAME)),
+                            'bin_bytes':os.path.getsize(os.path.join(dataDir,cloudiplookup.BINARY_FILE_NAME))}
+        results['load'] = {mode:measure_load(dataDir,mode,args.repeat) for mode in ('gz','mmap')}
+        mixes = {mix:lookup_mix(iplookup._db,mix,args.lookups,args.seed) for mix in ('hit','miss','ipv6')}
+        results['lookups'] = {mix:measure_lookups(iplookup,ips) for mix,ips in mixes.items()}
+        statsLookup = cloudiplookup.CloudIPLookup(stats=True)
+        for ips in mixes.values():
+            for ipaddr in ips:
+                statsLookup.lookup(ipaddr)
+        results['prefilter'] = statsLookup.prefilter_info()
+    return results
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Reproducible benchmark suite of Cloud IP Lookup")
+    parser.add_argument("--networks",dest="networks",type=int,default=50000,help="Number of networks of the synthetic feeds (all providers).")
+    parser.add_argument("--ipv6-ratio",dest="ipv6_ratio",type=float,default=0.3,help="Share of IPv6 networks.")
+    parser.add_argument("--lookups",dest="lookups",type=int,default=200000,help="IP addresses searched in each mix.")
+    parser.add_argument("--repeat",dest="repeat",type=int,default=3,help="Number of processes started to measure the load time.")
+    parser.add_argument("--seed",dest="seed",type=int,default=42,help="Seed of the synthetic feeds and IP addresses.")
+    parser.add_argument("--output",dest="output",default=None,help="Saves the json results in this file.")
+    args = parser.parse_args()
+    results = json.dumps(run_suite(args),indent=3)
+    if args.output is not None:
+        with open(args.output,'w') as f:
+            f.write(results+"\n")
+    print(results,flush=True)
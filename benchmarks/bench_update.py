@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+# -*- coding: utf-8 -*-
+"""
+Cloud IP Lookup - Benchmark of update_ip_ranges() with sequential and concurrent downloads
+
+Usage: python3 benchmarks/bench_update.py [--latency 0.5] [--failures 0] [--concurrency 6]
+
+The provider feeds are served by a local HTTP stand-in (feed_server.py) that waits *latency* seconds before each
+response, so the wall time shows the round trips. Both runs must create the same cloudiplookup.dat.bin file.
+"""
+import os, sys, tempfile
+from time import perf_counter
+from argparse import ArgumentParser
+sys.path.insert(0,os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import cloudiplookup.cloudiplookup as cloudiplookup
+from feed_server import FeedServer, write_fixture_feeds, write_info_file
+
+def run_update(name,data_dir,**options):
+    cloudiplookup.DATA_DIR = data_dir
+    startTime = perf_counter()
+    result = cloudiplookup.update_ip_ranges(verbose=False,**options)
+    elapsed = perf_counter()-startTime
+    print(f"{name.ljust(40,'.')}: {elapsed:9.3f} sec - exit code {result}",flush=True)
+    with open(os.path.join(data_dir,cloudiplookup.BINARY_FILE_NAME),'rb') as f:
+        return f.read()
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Benchmark of update_ip_ranges()")
+    parser.add_argument("--latency",dest="latency",type=float,default=0.5,help="Seconds to wait before each response.")
+    parser.add_argument("--failures",dest="failures",type=int,default=0,help="Number of HTTP 503 responses before serving each file.")
+    parser.add_argument("--concurrency",dest="concurrency",type=int,default=cloudiplookup.DOWNLOAD_CONCURRENCY,help="Concurrent downloads.")
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tempDir:
+        feedsDir = os.path.join(tempDir,'feeds')
+        write_fixture_feeds(feedsDir)
+        results = []
+        for name,concurrency in ((f"sequential (concurrency=1)",1),(f"concurrent (concurrency={args.concurrency})",args.concurrency)):
+            dataDir = os.path.join(tempDir,f'data{concurrency}')
+            with FeedServer(feedsDir,latency=args.latency,failures=args.failures) as server:
+                write_info_file(dataDir,server.base_url)
+                results.append(run_update(name,dataDir,concurrency=concurrency,retries=args.failures,timeout=args.latency+5,use_cache=False))
+        print(f"Same database: {results[0] == results[1]}")
+        ##──── Conditional downloads: the second update receives only 304 and the database is not rewritten ──────────────────────
+        dataDir = os.path.join(tempDir,'data-cache')
+        databaseFile = os.path.join(dataDir,cloudiplookup.OUTPUT_FILE_NAME)
+        with FeedServer(feedsDir,latency=args.latency) as server:
+            write_info_file(dataDir,server.base_url)
+            for name in ("first update with the feed cache","second update, nothing changed","third update, one provider changed"):
+                if name.startswith("third"):
+                    with open(os.path.join(feedsDir,'cloud.json'),'a') as f:
+                        f.write("\n")
+                server.stats.update(requests=0,not_modified=0,bytes_sent=0)
+                lastChange = os.path.getmtime(databaseFile) if os.path.exists(databaseFile) else None
+                run_update(name,dataDir,concurrency=args.concurrency,timeout=args.latency+5)
+                print(f"{''.ljust(40)}  {server.stats['requests']} requests, {server.stats['not_modified']} not modified, "
+                      f"{server.stats['bytes_sent']:,d} bytes, database rewritten: {lastChange != os.path.getmtime(databaseFile)}")
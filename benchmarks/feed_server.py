@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+# -*- coding: utf-8 -*-
+"""
+Cloud IP Lookup - Local HTTP stand-in for the provider feeds, used to run update_ip_ranges() without internet
+
+Usage: python3 benchmarks/feed_server.py [--port 8080] [--latency 0.5] [--data-dir /tmp/cloudiplookup-feeds/]
+
+Writes small fixture files in the format of each provider, serves them with an artificial latency and writes a
+cloudiplookup.json file in the data directory pointing to this server. Then run:
+
+    python3 -c "import cloudiplookup.cloudiplookup as c; c.DATA_DIR='/tmp/cloudiplookup-feeds/'; c.update_ip_ranges(verbose=True)"
+
+It can also be used as a context manager (see bench_update.py):
+
+    with FeedServer(directory,latency=0.5) as server:
+        write_info_file(data_dir,server.base_url)
+"""
+import os, sys, json, time, gzip, random, socket, struct, threading, ipaddress
+from email.utils import formatdate
+from argparse import ArgumentParser
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+##──── Provider key in cloudiplookup.json, key of the url and the file name served. The file names of Google and Azure ─────────
+##──── matter: update_ip_ranges_google_services() finds the service in the url and Azure is located by "ServiceTags_Public" ────
+FEED_FILES = [('AWS','download_url','ip-ranges.json'),
+              ('AZURE','info_page','azure-download-page.html'),
+              ('CLOUDFLARE','download_url','cloudflare-ips.json'),
+              ('DIGITALOCEAN','download_url','digitalocean-google.csv'),
+              ('GOOGLESERVICES','download_url','goog.json'),
+              ('GOOGLEBOT','download_url','googlebot.json'),
+              ('GOOGLESSPECIALCRAWLERS','download_url','special-crawlers.json'),
+              ('GOOGLESUSERTRIGGERED','download_url','user-triggered-fetchers.json'),
+              ('GOOGLECLOUD','download_url','cloud.json'),
+              ('JDCLOUD','download_url','cloudflare-jdcloud.json'),
+              ('ORACLE','download_url','public_ip_ranges.json')]
+AZURE_FILE_NAME = 'ServiceTags_Public_20240722.json'
+
+def write_fixture_feeds(directory):
+    """Writes a few networks of each provider, in the format of each provider, including nested networks"""
+    os.makedirs(directory,exist_ok=True)
+    feeds = {
+        'ip-ranges.json':{"syncToken":"1","createDate":"2024-07-24-21-33-10","prefixes":[
+            {"ip_prefix":"3.2.35.64/26","region":"sa-east-1","service":"AMAZON","network_border_group":"sa-east-1"},
+            {"ip_prefix":"3.2.35.64/26","region":"sa-east-1","service":"EC2","network_border_group":"sa-east-1"},
+            {"ip_prefix":"52.94.0.0/16","region":"us-east-1","service":"AMAZON","network_border_group":"us-east-1"},
+            {"ip_prefix":"52.94.7.0/24","region":"sa-east-1","service":"DYNAMODB","network_border_group":"sa-east-1"}],
+            "ipv6_prefixes":[
+            {"ipv6_prefix":"2600:9000:2000::/36","region":"GLOBAL","service":"CLOUDFRONT","network_border_group":"GLOBAL"},
+            {"ipv6_prefix":"2600:9000::/28","region":"GLOBAL","service":"AMAZON","network_border_group":"GLOBAL"}]},
+        AZURE_FILE_NAME:{"changeNumber":1,"cloud":"Public","values":[
+            {"name":"ActionGroup","id":"ActionGroup","properties":{"changeNumber":1,"region":"westcentralus","regionId":1,"platform":"Azure",
+             "systemService":"ActionGroup","addressPrefixes":["13.71.199.112/30","2603:1030:f00::/48"],"networkFeatures":["API","NSG"]}},
+            {"name":"AzureCloud","id":"AzureCloud","properties":{"changeNumber":1,"region":"","regionId":0,"platform":"Azure",
+             "systemService":"","addressPrefixes":["13.64.0.0/11"]}}]},
+        'cloudflare-ips.json':{"result":{"ipv4_cidrs":["173.245.48.0/20","104.16.0.0/13"],"ipv6_cidrs":["2400:cb00::/32"],"etag":"x"},"success":True},
+        'goog.json':{"syncToken":"1","creationTime":"2024-07-24T13:06:03.000","prefixes":[{"ipv4Prefix":"8.8.8.0/24"},{"ipv4Prefix":"104.196.0.0/14"},{"ipv6Prefix":"2001:4860::/32"}]},
+        'googlebot.json':{"creationTime":"2024-07-23T22:00:20.000","prefixes":[{"ipv4Prefix":"66.249.66.192/27"}]},
+        'special-crawlers.json':{"creationTime":"2024-07-23T22:00:20.000","prefixes":[{"ipv4Prefix":"66.249.90.64/27"}]},
+        'user-triggered-fetchers.json':{"creationTime":"2024-07-23T22:00:20.000","prefixes":[{"ipv4Prefix":"66.249.84.0/27"}]},
+        'cloud.json':{"syncToken":"1","creationTime":"2024-07-24T13:06:03.000","prefixes":[
+            {"ipv4Prefix":"104.198.16.0/20","service":"Google Cloud","scope":"us-central1"},
+            {"ipv6Prefix":"2600:1900:4000::/44","service":"Google Cloud","scope":"us-central1"}]},
+        'cloudflare-jdcloud.json':{"result":{"jdcloud_cidrs":["36.111.0.0/16","2400:dd01::/32"]},"success":True},
+        'public_ip_ranges.json':{"last_updated_timestamp":"2024-07-15T09:52:55.000","regions":[{"region":"us-phoenix-1","cidrs":[
+            {"cidr":"129.146.0.0/21","tags":["OCI"]},{"cidr":"129.146.0.0/24","tags":["OSN","OBJECT_STORAGE"]}]}]},
+    }
+    for name,content in feeds.items():
+        with open(os.path.join(directory,name),'w') as f:
+            json.dump(content,f)
+    with open(os.path.join(directory,'digitalocean-google.csv'),'w') as f:
+        f.write("5.101.104.0/22,NL,NL-NH,Amsterdam,\n2a03:b0c0::/32,NL,NL-NH,Amsterdam,\n")
+    write_azure_page(directory,"")
+
+##──── Share of the networks of each provider file in write_synthetic_feeds(), close to the real feeds ─────────────────────────
+SYNTHETIC_SHARES = {'ip-ranges.json':0.20,AZURE_FILE_NAME:0.45,'cloud.json':0.05,'goog.json':0.02,'googlebot.json':0.002,
+                    'special-crawlers.json':0.001,'user-triggered-fetchers.json':0.001,'cloudflare-ips.json':0.001,
+                    'cloudflare-jdcloud.json':0.005,'public_ip_ranges.json':0.05,'digitalocean-google.csv':0.21}
+
+def random_networks(rng,count,ipv6_ratio):
+    """Returns (ipv4 cidrs, ipv6 cidrs) with *count* random networks. Some networks are nested, like in the real feeds"""
+    ipv4, ipv6 = [], []
+    for _ in range(count):
+        if rng.random() < ipv6_ratio:
+            netlength = rng.choice((32,36,40,44,48,48,48,56,64))
+            first = ((0x2 << 124) | rng.getrandbits(124)) >> (128-netlength) << (128-netlength)
+            ipv6.append(f"{ipaddress.IPv6Address(first).compressed}/{netlength}")
+        else:
+            netlength = rng.choice((14,16,18,20,21,22,23,24,24,24,25,26,27,28,30,31,32))
+            first = rng.getrandbits(32) >> (32-netlength) << (32-netlength)
+            ipv4.append(f"{socket.inet_ntoa(struct.pack('>L',first))}/{netlength}")
+    return ipv4, ipv6
+
+def write_synthetic_feeds(directory,networks=50000,ipv6_ratio=0.3,seed=42):
+    """Writes the files of all providers, in the format of each provider, with about *networks* random networks in
+    total and *ipv6_ratio* of them IPv6. The same *seed* writes the same files."""
+    os.makedirs(directory,exist_ok=True)
+    rng = random.Random(seed)
+    regions = ['us-east-1','us-west-2','eu-west-1','sa-east-1','ap-south-1','me-central-1','af-south-1','GLOBAL']
+    services = ['AMAZON','EC2','S3','CLOUDFRONT','DYNAMODB','ROUTE53','API_GATEWAY','GLOBALACCELERATOR']
+    def share(name):
+        return random_networks(rng,max(1,int(networks*SYNTHETIC_SHARES[name])),ipv6_ratio)
+    ipv4, ipv6 = share('ip-ranges.json')
+    ##──── The region of the AWS networks in the database is the network_border_group, usually the same as the region ────────────
+    aws = {"syncToken":"1","createDate":"2024-07-24-21-33-10",
+           "prefixes":[{"ip_prefix":cidr,"region":region,"service":rng.choice(services),"network_border_group":region} for cidr in ipv4 for region in [rng.choice(regions)]],
+           "ipv6_prefixes":[{"ipv6_prefix":cidr,"region":region,"service":rng.choice(services),"network_border_group":region} for cidr in ipv6 for region in [rng.choice(regions)]]}
+    ipv4, ipv6 = share(AZURE_FILE_NAME)
+    cidrs, values = ipv4+ipv6, []
+    rng.shuffle(cidrs)
+    for pos in range(0,len(cidrs),25):
+        name = f"AzureService{pos//25}.{rng.choice(regions)}"
+        values.append({"name":name,"id":name,"properties":{"changeNumber":1,"region":rng.choice(regions),"regionId":pos//25,"platform":"Azure",
+                       "systemService":f"AzureService{pos//250}","addressPrefixes":cidrs[pos:pos+25],"networkFeatures":rng.choice([["API","NSG"],["NSG"],["API","NSG","UDR","FW"]])}})
+    azure = {"changeNumber":1,"cloud":"Public","values":values}
+    ipv4, ipv6 = share('cloud.json')
+    gcp = {"syncToken":"1","creationTime":"2024-07-24T13:06:03.000",
+           "prefixes":[{"ipv4Prefix":cidr,"service":"Google Cloud","scope":rng.choice(regions)} for cidr in ipv4]+
+                      [{"ipv6Prefix":cidr,"service":"Google Cloud","scope":rng.choice(regions)} for cidr in ipv6]}
+    def google(name):
+        ipv4, ipv6 = share(name)
+        return {"syncToken":"1","creationTime":"2024-07-23T22:00:20.000","prefixes":[{"ipv4Prefix":cidr} for cidr in ipv4]+[{"ipv6Prefix":cidr} for cidr in ipv6]}
+    ipv4, ipv6 = share('cloudflare-ips.json')
+    cloudflare = {"result":{"ipv4_cidrs":ipv4,"ipv6_cidrs":ipv6,"etag":"x"},"success":True}
+    ipv4, ipv6 = share('cloudflare-jdcloud.json')
+    jdcloud = {"result":{"jdcloud_cidrs":ipv4+ipv6},"success":True}
+    ipv4, ipv6 = share('public_ip_ranges.json')
+    cidrs = ipv4+ipv6
+    oracle = {"last_updated_timestamp":"2024-07-15T09:52:55.000","regions":[
+              {"region":region,"cidrs":[{"cidr":cidr,"tags":rng.choice([["OCI"],["OSN","OBJECT_STORAGE"]])} for cidr in cidrs[pos::len(regions)]]}
+              for pos,region in enumerate(regions)]}
+    feeds = {'ip-ranges.json':aws,AZURE_FILE_NAME:azure,'cloud.json':gcp,'cloudflare-ips.json':cloudflare,
+             'cloudflare-jdcloud.json':jdcloud,'public_ip_ranges.json':oracle}
+    for name in ('goog.json','googlebot.json','special-crawlers.json','user-triggered-fetchers.json'):
+        feeds[name] = google(name)
+    for name,content in feeds.items():
+        with open(os.path.join(directory,name),'w') as f:
+            json.dump(content,f)
+    ipv4, ipv6 = share('digitalocean-google.csv')
+    with open(os.path.join(directory,'digitalocean-google.csv'),'w') as f:
+        f.writelines(f"{cidr},{country},{country}-01,City {country},\n" for cidr in ipv4+ipv6 for country in [rng.choice(['NL','US','DE','SG','IN','GB','CA','AU'])])
+    write_azure_page(directory,"")
+
+def write_database_feeds(directory,database):
+    """Writes the files of all providers, in the format of each provider, with the networks of a CloudIPDatabase
+    (ex: CloudIPLookup()._db loaded from the cloudiplookup.dat.gz of the package): the real provider mix, with its
+    regions, services and network features, that update_ip_ranges() parses back into the same networks."""
+    os.makedirs(directory,exist_ok=True)
+    feeds = {}
+    for row in range(len(database)):
+        provider, service = database.indexProvider[database.provider[row]-1], database.indexServices[database.services[row]-1]
+        region, features = database.indexRegions[database.regions[row]-1], database.indexNetworkFeatures[database.features[row]-1]
+        feeds.setdefault((provider,service) if provider == 'Google' else provider,[]).append((database.cidr(row),region,service,features))
+    googleFiles = {'Services':'goog.json','Bot':'googlebot.json','Special Crawlers':'special-crawlers.json','User Triggered Fetchers':'user-triggered-fetchers.json'}
+    content = {name:{"syncToken":"1","creationTime":"2024-07-23T22:00:20.000","prefixes":[]} for name in googleFiles.values()}
+    for (cidr,region,service,features) in feeds.get('AWS',[]):
+        content.setdefault('ip-ranges.json',{"syncToken":"1","createDate":"2024-07-24-21-33-10","prefixes":[],"ipv6_prefixes":[]})
+        key = 'ipv6_prefixes' if ':' in cidr else 'prefixes'
+        content['ip-ranges.json'][key].append({key[:-2]:cidr,"region":region,"service":service,"network_border_group":region})
+    azure = {}
+    for (cidr,region,service,features) in feeds.get('Azure',[]):
+        azure.setdefault((service,region,features),[]).append(cidr)
+    content[AZURE_FILE_NAME] = {"changeNumber":1,"cloud":"Public","values":[
+        {"name":f"{service}.{region}","id":f"{service}.{region}","properties":{"changeNumber":1,"region":region,"regionId":pos,"platform":"Azure",
+         "systemService":service,"addressPrefixes":cidrs,"networkFeatures":features.split(", ") if features else []}}
+        for pos,((service,region,features),cidrs) in enumerate(azure.items())]}
+    content['cloud.json'] = {"syncToken":"1","creationTime":"2024-07-24T13:06:03.000","prefixes":[
+        {('ipv6Prefix' if ':' in cidr else 'ipv4Prefix'):cidr,"service":service,"scope":region} for (cidr,region,service,features) in feeds.get('Google Cloud Platform',[])]}
+    for service,name in googleFiles.items():
+        content[name]['prefixes'] = [{('ipv6Prefix' if ':' in cidr else 'ipv4Prefix'):cidr} for (cidr,region,service,features) in feeds.get(('Google',service),[])]
+    cidrs = [cidr for (cidr,region,service,features) in feeds.get('Cloudflare',[])]
+    content['cloudflare-ips.json'] = {"result":{"ipv4_cidrs":[cidr for cidr in cidrs if ':' not in cidr],"ipv6_cidrs":[cidr for cidr in cidrs if ':' in cidr],"etag":"x"},"success":True}
+    content['cloudflare-jdcloud.json'] = {"result":{"jdcloud_cidrs":[cidr for (cidr,region,service,features) in feeds.get('JD Cloud',[])]},"success":True}
+    oracle = {}
+    for (cidr,region,service,features) in feeds.get('Oracle Cloud',[]):
+        oracle.setdefault(region,[]).append({"cidr":cidr,"tags":service.split(", ")})
+    content['public_ip_ranges.json'] = {"last_updated_timestamp":"2024-07-15T09:52:55.000","regions":[{"region":region,"cidrs":cidrs} for region,cidrs in oracle.items()]}
+    for name,feed in content.items():
+        with open(os.path.join(directory,name),'w') as f:
+            json.dump(feed,f)
+    ##──── The region of Digital Ocean is "<micro region> <city>" ──────────────────────────────────────────────────────────────────
+    with open(os.path.join(directory,'digitalocean-google.csv'),'w') as f:
+        f.writelines(f"{cidr},{region[:2]},{microRegion},{city},\n" for (cidr,region,service,features) in feeds.get('Digital Ocean',[])
+                     for microRegion,_,city in [region.partition(" ")])
+    write_azure_page(directory,"")
+
+def write_azure_page(directory,base_url):
+    """The Azure download page has the link of the current ServiceTags_Public_*.json file"""
+    with open(os.path.join(directory,'azure-download-page.html'),'w') as f:
+        f.write(f'<html>\n<a href="{base_url}/{AZURE_FILE_NAME}">ServiceTags_Public</a>\n</html>\n')
+
+def write_info_file(data_dir,base_url):
+    """Writes a cloudiplookup.json file in *data_dir* with the urls of this server"""
+    os.makedirs(data_dir,exist_ok=True)
+    with open(os.path.join(data_dir,'cloudiplookup.json'),'w') as f:
+        json.dump({provider:{key:f"{base_url}/{name}"} for provider,key,name in FEED_FILES},f,indent=4)
+
+class FeedServer(object):
+    """Serves the files of *directory* in a background thread, like the providers do: with ETag and Last-Modified
+    headers, 304 Not Modified for conditional requests and gzip for clients that accept it. Each request waits
+    *latency* seconds and the first *failures* requests of each file receive a HTTP *failure_status* (503 by default,
+    to exercise the retries of download_file()). The number of requests of each path is in *requests* and the number
+    of requests, 304 responses and bytes sent are in *stats*."""
+    def __init__(self, directory, latency=0.0, failures=0, failure_status=503, host='127.0.0.1', port=0):
+        self.directory = directory
+        self.latency = latency
+        self.failures = failures
+        self.failure_status = failure_status
+        self.requests = {}
+        self.stats = {'requests':0,'not_modified':0,'bytes_sent':0}
+        self._lock = threading.Lock()
+        server = self
+        class FeedRequestHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with server._lock:
+                    count = server.requests[self.path] = server.requests.get(self.path,0) + 1
+                    server.stats['requests'] += 1
+                time.sleep(server.latency)
+                if count <= server.failures:
+                    self.send_error(server.failure_status)
+                    return
+                path = os.path.join(server.directory,os.path.basename(self.path.split('?')[0]))
+                if not os.path.isfile(path):
+                    self.send_error(404,"Not Found")
+                    return
+                stat = os.stat(path)
+                etag = '"%x-%x"'%(stat.st_mtime_ns,stat.st_size)
+                lastModified = formatdate(stat.st_mtime,usegmt=True)
+                if self.headers.get('If-None-Match') == etag or \
+                   (self.headers.get('If-None-Match') is None and self.headers.get('If-Modified-Since') == lastModified):
+                    with server._lock:
+                        server.stats['not_modified'] += 1
+                    self.send_response(304)
+                    self.send_header('ETag',etag)
+                    self.end_headers()
+                    return
+                with open(path,'rb') as f:
+                    body = f.read()
+                self.send_response(200)
+                if 'gzip' in self.headers.get('Accept-Encoding',''):
+                    body = gzip.compress(body)
+                    self.send_header('Content-Encoding','gzip')
+                self.send_header('Content-Length',str(len(body)))
+                self.send_header('ETag',etag)
+                self.send_header('Last-Modified',lastModified)
+                self.end_headers()
+                self.wfile.write(body)
+                with server._lock:
+                    server.stats['bytes_sent'] += len(body)
+            def log_message(self, format, *args):
+                return
+        self.httpd = ThreadingHTTPServer((host,port),FeedRequestHandler)
+        self.base_url = f"http://{host}:{self.httpd.server_address[1]}"
+        write_azure_page(directory,self.base_url)
+        self._thread = threading.Thread(target=self.httpd.serve_forever,daemon=True)
+    def __enter__(self):
+        self._thread.start()
+        return self
+    def __exit__(self, *args):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Local HTTP stand-in for the provider feeds")
+    parser.add_argument("--port",dest="port",type=int,default=8080,help="Port to listen.")
+    parser.add_argument("--latency",dest="latency",type=float,default=0.5,help="Seconds to wait before each response.")
+    parser.add_argument("--failures",dest="failures",type=int,default=0,help="Number of HTTP 503 responses before serving each file.")
+    parser.add_argument("--data-dir",dest="data_dir",default="/tmp/cloudiplookup-feeds/",help="Directory of the cloudiplookup.json file to create.")
+    args = parser.parse_args()
+    feedsDir = os.path.join(args.data_dir,'feeds')
+    write_fixture_feeds(feedsDir)
+    with FeedServer(feedsDir,latency=args.latency,failures=args.failures,port=args.port) as server:
+        write_info_file(args.data_dir,server.base_url)
+        print(f"Serving {feedsDir} at {server.base_url} with {args.latency} sec of latency. Press CTRL+C to stop.",flush=True)
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
@@ -6,4 +6,11 @@ __author__ = 'Ricardo Abuchaim'
 __license__ = 'MIT'
 __version__ = "1.0.6"
 
-from cloudiplookup.cloudiplookup import CloudIPLookup, update_ip_ranges
+from cloudiplookup.cloudiplookup import CloudIPLookup
+
+##──── The updater is imported on the first access to update_ip_ranges, "import cloudiplookup" only loads the lookup code ───
+def __getattr__(name):
+    if name == 'update_ip_ranges':
+        from cloudiplookup.updater import update_ip_ranges
+        return update_ip_ranges
+    raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
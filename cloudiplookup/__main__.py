@@ -0,0 +1,8 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+# -*- coding: utf-8 -*-
+"""python3 -m cloudiplookup [serve] [options] [ipaddr,ipaddrN...]"""
+import sys
+from cloudiplookup.cli import main_function
+
+sys.exit(main_function())
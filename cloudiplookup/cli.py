@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+# -*- coding: utf-8 -*-
+"""
+Cloud IP Lookup - Command line: cloudiplookup [serve] [options] [ipaddr,ipaddrN...]
+
+The entry point of the "cloudiplookup" command is main_function(). The updater is imported only by --update and
+the database is loaded only by the options that need it.
+"""
+import os, sys, json, re
+from time import perf_counter
+from argparse import ArgumentParser, HelpFormatter
+import cloudiplookup.cloudiplookup as _core
+from cloudiplookup.cloudiplookup import (__appid__, __version__, PROVIDERS_INFORMATION_FILE_NAME, OUTPUT_FILE_NAME, BINARY_FILE_NAME, LOG_PATTERNS, LOG_CHUNK_SIZE,
+                                         STREAM_FORMATS, STREAM_BATCH_SIZE, SERVE_HOST, SERVE_PORT, SERVE_MAX_BATCH, SERVE_BODY_BYTES_PER_IP, SERVE_WATCH_INTERVAL,
+                                         CloudIPLookup, CloudIPLookupServer, logVerbose, logDebug, _logDebug, _logEmpty, logError, pp_json)
+
+##──── CLASS FOR ARGUMENT PARSER ──────────────────────────────────────────────────────────────────────────────────────────────────────
+class class_argparse_formatter(HelpFormatter):
+    def add_usage(self, usage, actions, groups, prefix=None):
+        if prefix is None:
+            prefix = 'Usage: '
+        return super(class_argparse_formatter, self).add_usage(usage, actions, groups, prefix)
+    def _format_usage(self, usage, actions, groups, prefix):
+        return super(class_argparse_formatter, self)._format_usage(usage, actions, groups, prefix)
+
+##################################################################################################################################
+##################################################################################################################################
+
+                             ##     ##    ###    #### ##    ##                 
+                             ###   ###   ## ##    ##  ###   ##                 
+                             #### ####  ##   ##   ##  ####  ##                 
+                             ## ### ## ##     ##  ##  ## ## ##                 
+                             ##     ## #########  ##  ##  ####                 
+                             ##     ## ##     ##  ##  ##   ###                 
+             ####### ####### ##     ## ##     ## #### ##    ## ####### ####### 
+ 
+##################################################################################################################################
+##################################################################################################################################
+##──── STREAMING MODE OF THE COMMAND LINE (--input/--format). THE OUTPUT IS WRITTEN WITH A 1 MiB BUFFER ─────────────────────────
+def _main_stream(iplookup,args)->int:
+    if args.input is None:
+        inputLines = args.ipaddr.replace(' ','').split(",")
+    elif args.input == '-':
+        inputLines = open(sys.stdin.fileno(),'r',buffering=1048576,encoding='utf-8',errors='replace',closefd=False)
+    else:
+        try:
+            inputLines = open(args.input,'r',buffering=1048576,encoding='utf-8',errors='replace')
+        except Exception as ERR:
+            logError(f"Failed to open the input file {args.input}: {str(ERR)}")
+            return 1
+    output = open(sys.stdout.fileno(),'w',buffering=1048576,encoding='utf-8',newline='',closefd=False)
+    startTime = perf_counter()
+    try:
+        total = iplookup.lookup_stream(inputLines,output,args.format or 'jsonl',batch_size=max(1,args.batch_size or STREAM_BATCH_SIZE))
+        output.flush()
+    except BrokenPipeError:
+        ##──── The reader of the pipe (ex: head) has gone. Python docs: redirect stdout to devnull to avoid another error at exit ───
+        os.dup2(os.open(os.devnull,os.O_WRONLY),sys.stdout.fileno())
+        return 1
+    finally:
+        if args.input not in (None,'-'):
+            inputLines.close()
+    elapsed = perf_counter() - startTime
+    if args.verbose == True:
+        print(f"Resolved {total:,d} IP addresses in {elapsed:.3f} seconds ({int(total/elapsed) if elapsed > 0 else 0:,d} IPs/sec)",file=sys.stderr,flush=True)
+    return 0
+
+##──── ACCESS LOG MODE OF THE COMMAND LINE (--annotate-log). THE LINES/SEC OF EACH WORKER ARE PRINTED TO STDERR AT THE END ─────
+def _main_annotate_log(iplookup,args)->int:
+    if args.annotate_log == '-':
+        inputLines = open(sys.stdin.fileno(),'r',buffering=1048576,encoding='utf-8',errors='replace',closefd=False)
+    else:
+        try:
+            inputLines = open(args.annotate_log,'r',buffering=1048576,encoding='utf-8',errors='replace')
+        except Exception as ERR:
+            logError(f"Failed to open the log file {args.annotate_log}: {str(ERR)}")
+            return 1
+    output = open(sys.stdout.fileno(),'w',buffering=1048576,encoding='utf-8',newline='',closefd=False)
+    try:
+        stats = iplookup.annotate_log(inputLines,output,pattern=args.log_pattern,processes=args.processes,chunk_size=max(1,args.batch_size or LOG_CHUNK_SIZE))
+        output.flush()
+    except BrokenPipeError:
+        os.dup2(os.open(os.devnull,os.O_WRONLY),sys.stdout.fileno())
+        return 1
+    except re.error as ERR:
+        logError(f"Invalid --log-pattern {args.log_pattern!r}: {str(ERR)}")
+        return 1
+    finally:
+        if args.annotate_log != '-':
+            inputLines.close()
+    for worker in stats['workers']:
+        print(f"Worker {worker['pid']}: {worker['lines']:,d} lines in {worker['seconds']:.3f} seconds ({worker['lines_per_sec']:,d} lines/sec)",file=sys.stderr)
+    print(f"Annotated {stats['lines']:,d} lines in {stats['seconds']:.3f} seconds ({stats['lines_per_sec']:,d} lines/sec) with {len(stats['workers'])} workers",file=sys.stderr,flush=True)
+    return 0
+
+##──── NETWORKS MODE OF THE COMMAND LINE (--networks). ONE CIDR PER LINE, WRITTEN WITH A 1 MiB BUFFER ─────────────────────────
+def _main_networks(iplookup,args)->int:
+    output = open(sys.stdout.fileno(),'w',buffering=1048576,encoding='utf-8',newline='',closefd=False)
+    split = lambda value: None if value is None else [name.strip() for name in value.split(",")]
+    try:
+        for cidr in iplookup.networks(provider=split(args.provider),service=split(args.service),region=split(args.region)):
+            output.write(cidr+"\n")
+        output.flush()
+    except BrokenPipeError:
+        os.dup2(os.open(os.devnull,os.O_WRONLY),sys.stdout.fileno())
+        return 1
+    return 0
+
+##──── DIFF MODE OF THE COMMAND LINE (--diff OLD [NEW]). THE CHANGES IN JSON OR CSV, AND THE DELTA FILE WITH --delta ─────────────
+def _main_diff(args)->int:
+    from cloudiplookup.delta import diff_databases
+    if len(args.diff) > 2:
+        logError("Use --diff OLD [NEW], the default NEW is the current database file")
+        return 1
+    oldFile, newFile = args.diff[0], args.diff[1] if len(args.diff) == 2 else os.path.join(_core.DATA_DIR,OUTPUT_FILE_NAME)
+    try:
+        diff = diff_databases(oldFile,newFile)
+    except Exception as ERR:
+        logError(f"Failed to compare {oldFile} and {newFile}: {str(ERR)}")
+        return 1
+    if args.delta is not None:
+        diff.save_delta(args.delta)
+        logVerbose(f"Saved the delta file {args.delta} with {len(diff):,d} changed networks")
+    output = open(sys.stdout.fileno(),'w',buffering=1048576,encoding='utf-8',newline='',closefd=False)
+    try:
+        if args.csv == True:
+            output.writelines(line+"\n" for line in diff.csv_lines())
+        else:
+            output.write(diff.to_json()+"\n")
+        output.flush()
+    except BrokenPipeError:
+        os.dup2(os.open(os.devnull,os.O_WRONLY),sys.stdout.fileno())
+        return 1
+    return 0
+
+##──── HTTP SERVICE MODE OF THE COMMAND LINE (cloudiplookup serve). IT HAS ITS OWN OPTIONS ───────────────────────────────────────
+def _main_serve(argv)->int:
+    parser = ArgumentParser(formatter_class=class_argparse_formatter,prog="cloudiplookup serve",
+                            description="Cloud IP Lookup HTTP service: GET /lookup/<ipaddr>, POST /lookup, GET /info and GET /stats",
+                            allow_abbrev=True,add_help=False)
+    options = parser.add_argument_group("Serve Options")
+    options.add_argument("--host",dest="host",action="store",default=SERVE_HOST,help=f"Address to listen. Default: {SERVE_HOST}.")
+    options.add_argument("--port",dest="port",action="store",type=int,default=SERVE_PORT,help=f"Port to listen. Default: {SERVE_PORT}.")
+    options.add_argument("--max-batch",dest="max_batch",action="store",type=int,default=SERVE_MAX_BATCH,metavar="N",help=f"Maximum number of IP addresses in a POST /lookup request. Default: {SERVE_MAX_BATCH}.")
+    options.add_argument("--max-body",dest="max_body",action="store",type=int,default=None,metavar="BYTES",help=f"Maximum size of the body of a POST /lookup request, bigger bodies receive HTTP 413. Default: --max-batch * {SERVE_BODY_BYTES_PER_IP}.")
+    options.add_argument("--watch-interval",dest="watch_interval",action="store",type=float,default=SERVE_WATCH_INTERVAL,metavar="SECONDS",help=f"Checks the database file every N seconds and reloads it when it is replaced (0 disables). Default: {SERVE_WATCH_INTERVAL}.")
+    options.add_argument("--mmap",dest="mmap",action="store_true",default=False,help="Uses the memory-mapped cloudiplookup.dat.bin file instead of loading cloudiplookup.dat.gz.")
+    options.add_argument("--cache-size",dest="cache_size",action="store",type=int,default=0,metavar="N",help="Keeps the results of the last N distinct IP addresses of GET /lookup in a LRU cache. Default: 0 (disabled).")
+    options.add_argument('--verbose','-v',dest="verbose",action='store_true',default=False,help='Shows the startup messages.')
+    options.add_argument('--help','-h','-?',action='help',help='Shows this help message.')
+    args = parser.parse_args(argv)
+    iplookup = CloudIPLookup(args.verbose,use_mmap=args.mmap,cache_size=args.cache_size,watch_interval=args.watch_interval)
+    server = CloudIPLookupServer(iplookup,host=args.host,port=args.port,max_batch=args.max_batch,max_body=args.max_body)
+    if args.verbose == True:
+        print(f"Cloud IP Lookup v{__version__} is listening on http://{args.host}:{args.port}/ - press CTRL+C to stop.",flush=True)
+    server.run()
+    return 0
+
+#defmain
+def main_function():
+    global args
+    sys.tracebacklimit = 0
+    if sys.argv[1:2] == ['serve']:
+        return _main_serve(sys.argv[2:])
+    parser = ArgumentParser(formatter_class=class_argparse_formatter,
+                            description=_core.__doc__.splitlines()[1],
+                            allow_abbrev=True,
+                            add_help=False)
+    lookup = parser.add_argument_group("Lookup Parameters")
+    lookup.add_argument(dest="ipaddr",action="store",nargs='?',metavar="ipaddr,ipaddrN...",help="Supply one or more IP address separated by comma.")
+    lookup.add_argument("--input",dest="input",action="store",default=None,metavar="FILE|-",help="Streaming mode: reads one IP address per line from FILE (or from stdin with -) and writes one result per line in the --format (default jsonl). Use -v to see the throughput at the end.")
+    lookup.add_argument("--annotate-log",dest="annotate_log",action="store",default=None,metavar="FILE|-",help="Access log mode: reads an access log from FILE (or from stdin with -) and writes each line followed by the provider, service and region of the client IP address, separated by tabs. The lines/sec of each worker are printed to stderr at the end.")
+    lookup.add_argument("--log-pattern",dest="log_pattern",action="store",default='combined',metavar="NAME|REGEX",help=f"Access log mode: {', '.join(LOG_PATTERNS)} or a regular expression with a group named 'ip'. Default: combined (nginx/Apache).")
+    lookup.add_argument("--processes",dest="processes",action="store",type=int,default=None,metavar="N",help="Access log mode: number of worker processes. Default: the number of CPUs.")
+    output = parser.add_argument_group("Output Options") 
+    output.add_argument("--csv","-c",dest='csv',action="store_true",default=False,help="Print output in csv format (ip,cidr,region,cloud_provider,service,elapsed_time).")
+    output.add_argument("--format",dest='format',action="store",default=None,choices=STREAM_FORMATS,metavar="jsonl|csv|tsv",help="Streaming mode output format: jsonl, csv or tsv (ip,cidr,region,cloud_provider,service).")
+    output.add_argument("--batch-size",dest='batch_size',action="store",type=int,default=None,metavar="N",help=f"Streaming mode: number of IP addresses resolved at once (default: {STREAM_BATCH_SIZE}). Access log mode: lines sent at once to a worker (default: {LOG_CHUNK_SIZE}).")
+    update = parser.add_argument_group("Database Options")
+    update.add_argument("--update","-u",dest='update',action="store_true",default=False,help="Updates IP ranges directly from cloud service providers. Use -v to see updating progress.")
+    update.add_argument("--info","-i",dest='info',action="store_true",default=False,help="Shows information about the current database file in json format.")
+    update.add_argument("--pretty","-p",dest='pretty',action="store_true",default=False,help="Shows information about the current database file in a table format.")
+    update.add_argument("--networks","-n",dest='networks',action="store_true",default=False,help="Lists the CIDR of all networks of the --provider, --service and --region given (all networks if none is given), one per line.")
+    update.add_argument("--provider",dest='provider',action="store",default=None,metavar="NAME[,NAME]",help="Networks mode: provider names, ex: AWS (case insensitive).")
+    update.add_argument("--service",dest='service',action="store",default=None,metavar="NAME[,NAME]",help="Networks mode: service names, ex: EC2.")
+    update.add_argument("--region",dest='region',action="store",default=None,metavar="NAME[,NAME]",help="Networks mode: region names, ex: eu-west-1.")
+    update.add_argument("--diff",dest='diff',action="store",nargs='+',default=None,metavar="FILE",help="Diff mode: --diff OLD [NEW] prints the networks added, removed and re-attributed from the database file OLD to NEW (default: the current database file) and the totals of each provider and service, in json or with --csv in csv. The files can be cloudiplookup.dat.gz or cloudiplookup.dat.bin.")
+    update.add_argument("--delta",dest='delta',action="store",default=None,metavar="FILE",help="Diff mode: also saves the delta file, to be applied by CloudIPLookup.apply_delta() or --apply-delta.")
+    update.add_argument("--apply-delta",dest='apply_delta',action="store",default=None,metavar="FILE",help="Applies the delta file FILE to the database files (cloudiplookup.dat.gz and cloudiplookup.dat.bin) without downloading the IP ranges. The processes watching the files apply the delta instead of loading the whole file. Use -v to see the progress.")
+    update.add_argument("--show-config-file",dest='showconfigfile',action="store_true",default=False,help="Displays the available settings for downloading information about network ranges.")
+    optional = parser.add_argument_group("More Options")
+    optional.add_argument('--verbose','-v',dest="verbose",action='store_true',default=False,help='Shows useful messages about each step that application is doing.')
+    optional.add_argument('--debug','-d',dest="debug",action='store_true',default=False,help='Save all data from cloud providers in the data directory. Debug is not verbose!')
+    optional.add_argument('--help','-h','-?',action='help',help='Shows this help message about the allowed commands.')
+    optional.add_argument('--version',action='version',help='Shows the application version.',version="%s v%s"%(__appid__,__version__))
+    ##────── do the parse ───────────────────────────────────────────────────────────────────────────────────────────────────
+    args = parser.parse_args()
+    ##────── Se não houve subcomando, exiba o help ─────────────────────────────────────────────────────────────────────────
+
+    debug = args.debug
+    if (args.debug == True and args.verbose == True):
+        logDebug.__code__ = _logDebug.__code__
+    if (args.verbose == False):
+        logVerbose.__code__ = _logEmpty.__code__
+        
+    if (args.showconfigfile == True):
+        try:
+            with open(os.path.join(_core.DATA_DIR,PROVIDERS_INFORMATION_FILE_NAME),"r") as f:
+                infoFile = json.load(f)
+            logDebug(f"Config file location: {os.path.join(_core.DATA_DIR,PROVIDERS_INFORMATION_FILE_NAME)}")
+            pp_json(infoFile)
+            sys.exit(0)
+        except Exception as ERR:
+            logError(f"Failed to open information file \"{str(os.path.join(_core.DATA_DIR,PROVIDERS_INFORMATION_FILE_NAME))}\": {str(ERR)}")
+            sys.exit(1)
+    
+    if (args.update == True):
+        from cloudiplookup.updater import update_ip_ranges
+        sys.exit(update_ip_ranges(verbose=args.verbose,debug=debug))
+
+    if (args.apply_delta is not None):
+        from cloudiplookup.updater import update_from_delta
+        sys.exit(update_from_delta(args.apply_delta,verbose=args.verbose))
+
+    if (args.diff is not None):
+        sys.exit(_main_diff(args))
+
+    ##────── Nothing to do, the help is printed without loading the database ───────────────────────────────────────────────────
+    if (args.ipaddr is None and args.input is None and args.annotate_log is None and args.info == False and args.networks == False):
+        parser.print_help()
+        print("")
+        sys.exit(0)
+
+    ##────── In streaming mode the stdout has only the results, the messages go to stderr ────────────────────────────────────
+    streaming = (args.input is not None or args.format is not None or args.annotate_log is not None or args.networks == True)
+    ##────── The workers of the access log mode share the pages of the memory-mapped binary file, if it exists ───────────────────
+    iplookup = CloudIPLookup((args.verbose or args.debug) and not streaming,
+                             use_mmap=(args.annotate_log is not None and os.path.isfile(os.path.join(_core.DATA_DIR,BINARY_FILE_NAME))))
+    if (args.info == True):
+        if args.pretty == True:
+            for key,val in iplookup.get_database_info(print_result=False).items():
+                print(f"{key.ljust(32,'.')}: {(str(val['total_networks'])+' networks ').ljust(15)} - Last update: {val['last_updated']}")
+        else:
+            iplookup.get_database_info()
+        sys.exit(0)
+
+    if (args.networks == True):
+        sys.exit(_main_networks(iplookup,args))
+    
+    if streaming == True:
+        if args.verbose == True:
+            print(iplookup.startup_line_text,file=sys.stderr,flush=True)
+        if args.annotate_log is not None:
+            sys.exit(_main_annotate_log(iplookup,args))
+        sys.exit(_main_stream(iplookup,args))
+
+    iplist = args.ipaddr.replace(' ','').split(",")
+    for ipaddr in iplist:
+        if args.csv == True:
+            print(iplookup.lookup(ipaddr).pp_csv())
+        else:
+            print(iplookup.lookup(ipaddr).pp_json())
+
+if __name__ == "__main__":
+    sys.exit(main_function())
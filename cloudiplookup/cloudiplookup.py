@@ -13,28 +13,61 @@ License: MIT
 __appid__   = "Cloud IP Lookup"
 __version__ = "1.0.6"
 
-import sys, os, json, socket, struct, gzip, pickle, re, ctypes
-import urllib.request
+##──── Only the modules of the lookup path are imported here. gzip, pickle, ctypes and datetime are imported when used, ────────
+##──── the updater (urllib, concurrent.futures) is in cloudiplookup/updater.py and the command line (argparse) in cli.py ─────────
+import sys, os, json, socket, struct, re, mmap, threading, time, weakref
+from array import array
 from binascii import unhexlify
 from time import perf_counter
-from pprint import pprint as pp
 from timeit import default_timer
-from datetime import datetime as dt
 from contextlib import contextmanager
-from bisect import bisect as binary_search
-from argparse import ArgumentParser, HelpFormatter, SUPPRESS
+from bisect import bisect as binary_search, bisect_left
+from itertools import islice, accumulate
+from heapq import merge as heap_merge
+from collections import OrderedDict, deque
 import cloudiplookup as _ 
 
 DATA_DIR = os.path.dirname(_.__file__) if os.name == 'nt' else '/var/lib/cloudiplookup/'
 
 PROVIDERS_INFORMATION_FILE_NAME = 'cloudiplookup.json'
 OUTPUT_FILE_NAME                = 'cloudiplookup.dat.gz'
-LIST_SLICE_SIZE                 = 1000
-DOWNLOAD_TIMEOUT                = 30
+BINARY_FILE_NAME                = 'cloudiplookup.dat.bin'
+BINARY_FILE_MAGIC               = b'CLOUDIP\x00'
+DATABASE_VERSION                = 3     # version of the cloudiplookup.dat.gz and cloudiplookup.dat.bin files
+DOWNLOAD_TIMEOUT                = 30    # seconds, for each provider file
+DOWNLOAD_RETRIES                = 2     # retries of a provider file after a network error, timeout or HTTP 429/5xx
+DOWNLOAD_BACKOFF                = 1.0   # seconds before the first retry, doubled on each new retry
+DOWNLOAD_CONCURRENCY            = 6     # provider files downloaded at the same time by update_ip_ranges()
+FEED_CACHE_DIR_NAME             = 'cloudiplookup.feeds'     # raw feeds, ETag/Last-Modified and parsed networks of each provider
+FEED_CHUNK_SIZE                 = 65536 # bytes of a provider feed read at once by the streaming parsers of the updater
+DELTA_FILE_NAME                 = 'cloudiplookup.delta.gz'  # changes from the previous database, saved by update_ip_ranges()
+DELTA_FORMAT_VERSION            = 1     # version of the delta files read by CloudIPLookup.apply_delta()
+ROW_NOT_FOUND                   = -1    # value of CloudIPBatchResult.rows for IPs not found in database
+ROW_INVALID                     = -2    # value of CloudIPBatchResult.rows for invalid IP addresses
+STREAM_BATCH_SIZE               = 10000 # IP addresses resolved at once by CloudIPLookup.lookup_stream()
+STREAM_FORMATS                  = ('jsonl','csv','tsv')
+SERVE_HOST                      = '127.0.0.1'
+SERVE_PORT                      = 8090
+SERVE_MAX_BATCH                 = 100000 # IP addresses accepted in a POST /lookup request
+SERVE_BODY_BYTES_PER_IP         = 64    # bytes of a POST /lookup body accepted for each IP address of max_batch (the default max_body)
+SERVE_INLINE_BODY               = 16384 # bigger POST /lookup bodies are looked up in a thread, not in the event loop
+SERVE_WATCH_INTERVAL            = 5     # seconds between the checks of the database file by the HTTP server
+LOG_CHUNK_SIZE                  = 20000 # access log lines sent at once to a worker by CloudIPLookup.annotate_log()
+ANNOTATE_CHUNK_SIZE             = 200000 # IP addresses of a DataFrame/Table column converted at once by CloudIPLookup.annotate()
+TRIE_STRIDES                    = (20,6,6)   # bits of each level of the IPv4 stride tables of CloudIPLookup(engine='trie')
+TRIE_IPV6_STRIDES               = None       # bits of the IPv6 stride tables (over the hi 64 bits, ex: (16,8)), None keeps the binary search
+PREFILTER_IPV4_BITS             = 16    # the negative prefilter has one bit per IPv4 /16 that has at least one network
+PREFILTER_IPV6_BITS             = 32    # and the set of the IPv6 /32 prefixes that have at least one network
+PREFILTER_IPV6_MAX_PREFIXES     = 65536 # the IPv6 prefilter is not created if a network covers more /32 prefixes than this
+STATS_LATENCY_BUCKETS           = (0.000001,0.0000025,0.000005,0.00001,0.000025,0.00005,0.0001,0.00025,0.001,0.01) # upper bounds in seconds of the latency histogram of CloudIPLookup(stats=True)
+LOG_PATTERNS                    = {     # regular expressions of the client IP address in access logs, the group 'ip' is used
+    'combined': r'^(?P<ip>\S+)',                                           # nginx/Apache common and combined formats
+    'elb':      r'^\S+ \S+ \[?(?P<ip>[0-9A-Fa-f:.]+?)\]?:\d+ ',             # AWS Classic Load Balancer
+    'alb':      r'^\S+ \S+ \S+ \[?(?P<ip>[0-9A-Fa-f:.]+?)\]?:\d+ ',         # AWS Application Load Balancer
+    }
 middot                          = "\xb7"
 singleLine                      = "─"
 doubleLine                      = "═"
-_DEBUG                          = False
 os.environ["PYTHONWARNINGS"]    = "ignore"
 os.environ["PYTHONIOENCODING"]  = "utf-8"
 
@@ -58,6 +91,126 @@ ipv4_to_int = lambda ipv4_address: struct.unpack('!I', socket.inet_aton(ipv4_add
 int_to_ipv4 = lambda num: socket.inet_ntoa(struct.pack('!I', num))
 ipv6_to_int = lambda ipv6_address: int.from_bytes(socket.inet_pton(socket.AF_INET6, ipv6_address), byteorder='big')
 int_to_ipv6 = lambda num: socket.inet_ntop(socket.AF_INET6, unhexlify(hex(num)[2:].zfill(32)))
+ipv6_to_hilo = lambda ipv6_address: struct.unpack('!QQ', socket.inet_pton(socket.AF_INET6, ipv6_address))
+hilo_to_ipv6 = lambda hi, lo: socket.inet_ntop(socket.AF_INET6, struct.pack('!QQ', hi, lo))
+##──── Pre-bound functions used by the fast path CloudIPLookup.lookup_code() ───────────────────────────────────────────────────
+_unpack_I, _unpack_QQ = struct.Struct('!I').unpack, struct.Struct('!QQ').unpack
+_inet_aton, _inet_pton, _AF_INET6 = socket.inet_aton, socket.inet_pton, socket.AF_INET6
+##──── PARSING OF IP ADDRESSES WITHOUT EXCEPTIONS. THE KEY OF AN IP ADDRESS IS AN INTEGER FOR IPv4 AND A (hi,lo) TUPLE FOR IPv6 ────
+##──── The strings are classified by their characters (str.strip() of the allowed characters leaves nothing), so the garbage ──────
+##──── is rejected without raising. Only a malformed string made of digits and dots (or hex digits and ':') reaches the OSError ────
+##──── of inet_pton(), that is strict: no '1.2.3', '0x7f.0.0.1' or leading zeros like inet_aton(). The IPv4-mapped IPv6 ────────────
+##──── addresses (::ffff:a.b.c.d) are IPv4 addresses. ─────────────────────────────────────────────────────────────────────────────
+_IPV4_CHARS, _IPV6_CHARS, _AF_INET = '0123456789.', '0123456789abcdefABCDEF:.', socket.AF_INET
+_IPV4_REGEX = r'(?:(?:25[0-5]|2[0-4][0-9]|1[0-9][0-9]|[1-9]?[0-9])\.){3}(?:25[0-5]|2[0-4][0-9]|1[0-9][0-9]|[1-9]?[0-9])'
+_ipv4_list_match = re.compile(r'(?:%s\n)*%s'%(_IPV4_REGEX,_IPV4_REGEX)).fullmatch
+
+def parse_ip(ipaddr):
+    """Returns the key of an IP address: an integer for IPv4, a tuple (hi,lo) of 64 bits integers for IPv6 or None if
+    the IP address is invalid. Accepts strings, integers (up to 4294967295 are IPv4), packed bytes (4 or 16 bytes)
+    and ipaddress.IPv4Address/IPv6Address objects. The IPv4-mapped IPv6 addresses return the IPv4 key."""
+    if ipaddr.__class__ is str:
+        if ':' in ipaddr:
+            if ipaddr.strip(_IPV6_CHARS):
+                return None
+            try:
+                hi, lo = _unpack_QQ(_inet_pton(_AF_INET6,ipaddr))
+            except OSError:
+                return None
+            if hi == 0 and lo >> 32 == 0xFFFF:
+                return lo & 0xFFFFFFFF
+            return (hi,lo)
+        if ipaddr.strip(_IPV4_CHARS) or not ipaddr:
+            return None
+        try:
+            return _unpack_I(_inet_pton(_AF_INET,ipaddr))[0]
+        except OSError:
+            return None
+    if isinstance(ipaddr,int) and not isinstance(ipaddr,bool):
+        if 0 <= ipaddr <= 4294967295:
+            return ipaddr
+        if ipaddr < 0 or ipaddr >= numIPsv6[0]:
+            return None
+        hi, lo = ipaddr >> 64, ipaddr & 0xFFFFFFFFFFFFFFFF
+    else:
+        packed = getattr(ipaddr,'packed',ipaddr)   # ipaddress.IPv4Address/IPv6Address
+        if not isinstance(packed,(bytes,bytearray,memoryview)):
+            return None
+        if len(packed) == 4:
+            return _unpack_I(packed)[0]
+        if len(packed) != 16:
+            return None
+        hi, lo = _unpack_QQ(packed)
+    if hi == 0 and lo >> 32 == 0xFFFF:
+        return lo & 0xFFFFFFFF
+    return (hi,lo)
+
+def _key_of(iplong:int,ipv6:bool):
+    return (iplong >> 64, iplong & 0xFFFFFFFFFFFFFFFF) if ipv6 else iplong
+
+def key_to_ip(key)->str:
+    """Returns the string of a key returned by parse_ip()"""
+    return int_to_ipv4(key) if key.__class__ is int else hilo_to_ipv6(*key)
+
+##──── PARSES A RANGE OF IP ADDRESSES: A CIDR, AN IP ADDRESS, A (start, end) PAIR OR AN ipaddress.IPv4Network/IPv6Network ─────────
+##──── Returns (first, last, ipv6) with first and last as integers (128 bits for IPv6). The host bits of a CIDR are ignored. ──────
+def parse_range(start,end=None)->tuple:
+    if end is None and hasattr(start,'network_address'):
+        start, end = start.network_address, start.broadcast_address
+    elif end is None and start.__class__ is str and '/' in start:
+        address, _, length = start.partition('/')
+        key = parse_ip(address)
+        if key is None or not length.isdigit():
+            raise ValueError(f"Invalid CIDR {start!r}")
+        bits, length = (32, int(length) - (96 if ':' in address else 0)) if key.__class__ is int else (128, int(length))
+        if not 0 <= length <= bits:
+            raise ValueError(f"Invalid CIDR {start!r}")
+        value = key if bits == 32 else (key[0] << 64) | key[1]
+        hostmask = (1 << (bits-length)) - 1
+        return value & ~hostmask, value | hostmask, bits == 128
+    elif end is None:
+        end = start
+    first, last = parse_ip(start), parse_ip(end)
+    if first is None or last is None or first.__class__ is not last.__class__:
+        raise ValueError(f"Invalid range {start!r} - {end!r}, use a CIDR or two IP addresses of the same family")
+    isIPv6 = first.__class__ is tuple
+    if isIPv6:
+        first, last = (first[0] << 64) | first[1], (last[0] << 64) | last[1]
+    if first > last:
+        raise ValueError(f"Invalid range {start!r} - {end!r}, the first IP address is greater than the last")
+    return first, last, isIPv6
+
+##──── BULK PARSER: CONVERTS A LIST OF IP ADDRESSES INTO PACKED ARRAYS, ONE ITEM PER IP ADDRESS ─────────────────────────────────
+def ip_list_to_arrays(ips)->tuple:
+    """Parses a list of IP addresses (any input accepted by parse_ip()) and returns 4 columns with one item per IP address:
+    (families, ipv4, hi, lo). *families* is a bytearray with 4, 6 or 0 (invalid), *ipv4* an array('I') with the IPv4
+    addresses and *hi*/*lo* arrays('Q') with the halves of the IPv6 addresses (0 in the items of other families).
+    A list of IPv4 strings is validated with a single regex and converted with a single join + unpack."""
+    ips = ips if isinstance(ips,(list,tuple)) else list(ips)
+    total = len(ips)
+    if total > 0 and all(ipaddr.__class__ is str for ipaddr in ips):
+        joined = "\n".join(ips)
+        if joined.count("\n") == total-1 and _ipv4_list_match(joined) is not None:
+            ipv4 = array('I',b''.join(map(_inet_aton,ips)))
+            if sys.byteorder == 'little':
+                ipv4.byteswap()
+            zeros = bytes(8*total)
+            return bytearray(b'\x04')*total, ipv4, array('Q',zeros), array('Q',zeros)
+    families, ipv4, hi, lo = bytearray(total), array('I',bytes(4*total)), array('Q',bytes(8*total)), array('Q',bytes(8*total))
+    for pos,ipaddr in enumerate(ips):
+        key = parse_ip(ipaddr)
+        if key is None:
+            continue
+        if key.__class__ is int:
+            families[pos], ipv4[pos] = 4, key
+        else:
+            families[pos], hi[pos], lo[pos] = 6, key[0], key[1]
+    return families, ipv4, hi, lo
+
+##──── CONVERTS A LIST OF IP ADDRESSES (STRINGS OR INTEGERS) INTO A LIST OF INTEGERS. INVALID IP ADDRESSES BECOME None ───────────
+def ip_list_to_int(ips)->list:
+    families, ipv4, hi, lo = ip_list_to_arrays(ips)
+    return [ipv4[pos] if family == 4 else (hi[pos] << 64 | lo[pos]) if family == 6 else None for pos,family in enumerate(families)]
 ##──── Number os possible IPs in a network range. (/0, /1 .. /8 .. /24 .. /30, /31, /32) ─────────────────────────────────────────
 ##──── Call the index of a list. Ex. numIPs[24] (is the number os IPs of a network range class C /24) ────────────────────────────
 numIPsv4 = sorted([2**num for num in range(0,33)],reverse=True) # from 0 to 32
@@ -76,19 +229,21 @@ def cWhite(msg): return '\033[97m'+str(msg)+'\033[0m'
 def cDarkYellow(msg): return '\033[33m'+str(msg)+'\033[0m'
 
 ##──── Functions to print to stdout ─────────────────────────────────────────────────────────────────────────────────────────────────
+##──── The message and the end are printed with a single write, the providers are updated in threads and the lines can't mix ───
 def _logEmpty(msg,end=""):return
 def log(msg,end="\n"):
-    print(msg,end=end,flush=True)
+    print(str(msg)+end,end="",flush=True)
 def logVerbose(msg,end="\n"):
-    print(msg,end=end,flush=True)
+    print(str(msg)+end,end="",flush=True)
 def logDebug(msg,end="\n"):return
 def _logDebug(msg,end="\n"):
-    print(cDarkYellow(get_date()+" [DEBUG] "+msg),end=end,flush=True)
+    print(cDarkYellow(get_date()+" [DEBUG] "+msg)+end,end="",flush=True)
 def logError(msg,end="\n"):
-    print(cRed("[ERROR] "+msg),end=end,flush=True)
+    print(cRed("[ERROR] "+msg)+end,end="",flush=True)
 
 ##──── Return date with no spaces to use with filenames ──────────────────────────────────────────────────────────────────────────
 def get_date(no_spaces=False):
+    from datetime import datetime as dt
     A='%Y%m%d%H%M%S' if no_spaces else '%Y%m%d@%H%M%S'
     B=dt.now()
     return B.strftime(A)
@@ -137,57 +292,349 @@ def json_default_formatter(o):
     if isinstance(o, (datetime.date, datetime.datetime)):
         return o.__str__
 
-##──── DOWNLOAD A FILE FROM INTERNET. IF IT´S A JSON, RETURNS JSON OTHERWISE RETURNS A LIST OF STRINGS ───────────────────────────
-##──── A real browser User agent is needed to download Digital Ocean files because it does not accept empty/curl user agent ──────
-def download_file(url, user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/117.0.0.0 Safari/537.36", max_redirects=5):
-    global last_modified
-    redirects = 0
-    while redirects < max_redirects:
-        try:
-            req = urllib.request.Request(url, headers={'User-Agent': user_agent} if user_agent else {})
-            with urllib.request.urlopen(req,timeout=DOWNLOAD_TIMEOUT) as response:
-                if response.getcode() == 302:
-                    url = response.headers['Location']
-                    redirects += 1
-                    continue
-                last_modified = response.headers['Last-Modified'] if 'Last-Modified' in response.headers else None
-                if last_modified is None:
-                    try:
-                        last_modified = response.headers['date'] if 'date' in response.headers else None
-                    except:
-                        last_modified = dt.now()
-                data = response.read().decode('utf-8')                
-                try:
-                    json_data = json.loads(data)
-                    return json_data
-                except json.JSONDecodeError:
-                    return data.split("\n")
-        except urllib.error.URLError as ERR:
-            logVerbose(f"Unable to download file ({url}): {str(ERR)}")
-            return False
-    logVerbose(f"Exceeded maximum redirects. {url}")
-    return False
-
 ##──── SPLIT A LIST IN CHUNKS OF "n" ───────────────────────────────────────────────────────────────────────────────────────────
 def split_list(lista, n):
     for i in range(0, len(lista), n):
         yield lista[i:i + n]
 
+##──── IDENTIFIES A VERSION OF A FILE. THE UPDATE REPLACES THE DATABASE FILES, SO A NEW FILE HAS A NEW INODE OR MTIME ─────────────
+def _file_signature(filename)->tuple:
+    stat = os.stat(filename)
+    return (stat.st_ino,stat.st_mtime_ns,stat.st_size)
+
+##──── A HASH OF THE NETWORKS AND THEIR ATTRIBUTIONS, THE SAME FOR THE SAME NETWORKS IN cloudiplookup.dat.gz AND cloudiplookup.dat.bin ──
+def _columns_fingerprint(columns:dict,strings:dict)->str:
+    """Returns the fingerprint of the networks of the database *columns*/*strings*. The update saves it in the database
+    files (strings['fingerprint']) and the delta files are checked with it. The columns are hashed with a fixed width
+    and byte order, whatever the width of the columns in the file."""
+    import hashlib
+    digest = hashlib.sha1()
+    for name in ('ipv4.first','ipv6.first.hi','ipv6.first.lo','netlength','provider','services','regions','features'):
+        column = array('Q',columns[name])
+        if sys.byteorder == 'big':
+            column.byteswap()
+        digest.update(len(column).to_bytes(8,'little'))
+        digest.update(column.tobytes())
+    digest.update(json.dumps([strings['indexProvider'],strings['indexServices'],strings['indexRegions'],strings['indexNetworkFeatures']],ensure_ascii=False).encode('utf-8'))
+    return digest.hexdigest()
+
+##──── NUMPY IS OPTIONAL. RETURNS THE MODULE OR None IF NOT INSTALLED ─────────────────────────────────────────────────────────
+def _import_numpy():
+    try:
+        import numpy
+        return numpy
+    except ImportError:
+        return None
+
+##──── A NUMPY VIEW OF A COLUMN OF THE DATABASE (array.array or memoryview), WITHOUT COPY. CODES AND ROWS HAVE 1, 2 OR 4 BYTES ──────
+def _numpy_column(np,column):
+    return np.frombuffer(column,dtype=f"u{column.itemsize}")
+
+##──── RESOLVES THE COLUMNS OF ip_list_to_arrays() WITH numpy.searchsorted() OVER THE INTERVALS OF THE DATABASE ─────────────────
+##──── The IPv6 keys are pairs of 64 bits: the hi is searched in bulk, the few IP addresses whose hi is the hi of the start of an ──
+##──── interval need the lo in the same search and use find_ipv6(). Returns an int64 array of rows (or ROW_NOT_FOUND/ROW_INVALID) ─
+def _numpy_rows(np,db,families,ipv4,hi,lo):
+    asColumn = lambda values, dtype: values.astype(dtype,copy=False) if isinstance(values,np.ndarray) else np.frombuffer(values,dtype=dtype)
+    families = asColumn(families,np.uint8)
+    rows = np.where(families == 0,ROW_INVALID,ROW_NOT_FOUND).astype(np.int64)
+    positions = np.flatnonzero(families == 4)
+    if len(positions) > 0 and len(db.ipv4Start) > 0:
+        queries = asColumn(ipv4,np.uint32)
+        queries = queries if len(positions) == len(families) else queries[positions]
+        matches = np.searchsorted(asColumn(db.ipv4Start,np.uint32),queries,side='right').astype(np.int64)-1
+        safeMatches = np.maximum(matches,0)
+        found = (matches >= 0) & (queries <= asColumn(db.ipv4End,np.uint32)[safeMatches])
+        rows[positions[found]] = _numpy_column(np,db.ipv4Row)[safeMatches[found]]
+    positions = np.flatnonzero(families == 6)
+    if len(positions) > 0 and len(db.ipv6StartHi) > 0:
+        startHi = asColumn(db.ipv6StartHi,np.uint64)
+        queriesHi, queriesLo = asColumn(hi,np.uint64)[positions], asColumn(lo,np.uint64)[positions]
+        matches = np.searchsorted(startHi,queriesHi,side='right').astype(np.int64)-1
+        safeMatches = np.maximum(matches,0)
+        ##──── The interval found starts with a smaller hi, unless it has the same hi: then the lo decides, see find_ipv6() ────────────
+        sameHi = (matches >= 0) & (startHi[safeMatches] == queriesHi)
+        endHi, endLo = asColumn(db.ipv6EndHi,np.uint64)[safeMatches], asColumn(db.ipv6EndLo,np.uint64)[safeMatches]
+        found = (matches >= 0) & ~sameHi & ((endHi > queriesHi) | ((endHi == queriesHi) & (endLo >= queriesLo)))
+        rows[positions[found]] = _numpy_column(np,db.ipv6Row)[safeMatches[found]]
+        for pos in np.flatnonzero(sameHi).tolist():
+            rows[positions[pos]] = db.find_ipv6(int(queriesHi[pos]),int(queriesLo[pos]))
+    return rows
+
+##──── BINARY DATABASE FILE ──────────────────────────────────────────────────────────────────────────────────────────────────────
+##──── Layout: header (magic, version, number of sections), a directory of sections (name, typecode, offset, length) and the ──────
+##──── sections aligned at 8 bytes. All numbers are little-endian. The typecode 'J' is a json utf-8 section. ──────────────────────
+_binaryHeader = struct.Struct('<8sHHI')
+_binaryDirectoryEntry = struct.Struct('<15scQQ')
+
+def _write_binary_file(filename,columns:dict,strings:dict,rename=True):
+    """Writes a binary database file with the *columns* (dict of name: array.array or memoryview) and the json section
+    *strings*.
+    
+    The file is written with another name and renamed at the end, so processes with the old file memory-mapped 
+    keep reading the old content. With *rename* = False the file is left with the temporary name (filename.tmp),
+    to be renamed by the caller.
+    """
+    sections = [(name,column.typecode if isinstance(column,array) else column.format,column) for name,column in columns.items()]
+    sections.append(('strings','J',json.dumps(strings,ensure_ascii=False).encode('utf-8')))
+    offset = _binaryHeader.size + (_binaryDirectoryEntry.size * len(sections))
+    directory, payloads = [], []
+    for name, typecode, content in sections:
+        if isinstance(content,array) and sys.byteorder != 'little':
+            content = array(content.typecode,content)
+            content.byteswap()
+        content = content if isinstance(content,bytes) else content.tobytes()
+        offset += (-offset) % 8
+        directory.append(_binaryDirectoryEntry.pack(name.encode(),typecode.encode(),offset,len(content)))
+        payloads.append((offset,content))
+        offset += len(content)
+    tempFile = filename+".tmp"
+    with open(tempFile,'wb') as f:
+        f.write(_binaryHeader.pack(BINARY_FILE_MAGIC,DATABASE_VERSION,len(sections),0))
+        f.write(b''.join(directory))
+        for offset, content in payloads:
+            f.write(b'\x00'*(offset-f.tell()))
+            f.write(content)
+    if rename == True:
+        os.replace(tempFile,filename)
+
+def _read_binary_file(filename):
+    """Memory-maps a binary database file. Returns the mmap object, a dict of name: memoryview (or array.array 
+    in big-endian hosts) and the json section as a dict
+    """
+    with open(filename,'rb') as f:
+        mapped = mmap.mmap(f.fileno(),0,access=mmap.ACCESS_READ)
+    buffer = memoryview(mapped)
+    magic, version, totalSections, _ = _binaryHeader.unpack_from(buffer,0)
+    if magic != BINARY_FILE_MAGIC:
+        raise Exception(f"the file {filename} is not a Cloud IP Lookup binary database")
+    if version != DATABASE_VERSION:
+        raise Exception(f"the file {filename} has the version {version} and this library reads the version {DATABASE_VERSION}. Run an update (--update)")
+    columns, strings = {}, {}
+    for pos in range(totalSections):
+        name, typecode, offset, length = _binaryDirectoryEntry.unpack_from(buffer,_binaryHeader.size+(pos*_binaryDirectoryEntry.size))
+        name, typecode = name.rstrip(b'\x00').decode(), typecode.decode()
+        if typecode == 'J':
+            strings = json.loads(bytes(buffer[offset:offset+length]).decode('utf-8'))
+        elif sys.byteorder == 'little':
+            columns[name] = buffer[offset:offset+length].cast(typecode)
+        else:
+            columns[name] = array(typecode,bytes(buffer[offset:offset+length]))
+            columns[name].byteswap()
+    return mapped, columns, strings
+
+def _read_binary_strings(filename)->dict:
+    """Returns the json section of a binary database file (the string tables, databaseInfo and fingerprint) without
+    mapping the file, or an empty dict if it is not a binary database file of this version"""
+    with open(filename,'rb') as f:
+        magic, version, totalSections, _ = _binaryHeader.unpack(f.read(_binaryHeader.size))
+        if magic != BINARY_FILE_MAGIC or version != DATABASE_VERSION:
+            return {}
+        directory = f.read(_binaryDirectoryEntry.size*totalSections)
+        for pos in range(totalSections):
+            name, typecode, offset, length = _binaryDirectoryEntry.unpack_from(directory,pos*_binaryDirectoryEntry.size)
+            if typecode == b'J':
+                f.seek(offset)
+                return json.loads(f.read(length).decode('utf-8'))
+    return {}
+
+##──── FLATTEN A SORTED LIST OF NESTED NETWORKS IN DISJOINT INTERVALS OWNED BY THE MOST SPECIFIC NETWORK ─────────────────────────
+def _build_intervals(firstIP:list,lastIP:list,firstRow=0)->tuple:
+    """Returns the lists (start, end, row) of the disjoint intervals that cover the networks *firstIP*/*lastIP*. 
+    
+    The networks must be sorted by first IP and bigger networks first. CIDR networks are nested or disjoint, so a
+    stack of the networks that contain the current address is enough: each interval is owned by the network at the 
+    top of the stack, the most specific one. When the same network appears more than once, the last one wins.
+    """
+    start, end, rows = [], [], []
+    def add_interval(first_ip,last_ip,row):
+        if first_ip > last_ip:
+            return
+        if rows and rows[-1] == row and end[-1]+1 == first_ip:
+            end[-1] = last_ip
+        else:
+            start.append(first_ip), end.append(last_ip), rows.append(row)
+    stack, cursor = [], 0
+    for pos, (first_ip, last_ip) in enumerate(zip(firstIP,lastIP)):
+        while stack and lastIP[stack[-1]] < first_ip:
+            top = stack.pop()
+            add_interval(cursor,lastIP[top],firstRow+top)
+            cursor = lastIP[top]+1
+        if stack:
+            add_interval(cursor,first_ip-1,firstRow+stack[-1])
+        cursor = first_ip
+        stack.append(pos)
+    while stack:
+        top = stack.pop()
+        add_interval(cursor,lastIP[top],firstRow+top)
+        cursor = lastIP[top]+1
+    return start, end, rows
+
+##──── BUILD THE COLUMNS OF THE DATABASE. IPv4 AND IPv6 NETWORKS HAVE SEPARATE INDEXES ──────────────────────────────────────────
+def _build_database_columns(networksIPv4:list,networksIPv6:list)->dict:
+    """Builds the columns of the database from the lists of networks of each family, sorted by first IP and bigger 
+    networks first. Each network is a tuple (first_ip, netlength, provider, service, region, features) with the codes 
+    already encoded. See _build_columns()."""
+    networks = networksIPv4 + networksIPv6
+    return _build_columns([network[0] for network in networksIPv4],[network[0] for network in networksIPv6],
+                          [network[1] for network in networks],[network[2] for network in networks],[network[3] for network in networks],
+                          [network[4] for network in networks],[network[5] for network in networks])
+
+def _build_columns(ipv4First,ipv6First,netlength,provider,services,regions,features)->dict:
+    """Builds the columns of the database from the columns of the networks, sorted by first IP and bigger networks first:
+    the first IP of the IPv4 networks and of the IPv6 networks (128 bits integers), then the netlength and the encoded
+    provider, service, region and features of all networks, the IPv4 networks first. Any sequence of integers is
+    accepted (lists or arrays).
+
+    The networks are stored in rows, the IPv4 networks first and then the IPv6 networks, so the row of an IPv6 network
+    is the number of IPv4 networks + its position. The lookups use a table of disjoint intervals of each family
+    (ipv4.start/end/row and ipv6.start/end/row) where each interval is owned by the most specific network, so a 
+    single binary search finds the right network even for nested networks. IPv4 columns have 32 bits and IPv6 
+    columns are pairs of 64 bits (hi and lo).
+    """
+    totalIPv4 = len(ipv4First)
+    ##──── The first IP is aligned to the netlength, some providers publish the CIDR with host bits ───────────────────────────────────
+    ipv4FirstIP = [first_ip & ~(numIPsv4[netlen]-1) for first_ip, netlen in zip(ipv4First,netlength)]
+    ipv4LastIP = [first_ip + numIPsv4[netlen] - 1 for first_ip, netlen in zip(ipv4FirstIP,netlength)]
+    ipv6FirstIP = [first_ip & ~(numIPsv6[netlen]-1) for first_ip, netlen in zip(ipv6First,islice(netlength,totalIPv4,None))]
+    ipv6LastIP = [first_ip + numIPsv6[netlen] - 1 for first_ip, netlen in zip(ipv6FirstIP,islice(netlength,totalIPv4,None))]
+    ipv4Start, ipv4End, ipv4Row = _build_intervals(ipv4FirstIP,ipv4LastIP,0)
+    ipv6Start, ipv6End, ipv6Row = _build_intervals(ipv6FirstIP,ipv6LastIP,totalIPv4)
+    hi = lambda values: array('Q',[iplong >> 64 for iplong in values])
+    lo = lambda values: array('Q',[iplong & 0xFFFFFFFFFFFFFFFF for iplong in values])
+    ipv6FirstHi, ipv6LastHi = hi(ipv6FirstIP), hi(ipv6LastIP)
+    totalRows = len(netlength)
+    return {'ipv4.first': array('I',ipv4FirstIP),
+            'ipv4.last': array('I',ipv4LastIP),
+            'ipv6.first.hi': ipv6FirstHi,
+            'ipv6.first.lo': lo(ipv6FirstIP),
+            'ipv6.last.hi': ipv6LastHi,
+            'ipv6.last.lo': lo(ipv6LastIP),
+            'netlength': array('B',netlength),
+            'provider': _code_array(provider),
+            'services': _code_array(services),
+            'regions': _code_array(regions),
+            'features': _code_array(features),
+            'ipv4.start': array('I',ipv4Start),
+            'ipv4.end': array('I',ipv4End),
+            'ipv4.row': _row_array(ipv4Row,totalRows),
+            'ipv6.start.hi': hi(ipv6Start),
+            'ipv6.start.lo': lo(ipv6Start),
+            'ipv6.end.hi': hi(ipv6End),
+            'ipv6.end.lo': lo(ipv6End),
+            'ipv6.row': _row_array(ipv6Row,totalRows),
+            **_build_inverted_indexes(provider,services,regions),
+            **_build_prefilter(ipv4FirstIP,ipv4LastIP,ipv6FirstHi,ipv6LastHi)}
+
+##──── THE CODE COLUMNS HAVE 1 BYTE PER ROW WHILE ALL CODES FIT IN IT, 2 BYTES OTHERWISE ──────────────────────────────────────────────
+def _code_array(codes)->array:
+    return array('B' if max(codes,default=0) <= 0xFF else 'H',codes)
+
+##──── THE COLUMNS OF ROWS HAVE 2 BYTES PER ITEM WHILE THE DATABASE HAS UP TO 65536 ROWS, 4 BYTES OTHERWISE ───────────────────────────
+def _row_array(rows,totalRows:int)->array:
+    return array('H' if totalRows <= 0x10000 else 'I',rows)
+
+##──── THE FILES CREATED BEFORE THE NARROW COLUMNS HAVE 2 BYTES PER CODE AND 4 BYTES PER ROW, THEY ARE NARROWED AT LOAD TIME ──────
+def _narrow_columns(columns:dict,strings:dict)->dict:
+    ##──── The biggest code of a column is the size of its string table, the columns are not scanned ─────────────────────────────────
+    maxCode = {'provider':len(strings['indexProvider']),'services':len(strings['indexServices']),
+               'regions':len(strings['indexRegions']),'features':len(strings['indexNetworkFeatures'])}
+    totalRows = len(columns['netlength'])
+    for name, column in columns.items():
+        if name in maxCode:
+            typecode = 'B' if maxCode[name] <= 0xFF else 'H'
+        elif name.endswith('.row'):
+            typecode = 'H' if totalRows <= 0x10000 else 'I'
+        else:
+            continue
+        if array(typecode).itemsize < column.itemsize:
+            columns[name] = _narrow_array(column,typecode)
+    return columns
+
+##──── Keeps the low bytes of each item with slices of the bytes, all values fit in *typecode*. Faster than array(typecode,column) ───
+def _narrow_array(column,typecode)->array:
+    narrow = array(typecode)
+    size, ratio = narrow.itemsize, column.itemsize//narrow.itemsize
+    data, out = column.tobytes(), bytearray(len(column)*size)
+    offset = 0 if sys.byteorder == 'little' else (ratio-1)*size
+    for pos in range(size):
+        out[pos::size] = data[offset+pos::size*ratio]
+    narrow.frombytes(out)
+    return narrow
+
+##──── INVERTED INDEXES OF THE CODE COLUMNS: THE ROWS OF EACH CODE, SORTED. CODE c HAS THE ROWS rows[offsets[c]:offsets[c+1]] ──────
+def _build_inverted_index(codes)->tuple:
+    counts = [0]*(max(codes,default=0)+2)
+    for code in codes:
+        counts[code+1] += 1
+    ##──── sorted() is stable, the rows of each code keep their order ──────────────────────────────────────────────────────────────────
+    return array('I',accumulate(counts)), _row_array(sorted(range(len(codes)),key=codes.__getitem__),len(codes))
+
+def _build_inverted_indexes(provider,services,regions)->dict:
+    indexes = {}
+    for name, codes in (('provider',provider),('services',services),('regions',regions)):
+        indexes[f'ix.{name}.off'], indexes[f'ix.{name}.row'] = _build_inverted_index(codes)
+    return indexes
+
+##──── NEGATIVE PREFILTER: A BITMAP OF THE IPv4 PREFIXES AND A SET OF THE IPv6 PREFIXES THAT HAVE AT LEAST ONE NETWORK ─────────────
+def _build_prefilter(ipv4First,ipv4Last,ipv6FirstHi,ipv6LastHi,ipv4_bits=PREFILTER_IPV4_BITS,ipv6_bits=PREFILTER_IPV6_BITS)->dict:
+    """Returns the columns pf.ipv4 (one bit per IPv4 prefix of *ipv4_bits*, bit prefix&7 of the byte prefix>>3), pf.ipv6
+    (the sorted IPv6 prefixes of *ipv6_bits*) and pf.ipv6.bits (*ipv6_bits*, or 0 if the IPv6 prefilter was not created
+    because a network covers more than PREFILTER_IPV6_MAX_PREFIXES prefixes)"""
+    bitmap, shift = bytearray(1 << (ipv4_bits-3)), 32-ipv4_bits
+    for first, last in zip(ipv4First,ipv4Last):
+        firstPrefix, lastPrefix = first >> shift, last >> shift
+        ##──── the bits of the first and last bytes one by one, the bytes in the middle at once ─────────────────────────────────────────
+        while firstPrefix <= lastPrefix and (firstPrefix & 7 or lastPrefix-firstPrefix < 8):
+            bitmap[firstPrefix >> 3] |= 1 << (firstPrefix & 7)
+            firstPrefix += 1
+        while firstPrefix <= lastPrefix and lastPrefix & 7 != 7:
+            bitmap[lastPrefix >> 3] |= 1 << (lastPrefix & 7)
+            lastPrefix -= 1
+        if firstPrefix <= lastPrefix:
+            bitmap[firstPrefix >> 3:(lastPrefix >> 3)+1] = b'\xff'*((lastPrefix >> 3)-(firstPrefix >> 3)+1)
+    prefixes, shift = set(), 64-ipv6_bits
+    for firstHi, lastHi in zip(ipv6FirstHi,ipv6LastHi):
+        if (lastHi >> shift)-(firstHi >> shift) >= PREFILTER_IPV6_MAX_PREFIXES:
+            prefixes, ipv6_bits = set(), 0
+            break
+        prefixes.update(range(firstHi >> shift,(lastHi >> shift)+1))
+    return {'pf.ipv4':array('B',bitmap),'pf.ipv6':array('Q',sorted(prefixes)),'pf.ipv6.bits':array('B',[ipv6_bits])}
+
+##──── CONVERTS THE DATABASE FILE OF VERSIONS 1.0.x (A LIST OF 12 ITEMS WITH IPv4 AND IPv6 MIXED IN THE SAME LISTS) ───────────────
+def _legacy_database(data:list)->tuple:
+    indexMain, indexProvider, indexServices, indexRegions, indexNetworkFeatures, \
+        listFirstIP, listNetLength, listProvider, listServices, listRegions, listFeatures, databaseInfo = data
+    flat = lambda chunks: [item for chunk in chunks for item in chunk]
+    networks = list(zip(flat(listFirstIP),flat(listNetLength),flat(listProvider),flat(listServices),flat(listRegions),flat(listFeatures)))
+    columns = _build_database_columns([network for network in networks if network[0] <= 4294967295],
+                                      [network for network in networks if network[0] > 4294967295])
+    strings = {'indexProvider':indexProvider,'indexServices':indexServices,'indexRegions':indexRegions,
+               'indexNetworkFeatures':indexNetworkFeatures,'databaseInfo':databaseInfo}
+    return columns, strings
+
 ##──── GET MEMORY USAGE ───────────────────────────────────────────────────────────────────────────────────────────────────────
 PROCESS_QUERY_INFORMATION = 0x0400
 PROCESS_VM_READ = 0x0010
 
-class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
-    _fields_ = [("cb", ctypes.c_ulong),
-                ("PageFaultCount", ctypes.c_ulong),
-                ("PeakWorkingSetSize", ctypes.c_size_t),
-                ("WorkingSetSize", ctypes.c_size_t),
-                ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
-                ("QuotaPagedPoolUsage", ctypes.c_size_t),
-                ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
-                ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
-                ("PagefileUsage", ctypes.c_size_t),
-                ("PeakPagefileUsage", ctypes.c_size_t)]
+##──── The Windows struct is created on the first call without /proc, ctypes is not imported on Linux ──────────────────────────
+_process_memory_counters = None
+def _get_process_memory_counters():
+    global _process_memory_counters
+    if _process_memory_counters is None:
+        import ctypes
+        class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+            _fields_ = [("cb", ctypes.c_ulong),
+                        ("PageFaultCount", ctypes.c_ulong),
+                        ("PeakWorkingSetSize", ctypes.c_size_t),
+                        ("WorkingSetSize", ctypes.c_size_t),
+                        ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+                        ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                        ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                        ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                        ("PagefileUsage", ctypes.c_size_t),
+                        ("PeakPagefileUsage", ctypes.c_size_t)]
+        _process_memory_counters = PROCESS_MEMORY_COUNTERS
+    return _process_memory_counters
 
 def get_mem_usage()->float:
     ''' Memory usage in MiB '''
@@ -197,6 +644,8 @@ def get_mem_usage()->float:
         return float(memory_usage.strip()) / 1024
     except:
         try:
+            import ctypes
+            PROCESS_MEMORY_COUNTERS = _get_process_memory_counters()
             pid = ctypes.windll.kernel32.GetCurrentProcessId()
             process_handle = ctypes.windll.kernel32.OpenProcess(PROCESS_QUERY_INFORMATION | PROCESS_VM_READ, False, pid)
             counters = PROCESS_MEMORY_COUNTERS()
@@ -221,16 +670,53 @@ def get_mem_usage()->float:
 ##──── CLASS FOR DETAILS OF LOOKUP ───────────────────────────────────────────────────────────────────────────────────────────────        
 class CloudIPDetail(object):
     """Object to store the information obtained by searching an IP address
-    """    
+
+    The *cidr* and *elapsed_time* properties are computed only when they are read. The lookup() method stores the
+    database row and the elapsed seconds as a float, the string formatting only happens if the caller uses them.
+    """
+    __slots__ = ('ip','region','cloud_provider','service','_cidr','_elapsed_time','_db','_row')
     def __init__(self, ip, cidr="", region="", cloud_provider="", service="", elapsed_time=""):
         self.ip = ip
-        self.cidr = cidr
         self.region = region
         self.cloud_provider = cloud_provider
         self.service = service
-        self.elapsed_time = elapsed_time
+        self._cidr = cidr
+        self._elapsed_time = elapsed_time
+        self._db = None
+        self._row = ROW_NOT_FOUND
+    @classmethod
+    def from_row(cls,ip,database,row:int,elapsed_time="")->'CloudIPDetail':
+        """Creates a CloudIPDetail of a database row (a value returned by CloudIPLookup.lookup_code()) without
+        building the cidr string. The *elapsed_time* can be a float (seconds) or a string.
+        """
+        detail = cls.__new__(cls)
+        detail.ip = ip
+        detail.region = database.indexRegions[database.regions[row]-1]
+        detail.service = database.indexServices[database.services[row]-1]
+        detail.cloud_provider = database.indexProvider[database.provider[row]-1]
+        detail._cidr = None
+        detail._elapsed_time = elapsed_time
+        detail._db = database
+        detail._row = row
+        return detail
+    @property
+    def cidr(self)->str:
+        if self._cidr is None:
+            self._cidr = self._db.cidr(self._row)
+        return self._cidr
+    @cidr.setter
+    def cidr(self,value):
+        self._cidr = value
+    @property
+    def elapsed_time(self)->str:
+        if isinstance(self._elapsed_time,float):
+            self._elapsed_time = '%.9f sec'%(self._elapsed_time)
+        return self._elapsed_time
+    @elapsed_time.setter
+    def elapsed_time(self,value):
+        self._elapsed_time = value
     def __str__(self):
-        return f"{self.__dict__}"
+        return f"{self.to_dict()}"
     def __repr__(self):
         return f"{self.to_dict()}"    
     def to_dict(self):
@@ -274,699 +760,1556 @@ class CloudIPDetail(object):
         """ Print output in CSV format
         """
         try:
-            return f"{self.to_dict()['ip']},{self.to_dict()['cidr']},{self.to_dict()['region']},{self.to_dict()['cloud_provider']},{self.to_dict()['service']},{self.to_dict()['elapsed_time'].split(' ')[0]}"
+            return f"{self.ip},{self.cidr},{self.region},{self.cloud_provider},{self.service},{self.elapsed_time.split(' ')[0]}"
         except Exception as ERR:
             raise Exception("Failed pp_csv() %a"%(str(ERR)))
             
         
+##──── FORMATS THE FIELDS OF A DATABASE ROW FOR CloudIPLookup.lookup_stream(), EVERYTHING AFTER THE IP ADDRESS ───────────────────
+def _stream_row_tail(database,row:int,output_format:str)->str:
+    if row == ROW_INVALID:
+        values = ["","","<invalid ip address>",""]
+    elif row < 0:
+        values = ["","","<not found in database>",""]
+    else:
+        values = [database.cidr(row),database.indexRegions[database.regions[row]-1],
+                  database.indexProvider[database.provider[row]-1],database.indexServices[database.services[row]-1]]
+    if output_format == 'jsonl':
+        return ", "+json.dumps(dict(zip(("cidr","region","cloud_provider","service"),values)),ensure_ascii=False)[1:]+"\n"
+    delimiter = "\t" if output_format == 'tsv' else ","
+    return "".join(delimiter+_stream_quote(value,delimiter) for value in values)+"\n"
+
+##──── THE C FUNCTION USED BY json.dumps() TO ENCODE A STRING, WITHOUT THE OVERHEAD OF json.dumps() FOR EACH IP ADDRESS ────────────
+_json_string = json.encoder.encode_basestring
+
+##──── QUOTES A CSV/TSV VALUE ONLY IF NEEDED (ex: the Oracle services "OSN, OBJECT_STORAGE") ──────────────────────────────────────
+def _stream_quote(value:str,delimiter:str)->str:
+    if delimiter in value or '"' in value or "\n" in value or "\r" in value:
+        return '"'+value.replace('"','""')+'"'
+    return value
+
+##──── ACCESS LOG ANNOTATION OF CloudIPLookup.annotate_log(). THE STATE OF THE WORKERS IS A MODULE GLOBAL: THE FORKED WORKERS ──────
+##──── INHERIT THE DATABASE ALREADY LOADED BY THE PARENT, THE SPAWNED WORKERS (Windows/macOS) MAP THE cloudiplookup.dat.bin FILE ──
+_logWorker = None   # (iplookup, compiled pattern, group of the IP address, separator)
+
+def _log_compile_pattern(pattern:str)->tuple:
+    regex = re.compile(LOG_PATTERNS.get(pattern,pattern))
+    group = 'ip' if 'ip' in regex.groupindex else (1 if regex.groups > 0 else 0)
+    return regex, group
+
+def _log_worker_init(data_dir,pattern,separator):
+    global _logWorker, DATA_DIR
+    if _logWorker is None:
+        DATA_DIR = data_dir
+        _logWorker = (CloudIPLookup(use_mmap=os.path.isfile(os.path.join(data_dir,BINARY_FILE_NAME))),)+_log_compile_pattern(pattern)+(separator,)
+
+def _log_worker_chunk(lines:list)->tuple:
+    return _log_annotate_lines(_logWorker,lines)
+
+def _log_annotate_lines(state,lines:list)->tuple:
+    """Annotates a chunk of lines. Returns (pid, annotated text, number of lines, seconds spent)"""
+    startTime = perf_counter()
+    iplookup, regex, group, separator = state
+    db, search, lookup_code = iplookup._db, regex.search, iplookup.lookup_code
+    ##──── The columns added are the same for all IPs of a network, they are formatted once per row ────────────────────────────────
+    missing = separator+"-"+separator+"-"+separator+"-\n"
+    tails = {ROW_NOT_FOUND:missing,ROW_INVALID:missing}
+    out = []
+    for line in lines:
+        match = search(line)
+        row = lookup_code(match.group(group)) if match is not None else ROW_INVALID
+        tail = tails.get(row)
+        if tail is None:
+            tail = tails[row] = separator+separator.join(value or "-" for value in (db.indexProvider[db.provider[row]-1],
+                                db.indexServices[db.services[row]-1],db.indexRegions[db.regions[row]-1]))+"\n"
+        out.append(line.rstrip("\r\n")+tail)
+    return os.getpid(), "".join(out), len(lines), perf_counter()-startTime
+
+##──── CLASS FOR COLUMNAR RESULTS OF lookup_many() ──────────────────────────────────────────────────────────────────────────────
+class CloudIPBatchResult(object):
+    """Object to store the information obtained by searching a list of IP addresses, in columns.
+
+    The columns *provider*, *service*, *region* and *features* have one code per IP address that can be decoded with
+    the lists *indexProvider*, *indexServices*, *indexRegions* and *indexNetworkFeatures* (ex: indexProvider[code-1]).
+    The code 0 means that the IP address was not found or is invalid. The column *rows* has the row of the network
+    in the database, or ROW_NOT_FOUND (-1) / ROW_INVALID (-2).
+
+    The columns are numpy arrays if numpy was used or array.array objects otherwise.
+    """
+    def __init__(self, ips, rows, provider, service, region, features, database):
+        self.ips = ips
+        self.rows = rows
+        self.provider = provider
+        self.service = service
+        self.region = region
+        self.features = features
+        self.indexProvider = database.indexProvider
+        self.indexServices = database.indexServices
+        self.indexRegions = database.indexRegions
+        self.indexNetworkFeatures = database.indexNetworkFeatures
+        self._db = database
+    def __len__(self):
+        return len(self.ips)
+    def __iter__(self):
+        for pos in range(len(self.ips)):
+            yield self[pos]
+    def __getitem__(self,pos)->CloudIPDetail:
+        row = int(self.rows[pos])
+        if row == ROW_INVALID:
+            return CloudIPDetail(ip=self.ips[pos],cloud_provider="<invalid ip address>")
+        if row == ROW_NOT_FOUND:
+            return CloudIPDetail(ip=self.ips[pos],cloud_provider="<not found in database>")
+        return CloudIPDetail.from_row(self.ips[pos],self._db,row)
+    def __repr__(self):
+        return f"<CloudIPBatchResult with {len(self)} IP addresses>"
+    def cidr(self,pos)->str:
+        """Returns the CIDR of the network found for the IP address at position *pos*, or an empty string"""
+        row = int(self.rows[pos])
+        return self._db.cidr(row) if row >= 0 else ""
+    def to_dict(self)->dict:
+        """To use the result as a dict of decoded columns (lists of strings)
+
+        Returns:
+            dict: a dictionary with the columns ip, cidr, region, cloud_provider and service
+        """
+        decode = lambda index, codes: [index[code-1] if code > 0 else "" for code in codes.tolist()]
+        return {"ip": list(self.ips),
+                "cidr": [self.cidr(pos) for pos in range(len(self.ips))],
+                "region": decode(self.indexRegions,self.region),
+                "cloud_provider": decode(self.indexProvider,self.provider),
+                "service": decode(self.indexServices,self.service)}
+
+##──── CLASS FOR THE RESULTS OF lookup_range() ─────────────────────────────────────────────────────────────────────────────────
+class CloudIPRangeResult(object):
+    """Lazy result of lookup_range(). Iterate it to get the networks that overlap the range, sorted by first IP, as
+    CloudIPDetail objects (the *ip* is the range searched). The networks are searched while iterating.
+
+    The totals of the networks returned so far are in *networks*, *providers* ({provider: networks}) and *services*
+    ({provider: {service: networks}}). Use totals() to count all networks without creating the CloudIPDetail objects.
+    """
+    def __init__(self, query, first, last, ipv6, database):
+        self.query = query
+        self.first = first
+        self.last = last
+        self.ipv6 = ipv6
+        self.networks = 0
+        self.providers = {}
+        self.services = {}
+        self._db = database
+        self._rows = database.rows_in_range(first,last,ipv6)
+    def __repr__(self):
+        return f"<CloudIPRangeResult of {self.query} with {self.networks} networks so far>"
+    def __iter__(self):
+        return self
+    def __next__(self)->CloudIPDetail:
+        row = next(self._rows)
+        self._count(row)
+        return CloudIPDetail.from_row(self.query,self._db,row)
+    def _count(self,row:int):
+        db = self._db
+        provider, service = db.indexProvider[db.provider[row]-1], db.indexServices[db.services[row]-1]
+        self.networks += 1
+        self.providers[provider] = self.providers.get(provider,0) + 1
+        services = self.services.setdefault(provider,{})
+        services[service] = services.get(service,0) + 1
+    def totals(self)->dict:
+        """Counts the networks not iterated yet and returns the totals of all networks that overlap the range"""
+        for row in self._rows:
+            self._count(row)
+        return {'networks':self.networks,'providers':self.providers,'services':self.services}
+
+##──── CLASS FOR THE RESULT CACHE OF lookup() ───────────────────────────────────────────────────────────────────────────────────
+class CloudIPLRUCache(object):
+    """A size-bounded LRU (least recently used) cache, safe to be used by many threads.
+
+    The keys are normalized IP addresses (an integer for IPv4 and a (hi,lo) tuple for IPv6) so different writings
+    of the same IPv6 address share the same entry. When the cache is full, the least recently used entry is evicted.
+    """
+    def __init__(self, capacity:int):
+        if capacity <= 0:
+            raise ValueError("The cache capacity must be greater than 0")
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+    def __len__(self):
+        return len(self._data)
+    def get(self,key):
+        """Returns the value of *key* or None, and counts a hit or a miss"""
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+    def put(self,key,value):
+        """Stores *value* as the most recently used entry, evicting the least recently used one if the cache is full"""
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if len(self._data) > self.capacity:
+                self._data.popitem(last=False)
+                self.evictions += 1
+    def clear(self):
+        """Removes all entries. The counters are kept."""
+        with self._lock:
+            self._data.clear()
+    def info(self)->dict:
+        """Returns a dict with the counters (hits, misses, evictions), the current size and the capacity"""
+        with self._lock:
+            return {"hits":self.hits,"misses":self.misses,"evictions":self.evictions,"size":len(self._data),"capacity":self.capacity}
+
+##──── CLASS FOR THE LOOKUP COUNTERS OF CloudIPLookup(stats=True) ────────────────────────────────────────────────────────────
+class CloudIPLookupStats(object):
+    """Counters of the lookup() calls: hits, misses, invalid IP addresses and internal errors, the hits of each provider
+    and service and a histogram of the latency with fixed *buckets* (upper bounds in seconds, a value equal to a bound
+    is counted in that bucket, like the Prometheus "le" label). The latency is the elapsed_time of each result. The
+    misses are split in the IP addresses rejected by the negative prefilter of the database and the ones searched in
+    the index (see CloudIPLookup.prefilter_info()).
+
+    The counters are not locked, under many threads they are approximate.
+    """
+    def __init__(self, buckets=STATS_LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.reset()
+    def reset(self):
+        """Sets all counters to zero"""
+        self.hits = self.misses = self.invalid = self.errors = 0
+        self.prefilter_rejected = self.prefilter_missed = 0
+        self.networks = {}   # {(provider,service): hits}
+        self.histogram = [0]*(len(self.buckets)+1)   # the last one is +Inf
+        self.latency_sum = 0.0
+    def record(self,result:'CloudIPDetail',db=None):
+        """Counts a result of lookup(). A miss is tested with the prefilter of the snapshot *db* that answered it"""
+        provider = result.cloud_provider
+        if provider[:1] != "<":
+            self.hits += 1
+            key = (provider,result.service)
+            self.networks[key] = self.networks.get(key,0) + 1
+        elif provider == "<not found in database>":
+            self.misses += 1
+            if db is not None and db.prefilter == True and not db.prefilter_passes(parse_ip(result.ip)):
+                self.prefilter_rejected += 1
+            else:
+                self.prefilter_missed += 1
+        elif provider == "<invalid ip address>":
+            self.invalid += 1
+        else:
+            self.errors += 1
+        elapsed = result._elapsed_time
+        if elapsed.__class__ is float:
+            self.histogram[bisect_left(self.buckets,elapsed)] += 1
+            self.latency_sum += elapsed
+    def info(self)->dict:
+        """Returns the counters in a dict, the histogram is cumulative"""
+        providers, services = {}, {}
+        for (provider,service),count in list(self.networks.items()):
+            providers[provider] = providers.get(provider,0) + count
+            services.setdefault(provider,{})[service] = count
+        return {'lookups':self.hits+self.misses+self.invalid+self.errors,'hits':self.hits,'misses':self.misses,
+                'invalid':self.invalid,'errors':self.errors,'providers':providers,'services':services,
+                'prefilter':{'rejected':self.prefilter_rejected,'passed_missed':self.prefilter_missed},
+                'latency':{'buckets':{**{str(bound):count for bound,count in zip(self.buckets,accumulate(self.histogram))},'+Inf':sum(self.histogram)},
+                           'sum':self.latency_sum,'count':sum(self.histogram)}}
+
+##──── CLASS FOR THE MULTIBIT TRIE OF CloudIPLookup(engine='trie') ─────────────────────────────────────────────────────────────
+class CloudIPStrideTable(object):
+    """Multibit trie (stride tables) over the disjoint intervals of one address family of the database.
+
+    Each level consumes *strides[level]* bits of the key and has chunks of 2**bits entries. An entry is a row of the
+    database, ROW_NOT_FOUND, or (values <= -2) a pointer -2-n to the chunk n of the next level when the slot is only
+    partially covered by the intervals. A search is a fixed number of array indexings, one per level, ex: (20,6,6)
+    for IPv4 or (24,8) for a DIR-24-8 table (64 MiB). When the strides don't cover the whole key, the partially
+    covered slots of the last level point to the slice of the intervals that intersect them and are finished with
+    *find_slice(key,lo,first,last)*, a binary search in a few intervals. Wider strides use more memory and fewer levels.
+
+    *starts*/*ends* are the intervals as integers of *width* bits (32 for IPv4, 128 for IPv6), the search key has
+    *key_width* bits (32 for IPv4, the hi 64 bits for IPv6).
+    """
+    def __init__(self, starts, ends, rows, width, key_width, strides, find_slice):
+        self.strides = self.check_strides(strides,key_width)
+        self.tables = [array('i') for _ in self.strides]
+        self.sliceFirst, self.sliceLast = array('I'), array('I')
+        self._width = width
+        self._find_slice = find_slice
+        if len(starts) > 0:
+            self._build_chunk(0,0,0,len(starts),starts,ends,rows)
+        else:
+            self.tables[0].extend(array('i',[ROW_NOT_FOUND])*(1 << self.strides[0]))
+        self.find = self._make_find(key_width)
+    @staticmethod
+    def check_strides(strides,key_width:int)->tuple:
+        """Returns the *strides* as a tuple of int. Raises ValueError if a level is out of 1..24 bits or the sum is more than *key_width*"""
+        strides = tuple(int(bits) for bits in strides)
+        if not strides or min(strides) < 1 or max(strides) > 24 or sum(strides) > key_width:
+            raise ValueError(f"invalid strides {strides}: each level needs from 1 to 24 bits and the sum can't be more than {key_width} bits")
+        return strides
+    def _build_chunk(self,level,base,first,last,starts,ends,rows)->int:
+        """Creates the chunk of *level* for the slot that starts at *base* with the intervals [first:last) and returns its number"""
+        bits, table = self.strides[level], self.tables[level]
+        slotShift = self._width-sum(self.strides[:level+1])
+        offset, chunkLast = len(table), base+(1 << (slotShift+bits))-1
+        table.extend(array('i',[ROW_NOT_FOUND])*(1 << bits))
+        partial = {}
+        for pos in range(first,last):
+            start, end = max(starts[pos],base), min(ends[pos],chunkLast)
+            firstSlot, lastSlot = (start-base) >> slotShift, (end-base) >> slotShift
+            fullFirst = firstSlot if start == base+(firstSlot << slotShift) else firstSlot+1
+            fullLast = lastSlot if end == base+((lastSlot+1) << slotShift)-1 else lastSlot-1
+            if fullFirst <= fullLast:
+                table[offset+fullFirst:offset+fullLast+1] = array('i',[rows[pos]])*(fullLast-fullFirst+1)
+            ##──── the slots at the ends of the interval that it covers only in part: [first interval, last interval] of each slot ─────
+            for slot in (firstSlot,lastSlot):
+                if slot < fullFirst or slot > fullLast:
+                    partial.setdefault(slot,[pos,pos])[1] = pos
+        for slot,(firstPos,lastPos) in partial.items():
+            if level+1 < len(self.strides):
+                table[offset+slot] = -2-self._build_chunk(level+1,base+(slot << slotShift),firstPos,lastPos+1,starts,ends,rows)
+            else:
+                table[offset+slot] = -2-len(self.sliceFirst)
+                self.sliceFirst.append(firstPos)
+                self.sliceLast.append(lastPos+1)
+        return offset >> bits
+    def _make_find(self,key_width):
+        """Returns find(key,lo=0), the row of the interval that contains *key* (and *lo*, the low 64 bits of an IPv6
+        address) or ROW_NOT_FOUND. The levels are unrolled for up to 3 levels, an entry < -1 (ROW_NOT_FOUND) is a pointer"""
+        root, rootShift = self.tables[0], key_width-self.strides[0]
+        levels, totalBits = [], self.strides[0]
+        for table,bits in zip(self.tables[1:],self.strides[1:]):
+            totalBits += bits
+            levels.append((table,key_width-totalBits,bits,(1 << bits)-1))
+        find_slice, sliceFirst, sliceLast = self._find_slice, self.sliceFirst, self.sliceLast
+        if len(levels) == 0:
+            def find(key,lo=0):
+                entry = root[key >> rootShift]
+                if entry < -1:
+                    return find_slice(key,lo,sliceFirst[-2-entry],sliceLast[-2-entry])
+                return entry
+        elif len(levels) == 1:
+            (table1,shift1,bits1,mask1), = levels
+            def find(key,lo=0):
+                entry = root[key >> rootShift]
+                if entry < -1:
+                    entry = table1[((-2-entry) << bits1) | ((key >> shift1) & mask1)]
+                    if entry < -1:
+                        return find_slice(key,lo,sliceFirst[-2-entry],sliceLast[-2-entry])
+                return entry
+        elif len(levels) == 2:
+            (table1,shift1,bits1,mask1), (table2,shift2,bits2,mask2) = levels
+            def find(key,lo=0):
+                entry = root[key >> rootShift]
+                if entry < -1:
+                    entry = table1[((-2-entry) << bits1) | ((key >> shift1) & mask1)]
+                    if entry < -1:
+                        entry = table2[((-2-entry) << bits2) | ((key >> shift2) & mask2)]
+                        if entry < -1:
+                            return find_slice(key,lo,sliceFirst[-2-entry],sliceLast[-2-entry])
+                return entry
+        else:
+            def find(key,lo=0):
+                entry = root[key >> rootShift]
+                for table,shift,bits,mask in levels:
+                    if entry >= -1:
+                        return entry
+                    entry = table[((-2-entry) << bits) | ((key >> shift) & mask)]
+                if entry < -1:
+                    return find_slice(key,lo,sliceFirst[-2-entry],sliceLast[-2-entry])
+                return entry
+        return find
+    def memory_usage(self)->dict:
+        """Returns the bytes of each level and of the slices"""
+        memory = {f"level{level}":len(table)*table.itemsize for level,table in enumerate(self.tables)}
+        memory['slices'] = (len(self.sliceFirst)+len(self.sliceLast))*self.sliceFirst.itemsize
+        return memory
+
+##──── CLASS FOR THE TABLES OF THE DATABASE ──────────────────────────────────────────────────────────────────────────────────────
+_FINGERPRINT_LOCK = threading.Lock()
+
+class CloudIPDatabase(object):
+    """Tables of the database loaded from the cloudiplookup.dat.gz file
+
+    IPv4 and IPv6 networks have separate indexes with fixed width keys: 32 bits for IPv4 and a pair of 64 bits
+    (hi and lo) for IPv6, so an IPv4 search never compares 128 bits integers. The rows of the IPv4 networks come
+    first, the row of an IPv6 network is totalIPv4 + its position in the IPv6 network columns.
+
+    The indexes are tables of disjoint intervals, each one owned by the row of the most specific network that
+    covers it. Nested networks (ex: AWS AMAZON and EC2) are resolved with a single binary search.
+
+    A CloudIPDatabase is an immutable snapshot: its attributes can't be changed after it is created. CloudIPLookup
+    reloads the database by creating a new snapshot and replacing the old one, so it can be read by many threads.
+    The snapshot keeps its own copies of the *columns* and *strings* dicts, the derived columns are never added to
+    the dicts of the caller.
+
+    With *trie* = (ipv4 strides, ipv6 strides), find_ipv4() and find_ipv6() search CloudIPStrideTable objects built
+    from the intervals instead of the binary search over the intervals. The IPv6 strides can be None to keep the
+    binary search for IPv6.
+
+    With *prefilter* = True, find_ipv4() and find_ipv6() first test the negative prefilter (a bit per IPv4 /16 and
+    the set of IPv6 /32 prefixes that have networks) and return ROW_NOT_FOUND without searching the index when the
+    prefix has no network. prefilter_passes() tests the prefilter of an IP address.
+    """
+    def __init__(self, columns:dict, strings:dict, filename="", trie=None, prefilter=False):
+        self.filename = filename
+        columns, strings = dict(columns), dict(strings)
+        self.columns, self.strings = columns, strings
+        self.ipv4FirstIP = columns['ipv4.first']
+        self.ipv4LastIP = columns['ipv4.last']
+        self.ipv6FirstHi, self.ipv6FirstLo = columns['ipv6.first.hi'], columns['ipv6.first.lo']
+        self.ipv6LastHi, self.ipv6LastLo = columns['ipv6.last.hi'], columns['ipv6.last.lo']
+        self.totalIPv4 = len(self.ipv4FirstIP)
+        self.ipv4Start, self.ipv4End, self.ipv4Row = columns['ipv4.start'], columns['ipv4.end'], columns['ipv4.row']
+        self.ipv6StartHi, self.ipv6StartLo = columns['ipv6.start.hi'], columns['ipv6.start.lo']
+        self.ipv6EndHi, self.ipv6EndLo = columns['ipv6.end.hi'], columns['ipv6.end.lo']
+        self.ipv6Row = columns['ipv6.row']
+        self.netLength = columns['netlength']
+        self.provider = columns['provider']
+        self.services = columns['services']
+        self.regions = columns['regions']
+        self.features = columns['features']
+        ##──── The files created before the inverted indexes get them at load time ───────────────────────────────────────────────────────
+        if 'ix.provider.off' not in columns:
+            columns.update(_build_inverted_indexes(self.provider.tolist(),self.services.tolist(),self.regions.tolist()))
+        self.ixProvider = (columns['ix.provider.off'],columns['ix.provider.row'])
+        self.ixServices = (columns['ix.services.off'],columns['ix.services.row'])
+        self.ixRegions = (columns['ix.regions.off'],columns['ix.regions.row'])
+        if 'pf.ipv4' not in columns:
+            columns.update(_build_prefilter(self.ipv4FirstIP,self.ipv4LastIP,self.ipv6FirstHi,self.ipv6LastHi))
+        self.prefilterIPv4, self.prefilterIPv4Bits = columns['pf.ipv4'], (len(columns['pf.ipv4'])*8).bit_length()-1
+        self.prefilterIPv6, self.prefilterIPv6Bits = frozenset(columns['pf.ipv6']), columns['pf.ipv6.bits'][0]
+        self.indexProvider = strings['indexProvider']
+        self.indexServices = strings['indexServices']
+        self.indexRegions = strings['indexRegions']
+        self.indexNetworkFeatures = strings['indexNetworkFeatures']
+        self.databaseInfo = strings['databaseInfo']
+        ##──── Swap the search functions at __init__ when the trie engine is used ─────────────────────────────────────────────────────────
+        self.trieIPv4 = self.trieIPv6 = None
+        if trie is not None:
+            ipv4Strides, ipv6Strides = trie
+            self.trieIPv4 = CloudIPStrideTable(self.ipv4Start,self.ipv4End,self.ipv4Row,32,32,ipv4Strides,self._find_ipv4_slice)
+            self.find_ipv4 = self.trieIPv4.find
+            if ipv6Strides is not None:
+                self.trieIPv6 = CloudIPStrideTable([(hi << 64) | lo for hi,lo in zip(self.ipv6StartHi,self.ipv6StartLo)],
+                                                   [(hi << 64) | lo for hi,lo in zip(self.ipv6EndHi,self.ipv6EndLo)],
+                                                   self.ipv6Row,128,64,ipv6Strides,self._find_ipv6_slice)
+                self.find_ipv6 = self.trieIPv6.find
+        ##──── The prefilter wraps the search functions, binary search or trie ──────────────────────────────────────────────────────────
+        self.prefilter = prefilter
+        if prefilter == True:
+            self.find_ipv4, self.find_ipv6 = self._make_prefiltered_find(self.find_ipv4,self.find_ipv6)
+        self._frozen = True
+    def __setattr__(self, name, value):
+        if getattr(self,'_frozen',False):
+            raise AttributeError(f"CloudIPDatabase is a read-only snapshot, can't set '{name}'")
+        object.__setattr__(self,name,value)
+    @classmethod
+    def from_pickle(cls, fileobj, filename="", trie=None, prefilter=False):
+        """Loads the database from an opened cloudiplookup.dat.gz file. The files of versions 1.0.x are converted"""
+        import pickle
+        data = pickle.load(fileobj)
+        if isinstance(data,list):
+            columns, strings = _legacy_database(data)
+        elif data.get('version') != DATABASE_VERSION:
+            raise Exception(f"the file {filename} has the version {data.get('version')} and this library reads the version {DATABASE_VERSION}. Run an update (--update)")
+        else:
+            columns, strings = _narrow_columns(data['columns'],data['strings']), data['strings']
+        return cls(columns,strings,filename,trie,prefilter)
+    def __len__(self):
+        return len(self.netLength)
+    @property
+    def fingerprint(self)->str:
+        """The fingerprint of the networks, saved in the database files by the update and checked by the delta files
+        (see cloudiplookup.delta). The files created before it get it computed once, on the first access, under a lock
+        (about 15 ms, not paid by the loads that never apply a delta)"""
+        fingerprint = self.strings.get('fingerprint')
+        if fingerprint is None:
+            with _FINGERPRINT_LOCK:
+                fingerprint = self.strings.get('fingerprint')
+                if fingerprint is None:
+                    fingerprint = self.strings['fingerprint'] = _columns_fingerprint(self.columns,self.strings)
+        return fingerprint
+    def memory_usage(self)->dict:
+        """Returns the bytes of each column, ex: {'ipv4.first': 162340, 'netlength': 59400, ...}. The columns of a
+        memory-mapped database are pages of the file shared by all processes, not private memory"""
+        memory = {name:len(column)*column.itemsize for name,column in self.columns.items()}
+        for family,trie in (('ipv4',self.trieIPv4),('ipv6',self.trieIPv6)):
+            if trie is not None:
+                memory.update({f"trie.{family}.{name}":size for name,size in trie.memory_usage().items()})
+        return memory
+    def find_ipv4(self,iplong:int)->int:
+        """Returns the row of the most specific network that contains the IPv4 address *iplong* (32 bits integer) or ROW_NOT_FOUND"""
+        pos = binary_search(self.ipv4Start,iplong)-1
+        if pos >= 0 and iplong <= self.ipv4End[pos]:
+            return self.ipv4Row[pos]
+        return ROW_NOT_FOUND
+    def find_ipv6(self,hi:int,lo:int)->int:
+        """Returns the row of the most specific network that contains the IPv6 address given by its 64 bits halves *hi* and *lo*, or ROW_NOT_FOUND"""
+        ##──── intervals with the same 'hi' are in [start:end], search the 'lo' only inside this slice ────────────────────────────────────
+        end = binary_search(self.ipv6StartHi,hi)
+        start = bisect_left(self.ipv6StartHi,hi,0,end)
+        pos = max(binary_search(self.ipv6StartLo,lo,start,end),start)-1
+        if pos < 0:
+            return ROW_NOT_FOUND
+        endHi = self.ipv6EndHi[pos]
+        if endHi > hi or (endHi == hi and self.ipv6EndLo[pos] >= lo):
+            return self.ipv6Row[pos]
+        return ROW_NOT_FOUND
+    def prefilter_passes(self,key)->bool:
+        """Returns False if the prefilter rejects the parsed IP address *key* (an int for IPv4 or a (hi, lo) tuple for
+        IPv6, see parse_ip()): its prefix has no network. Doesn't depend on *prefilter*, the tables are always loaded"""
+        if key.__class__ is int:
+            prefix = key >> (32-self.prefilterIPv4Bits)
+            return bool(self.prefilterIPv4[prefix >> 3] & (1 << (prefix & 7)))
+        return self.prefilterIPv6Bits == 0 or (key[0] >> (64-self.prefilterIPv6Bits)) in self.prefilterIPv6
+    def _make_prefiltered_find(self,find_ipv4,find_ipv6)->tuple:
+        """Returns find_ipv4() and find_ipv6() that test the prefilter before calling *find_ipv4*/*find_ipv6*. They
+        don't count anything, the counters of the prefilter are the ones of CloudIPLookup(stats=True)"""
+        bitmap, shift = self.prefilterIPv4, 32-self.prefilterIPv4Bits
+        if self.trieIPv4 is None:
+            ##──── The binary search of find_ipv4() inlined: one Python call per lookup, as without the prefilter ─────────────────────────
+            ipv4Start, ipv4End, ipv4Row = self.ipv4Start, self.ipv4End, self.ipv4Row
+            def prefiltered_find_ipv4(iplong):
+                prefix = iplong >> shift
+                if not bitmap[prefix >> 3] & (1 << (prefix & 7)):
+                    return ROW_NOT_FOUND
+                pos = binary_search(ipv4Start,iplong)-1
+                if pos >= 0 and iplong <= ipv4End[pos]:
+                    return ipv4Row[pos]
+                return ROW_NOT_FOUND
+        else:
+            def prefiltered_find_ipv4(iplong):
+                prefix = iplong >> shift
+                if not bitmap[prefix >> 3] & (1 << (prefix & 7)):
+                    return ROW_NOT_FOUND
+                return find_ipv4(iplong)
+        if self.prefilterIPv6Bits == 0:
+            return prefiltered_find_ipv4, find_ipv6
+        prefixes, shiftIPv6 = self.prefilterIPv6, 64-self.prefilterIPv6Bits
+        def prefiltered_find_ipv6(hi,lo):
+            if hi >> shiftIPv6 not in prefixes:
+                return ROW_NOT_FOUND
+            return find_ipv6(hi,lo)
+        return prefiltered_find_ipv4, prefiltered_find_ipv6
+    ##──── find_ipv4()/find_ipv6() restricted to the intervals [first:last), used by the stride tables of the trie engine ─────────────────
+    def _find_ipv4_slice(self,iplong:int,lo:int,first:int,last:int)->int:
+        pos = binary_search(self.ipv4Start,iplong,first,last)-1
+        if pos >= first and iplong <= self.ipv4End[pos]:
+            return self.ipv4Row[pos]
+        return ROW_NOT_FOUND
+    def _find_ipv6_slice(self,hi:int,lo:int,first:int,last:int)->int:
+        end = binary_search(self.ipv6StartHi,hi,first,last)
+        start = bisect_left(self.ipv6StartHi,hi,first,end)
+        pos = max(binary_search(self.ipv6StartLo,lo,start,end),start)-1
+        if pos < first:
+            return ROW_NOT_FOUND
+        endHi = self.ipv6EndHi[pos]
+        if endHi > hi or (endHi == hi and self.ipv6EndLo[pos] >= lo):
+            return self.ipv6Row[pos]
+        return ROW_NOT_FOUND
+    def find(self,iplong:int)->int:
+        """Returns the row of the network that contains the IP address *iplong* (integers up to 4294967295 are IPv4) or ROW_NOT_FOUND"""
+        if iplong <= 4294967295:
+            return self.find_ipv4(iplong)
+        return self.find_ipv6(iplong >> 64,iplong & 0xFFFFFFFFFFFFFFFF)
+    def rows_in_range(self,first:int,last:int,ipv6:bool=False):
+        """Yields the rows of the networks that overlap the range [first, last] of IP addresses (integers, 128 bits for
+        IPv6), sorted by first IP. The networks of each family are sorted by first IP and are CIDR blocks, so they are
+        the networks that start inside the range, a slice found with one binary search, plus the networks that start
+        before and contain *first*: their first IP is *first* with the last bits cleared, at most 32 (or 128) binary
+        searches. The cost depends on the number of matches and not on the size of the database."""
+        if ipv6:
+            firstHi, firstLo, lastHi, lastLo = self.ipv6FirstHi, self.ipv6FirstLo, self.ipv6LastHi, self.ipv6LastLo
+            total, offset, bits = len(firstHi), self.totalIPv4, 128
+            firstOf = lambda pos: (firstHi[pos] << 64) | firstLo[pos]
+            lastOf = lambda pos: (lastHi[pos] << 64) | lastLo[pos]
+            def seek(value):
+                hi, lo = value >> 64, value & 0xFFFFFFFFFFFFFFFF
+                end = binary_search(firstHi,hi)
+                return bisect_left(firstLo,lo,bisect_left(firstHi,hi,0,end),end)
+        else:
+            firstIP, lastIP = self.ipv4FirstIP, self.ipv4LastIP
+            total, offset, bits = self.totalIPv4, 0, 32
+            firstOf, lastOf = firstIP.__getitem__, lastIP.__getitem__
+            seek = lambda value: bisect_left(firstIP,value)
+        ##──── The networks that contain *first* and start before it, the biggest first ─────────────────────────────────────────────────
+        for value in sorted({first >> shift << shift for shift in range(1,bits+1)} - {first}):
+            pos = seek(value)
+            while pos < total and firstOf(pos) == value:
+                if lastOf(pos) >= first:
+                    yield offset + pos
+                pos += 1
+        ##──── The networks that start inside the range ─────────────────────────────────────────────────────────────────────────────────
+        pos = seek(first)
+        while pos < total and firstOf(pos) <= last:
+            yield offset + pos
+            pos += 1
+    def rows_where(self,provider=None,service=None,region=None)->list:
+        """Returns the rows of the networks of the *provider*, *service* and *region* (names, or lists of names for more
+        than one value, case insensitive; None is any value), sorted. Only the rows of the smallest inverted index are
+        read, the other filters are checked in the code columns of these rows."""
+        filters = []
+        for names, decode, column, (offsets, rows) in ((provider,self.indexProvider,self.provider,self.ixProvider),
+                                                       (service,self.indexServices,self.services,self.ixServices),
+                                                       (region,self.indexRegions,self.regions,self.ixRegions)):
+            if names is None:
+                continue
+            names = {name.lower() for name in ([names] if isinstance(names,str) else names)}
+            codes = {code for code, name in enumerate(decode,1) if name.lower() in names and code+1 < len(offsets)}
+            if not codes:
+                return []
+            filters.append((sum(offsets[code+1]-offsets[code] for code in codes),codes,column,offsets,rows))
+        if not filters:
+            return list(range(len(self)))
+        filters.sort(key=lambda item:item[0])
+        _, codes, _, offsets, rows = filters[0]
+        postings = [rows[offsets[code]:offsets[code+1]] for code in sorted(codes)]
+        candidates = postings[0] if len(postings) == 1 else heap_merge(*postings)
+        if len(filters) == 1:
+            return list(candidates)
+        checks = [(column,codes) for _, codes, column, _, _ in filters[1:]]
+        return [row for row in candidates if all(column[row] in codes for column,codes in checks)]
+    def cidr(self,row:int)->str:
+        """Returns the CIDR of the network at *row*"""
+        if row < self.totalIPv4:
+            return int_to_ipv4(self.ipv4FirstIP[row])+"/"+str(self.netLength[row])
+        pos = row - self.totalIPv4
+        return hilo_to_ipv6(self.ipv6FirstHi[pos],self.ipv6FirstLo[pos])+"/"+str(self.netLength[row])
+
+##──── CLASS FOR THE MEMORY-MAPPED BINARY DATABASE ───────────────────────────────────────────────────────────────────────────────
+class CloudIPMmapDatabase(CloudIPDatabase):
+    """Read-only database searched in place from the memory-mapped binary file (cloudiplookup.dat.bin)
+
+    Nothing is decompressed or unpickled, the columns are memoryviews of the file. The pages of the file stay in
+    the page cache and are shared by all processes that map it, so forked workers do not hold their own copy.
+    """
+    def __init__(self, filename, trie=None, prefilter=False):
+        self._mmap, columns, strings = _read_binary_file(filename)
+        CloudIPDatabase.__init__(self,columns,strings,filename,trie,prefilter)
+
 class CloudIPLookup(object):
     """Locate if IP Address belongs to a pulic cloud service
+
+    Use *use_mmap* = True to search the binary database file (cloudiplookup.dat.bin) in place, memory-mapped, instead
+    of loading the cloudiplookup.dat.gz file in memory. The binary file is created by update_ip_ranges().
+
+    Use *cache_size* = N to keep the results of the last N distinct IP addresses searched with lookup() in a LRU cache.
+    The cache is useful when a few IP addresses are searched over and over, see cache_info(). It is cleared when the
+    database is loaded again or updated with update_database().
+
+    Use *engine* = 'trie' to search multibit tries (CloudIPStrideTable) built at load time instead of the binary search
+    ('bisect'). *trie_strides* and *trie_ipv6_strides* are the bits of each level: fewer and wider levels are faster
+    and use more memory, ex: trie_strides=(24,8) is a DIR-24-8 table of 64 MiB. The IPv6 networks of the providers are
+    mostly /48 to /64, so an IPv6 trie (ex: trie_ipv6_strides=(16,8)) ends in a binary search for most addresses: the
+    default None keeps the binary search for IPv6. The tries are private memory of each process, also with use_mmap=True.
+
+    Use *prefilter* = False to search the index for every IP address. By default, the IP addresses whose IPv4 /16 or
+    IPv6 /32 prefix has no network are rejected with a single bit test (or set lookup), see prefilter_info().
+
+    Use *lazy* = True to load the database on the first lookup (or any other call that needs the data) instead of at
+    __init__. Useful for command line jobs and serverless handlers that often exit without a lookup. Errors of the
+    database file are raised by that first call. The watcher does not load a database that was not loaded yet.
+
+    Use *stats* = True to count the lookup() calls (hits, misses and invalid IP addresses, the hits of each provider
+    and service and a latency histogram), see stats_info() and stats_prometheus(). When disabled, lookup() is not
+    wrapped and costs nothing more. lookup_code() and the batch methods are not counted.
     """
-    def __init__(self, verbose=False):
-        global startMem  # declared as global to be used at function _load_data()
-        startMem = get_mem_usage()
+    def __init__(self, verbose=False, use_mmap=False, cache_size=0, watch_interval=0, engine='bisect', trie_strides=TRIE_STRIDES, trie_ipv6_strides=TRIE_IPV6_STRIDES,
+                 prefilter=True, lazy=False, stats=False):
+        if engine not in ('bisect','trie'):
+            raise ValueError(f"invalid engine '{engine}', use 'bisect' or 'trie'")
         self.verbose = verbose
-        self._load_data_text = "" 
+        self.use_mmap = use_mmap
+        self.engine = engine
+        self.prefilter = prefilter
+        self._trie = None
+        if engine == 'trie':
+            self._trie = (CloudIPStrideTable.check_strides(trie_strides,32),
+                          CloudIPStrideTable.check_strides(trie_ipv6_strides,64) if trie_ipv6_strides is not None else None)
+        self._db_signature = None
+        self._cache = None
+        self._stats = None
+        self._watcher = None
+        self._reload_lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._load_data_text = ""
         ##──── Swap functions code at __init__ to avoid "if verbose=True" and save time ──────────────────────────────────────────────────
         if verbose == False:
             self._print_verbose = self.__print_verbose_empty
-        ##────────────────────────────────────────────────────────────────────────────────────────────────────────────────────────────────        
+        ##──── Swap the lookup() code at __init__ to avoid "if cache" and save time when the cache is not used ──────────────────────────
+        if cache_size > 0:
+            self._cache = CloudIPLRUCache(cache_size)
+            self.lookup = self._lookup_cached
+        ##──── The stats wrap the lookup() chosen above, with or without cache. Without stats lookup() is not wrapped ───────────────
+        if stats == True:
+            self._stats = CloudIPLookupStats()
+            self._lookup_without_stats = self.lookup
+            self.lookup = self._lookup_with_stats
+        ##────────────────────────────────────────────────────────────────────────────────────────────────────────────────────────────────
         self.is_loaded = False
-        self._load_data(self.verbose)
+        ##──── In lazy mode there is no self._db until the first access, that calls __getattr__() and loads the database ────────────
+        if lazy == False:
+            self._load_data(self.verbose)
+        if watch_interval > 0:
+            self.start_watcher(watch_interval)
     ##──── Function used to avoid "if verbose == True". The code is swaped at __init__ ───────────────────────────────────────────────────
     def __print_verbose_empty(self,msg):return
     def _print_verbose(self,msg):
         print(msg,flush=True)
     ##────────────────────────────────────────────────────────────────────────────────────────────────────────────────────────────────────
-    def _load_data(self, verbose=False)->bool:        
-        global indexMain, indexProvider, indexServices, indexRegions, indexNetworkFeatures, \
-                listFirstIP, listNetLength, listProvider, listServices, listRegions, listFeatures, databaseInfo
+    def _load_data(self, verbose=False)->bool:
         if self.is_loaded == True:
-            return True   
-        startLoadData = perf_counter()
-        ##──── Open the dat.gz file ──────────────────────────────────────────────────────────────────────────────────────────────────────
-        try:
-            f = gzip.open(os.path.join(DATA_DIR,OUTPUT_FILE_NAME),'rb')
-        except Exception as ERR:
-            raise Exception(f"Failed to 'load' CloudIPLookup dat file! the data file {str(os.path.join(DATA_DIR,OUTPUT_FILE_NAME))} appears to be invalid or does not exist! Run an update (--update) or call the function update_ip_ranges() to create this file.\n\n{str(ERR)}\n")
-        try:
-            indexMain, indexProvider, indexServices, indexRegions, indexNetworkFeatures, \
-                listFirstIP, listNetLength, listProvider, listServices, listRegions, listFeatures, databaseInfo = pickle.load(f)
-        except Exception as ERR:
-            raise Exception(f"Failed to pickle the data file {str(os.path.join(DATA_DIR,OUTPUT_FILE_NAME))} {str(ERR)}\n")
+            return True
+        with self._load_lock:
+            if self.is_loaded == False:
+                self.reload()
+                self.is_loaded = True
+        return True
+    def __getattr__(self, name):
+        """Called only for missing attributes: loads the database of the lazy mode on the first access to self._db"""
+        if name != '_db' or '_load_lock' not in self.__dict__:
+            raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+        self._load_data(self.verbose)
+        return self.__dict__['_db']
+    def _open_database(self):
+        """Creates a new snapshot (a CloudIPDatabase object) from the database file. Returns (snapshot, file signature)"""
+        if self.use_mmap == True:
+            ##──── Map the dat.bin file ──────────────────────────────────────────────────────────────────────────────────────────────────────
+            try:
+                signature = _file_signature(os.path.join(DATA_DIR,BINARY_FILE_NAME))
+                database = CloudIPMmapDatabase(os.path.join(DATA_DIR,BINARY_FILE_NAME),self._trie,self.prefilter)
+            except Exception as ERR:
+                raise Exception(f"Failed to 'load' CloudIPLookup binary file! the data file {str(os.path.join(DATA_DIR,BINARY_FILE_NAME))} appears to be invalid or does not exist! Run an update (--update) or call the function update_ip_ranges() to create this file.\n\n{str(ERR)}\n")
+        else:
+            ##──── Open the dat.gz file ──────────────────────────────────────────────────────────────────────────────────────────────────────
+            import gzip
+            try:
+                signature = _file_signature(os.path.join(DATA_DIR,OUTPUT_FILE_NAME))
+                f = gzip.open(os.path.join(DATA_DIR,OUTPUT_FILE_NAME),'rb')
+            except Exception as ERR:
+                raise Exception(f"Failed to 'load' CloudIPLookup dat file! the data file {str(os.path.join(DATA_DIR,OUTPUT_FILE_NAME))} appears to be invalid or does not exist! Run an update (--update) or call the function update_ip_ranges() to create this file.\n\n{str(ERR)}\n")
+            try:
+                with f:
+                    database = CloudIPDatabase.from_pickle(f,os.path.join(DATA_DIR,OUTPUT_FILE_NAME),self._trie,self.prefilter)
+            except Exception as ERR:
+                raise Exception(f"Failed to pickle the data file {str(os.path.join(DATA_DIR,OUTPUT_FILE_NAME))} {str(ERR)}\n")
         ##──── Warming-up ────────────────────────────────────────────────────────────────────────────────────────────────────────────────
         try:
-            [self.lookup(iplong) for iplong in [4294967295]]
+            database.find_ipv4(4294967295)
+            database.find_ipv6(0xFFFFFFFFFFFFFFFF,0xFFFFFFFFFFFFFFFF)
         except Exception as ERR:
             raise Exception("Failed at warming-up... exiting... %s"%(str(ERR)))
         ##────────────────────────────────────────────────────────────────────────────────────────────────────────────────────────────────
-        ##──── Load Time Info ────────────────────────────────────────────────────────────────────────────────────────────────────────────
-        try:
-            totalLoadTime = (perf_counter() - startLoadData)
-            totalMemUsage = (get_mem_usage() - startMem)
+        return database, signature
+    def reload(self)->bool:
+        """
+        Loads the database file again and swaps it in atomically. The new snapshot is fully built before the swap, the
+        lookups running during the reload use the previous snapshot and never see a half loaded database. The lookup
+        cache is cleared. If the file is invalid an exception is raised and the current snapshot is kept.
+        """
+        with self._reload_lock:
+            startMem = get_mem_usage()
+            startLoadData = perf_counter()
+            database, signature = self._open_database()
+            ##──── A single assignment: lookups that already got the old snapshot finish with it, the next ones use the new one ───────────
+            self._db = database
+            self._db_signature = signature
+            self.is_loaded = True
+            if self._cache is not None:
+                self._cache.clear()
+            ##──── Load Time Info ────────────────────────────────────────────────────────────────────────────────────────────────────────────
+            try:
+                totalLoadTime = (perf_counter() - startLoadData)
+                totalMemUsage = (get_mem_usage() - startMem)
+                self._load_data_text = f"Cloud IP Lookup v{__version__} is ready! "+ \
+                    "loaded with %s networks in %.5f seconds and using %.2f MiB of RAM."%(str(len(database)),totalLoadTime,totalMemUsage)
+                columnsMemory = database.memory_usage()
+                self._load_data_text += "\n%s columns: %.2f MiB (%s)"%("Memory-mapped" if self.use_mmap else "In-memory",sum(columnsMemory.values())/1048576,
+                    ", ".join(f"{name} {size/1024:.1f} KiB" for name,size in columnsMemory.items()))
+                self._print_verbose(self._load_data_text)
+            except Exception as ERR:
+                raise Exception("Failed at the end of load data %s"%(str(ERR)))
+            ##────────────────────────────────────────────────────────────────────────────────────────────────────────────────────────────────
+        return True
+    def apply_delta(self,delta,verify=False)->bool:
+        """
+        Applies a delta file (cloudiplookup.delta.gz, saved by update_ip_ranges() or CloudIPDatabaseDiff.save_delta()) to
+        the database loaded and swaps the new snapshot in atomically, like reload(), without reading the database file.
+        *delta* is the name of the file, its bytes or a dict. Only the changed networks are patched, see apply_delta() of
+        cloudiplookup/delta.py (with *verify* = True the fingerprint of the result is also checked). The delta must have
+        been created from the database loaded: otherwise a ValueError is raised and the current snapshot is kept, call
+        reload() to load the whole file. The lookup cache is cleared.
+
+        With use_mmap=True, if the cloudiplookup.dat.bin file already has the networks of the delta (ex: it was applied
+        to the files with "cloudiplookup --apply-delta") the new file is mapped by reload(), its pages stay shared by
+        all processes. Otherwise the columns changed by the delta are private memory of the process, until the next
+        file is mapped.
+        """
+        from cloudiplookup.delta import load_delta, apply_delta
+        delta = load_delta(delta)
+        self._load_data(self.verbose)
+        if self.use_mmap == True and self._db.fingerprint != delta['target']:
+            try:
+                fileFingerprint = _read_binary_strings(self._db.filename).get('fingerprint')
+            except Exception:
+                fileFingerprint = None
+            if fileFingerprint == delta['target']:
+                return self.reload()
+        with self._reload_lock:
+            startLoadData = perf_counter()
+            columns, strings = apply_delta(self._db,delta,verify)
+            database = CloudIPDatabase(columns,strings,self._db.filename,self._trie,self.prefilter)
+            ##──── The file signature is kept: the watcher adopts the signature of the next file if it has the networks of the snapshot ─────
+            self._db = database
+            if self._cache is not None:
+                self._cache.clear()
             self._load_data_text = f"Cloud IP Lookup v{__version__} is ready! "+ \
-                "loaded with %s networks in %.5f seconds and using %.2f MiB of RAM."%(str(self._total_networks()),totalLoadTime,totalMemUsage)
+                "delta applied with %s networks in %.5f seconds."%(str(len(database)),perf_counter()-startLoadData)
             self._print_verbose(self._load_data_text)
-        except Exception as ERR:
-            raise Exception("Failed at the end of load data %s"%(str(ERR)))
-        ##────────────────────────────────────────────────────────────────────────────────────────────────────────────────────────────────
-        self.is_loaded = True
         return True
+    def _file_replaced(self,signature:tuple)->bool:
+        """
+        Called by the watcher when the database file has another *signature*. The update saves the delta with the size
+        and mtime of the new files (see update_ip_ranges()): if the delta file goes from the networks loaded to this
+        file, the delta is applied instead of loading the whole file, and if the networks loaded are already the ones
+        of this file (ex: the delta was applied by apply_delta()) nothing is loaded. Otherwise the file is loaded again
+        by reload(). With use_mmap=True the new file is always mapped by reload(), that is cheap.
+        """
+        if self.use_mmap == False:
+            from cloudiplookup.delta import load_delta
+            try:
+                delta = load_delta(os.path.join(os.path.dirname(self._db.filename),DELTA_FILE_NAME))
+                deltaOfFile = delta.get('files',{}).get(os.path.basename(self._db.filename)) == [signature[2],signature[1]]
+            except Exception:
+                deltaOfFile = False
+            if deltaOfFile == True:
+                if self._db.fingerprint == delta['base']:
+                    self.apply_delta(delta)
+                if self._db.fingerprint == delta['target']:
+                    self._db_signature = signature
+                    return True
+        return self.reload()
+    def start_watcher(self,interval=5.0):
+        """
+        Starts a background thread that checks the database file (cloudiplookup.dat.gz, or cloudiplookup.dat.bin with
+        use_mmap=True) every *interval* seconds and loads it when the file is replaced, ex: by an update running in
+        another process. The update writes the files in temporary files and renames them, a reload never reads a file
+        being written. With the dat.gz file the delta saved by the update is applied instead of loading the whole file
+        when it goes from the networks loaded to the new file. If the reload fails, the current snapshot is kept and
+        the file is checked again later.
+        """
+        if self._watcher is not None:
+            return
+        stopEvent = threading.Event()
+        instance = weakref.ref(self)  # the thread does not keep the instance alive
+        def watch():
+            while not stopEvent.wait(interval):
+                iplookup = instance()
+                if iplookup is None:
+                    return
+                try:
+                    if iplookup.is_loaded == True:
+                        signature = _file_signature(iplookup._db.filename)
+                        if signature != iplookup._db_signature:
+                            iplookup._file_replaced(signature)
+                except Exception as ERR:
+                    iplookup._print_verbose(f"Failed to reload the database file {iplookup._db.filename}: {str(ERR)}")
+                del iplookup
+        self._watcher = (threading.Thread(target=watch,name="cloudiplookup-watcher",daemon=True),stopEvent)
+        self._watcher[0].start()
+    def stop_watcher(self):
+        """Stops the thread started by start_watcher()"""
+        if self._watcher is not None:
+            thread, stopEvent = self._watcher
+            stopEvent.set()
+            if thread is not threading.current_thread():
+                thread.join()
+            self._watcher = None
     @property
     def startup_line_text(self):
         """
-        Returns the text of _load_data() in case you want to know without set verbose=True 
-        
+        Returns the text of _load_data() in case you want to know without set verbose=True
+
         Like: Cloud IP Lookup v1.x.x is ready! cloudiplookup.dat.gz loaded with 40217 networks in 0.00564 seconds and using 3.57 MiB.
-        """    
+              In-memory columns: 1.21 MiB (ipv4.first 135.2 KiB, ipv4.last 135.2 KiB, ..., netlength 39.3 KiB, provider 39.3 KiB, ...)
+        """
         return self._load_data_text
     def _total_networks(self):
         """
         Returns the number of all networks included in cloudiplookup.dat.gz file
         """
-        total = 0
-        for a_list in listFirstIP:
-            total += len(a_list)
-        return total        
+        return len(self._db)
     def get_database_info(self,print_result=True):
         """Returns or print the current database info"""
         if print_result == True:
-            pp_json(databaseInfo)
+            pp_json(self._db.databaseInfo)
         else:
-            return databaseInfo
+            return self._db.databaseInfo
+    def save_binary_database(self,filename=None):
+        """Saves the database currently loaded in the binary format used by CloudIPLookup(use_mmap=True). The default
+        filename is cloudiplookup.dat.bin in the data directory. Useful to create the binary file from an existing
+        cloudiplookup.dat.gz file without running an update."""
+        _write_binary_file(filename or os.path.join(DATA_DIR,BINARY_FILE_NAME),self._db.columns,self._db.strings)
     def update_database(self,verbose=True):
-        """Update current database"""
+        """Update current database and load it again. The lookup cache is cleared."""
         if (verbose == False):
             logVerbose = _logEmpty
+        from cloudiplookup.updater import update_ip_ranges
         update_ip_ranges(verbose)
-        
+        self.reload()
+    def cache_info(self)->dict:
+        """Returns the counters of the lookup cache (hits, misses, evictions, size and capacity), or an empty
+        dict if the cache is not enabled (cache_size=0)"""
+        return self._cache.info() if self._cache is not None else {}
+    def cache_clear(self):
+        """Removes all entries of the lookup cache"""
+        if self._cache is not None:
+            self._cache.clear()
+    def stats_info(self)->dict:
+        """Returns the lookup counters of stats=True and the bytes of each table of the database loaded, or an empty
+        dict if the stats are not enabled:
+
+            lookups, hits, misses, invalid, errors      the lookup() calls and their results
+            providers                                   hits of each provider, ex: {'AWS': 10, 'Azure': 2}
+            services                                    hits of each service of each provider, ex: {'AWS': {'EC2': 8, 'S3': 2}}
+            latency                                     cumulative histogram {'buckets': {'1e-06': 0, ..., '+Inf': 12}, 'sum', 'count'}
+            prefilter                                   misses rejected by the prefilter and searched in the index, ex: {'rejected': 9, 'passed_missed': 1}
+            memory                                      bytes of each column and trie of the database, see memory_usage()
+
+        The counters are not locked, under many threads they are approximate.
+        """
+        if self._stats is None:
+            return {}
+        return dict(self._stats.info(),networks=len(self._db),memory=self._db.memory_usage())
+    def stats_prometheus(self)->str:
+        """Returns the stats_info() in the Prometheus text exposition format (metrics cloudiplookup_*), or an empty
+        string if the stats are not enabled"""
+        info = self.stats_info()
+        if not info:
+            return ""
+        label = lambda value: str(value).replace('\\','\\\\').replace('"','\\"').replace('\n','\\n')
+        lines = ["# HELP cloudiplookup_lookups_total Calls of lookup() by result.","# TYPE cloudiplookup_lookups_total counter"]
+        lines.extend(f'cloudiplookup_lookups_total{{result="{result}"}} {info[key]}' for result,key in (('hit','hits'),('miss','misses'),('invalid','invalid'),('error','errors')))
+        lines.extend(["# HELP cloudiplookup_hits_total Calls of lookup() found in a network, by provider and service.","# TYPE cloudiplookup_hits_total counter"])
+        lines.extend(f'cloudiplookup_hits_total{{provider="{label(provider)}",service="{label(service)}"}} {count}'
+                     for provider,services in info['services'].items() for service,count in services.items())
+        lines.extend(["# HELP cloudiplookup_prefilter_misses_total Calls of lookup() not found, rejected by the prefilter or searched in the index.","# TYPE cloudiplookup_prefilter_misses_total counter"])
+        lines.extend(f'cloudiplookup_prefilter_misses_total{{prefilter="{result}"}} {info["prefilter"][key]}' for result,key in (('rejected','rejected'),('passed','passed_missed')))
+        lines.extend(["# HELP cloudiplookup_lookup_duration_seconds Latency of lookup().","# TYPE cloudiplookup_lookup_duration_seconds histogram"])
+        lines.extend(f'cloudiplookup_lookup_duration_seconds_bucket{{le="{bound}"}} {count}' for bound,count in info['latency']['buckets'].items())
+        lines.append(f"cloudiplookup_lookup_duration_seconds_sum {info['latency']['sum']!r}")
+        lines.append(f"cloudiplookup_lookup_duration_seconds_count {info['latency']['count']}")
+        lines.extend(["# HELP cloudiplookup_networks Networks of the database loaded.","# TYPE cloudiplookup_networks gauge",f"cloudiplookup_networks {info['networks']}"])
+        lines.extend(["# HELP cloudiplookup_memory_bytes Bytes of each table of the database loaded.","# TYPE cloudiplookup_memory_bytes gauge"])
+        lines.extend(f'cloudiplookup_memory_bytes{{table="{label(table)}"}} {size}' for table,size in info['memory'].items())
+        return "\n".join(lines)+"\n"
+    def stats_reset(self):
+        """Sets the lookup counters of stats=True to zero"""
+        if self._stats is not None:
+            self._stats.reset()
+    def prefilter_info(self)->dict:
+        """Returns the negative prefilter settings of the database loaded and, with stats=True, its counters of the
+        lookup() calls since the stats were reset (see stats_info()):
+
+            rejected        IP addresses rejected by the prefilter without searching the index
+            passed          IP addresses searched in the index
+            passed_missed   IP addresses searched in the index and not found (false positives of the prefilter)
+            hit_ratio       share of the IP addresses not found that were rejected by the prefilter
+            ipv4_coverage   share of the IPv4 prefixes that have networks
+
+        The prefilter itself counts nothing: the snapshot is read-only and a lookup writes no shared state.
+        """
+        db = self._db
+        bitsSet = sum(bin(byte).count("1") for byte in bytes(db.prefilterIPv4))
+        info = {'enabled':db.prefilter,'ipv4_bits':db.prefilterIPv4Bits,'ipv6_bits':db.prefilterIPv6Bits,
+                'ipv4_coverage':round(bitsSet/(len(db.prefilterIPv4)*8),6),'ipv6_prefixes':len(db.prefilterIPv6)}
+        if self._stats is not None:
+            rejected, missed = self._stats.prefilter_rejected, self._stats.prefilter_missed
+            info.update(rejected=rejected,passed=self._stats.hits+missed,passed_missed=missed,
+                        hit_ratio=round(rejected/(rejected+missed),6) if rejected+missed > 0 else 0.0)
+        return info
+
     def lookup(self,ipaddr:str)->CloudIPDetail:
         """
-        Performs a search for the given IP address in the in-memory database
+        Performs a search for the given IP address in the in-memory database. The IP address can be a string, an
+        integer, packed bytes or an ipaddress.IPv4Address/IPv6Address (see parse_ip()). The IPv4-mapped IPv6
+        addresses (::ffff:a.b.c.d) are searched as IPv4 addresses.
 
         - Usage:
 
             from cloudiplookip import CloudIPLookup
-    
+
             myLookup = CloudIPLookup()
-            
+
             result = myLookup.lookup("8.8.8.8")
-            
+
             print(result)
-        """                    
+        """
         startTime = perf_counter()
+        ##──── The address family is chosen once here, IPv4 is searched in the 32 bits index and IPv6 in the hi/lo index ────────────────
+        key = parse_ip(ipaddr)
+        if ipaddr.__class__ is not str:
+            ipaddr = key_to_ip(key) if key is not None else str(ipaddr)
+        if key is None:
+            return CloudIPDetail(ip=ipaddr,cloud_provider="<invalid ip address>",elapsed_time=perf_counter()-startTime)
         try:
-            try:
-                iplong = ipv4_to_int(ipaddr)
-            except:
-                iplong = ipv6_to_int(ipaddr)
-        except:
-            return CloudIPDetail(ip=ipaddr,cloud_provider="<invalid ip address>",elapsed_time='%.9f sec'%(perf_counter()-startTime))
-        try:
-            matchRoot = binary_search(indexMain,iplong)-1
-            if matchRoot < 0:
-                return CloudIPDetail(ip=ipaddr,cloud_provider="<not found in database>",elapsed_time='%.9f sec'%(perf_counter()-startTime))
-            matchChunk = binary_search(listFirstIP[matchRoot],iplong)-1
-            try:
-                cidr = int_to_ipv4(listFirstIP[matchRoot][matchChunk])+"/"+str(listNetLength[matchRoot][matchChunk])
-                last_ip = listFirstIP[matchRoot][matchChunk] + numHostsv4[listNetLength[matchRoot][matchChunk]] - 1
-            except:
-                cidr = int_to_ipv6(int(listFirstIP[matchRoot][matchChunk]))+"/"+str(listNetLength[matchRoot][matchChunk])
-                last_ip = listFirstIP[matchRoot][matchChunk] + numHostsv6[listNetLength[matchRoot][matchChunk]] - 1
-            if iplong > last_ip:
-                return CloudIPDetail(ip=ipaddr,cloud_provider="<not found in database>",elapsed_time='%.9f sec'%(perf_counter()-startTime))
-            region = indexRegions[listRegions[matchRoot][matchChunk]-1]
-            service = indexServices[listServices[matchRoot][matchChunk]-1]
-            cloud_provider = indexProvider[listProvider[matchRoot][matchChunk]-1]
+            db = self._db
+            row = db.find_ipv4(key) if key.__class__ is int else db.find_ipv6(*key)
+            if row < 0:
+                return CloudIPDetail(ip=ipaddr,cloud_provider="<not found in database>",elapsed_time=perf_counter()-startTime)
             ##──── SUCCESS! ───────────────────────────────────────────────────────────────────────────────────────────────────────────────────
-            return CloudIPDetail(ipaddr,cidr,region,cloud_provider,service,elapsed_time='%.9f sec'%((perf_counter()-startTime)))
+            return CloudIPDetail.from_row(ipaddr,db,row,elapsed_time=perf_counter()-startTime)
             ##────────────────────────────────────────────────────────────────────────────────────────────────────────────────────────────────
         except Exception as ERR:
-            return CloudIPDetail(ip=ipaddr,region=str(ERR),cloud_provider="<internal lookup error>",elapsed_time='%.9f sec'%(perf_counter()-startTime))
-             
-##──── CLASS FOR ARGUMENT PARSER ──────────────────────────────────────────────────────────────────────────────────────────────────────
-class class_argparse_formatter(HelpFormatter):
-    def add_usage(self, usage, actions, groups, prefix=None):
-        if prefix is None:
-            prefix = 'Usage: '
-        return super(class_argparse_formatter, self).add_usage(usage, actions, groups, prefix)
-    def _format_usage(self, usage, actions, groups, prefix):
-        return super(class_argparse_formatter, self)._format_usage(usage, actions, groups, prefix)
+            return CloudIPDetail(ip=ipaddr,region=str(ERR),cloud_provider="<internal lookup error>",elapsed_time=perf_counter()-startTime)
 
-##################################################################################################################################
-
-                # # ##  ##   #  ### ###     ### ##      ##   #  ###  ## ###  ##
-                # # # # # # # #  #  #        #  # #     # # # # # # #   #   #
-                # # ##  # # ###  #  ##       #  ##      ##  ### # # # # ##   #
-                # # #   # # # #  #  #        #  #       # # # # # # # # #     #
-                ### #   ##  # #  #  ###     ### #       # # # # # #  ## ### ##
+    def _lookup_with_stats(self,ipaddr:str)->CloudIPDetail:
+        """The lookup() used when the stats are enabled (stats=True), counts the result of the lookup() chosen at __init__"""
+        db = self._db
+        result = self._lookup_without_stats(ipaddr)
+        self._stats.record(result,db)
+        return result
 
-##################################################################################################################################
-#defupdate
-@print_elapsed_time
-def update_ip_ranges(verbose=False,debug=False):
-    global cloudip, databaseInfo, _DEBUG
-    cloudip, databaseInfo = {}, {}
-    _DEBUG = debug
-    logDebug.__code__ = _logDebug.__code__ if (verbose == True and debug == True) else _logEmpty.__code__
-    logVerbose.__code__ = _logEmpty.__code__ if (verbose == False) else log.__code__    
-    ##──── LOAD CLOUD SERVICE PROVIDERS INFORMATION FILE ─────────────────────────────────────────────────────────────────────────────
-    try:
-        with open(os.path.join(DATA_DIR,PROVIDERS_INFORMATION_FILE_NAME),"r") as f:
-            infoFile = json.load(f)        
-    except Exception as ERR:
-        logError(f"Failed to open information file \"{str(os.path.join(DATA_DIR,PROVIDERS_INFORMATION_FILE_NAME))}\": {str(ERR)}")
-        return 1
-    try:
-        with elapsed_timer() as elapsed:
-            ##──── Each cloud provider has its own file format, so it´s necessary a specific for each one ────────────────────────────────────
-            update_ip_ranges_aws(infoFile['AWS']['download_url'])
-            update_ip_ranges_azure(infoFile['AZURE']['info_page']) # azure is different
-            update_ip_ranges_cloudflare(infoFile['CLOUDFLARE']['download_url']) 
-            update_ip_ranges_digital_ocean(infoFile['DIGITALOCEAN']['download_url'])
-            update_ip_ranges_google_cloud(infoFile['GOOGLECLOUD']['download_url'])
-            update_ip_ranges_google_services(infoFile['GOOGLESERVICES']['download_url'])
-            update_ip_ranges_google_services(infoFile['GOOGLEBOT']['download_url'])
-            update_ip_ranges_google_services(infoFile['GOOGLESSPECIALCRAWLERS']['download_url'])
-            update_ip_ranges_google_services(infoFile['GOOGLESUSERTRIGGERED']['download_url'])
-            update_ip_ranges_jdcloud(infoFile['JDCLOUD']['download_url']) # cloudflare jdcloud china
-            update_ip_ranges_oracle_cloud(infoFile['ORACLE']['download_url'])
-    except Exception as ERR:
-        logDebug(f"Failed to update IP ranges - {str(ERR)}")
-        return 1
-    with elapsed_timer() as elapsed_sort:
-        cloudip = dict(sorted(cloudip.items(),key=lambda x:int(x[0]), reverse=False))
-    logVerbose(f"Sorting IPv4 and IPv6 data {timer(elapsed_sort())}")
-    with elapsed_timer() as elapsed_lists:
-        listFirstIP = [int(key) for key,val in cloudip.items()]
-        listNetLength = [int(val['netlength']) for key,val in cloudip.items()]
-        dictProvider, dictServices, dictRegions, dictFeatures = {}, {}, {}, {}
-        listProvider, listServices, listRegions, listFeatures = [], [], [], []
-        nextKeyProvider, nextKeyServices, nextKeyRegions, nextKeyFeatures = 0, 0, 0, 0
-        for key,val in cloudip.items():
-            if dictProvider.get(val['provider'],0) == 0:
-                nextKeyProvider += 1
-                dictProvider[val['provider']] = nextKeyProvider
-            if dictServices.get(val['service'],0) == 0:
-                nextKeyServices += 1
-                dictServices[val['service']] = nextKeyServices
-            if dictRegions.get(val['region'],0) == 0:
-                nextKeyRegions += 1
-                dictRegions[val['region']] = nextKeyRegions
-            if dictFeatures.get(val['network_features'],0) == 0:
-                nextKeyFeatures += 1
-                dictFeatures[val['network_features']] = nextKeyFeatures
-            listProvider.append(dictProvider[val['provider']])
-            listServices.append(dictServices[val['service']])
-            listRegions.append(dictRegions[val['region']])
-            listFeatures.append(dictFeatures[val['network_features']])
-        indexProvider = list(dictProvider.keys())
-        indexServices = list(dictServices.keys())
-        indexRegions = list(dictRegions.keys())
-        indexNetworkFeatures = list(dictFeatures.keys())
-        listFirstIP = list(split_list(listFirstIP,LIST_SLICE_SIZE))
-        listNetLength = list(split_list(listNetLength,LIST_SLICE_SIZE))
-        listProvider = list(split_list(listProvider,LIST_SLICE_SIZE))
-        listServices = list(split_list(listServices,LIST_SLICE_SIZE))
-        listRegions = list(split_list(listRegions,LIST_SLICE_SIZE))
-        listFeatures = list(split_list(listFeatures,LIST_SLICE_SIZE))
-        indexMain = [item[0] for item in listFirstIP]
-        database = [indexMain, indexProvider, indexServices, indexRegions, indexNetworkFeatures, 
-                    listFirstIP, listNetLength, listProvider, listServices, listRegions, listFeatures,
-                    databaseInfo]
-    logVerbose(f"Updating all lists... Done! {timer(elapsed_lists())}")
-    if _DEBUG == True:
-        with elapsed_timer() as elapsed_savefiles:
-            with open(os.path.join(DATA_DIR,"cloudip.json"),"w") as f:
-                json.dump(cloudip,f,indent=3,sort_keys=False,ensure_ascii=False,default=json_default_formatter)
-            logDebug(f"Saving cloudip.json file {timer(elapsed_savefiles())}")
-            with open(os.path.join(DATA_DIR,"cloudiplookup.dat.json"),"w") as f:
-                json.dump(database,f,indent=3,sort_keys=False,ensure_ascii=False,default=json_default_formatter)
-            logDebug(f"Saving cloudiplookup.dat.json file {timer(elapsed_savefiles())}")
-    with elapsed_timer() as elapsed_save_gzip:
-        with gzip.GzipFile(filename=os.path.join(DATA_DIR,OUTPUT_FILE_NAME), mode='wb', compresslevel=9) as f:
-            pickle.dump(database,f,pickle.HIGHEST_PROTOCOL)
-        f.close()
-        logVerbose(f"Saved file {os.path.join(DATA_DIR,OUTPUT_FILE_NAME)} {timer(elapsed_save_gzip())}")
-    logVerbose(f"Cloud IP Lookup updated with success! {timer(elapsed())}")
-    ##──── EXIT WITH SUCCESS ─────────────────────────────────────────────────────────────────────────────────────────────────────────
-    return 0
-
-##──── UPDATE AWS IP RANGES ──────────────────────────────────────────────────────────────────────────────────────────────────────
-@print_elapsed_time
-def update_ip_ranges_aws(download_url):
-    global cloudip, databaseInfo, _DEBUG
-    initialLen = len(cloudip.keys())
-    try:
-        with elapsed_timer() as elapsed:
-            ipranges = download_file(download_url)
-            if ipranges == False:
-                logError(f"Updating AWS - FAILED to download IP ranges file from {download_url} {timer(elapsed())}")
-                return False
-            logVerbose(f"Updating AWS - Downloading IP ranges file {timer(elapsed())}")
-            if _DEBUG == True:
-                outputFile = os.path.join(DATA_DIR,'ipranges-aws.json')
-                logDebug(f"Saving ipranges to {outputFile}")
-                with open(outputFile,'w') as f:
-                    json.dump(ipranges,f,indent=3,sort_keys=False,ensure_ascii=False,default=json_default_formatter)
-        with elapsed_timer() as elapsed:
-            total_ipv4 = total_ipv6 = 0
-            for item in ipranges['prefixes']:
-                cidr, region, service, network_border_group = item.values()
-                first_ip, netlen = cidr.split("/")
-                total_ipv4 += numIPsv4[int(netlen)]
-                first_ip2int = ipv4_to_int(first_ip)
-                region = network_border_group if region != network_border_group else region
-                cloudip[first_ip2int] = {'provider':'AWS','cidr':cidr,'region':region, 'service':service, 'netlength':int(netlen),'network_features':''}
-            for item in ipranges['ipv6_prefixes']:
-                cidr, region, service, network_border_group = item.values()
-                first_ip, netlen = cidr.split("/")
-                total_ipv6 += numIPsv6[int(netlen)]
-                first_ip2int = ipv6_to_int(first_ip)
-                region = network_border_group if region != network_border_group else region
-                cloudip[first_ip2int] = {'provider':'AWS','cidr':cidr,'region':region, 'service':service, 'netlength':int(netlen),'network_features':''}
-            try:
-                formatedDate = dt.strptime(ipranges['createDate'], "%Y-%m-%d-%H-%M-%S")
-                formatedDate = formatedDate.strftime("%Y-%m-%d %H:%M:%S")
-            except:
-                formatedDate = ipranges['createDate']
-            logVerbose(f"Updating AWS - Parsing IPv4 and IPv6 ranges updated at {formatedDate} {timer(elapsed())}")
-        databaseInfo["AWS"] = {'last_updated':formatedDate,
-                               'total_networks':len(cloudip.keys())-initialLen,
-                               'total_ipv4':total_ipv4, 'total_ipv6':total_ipv6}
-    except Exception as ERR:
-        logVerbose(f"Failed to update AWS IP ranges - {str(ERR)}")
-    return
-    
-##──── UPDATE AZURE IP RANGES ──────────────────────────────────────────────────────────────────────────────────────────────────────
-@print_elapsed_time
-def update_ip_ranges_azure(info_page):
-    global cloudip, databaseInfo, _DEBUG
-    initialLen = len(cloudip.keys())
-    try:
-        with elapsed_timer() as elapsed:
-            ##──── Azure changes the name og the file on each version, so is necessary to locate it ──────────────────────────────────────────
-            rule = re.compile(r'.*(https://download.microsoft.com.*ServiceTags_Public.*.json)".*')
-            ipranges = download_file(info_page)
-            url = next((linha for linha in ipranges if (re.match(rule,linha))),False)
-            download_url = re.match(rule,url).group(1)
-            ipranges = download_file(download_url)
-            if ipranges == False:
-                logError(f"Updating AZURE - FAILED to download IP ranges file from {download_url} {timer(elapsed())}")
-                return False
-            logVerbose(f"Updating AZURE - Downloading IP ranges file {timer(elapsed())}")
-            if _DEBUG == True:
-                outputFile = os.path.join(DATA_DIR,'ipranges-azure.json')
-                logDebug(f"Saving ipranges to {outputFile}")
-                with open(outputFile,'w') as f:
-                    json.dump(ipranges,f,indent=3,sort_keys=False,ensure_ascii=False,default=json_default_formatter)
-        with elapsed_timer() as elapsed:
-            total_ipv4 = total_ipv6 = 0
-            values = ipranges['values']
-            for bloco in values:
-                service = bloco['properties']['systemService']
-                try:
-                    networkFeatures = ", ".join(bloco['properties']['networkFeatures'])
-                except:
-                    networkFeatures = ""
-                region = bloco['properties']['region']
-                region_id = bloco['properties']['regionId']
-                for cidr in bloco['properties']['addressPrefixes']:
-                    first_ip, netlen = str(cidr).split("/")
-                    if first_ip.find(":") < 0:
-                        total_ipv4 += numIPsv4[int(netlen)]
-                        first_ip2int = ipv4_to_int(first_ip)
-                    else:
-                        total_ipv6 += numIPsv6[int(netlen)]
-                        first_ip2int = ipv6_to_int(first_ip)
-                    cloudip[first_ip2int] = {'provider':'Azure','cidr':str(cidr),'region':region, 'service':service, 'netlength':int(netlen),'network_features':networkFeatures}
+    def _lookup_cached(self,ipaddr:str)->CloudIPDetail:
+        """The lookup() used when the cache is enabled (cache_size > 0). The cache entries keep the row, the cidr string
+        and the names of the network, so a hit only parses the IP address and creates the CloudIPDetail. An entry
+        created with a snapshot replaced by reload() in the meantime is ignored."""
+        startTime = perf_counter()
+        key = parse_ip(ipaddr)
+        if ipaddr.__class__ is not str:
+            ipaddr = key_to_ip(key) if key is not None else str(ipaddr)
+        if key is None:
+            return CloudIPDetail(ip=ipaddr,cloud_provider="<invalid ip address>",elapsed_time=perf_counter()-startTime)
         try:
-            formatedDate = dt.strptime(last_modified, "%a, %d %b %Y %H:%M:%S %Z")
-            formatedDate = formatedDate.strftime("%Y-%m-%d %H:%M:%S")
-        except:
-            formatedDate = last_modified
-        logVerbose(f"Updating AZURE - Parsing IPv4 and IPv6 ranges updated at {formatedDate} {timer(elapsed())}")
-        databaseInfo["Azure"] = {'last_updated':formatedDate,
-                                 'total_networks':len(cloudip.keys())-initialLen,
-                                 'total_ipv4':total_ipv4, 'total_ipv6':total_ipv6}
-    except Exception as ERR:
-        logVerbose(f"Failed to update AZURE IP ranges {bloco['properties']['networkFeatures']} - {str(ERR)}")
-    return
-
-##──── UPDATE GOOGLE CLOUD PLATFORM IP RANGES ──────────────────────────────────────────────────────────────────────────────────────────────────────
-@print_elapsed_time
-def update_ip_ranges_google_cloud(download_url):
-    global cloudip, databaseInfo, _DEBUG
-    initialLen = len(cloudip.keys())
-    try:
-        with elapsed_timer() as elapsed:
-            ipranges = download_file(download_url)
-            if ipranges == False:
-                logError(f"Updating GOOGLE CLOUD - FAILED to download IP ranges file from {download_url} {timer(elapsed())}")
-                return False
-            logVerbose(f"Updating GOOGLE CLOUD - Downloading IP ranges file {timer(elapsed())}")
-            if _DEBUG == True:
-                outputFile = os.path.join(DATA_DIR,'ipranges-googlecloud.json')
-                logDebug(f"Saving ipranges to {outputFile}")
-                with open(outputFile,'w') as f:
-                    json.dump(ipranges,f,indent=3,sort_keys=False,ensure_ascii=False,default=json_default_formatter)
-        with elapsed_timer() as elapsed:
-            total_ipv4 = total_ipv6 = 0
-            for item in ipranges['prefixes']:
-                service = item['service']
-                region = item['scope']
-                if item.get('ipv4Prefix',0) != 0:
-                    cidr = item['ipv4Prefix']
-                    first_ip, netlen = str(cidr).split("/")
-                    total_ipv4 += numIPsv4[int(netlen)]
-                    first_ip2int = ipv4_to_int(first_ip)
+            db = self._db
+            entry = self._cache.get(key)
+            if entry is None or entry[0] is not db:
+                row = db.find_ipv4(key) if key.__class__ is int else db.find_ipv6(*key)
+                if row < 0:
+                    entry = (db,row)
                 else:
-                    cidr = item['ipv6Prefix']
-                    first_ip, netlen = str(cidr).split("/")
-                    total_ipv6 += numIPsv6[int(netlen)]
-                    first_ip2int = ipv6_to_int(first_ip)
-                cloudip[first_ip2int] = {'provider':'Google Cloud Platform','cidr':cidr,'region':region,'service':service,'netlength':int(netlen),'network_features':''}
-        try:
-            formatedDate = dt.strptime(ipranges['creationTime'], "%Y-%m-%dT%H:%M:%S.%f")
-            formatedDate = formatedDate.strftime("%Y-%m-%d %H:%M:%S")
-        except:
-            formatedDate = ipranges['creationTime']
-        logVerbose(f"Updating GOOGLE CLOUD - Parsing IPv4 and IPv6 ranges updated at {formatedDate} {timer(elapsed())}")
-        databaseInfo["Google Cloud"] = {'last_updated':formatedDate,
-                                        'total_networks':len(cloudip.keys())-initialLen,
-                                        'total_ipv4':total_ipv4, 'total_ipv6':total_ipv6}
-    except Exception as ERR:
-        logVerbose(f"Failed to update GOOGLE CLOUD PLATFORM IP ranges - {str(ERR)}")
-        return 1
-
-##──── UPDATE GOOGLE CLOUD SERVICES IP RANGES ──────────────────────────────────────────────────────────────────────────────────────────────────────
-@print_elapsed_time
-def update_ip_ranges_google_services(download_url):
-    global cloudip, databaseInfo, _DEBUG
-    initialLen = len(cloudip.keys())
-    try:
-        service = 'Google Bot' \
-                if download_url.find("googlebot") >= 0 else 'Google Special Crawlers' \
-                if download_url.find("special-crawlers") >= 0 else 'Google User Triggered Fetchers' \
-                if download_url.find("user-triggered") >= 0 else 'Google Services'
-        with elapsed_timer() as elapsed:
-            ipranges = download_file(download_url)
-            if ipranges == False:
-                logError(f"Updating GOOGLE {service.upper().replace('GOOGLE ','')} - FAILED to download IP ranges file from {download_url} {timer(elapsed())}")
-                return False
-            logVerbose(f"Updating GOOGLE {service.upper().replace('GOOGLE ','')} - Downloading IP ranges file {timer(elapsed())}")
-            if _DEBUG == True:
-                filename = download_url.split("/")[-1]
-                outputFile = os.path.join(DATA_DIR,f'ipranges-{filename}.json')
-                logDebug(f"Saving ipranges to {outputFile}")
-                with open(outputFile,'w') as f:
-                    json.dump(ipranges,f,indent=3,sort_keys=False,ensure_ascii=False,default=json_default_formatter)
-        with elapsed_timer() as elapsed:
-            total_ipv4 = total_ipv6 = 0
-            for item in ipranges['prefixes']:
-                if item.get('ipv4Prefix',0) != 0:
-                    cidr = item['ipv4Prefix']
-                    first_ip, netlen = str(cidr).split("/")
-                    total_ipv4 += numIPsv4[int(netlen)]
-                    first_ip2int = ipv4_to_int(first_ip)
+                    entry = (db,row,db.cidr(row),db.indexRegions[db.regions[row]-1],db.indexProvider[db.provider[row]-1],db.indexServices[db.services[row]-1])
+                self._cache.put(key,entry)
+            if entry[1] < 0:
+                return CloudIPDetail(ip=ipaddr,cloud_provider="<not found in database>",elapsed_time=perf_counter()-startTime)
+            return CloudIPDetail(ipaddr,entry[2],entry[3],entry[4],entry[5],elapsed_time=perf_counter()-startTime)
+        except Exception as ERR:
+            return CloudIPDetail(ip=ipaddr,region=str(ERR),cloud_provider="<internal lookup error>",elapsed_time=perf_counter()-startTime)
+
+    def lookup_code(self,ipaddr:str)->int:
+        """
+        Fast path of lookup(): returns only the row of the network that contains the IP address in the database,
+        or ROW_NOT_FOUND (-1) / ROW_INVALID (-2). No object is created and the clock is not read. The row can be
+        decoded later with decode() or used with provider_code()/provider_name().
+
+        - Usage:
+
+            row = myLookup.lookup_code("3.5.140.1")
+
+            if row >= 0: print(myLookup.decode(row))
+        """
+        ##──── The IPv4 string branch of parse_ip(), inlined ───────────────────────────────────────────────────────────────────────
+        if ipaddr.__class__ is str and ':' not in ipaddr:
+            if ipaddr.strip(_IPV4_CHARS) or not ipaddr:
+                return ROW_INVALID
+            try:
+                return self._db.find_ipv4(_unpack_I(_inet_pton(_AF_INET,ipaddr))[0])
+            except OSError:
+                return ROW_INVALID
+        key = parse_ip(ipaddr)
+        if key.__class__ is int:
+            return self._db.find_ipv4(key)
+        if key is None:
+            return ROW_INVALID
+        return self._db.find_ipv6(*key)
+
+    def lookup_provider_code(self,ipaddr:str)->int:
+        """Returns the provider code of the IP address (a position in indexProvider starting at 1) or 0 if the IP address
+        was not found or is invalid. Use provider_name() to decode it."""
+        db = self._db
+        key = parse_ip(ipaddr)
+        if key is None:
+            return 0
+        row = db.find_ipv4(key) if key.__class__ is int else db.find_ipv6(*key)
+        return db.provider[row] if row >= 0 else 0
+
+    def is_cloud(self,ipaddr:str)->bool:
+        """Returns True if the IP address belongs to a network of the database"""
+        return self.lookup_code(ipaddr) >= 0
+
+    def provider_code(self,row:int)->int:
+        """Returns the provider code of a row returned by lookup_code(), or 0 for ROW_NOT_FOUND/ROW_INVALID"""
+        return self._db.provider[row] if row >= 0 else 0
+
+    def provider_name(self,code:int)->str:
+        """Returns the provider name of a code returned by lookup_provider_code() or provider_code(), or an empty string for 0"""
+        return self._db.indexProvider[code-1] if code > 0 else ""
+
+    def decode(self,row:int,ipaddr:str="")->CloudIPDetail:
+        """Returns the CloudIPDetail of a row returned by lookup_code(). The *ipaddr* is only copied to the result.
+        The elapsed_time of the result is empty. The rows are positions in the current snapshot, a reload() may
+        change them."""
+        if row == ROW_INVALID:
+            return CloudIPDetail(ip=ipaddr,cloud_provider="<invalid ip address>")
+        if row < 0:
+            return CloudIPDetail(ip=ipaddr,cloud_provider="<not found in database>")
+        return CloudIPDetail.from_row(ipaddr,self._db,row)
+
+    def lookup_range(self,cidr_or_start,end=None)->CloudIPRangeResult:
+        """
+        Finds the networks of the database that overlap a range of IP addresses: a CIDR ("52.0.0.0/8"), an IP address,
+        an ipaddress.IPv4Network/IPv6Network or the first and the last IP address (lookup_range(start,end)). Returns a
+        CloudIPRangeResult that yields the networks lazily (CloudIPDetail objects, sorted by first IP) and has the
+        totals per provider and service. Raises ValueError if the range is invalid.
+
+        - Usage:
+
+            result = myLookup.lookup_range("52.0.0.0/8")
+
+            for detail in result: print(detail.cidr, detail.cloud_provider, detail.service)
+
+            print(result.totals())
+
+            touches = next(myLookup.lookup_range("198.51.100.0/22"),None) is not None
+        """
+        first, last, ipv6 = parse_range(cidr_or_start,end)
+        query = cidr_or_start if end is None and cidr_or_start.__class__ is str else f"{key_to_ip(_key_of(first,ipv6))}-{key_to_ip(_key_of(last,ipv6))}"
+        return CloudIPRangeResult(query,first,last,ipv6,self._db)
+
+    def networks(self,provider=None,service=None,region=None):
+        """
+        Yields the CIDR of all networks of a *provider*, *service* and *region*, ex: all AWS EC2 networks of eu-west-1.
+        Each filter is a name or a list of names (case insensitive), None is any value. The networks are found with
+        the inverted indexes of the database, no row is decoded. Use network_rows() to get the rows and decode().
+
+        - Usage:
+
+            for cidr in myLookup.networks(provider="AWS",service="EC2",region="eu-west-1"): print(cidr)
+        """
+        db = self._db
+        for row in db.rows_where(provider,service,region):
+            yield db.cidr(row)
+
+    def network_rows(self,provider=None,service=None,region=None)->list:
+        """Returns the rows of the networks of networks(), sorted. The rows can be decoded with decode()"""
+        return self._db.rows_where(provider,service,region)
+
+    def lookup_stream(self,input_lines,output,output_format="jsonl",batch_size=STREAM_BATCH_SIZE,header=True)->int:
+        """
+        Resolves the IP addresses of *input_lines* (any iterable of strings, ex: a file opened for reading with one IP
+        address per line) and writes one result per line to *output* (a file opened for writing) in the format jsonl,
+        csv or tsv (ip, cidr, region, cloud_provider, service). Empty lines are ignored.
+
+        The IP addresses are read and resolved with lookup_many() in batches of *batch_size* and each batch is written
+        with a single write(), so the memory used does not depend on the size of the input. Returns the number of IP
+        addresses resolved.
+
+        - Usage:
+
+            with open("ips.txt") as infile, open("ips.jsonl","w") as outfile:
+
+                myLookup.lookup_stream(infile,outfile,"jsonl")
+        """
+        if output_format not in STREAM_FORMATS:
+            raise ValueError(f"Invalid output format {output_format!r}, use one of {', '.join(STREAM_FORMATS)}")
+        delimiter = "\t" if output_format == 'tsv' else ","
+        if header == True and output_format != 'jsonl':
+            output.write(delimiter.join(("ip","cidr","region","cloud_provider","service"))+"\n")
+        lines = iter(input_lines)
+        total, tails, tailsDatabase = 0, {}, None
+        while True:
+            batch = [line.strip() for line in islice(lines,batch_size)]
+            if not batch:
+                break
+            batch = [ipaddr for ipaddr in batch if ipaddr]
+            if not batch:
+                continue
+            result = self.lookup_many(batch)
+            ##──── The text after the IP address is the same for all IPs of a network, it is formatted once per row ────────────────────────
+            if result._db is not tailsDatabase:
+                tails, tailsDatabase = {}, result._db
+            out = []
+            for ipaddr,row in zip(batch,result.rows.tolist()):
+                tail = tails.get(row)
+                if tail is None:
+                    tail = tails[row] = _stream_row_tail(tailsDatabase,row,output_format)
+                if output_format == 'jsonl':
+                    out.append('{"ip": '+_json_string(ipaddr)+tail)
                 else:
-                    cidr = item['ipv6Prefix']
-                    first_ip, netlen = str(cidr).split("/")
-                    total_ipv6 += numIPsv6[int(netlen)]
-                    first_ip2int = ipv6_to_int(first_ip)
-                cloudip[first_ip2int] = {'provider':"Google",'cidr':cidr,'region':'','service':service.replace("Google ",""),'netlength':int(netlen),'network_features':''}
-        try:
-            formatedDate = dt.strptime(ipranges['creationTime'], "%Y-%m-%dT%H:%M:%S.%f")
-            formatedDate = formatedDate.strftime("%Y-%m-%d %H:%M:%S")
-        except:
-            formatedDate = ipranges['creationTime']
-        logVerbose(f"Updating GOOGLE {service.upper().replace('GOOGLE ','')} - Parsing IPv4 and IPv6 ranges updated at {formatedDate} {timer(elapsed())}")
-        databaseInfo[service] = {'last_updated':formatedDate,
-                                 'total_networks':len(cloudip.keys())-initialLen,
-                                 'total_ipv4':total_ipv4, 'total_ipv6':total_ipv6}
-    except Exception as ERR:
-        logVerbose(f"Failed to update GOOGLE {service.upper().replace('GOOGLE ','')} IP ranges - {str(ERR)}")
-        return 1
-
-##──── UPDATE CLOUDFLARE IP RANGES ──────────────────────────────────────────────────────────────────────────────────────────────────────
-@print_elapsed_time
-def update_ip_ranges_cloudflare(download_url):
-    global cloudip, databaseInfo, _DEBUG
-    initialLen = len(cloudip.keys())
-    try:
-        with elapsed_timer() as elapsed:
-            ipranges = download_file(download_url)
-            if ipranges == False:
-                logError(f"Updating CLOUDFLARE - FAILED to download IP ranges file from {download_url} {timer(elapsed())}")
-                return False
-            logVerbose(f"Updating CLOUDFLARE - Downloading IP ranges file {timer(elapsed())}")
-            if _DEBUG == True:
-                outputFile = os.path.join(DATA_DIR,'ipranges-cloudflare.json')
-                logDebug(f"Saving ipranges to {outputFile}")
-                with open(outputFile,'w') as f:
-                    json.dump(ipranges,f,indent=3,sort_keys=False,ensure_ascii=False,default=json_default_formatter)
-        with elapsed_timer() as elapsed:
-            total_ipv4 = total_ipv6 = 0
-            for item in ipranges['result']['ipv4_cidrs']:
-                cidr = item
-                first_ip, netlen = str(cidr).split("/")
-                total_ipv4 += numIPsv4[int(netlen)]
-                first_ip2int = ipv4_to_int(first_ip)
-                cloudip[first_ip2int] = {'provider':'Cloudflare','cidr':cidr,'region':'','service':'','netlength':int(netlen),'network_features':''}
-            for item in ipranges['result']['ipv6_cidrs']:
-                cidr = item
-                first_ip, netlen = str(cidr).split("/")
-                total_ipv6 += numIPsv6[int(netlen)]
-                first_ip2int = ipv6_to_int(first_ip)
-                cloudip[first_ip2int] = {'provider':'Cloudflare','cidr':cidr,'region':'','service':'','netlength':int(netlen),'network_features':''}
-        # Cloudflare has an API, so the date in header is always the current date time.
-        try:
-            formatedDate = dt.strptime(last_modified, "%a, %d %b %Y %H:%M:%S %Z")
-            formatedDate = formatedDate.strftime("%Y-%m-%d %H:%M:%S")
-        except:
-            formatedDate = last_modified
-        logVerbose(f"Updating CLOUDFLARE - Parsing IPv4 and IPv6 ranges updated at {formatedDate} {timer(elapsed())}")
-        databaseInfo["Cloudflare"] = {'last_updated':formatedDate,
-                                      'total_networks':len(cloudip.keys())-initialLen,
-                                      'total_ipv4':total_ipv4, 'total_ipv6':total_ipv6}
-    except Exception as ERR:
-        logVerbose(f"Failed to update CLOUDFLARE IP ranges - {str(ERR)}")
-        return 1
-
-##──── UPDATE CLOUDFLARE IP RANGES ──────────────────────────────────────────────────────────────────────────────────────────────────────
-@print_elapsed_time
-def update_ip_ranges_jdcloud(download_url):
-    global cloudip, databaseInfo, _DEBUG
-    initialLen = len(cloudip.keys())
-    try:
-        with elapsed_timer() as elapsed:
-            ipranges = download_file(download_url)
-            if ipranges == False:
-                logError(f"Updating JD CLOUD - FAILED to download IP ranges file from {download_url} {timer(elapsed())}")
-                return False
-            logVerbose(f"Updating JD CLOUD - Downloading IP ranges file {timer(elapsed())}")
-            if _DEBUG == True:
-                outputFile = os.path.join(DATA_DIR,'ipranges-jdcloud.json')
-                logDebug(f"Saving ipranges to {outputFile}")
-                with open(outputFile,'w') as f:
-                    json.dump(ipranges,f,indent=3,sort_keys=False,ensure_ascii=False,default=json_default_formatter)
-        with elapsed_timer() as elapsed:
-            total_ipv4 = total_ipv6 = 0
-            for item in ipranges['result']['jdcloud_cidrs']:
-                cidr = item
-                first_ip, netlen = str(cidr).split("/")
-                try:
-                    first_ip2int = ipv4_to_int(first_ip)
-                    total_ipv4 += numIPsv4[int(netlen)]
-                except:
-                    first_ip2int = ipv6_to_int(first_ip)
-                    total_ipv6 += numIPsv6[int(netlen)]
-                cloudip[first_ip2int] = {'provider':'JD Cloud','cidr':cidr,'region':'China','service':'','netlength':int(netlen),'network_features':''}
-        # Cloudflare JD Cloud China has an API, so the date in header is always the current date time.
-        try:
-            formatedDate = dt.strptime(last_modified, "%a, %d %b %Y %H:%M:%S %Z")
-            formatedDate = formatedDate.strftime("%Y-%m-%d %H:%M:%S")
-        except:
-            formatedDate = last_modified
-        logVerbose(f"Updating JD CLOUD - Parsing IPv4 and IPv6 ranges updated at {formatedDate} {timer(elapsed())}")
-        databaseInfo["JD Cloud"] = {'last_updated':formatedDate,
-                                    'total_networks':len(cloudip.keys())-initialLen,
-                                    'total_ipv4':total_ipv4, 'total_ipv6':total_ipv6}
-    except Exception as ERR:
-        logVerbose(f"Failed to update JD CLOUD IP ranges - {str(ERR)}")
-        return 1
+                    out.append(_stream_quote(ipaddr,delimiter)+tail)
+            output.write("".join(out))
+            total += len(batch)
+        return total
 
+    def annotate_log(self,input_lines,output,pattern='combined',processes=None,chunk_size=LOG_CHUNK_SIZE,separator="\t")->dict:
+        """
+        Annotates access logs (nginx, Apache, AWS ELB/ALB...) with the cloud provider of the client IP address. Each line
+        of *input_lines* is written to *output* followed by the columns provider, service and region, separated by
+        *separator*. The missing values are written as "-". The lines keep the order of the input.
 
-##──── UPDATE ORACLE CLOUD IP RANGES ──────────────────────────────────────────────────────────────────────────────────────────────────────
-@print_elapsed_time
-def update_ip_ranges_oracle_cloud(download_url):
-    global cloudip, databaseInfo, _DEBUG
-    initialLen = len(cloudip.keys())
-    try:
-        with elapsed_timer() as elapsed:
-            ipranges = download_file(download_url)
-            if ipranges == False:
-                logError(f"Updating ORACLE - FAILED to download IP ranges file from {download_url} {timer(elapsed())}")
-                return False
-            logVerbose(f"Updating ORACLE - Downloading IP ranges file {timer(elapsed())}")
-            if _DEBUG == True:
-                outputFile = os.path.join(DATA_DIR,'ipranges-oracle.json')
-                logDebug(f"Saving ipranges to {outputFile}")
-                with open(outputFile,'w') as f:
-                    json.dump(ipranges,f,indent=3,sort_keys=False,ensure_ascii=False,default=json_default_formatter)
-        with elapsed_timer() as elapsed:
-            total_ipv4 = total_ipv6 = 0
-            for region in ipranges['regions']:
-                region_name = region['region']
-                for item in region['cidrs']:
-                    cidr = item['cidr']
-                    service = ', '.join(item['tags'])
-                    first_ip, netlen = str(cidr).split("/")
-                    if cidr.find(":") < 0:
-                        first_ip2int = ipv4_to_int(first_ip)                
-                        total_ipv4 += numIPsv4[int(netlen)]
-                    else:
-                        first_ip2int = ipv6_to_int(first_ip)                
-                        total_ipv6 += numIPsv6[int(netlen)]
-                    cloudip[first_ip2int] = {'provider':'Oracle Cloud','cidr':cidr,'region':region_name,'service':service,'netlength':int(netlen),'network_features':''}
-        try:
-            formatedDate = dt.strptime(ipranges['last_updated_timestamp'], "%Y-%m-%dT%H:%M:%S.%f")
-            formatedDate = formatedDate.strftime("%Y-%m-%d %H:%M:%S")
-        except:
-            formatedDate = ipranges['last_updated_timestamp']
-        logVerbose(f"Updating ORACLE - Parsing IPv4 and IPv6 ranges updated at {formatedDate} {timer(elapsed())}")
-        databaseInfo["Oracle Cloud"] = {'last_updated':formatedDate,
-                                        'total_networks':len(cloudip.keys())-initialLen,
-                                        'total_ipv4':total_ipv4, 'total_ipv6':total_ipv6}
-    except Exception as ERR:
-        logVerbose(f"Failed to update ORACLE CLOUD IP ranges - {str(ERR)}")
-        return 1
-
-##──── UPDATE DIGITAL OCEAN IP RANGES ──────────────────────────────────────────────────────────────────────────────────────────────────────
-@print_elapsed_time
-def update_ip_ranges_digital_ocean(download_url):
-    global cloudip, databaseInfo, last_modified, _DEBUG
-    initialLen = len(cloudip.keys())    
-    try:
-        with elapsed_timer() as elapsed:
-            ipranges = download_file(download_url)
-            if ipranges == False:
-                logError(f"Updating DIGITAL OCEAN - FAILED to download IP ranges file from {download_url} {timer(elapsed())}")
-                return False
-            logVerbose(f"Updating DIGITAL OCEAN - Downloading IP ranges file {timer(elapsed())}")
-            if _DEBUG == True:
-                outputFile = os.path.join(DATA_DIR,'ipranges-digitalocean.csv')
-                logDebug(f"Saving ipranges to {outputFile}")
-                with open(outputFile,'w') as f:
-                    for line in ipranges:
-                        if line:
-                            f.write(line+"\n")
-        with elapsed_timer() as elapsed:
-            total_ipv4 = total_ipv6 = 0
-            for linha in ipranges:
-                if linha != "":
-                    cidr, country_code, micro_region, city, unknown = linha.split(",")
-                    first_ip, netlen = str(cidr).split("/")
-                    if cidr.find(":") < 0:
-                        first_ip2int = ipv4_to_int(first_ip)
-                        total_ipv4 += numIPsv4[int(netlen)]
-                    else:
-                        first_ip2int = ipv6_to_int(first_ip)
-                        total_ipv6 += numIPsv6[int(netlen)]                
-                    cloudip[first_ip2int] = {'provider':'Digital Ocean','cidr':cidr,'region':micro_region+" "+city,'service':'','netlength':int(netlen),'network_features':''}
-        try:
-            formatedDate = dt.strptime(last_modified, "%a, %d %b %Y %H:%M:%S %Z")
-            formatedDate = formatedDate.strftime("%Y-%m-%d %H:%M:%S")
-        except:
-            formatedDate = last_modified
-        logVerbose(f"Updating DIGITAL OCEAN - Parsing IPv4 and IPv6 ranges updated at {formatedDate} {timer(elapsed())}")
-        databaseInfo["Digital Ocean"] = {'last_updated':formatedDate,
-                                        'total_networks':len(cloudip.keys())-initialLen,
-                                        'total_ipv4':total_ipv4, 'total_ipv6':total_ipv6}
-    except Exception as ERR:
-        logVerbose(f"Failed to update DIGITAL OCEAN IP ranges - {str(ERR)}")
-        return 1
-        
+        The client IP address is extracted with *pattern*: a key of LOG_PATTERNS ('combined' for nginx/Apache, 'elb'
+        and 'alb' for the AWS load balancers) or a regular expression with a group named 'ip' (or a single group).
 
-##################################################################################################################################
-##################################################################################################################################
+        The lines are sent in chunks of *chunk_size* to a pool of *processes* worker processes (default: the number of
+        CPUs, use 1 to annotate in this process). The workers do not load the database file again: on platforms
+        with fork() they inherit the snapshot already loaded by this instance, otherwise they map the binary file
+        cloudiplookup.dat.bin. A few chunks are in flight at a time, so the memory used does not depend on the size
+        of the input.
 
-                             ##     ##    ###    #### ##    ##                 
-                             ###   ###   ## ##    ##  ###   ##                 
-                             #### ####  ##   ##   ##  ####  ##                 
-                             ## ### ## ##     ##  ##  ## ## ##                 
-                             ##     ## #########  ##  ##  ####                 
-                             ##     ## ##     ##  ##  ##   ###                 
-             ####### ####### ##     ## ##     ## #### ##    ## ####### ####### 
- 
-##################################################################################################################################
-##################################################################################################################################
-#defmain
-def main_function():
-    global args, _DEBUG
-    sys.tracebacklimit = 0
-    parser = ArgumentParser(formatter_class=class_argparse_formatter,
-                            description=__doc__.splitlines()[1],
-                            allow_abbrev=True,
-                            add_help=False)
-    lookup = parser.add_argument_group("Lookup Parameters")
-    lookup.add_argument(dest="ipaddr",action="store",nargs='?',metavar="ipaddr,ipaddrN...",help="Supply one or more IP address separated by comma.")
-    output = parser.add_argument_group("Output Options") 
-    output.add_argument("--csv","-c",dest='csv',action="store_true",default=False,help="Print output in csv format (ip,cidr,region,cloud_provider,service,elapsed_time).")
-    update = parser.add_argument_group("Database Options")
-    update.add_argument("--update","-u",dest='update',action="store_true",default=False,help="Updates IP ranges directly from cloud service providers. Use -v to see updating progress.")
-    update.add_argument("--info","-i",dest='info',action="store_true",default=False,help="Shows information about the current database file in json format.")
-    update.add_argument("--pretty","-p",dest='pretty',action="store_true",default=False,help="Shows information about the current database file in a table format.")
-    update.add_argument("--show-config-file",dest='showconfigfile',action="store_true",default=False,help="Displays the available settings for downloading information about network ranges.")
-    optional = parser.add_argument_group("More Options")
-    optional.add_argument('--verbose','-v',dest="verbose",action='store_true',default=False,help='Shows useful messages about each step that application is doing.')
-    optional.add_argument('--debug','-d',dest="debug",action='store_true',default=False,help='Save all data from cloud providers in the data directory. Debug is not verbose!')
-    optional.add_argument('--help','-h','-?',action='help',help='Shows this help message about the allowed commands.')
-    optional.add_argument('--version',action='version',help='Shows the application version.',version="%s v%s"%(__appid__,__version__))
-    ##────── do the parse ───────────────────────────────────────────────────────────────────────────────────────────────────
-    args = parser.parse_args()
-    ##────── Se não houve subcomando, exiba o help ─────────────────────────────────────────────────────────────────────────
-
-    _DEBUG = args.debug
-    if (args.debug == True and args.verbose == True):
-        logDebug.__code__ = _logDebug.__code__
-    if (args.verbose == False):
-        logVerbose.__code__ = _logEmpty.__code__
-        
-    if (args.showconfigfile == True):
-        try:
-            with open(os.path.join(DATA_DIR,PROVIDERS_INFORMATION_FILE_NAME),"r") as f:
-                infoFile = json.load(f)
-            logDebug(f"Config file location: {os.path.join(DATA_DIR,PROVIDERS_INFORMATION_FILE_NAME)}")
-            pp_json(infoFile)
-            sys.exit(0)
-        except Exception as ERR:
-            logError(f"Failed to open information file \"{str(os.path.join(DATA_DIR,PROVIDERS_INFORMATION_FILE_NAME))}\": {str(ERR)}")
-            sys.exit(1)
-    
-    if (args.update == True):
-        sys.exit(update_ip_ranges(verbose=args.verbose,debug=_DEBUG))
-
-    iplookup = CloudIPLookup((args.verbose or args.debug))
-    if (args.info == True):
-        if args.pretty == True:
-            for key,val in databaseInfo.items():
-                print(f"{key.ljust(32,'.')}: {(str(val['total_networks'])+' networks ').ljust(15)} - Last update: {val['last_updated']}")
+        Returns a dict with the total of lines, seconds and lines/sec, and the same numbers for each worker in 'workers'
+        (the seconds of a worker are the time spent annotating).
+
+        - Usage:
+
+            with open("access.log") as infile, open("access.cloud.log","w") as outfile:
+
+                stats = myLookup.annotate_log(infile,outfile,pattern='combined',processes=4)
+        """
+        global _logWorker
+        regex, group = _log_compile_pattern(pattern)
+        processes = processes or os.cpu_count() or 1
+        lines = iter(input_lines)
+        chunks = iter(lambda: list(islice(lines,max(1,chunk_size))),[])
+        workers = {}
+        def write(result):
+            pid, text, count, seconds = result
+            output.write(text)
+            worker = workers.setdefault(pid,{'pid':pid,'lines':0,'seconds':0.0})
+            worker['lines'] += count
+            worker['seconds'] += seconds
+        startTime = perf_counter()
+        if processes <= 1:
+            state = (self,regex,group,separator)
+            for chunk in chunks:
+                write(_log_annotate_lines(state,chunk))
         else:
-            pp_json(databaseInfo)
-        sys.exit(0)
-    
-    if (args.ipaddr is None):
-        parser.print_help()
-        print("")
-        sys.exit(0)
-    
-    iplist = args.ipaddr.replace(' ','').split(",")
-    for ipaddr in iplist:
-        if args.csv == True:
-            print(iplookup.lookup(ipaddr).pp_csv())
+            import multiprocessing
+            context = multiprocessing.get_context('fork' if 'fork' in multiprocessing.get_all_start_methods() else None)
+            _logWorker = (self,regex,group,separator) if context.get_start_method() == 'fork' else None
+            try:
+                with context.Pool(processes,initializer=_log_worker_init,initargs=(DATA_DIR,pattern,separator)) as pool:
+                    pending = deque()
+                    for chunk in chunks:
+                        pending.append(pool.apply_async(_log_worker_chunk,(chunk,)))
+                        if len(pending) > processes * 2:
+                            write(pending.popleft().get())
+                    while pending:
+                        write(pending.popleft().get())
+            finally:
+                _logWorker = None
+        elapsed = perf_counter() - startTime
+        for worker in workers.values():
+            worker['lines_per_sec'] = int(worker['lines']/worker['seconds']) if worker['seconds'] > 0 else 0
+        total = sum(worker['lines'] for worker in workers.values())
+        return {'lines':total,'seconds':elapsed,'lines_per_sec':int(total/elapsed) if elapsed > 0 else 0,
+                'workers':sorted(workers.values(),key=lambda worker:worker['pid'])}
+
+    def lookup_many(self,ips,use_numpy=None)->'CloudIPBatchResult':
+        """
+        Performs a search for a list of IP addresses (strings, integers, packed bytes or ipaddress objects) in the
+        in-memory database and returns the result in columns (a CloudIPBatchResult object).
+
+        The IP addresses are converted in bulk by ip_list_to_arrays(). If numpy is installed, they are resolved with
+        numpy.searchsorted() over the intervals of the database (no copy is made, the arrays are views of the database
+        columns), the environments without numpy use a pure Python binary search. Use *use_numpy* = False to force pure
+        Python or True to require numpy.
+
+        - Usage:
+
+            from cloudiplookip import CloudIPLookup
+
+            myLookup = CloudIPLookup()
+
+            result = myLookup.lookup_many(["8.8.8.8","52.94.7.24","2600:9000:21e8:2600:1:5a19:8b40:93a1"])
+
+            print(result.provider, result.indexProvider)
+
+            for detail in result:
+                print(detail)
+        """
+        np = _import_numpy() if use_numpy != False else None
+        if use_numpy == True and np is None:
+            raise Exception("Failed lookup_many() 'numpy' is not installed, use lookup_many(ips,use_numpy=False)")
+        if hasattr(ips,'tolist'):   # numpy arrays and array.array
+            ips = ips.tolist()
+        elif not isinstance(ips,(list,tuple)):
+            ips = list(ips)
+        db = self._db
+        families, ipv4, hi, lo = ip_list_to_arrays(ips)
+        total, totalIPv4 = len(families), families.count(4)
+        if np is not None:
+            rows = _numpy_rows(np,db,families,ipv4,hi,lo)
+            found = rows >= 0
+            codes = []
+            for column in (db.provider,db.services,db.regions,db.features):
+                columnCodes = np.zeros(total,dtype=np.uint16)
+                columnCodes[found] = _numpy_column(np,column)[rows[found]]
+                codes.append(columnCodes)
         else:
-            print(iplookup.lookup(ipaddr).pp_json())
+            find_ipv4, find_ipv6 = db.find_ipv4, db.find_ipv6
+            if totalIPv4 == total:
+                rows = array('l',map(find_ipv4,ipv4))
+            else:
+                rows = array('l',[find_ipv4(ipv4[pos]) if family == 4 else find_ipv6(hi[pos],lo[pos]) if family == 6 else ROW_INVALID
+                                  for pos,family in enumerate(families)])
+            codes = [array('H',[column[row] if row >= 0 else 0 for row in rows]) for column in (db.provider,db.services,db.regions,db.features)]
+        return CloudIPBatchResult(ips,rows,*codes,db)
+
+    def annotate(self,frame,column,prefix="",chunk_size=ANNOTATE_CHUNK_SIZE):
+        """
+        Resolves the IP addresses of the column *column* of a pandas.DataFrame or a pyarrow Table/RecordBatch and returns
+        a new frame with the categorical columns cidr, region, cloud_provider and service appended (named with *prefix*,
+        ex: prefix="src_"). The IP addresses not found or invalid are null. Requires numpy, pandas and pyarrow are only
+        imported by the frame itself.
+
+        The column is converted in chunks of *chunk_size* values by ip_list_to_arrays() (integer columns of IPv4 are
+        used as they are) and resolved with numpy.searchsorted() over the database arrays, like lookup_many(). The
+        categories of region, cloud_provider and service are the lists indexRegions, indexProvider and indexServices
+        of the database, the codes are the codes of the database, so no string is created per row.
+
+        - Usage:
+
+            import pandas as pd
+
+            df = pd.read_csv("access.csv")
+
+            df = myLookup.annotate(df,"client_ip")
+
+            print(df.groupby("cloud_provider",observed=True).size())
+        """
+        np = _import_numpy()
+        if np is None:
+            raise Exception("Failed annotate() 'numpy' is not installed")
+        db = self._db
+        library = type(frame).__module__.split(".")[0]
+        if library == "pandas":
+            import pandas as pd
+            values = frame[column]
+            total = len(values)
+            isInteger = values.dtype.kind in "iu" and not values.hasnans
+            getChunk = lambda start, end: values.iloc[start:end].tolist()
+            getIntegers = lambda: values.to_numpy()
+        elif library == "pyarrow":
+            import pyarrow as pa
+            values = frame.column(column)
+            total = len(values)
+            isInteger = pa.types.is_integer(values.type) and values.null_count == 0
+            getChunk = lambda start, end: values.slice(start,end-start).to_pylist()
+            getIntegers = lambda: values.to_numpy()
+        else:
+            raise TypeError(f"Failed annotate() expected a pandas.DataFrame or a pyarrow Table/RecordBatch, got {type(frame).__name__}")
+        rows = None
+        if isInteger and total > 0:
+            integers = getIntegers()
+            if integers.min() >= 0 and integers.max() <= 0xFFFFFFFF:
+                rows = _numpy_rows(np,db,np.full(total,4,dtype=np.uint8),integers.astype(np.uint32),None,None)
+        if rows is None:
+            chunk_size = max(1,int(chunk_size))
+            rows = np.concatenate([np.empty(0,dtype=np.int64)]+[_numpy_rows(np,db,*ip_list_to_arrays(getChunk(start,min(total,start+chunk_size))))
+                                                                 for start in range(0,total,chunk_size)])
+        found = rows >= 0
+        ##──── cidr: one category per network found, the codes are the positions of the rows in the sorted unique rows ────────
+        uniqueRows, cidrCodes = np.unique(rows[found],return_inverse=True)
+        codes = np.full(total,-1,dtype=np.int32)
+        codes[found] = cidrCodes
+        newColumns = [("cidr",codes,[db.cidr(row) for row in uniqueRows.tolist()])]
+        for name,dbColumn,categories in (("region",db.regions,db.indexRegions),("cloud_provider",db.provider,db.indexProvider),("service",db.services,db.indexServices)):
+            codes = np.full(total,-1,dtype=np.int32)
+            codes[found] = _numpy_column(np,dbColumn)[rows[found]].astype(np.int32)-1
+            newColumns.append((name,codes,list(categories)))
+        if library == "pandas":
+            return frame.assign(**{prefix+name:pd.Categorical.from_codes(codes,categories=categories) for name,codes,categories in newColumns})
+        for name,codes,categories in newColumns:
+            frame = frame.append_column(prefix+name,pa.DictionaryArray.from_arrays(pa.array(codes,mask=codes < 0,type=pa.int32()),pa.array(categories,type=pa.string())))
+        return frame
+
+##──── CLASS FOR THE HTTP LOOKUP SERVICE (cloudiplookup serve) ──────────────────────────────────────────────────────────────────
+class CloudIPLookupServer(object):
+    """A small HTTP/1.1 server (asyncio, keep-alive) to use Cloud IP Lookup from services written in other languages
+
+    Endpoints (all responses are json):
+
+        GET  /lookup/<ipaddr>   the result of lookup() for one IP address
+        POST /lookup            the results of a list of IP addresses, sent as a json array or one IP address per line
+        GET  /info              the result of get_database_info()
+        GET  /stats             the counters of requests, errors, IP addresses and latency of each endpoint
+
+    The lookups are served from the in-memory *iplookup* (a CloudIPLookup). If none is given, a CloudIPLookup that
+    checks the database file every *watch_interval* seconds and reloads it when it is replaced is created.
+
+    The bodies bigger than *max_body* bytes (default *max_batch* * SERVE_BODY_BYTES_PER_IP) are answered with HTTP 413
+    before they are read, and the bodies without a Content-Length (Transfer-Encoding: chunked) with HTTP 411. Both
+    close the connection. The bodies bigger than SERVE_INLINE_BODY bytes are looked up in a thread of the default
+    executor of the event loop, the other connections are answered meanwhile.
+    """
+    ENDPOINTS = ('lookup','batch','info','stats','other')
+    def __init__(self, iplookup=None, host=SERVE_HOST, port=SERVE_PORT, max_batch=SERVE_MAX_BATCH, watch_interval=SERVE_WATCH_INTERVAL, max_body=None):
+        self.iplookup = iplookup if iplookup is not None else CloudIPLookup(watch_interval=watch_interval)
+        self.host = host
+        self.port = port
+        self.max_batch = max_batch
+        self.max_body = max_body if max_body is not None else max_batch*SERVE_BODY_BYTES_PER_IP
+        self.started_at = time.time()
+        self.connections = 0
+        self.counters = {endpoint:{'requests':0,'errors':0,'ips':0,'latency_total':0.0,'latency_max':0.0} for endpoint in self.ENDPOINTS}
+        self._server = None
+    def stats(self)->dict:
+        """Returns the counters of the server. The latencies are in seconds, from the end of the request to the response"""
+        endpoints = {}
+        for endpoint,counter in self.counters.items():
+            endpoints[endpoint] = dict(counter,latency_avg=counter['latency_total']/counter['requests'] if counter['requests'] > 0 else 0.0)
+        return {'uptime':time.time()-self.started_at,'connections':self.connections,
+                'requests':sum(counter['requests'] for counter in self.counters.values()),
+                'errors':sum(counter['errors'] for counter in self.counters.values()),
+                'networks':len(self.iplookup._db),'database_file':self.iplookup._db.filename,'endpoints':endpoints}
+    async def start(self):
+        """Starts listening. With port=0 a free port is chosen and saved in *port*"""
+        import asyncio
+        self._server = await asyncio.start_server(self._handle_connection,self.host,self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self._server
+    async def serve_forever(self):
+        if self._server is None:
+            await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+    def run(self):
+        """Runs the server until CTRL+C"""
+        import asyncio
+        try:
+            asyncio.run(self.serve_forever())
+        except KeyboardInterrupt:
+            pass
+    async def _handle_connection(self,reader,writer):
+        import asyncio
+        self.connections += 1
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError,ConnectionError):
+                    return
+                except asyncio.LimitOverrunError:
+                    writer.write(self._response(431,{'error':'request header too large'},False))
+                    return
+                startTime = perf_counter()
+                try:
+                    requestLine, *headerLines = head.decode('latin-1').split("\r\n")
+                    method, target, version = requestLine.split(" ")
+                    headers = {}
+                    for line in headerLines:
+                        if line:
+                            name, value = line.split(":",1)
+                            headers[name.strip().lower()] = value.strip()
+                    ##──── The body is read only if its size is known and allowed, the rest of the connection can't be parsed otherwise ─────────
+                    if 'transfer-encoding' in headers:
+                        writer.write(self._response(411,{'error':'Transfer-Encoding is not supported, send the body with a Content-Length'},False))
+                        return
+                    contentLength = headers.get('content-length','0')
+                    if not contentLength.isdecimal():
+                        raise ValueError(f"invalid Content-Length {contentLength}")
+                    if int(contentLength) > self.max_body:
+                        writer.write(self._response(413,{'error':f'request body too large, the limit is {self.max_body} bytes'},False))
+                        return
+                    body = await reader.readexactly(int(contentLength))
+                except (asyncio.IncompleteReadError,ConnectionError):
+                    return
+                except Exception:
+                    writer.write(self._response(400,{'error':'bad request'},False))
+                    return
+                connection = headers.get('connection','').lower()
+                keepAlive = (connection != 'close') if version == 'HTTP/1.1' else (connection == 'keep-alive')
+                endpoint, status, payload = await self._dispatch(method,target,body)
+                writer.write(self._response(status,payload,keepAlive))
+                await writer.drain()
+                ##──── Single-threaded event loop: the counters don't need a lock ─────────────────────────────────────────────────────────
+                latency = perf_counter() - startTime
+                counter = self.counters[endpoint]
+                counter['requests'] += 1
+                counter['latency_total'] += latency
+                if latency > counter['latency_max']:
+                    counter['latency_max'] = latency
+                if status >= 400:
+                    counter['errors'] += 1
+                if keepAlive == False:
+                    return
+        except ConnectionError:
+            return
+        finally:
+            self.connections -= 1
+            writer.close()
+    async def _dispatch(self,method:str,target:str,body:bytes)->tuple:
+        """Returns (endpoint, status, payload). The payload is a json-serializable object or json bytes already encoded"""
+        from urllib.parse import unquote
+        path = target.split("?",1)[0]
+        if path.startswith("/lookup/"):
+            if method != 'GET':
+                return 'lookup', 405, {'error':'use GET /lookup/<ipaddr>'}
+            self.counters['lookup']['ips'] += 1
+            result = self.iplookup.lookup(unquote(path[8:])).to_dict()
+            return 'lookup', (400 if result['cloud_provider'] == "<invalid ip address>" else 200), result
+        if path in ("/lookup","/lookup/"):
+            if method != 'POST':
+                return 'batch', 405, {'error':'use POST /lookup with a json array of IP addresses'}
+            ##──── A big batch takes up to a few tenths of a second: it runs in a thread so the other connections are still served ───────
+            if len(body) > SERVE_INLINE_BODY:
+                import asyncio
+                status, payload, ips = await asyncio.get_running_loop().run_in_executor(None,self._batch,body)
+            else:
+                status, payload, ips = self._batch(body)
+            self.counters['batch']['ips'] += ips
+            return 'batch', status, payload
+        if path == "/info" and method == 'GET':
+            return 'info', 200, self.iplookup.get_database_info(print_result=False)
+        if path == "/stats" and method == 'GET':
+            return 'stats', 200, self.stats()
+        return 'other', 404, {'error':'not found, use GET /lookup/<ipaddr>, POST /lookup, GET /info or GET /stats'}
+    def _batch(self,body:bytes)->tuple:
+        """Returns (status, payload, IP addresses looked up) of a POST /lookup *body*. It runs in the event loop or in a
+        thread of its default executor, it doesn't change the counters"""
+        try:
+            text = body.decode('utf-8').strip()
+            ips = json.loads(text) if text.startswith("[") else [line.strip() for line in text.splitlines() if line.strip()]
+            if not all(isinstance(ipaddr,str) for ipaddr in ips):
+                raise ValueError("the IP addresses must be strings")
+        except Exception as ERR:
+            return 400, {'error':f'invalid body: {str(ERR)}'}, 0
+        if len(ips) > self.max_batch:
+            return 413, {'error':f'too many IP addresses, the limit is {self.max_batch}'}, 0
+        return 200, self._batch_json(ips), len(ips)
+    def _batch_json(self,ips:list)->bytes:
+        """Encodes the results of a batch as a json array, each network is formatted once (see lookup_stream())"""
+        result = self.iplookup.lookup_many(ips)
+        tails, out = {}, []
+        for ipaddr,row in zip(ips,result.rows.tolist()):
+            tail = tails.get(row)
+            if tail is None:
+                tail = tails[row] = _stream_row_tail(result._db,row,'jsonl')[:-1]
+            out.append('{"ip": '+_json_string(ipaddr)+tail)
+        return ("["+",".join(out)+"]").encode('utf-8')
+    def _response(self,status:int,payload,keep_alive:bool)->bytes:
+        body = payload if isinstance(payload,bytes) else json.dumps(payload,ensure_ascii=False,default=json_default_formatter).encode('utf-8')
+        reason = {200:'OK',400:'Bad Request',404:'Not Found',405:'Method Not Allowed',411:'Length Required',413:'Payload Too Large',431:'Request Header Fields Too Large'}.get(status,'')
+        return (f"HTTP/1.1 {status} {reason}\r\nContent-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n").encode('latin-1')+body
+
+##──── NAMES OF THE UPDATER AND OF THE COMMAND LINE, IMPORTED ON THE FIRST ACCESS (PEP 562). THEY WERE DEFINED IN THIS MODULE ─────
+_LAZY_ATTRIBUTES = {name:'cloudiplookup.updater' for name in ('update_ip_ranges','update_ip_ranges_aws','update_ip_ranges_azure',
+                    'update_ip_ranges_google_cloud','update_ip_ranges_google_services','update_ip_ranges_cloudflare','update_ip_ranges_jdcloud',
+                    'update_ip_ranges_oracle_cloud','update_ip_ranges_digital_ocean','update_from_delta','download_file','CloudIPFeedCache','FeedNotModified')}
+_LAZY_ATTRIBUTES.update({name:'cloudiplookup.cli' for name in ('main_function','class_argparse_formatter')})
+def __getattr__(name):
+    if name not in _LAZY_ATTRIBUTES:
+        raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
+    import importlib
+    return getattr(importlib.import_module(_LAZY_ATTRIBUTES[name]),name)
 
 if __name__ == "__main__":
-    sys.exit(main_function())
\ No newline at end of file
+    ##──── Run as a script, the directory of this file is replaced by its parent so "cloudiplookup" is the package, not this file ───
+    sys.path[0] = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    sys.modules.pop('cloudiplookup',None)
+    from cloudiplookup.cli import main_function
+    sys.exit(main_function())
@@ -0,0 +1,537 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+# -*- coding: utf-8 -*-
+"""
+Cloud IP Lookup - Database diffs and delta files
+
+diff_databases(old,new) compares two databases and returns a CloudIPDatabaseDiff with the networks added, removed and
+re-attributed (the same CIDR with another provider, service, region or network features), counted for each provider
+and service and exported in json or csv. Its delta, the new attributions of the changed CIDRs only, is saved in a
+small file (save_delta()) that CloudIPLookup.apply_delta() applies to the database loaded without reading the
+database file again. update_ip_ranges() saves the delta from the previous database in DATA_DIR/cloudiplookup.delta.gz.
+
+Imported only when a diff or a delta is used.
+"""
+import os, json, gzip
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import chain, repeat, islice
+from collections import Counter
+from datetime import datetime as dt
+from cloudiplookup.cloudiplookup import (BINARY_FILE_MAGIC, DELTA_FORMAT_VERSION, PREFILTER_IPV6_MAX_PREFIXES, CloudIPDatabase, CloudIPMmapDatabase, CloudIPLookup,
+                                         numIPsv4, numIPsv6, int_to_ipv4, int_to_ipv6, ipv4_to_int, ipv6_to_int, _build_intervals, _build_prefilter,
+                                         _columns_fingerprint, _import_numpy)
+
+DIFF_CSV_HEADER = "change,cidr,old_provider,old_service,old_region,old_features,new_provider,new_service,new_region,new_features"
+
+##──── THE DATABASE OF A CloudIPLookup, A CloudIPDatabase OR A FILE (cloudiplookup.dat.gz OR cloudiplookup.dat.bin) ──────────────
+def load_database(source)->CloudIPDatabase:
+    """Returns the CloudIPDatabase of *source*: a CloudIPLookup (the snapshot loaded), a CloudIPDatabase or the name
+    of a cloudiplookup.dat.gz or cloudiplookup.dat.bin file"""
+    if isinstance(source,CloudIPLookup):
+        return source._db
+    if isinstance(source,CloudIPDatabase):
+        return source
+    with open(source,'rb') as f:
+        magic = f.read(len(BINARY_FILE_MAGIC))
+    if magic == BINARY_FILE_MAGIC:
+        return CloudIPMmapDatabase(source)
+    with gzip.open(source,'rb') as f:
+        return CloudIPDatabase.from_pickle(f,source)
+
+##──── THE NETWORKS OF A DATABASE GROUPED BY CIDR. KEY (family, first_ip, netlength), THE IPv4 NETWORKS SORT FIRST ───────────────────
+def network_groups(database)->dict:
+    """Returns {(family, first_ip, netlength): [(provider, service, region, features), ...]} with the attributions of
+    each CIDR of *database* in the order of the rows. The order matters: the last one wins in the lookups."""
+    groups = {}
+    for key, attribution in zip(_row_keys(database),_row_attributions(database)):
+        group = groups.get(key)
+        if group is None:
+            groups[key] = [attribution]
+        else:
+            group.append(attribution)
+    return groups
+
+def _row_keys(database):
+    return chain(zip(repeat(4),database.ipv4FirstIP,islice(database.netLength,0,database.totalIPv4)),
+                 zip(repeat(6),[hi << 64 | lo for hi, lo in zip(database.ipv6FirstHi,database.ipv6FirstLo)],islice(database.netLength,database.totalIPv4,None)))
+
+def _row_attributions(database):
+    ##──── The codes start at 1, the tables get a first item to be indexed by the codes ──────────────────────────────────────────────
+    return zip(*(map(([None]+table).__getitem__,codes) for codes, table in ((database.provider,database.indexProvider),(database.services,database.indexServices),
+                                                                          (database.regions,database.indexRegions),(database.features,database.indexNetworkFeatures))))
+
+def _key_cidr(key)->str:
+    family, first_ip, netlength = key
+    return (int_to_ipv4(first_ip) if family == 4 else int_to_ipv6(first_ip))+"/"+str(netlength)
+
+def _cidr_key(cidr)->tuple:
+    first_ip, netlength = cidr.split("/")
+    return (6,ipv6_to_int(first_ip),int(netlength)) if ':' in first_ip else (4,ipv4_to_int(first_ip),int(netlength))
+
+##──── A HASH OF THE NETWORKS AND THEIR ATTRIBUTIONS, THE SAME FOR THE SAME NETWORKS IN cloudiplookup.dat.gz AND cloudiplookup.dat.bin ──
+def database_fingerprint(source)->str:
+    """Returns the fingerprint of the networks of *source* (see load_database()), checked by the delta files. It is
+    saved in the database files by the update, the files created before it get it computed from the columns."""
+    return load_database(source).fingerprint
+
+##──── DIFF OF TWO DATABASES ─────────────────────────────────────────────────────────────────────────────────────────────────────
+class CloudIPDatabaseDiff(object):
+    """The changes from the database *old* to the database *new* (CloudIPDatabase objects), by CIDR:
+
+        added           [(cidr, (provider, service, region, features)), ...] the CIDRs that are only in *new*
+        removed         [(cidr, (provider, service, region, features)), ...] the CIDRs that are only in *old*
+        reattributed    [(cidr, [old attributions], [new attributions]), ...] the CIDRs in both with other attributions
+
+    A CIDR can have many attributions (ex: AWS AMAZON and EC2). The attributions that are in both databases are not
+    reported: when AWS adds the service S3 to a network of AMAZON, the network is "added" for AWS S3.
+    """
+    def __init__(self, old, new):
+        oldGroups, newGroups = network_groups(old), network_groups(new)
+        self.base, self.target = old.fingerprint, new.fingerprint
+        self.old_networks, self.new_networks = len(old), len(new)
+        self.databaseInfo = new.databaseInfo
+        self.added, self.removed, self.reattributed = [], [], []
+        self._changes = {}
+        changedKeys = [key for key, group in oldGroups.items() if newGroups.get(key) != group]+[key for key in newGroups if key not in oldGroups]
+        for key in sorted(changedKeys):
+            oldGroup, newGroup = oldGroups.get(key,[]), newGroups.get(key,[])
+            cidr = _key_cidr(key)
+            self._changes[cidr] = newGroup
+            common = Counter(oldGroup) & Counter(newGroup)
+            onlyOld, onlyNew = list((Counter(oldGroup)-common).elements()), list((Counter(newGroup)-common).elements())
+            if onlyOld and onlyNew:
+                self.reattributed.append((cidr,onlyOld,onlyNew))
+            elif onlyNew:
+                self.added.extend((cidr,attribution) for attribution in onlyNew)
+            elif onlyOld:
+                self.removed.extend((cidr,attribution) for attribution in onlyOld)
+            else:
+                ##──── The same attributions in another order, the network found by the lookups changed ─────────────────────────────────────
+                self.reattributed.append((cidr,oldGroup,newGroup))
+    def __len__(self):
+        """The number of changed CIDRs"""
+        return len(self._changes)
+    def summary(self)->dict:
+        """Returns {provider: {service: {'added': n, 'removed': n, 'reattributed': n}}}. A re-attributed CIDR is counted
+        once for each provider and service of its old and new attributions"""
+        summary = {}
+        def count(provider,service,change):
+            counters = summary.setdefault(provider,{}).setdefault(service,{'added':0,'removed':0,'reattributed':0})
+            counters[change] += 1
+        for cidr, (provider, service, region, features) in self.added:
+            count(provider,service,'added')
+        for cidr, (provider, service, region, features) in self.removed:
+            count(provider,service,'removed')
+        for cidr, oldGroup, newGroup in self.reattributed:
+            for provider, service in dict.fromkeys((attribution[0],attribution[1]) for attribution in oldGroup+newGroup):
+                count(provider,service,'reattributed')
+        return summary
+    def to_dict(self)->dict:
+        attribution = lambda values: dict(zip(('provider','service','region','features'),values))
+        return {'old':{'fingerprint':self.base,'networks':self.old_networks},
+                'new':{'fingerprint':self.target,'networks':self.new_networks},
+                'summary':self.summary(),
+                'added':[dict(cidr=cidr,**attribution(values)) for cidr, values in self.added],
+                'removed':[dict(cidr=cidr,**attribution(values)) for cidr, values in self.removed],
+                'reattributed':[{'cidr':cidr,'old':[attribution(values) for values in oldGroup],'new':[attribution(values) for values in newGroup]}
+                                for cidr, oldGroup, newGroup in self.reattributed]}
+    def to_json(self,indent=3)->str:
+        return json.dumps(self.to_dict(),indent=indent,ensure_ascii=False)
+    def csv_lines(self,header=True):
+        """Yields the lines (without line break) of the csv format, a line per change (see DIFF_CSV_HEADER). A re-attributed
+        CIDR has a line for each pair of its old and new attributions"""
+        quote = lambda value: '"'+value.replace('"','""')+'"' if (',' in value or '"' in value) else value
+        line = lambda change, cidr, old, new: ",".join([change,cidr]+[quote(value) for value in (old or ('',)*4)+(new or ('',)*4)])
+        if header == True:
+            yield DIFF_CSV_HEADER
+        for cidr, values in self.added:
+            yield line('added',cidr,None,values)
+        for cidr, values in self.removed:
+            yield line('removed',cidr,values,None)
+        for cidr, oldGroup, newGroup in self.reattributed:
+            for pos in range(max(len(oldGroup),len(newGroup))):
+                yield line('reattributed',cidr,oldGroup[pos] if pos < len(oldGroup) else None,newGroup[pos] if pos < len(newGroup) else None)
+    def delta(self)->dict:
+        """Returns the delta file as a dict: the fingerprints of the old and new databases, all attributions of each changed
+        CIDR in the new database (an empty list if the CIDR was removed) and the databaseInfo of the new database"""
+        return {'format':'cloudiplookup-delta','version':DELTA_FORMAT_VERSION,'created':dt.now().strftime("%Y-%m-%d %H:%M:%S"),
+                'base':self.base,'target':self.target,'networks':{cidr:[list(values) for values in group] for cidr, group in self._changes.items()},
+                'databaseInfo':self.databaseInfo}
+    def save_delta(self,filename):
+        """Saves the delta in *filename* (json compressed with gzip), see save_delta()"""
+        save_delta(self.delta(),filename)
+
+def diff_databases(old,new)->CloudIPDatabaseDiff:
+    """Compares the databases *old* and *new*: CloudIPLookup objects, CloudIPDatabase objects or the names of the
+    cloudiplookup.dat.gz or cloudiplookup.dat.bin files. Returns a CloudIPDatabaseDiff"""
+    return CloudIPDatabaseDiff(load_database(old),load_database(new))
+
+##──── DELTA FILES ───────────────────────────────────────────────────────────────────────────────────────────────────────────────
+def load_delta(delta)->dict:
+    """Returns the delta *delta*: the name of a delta file, its bytes (compressed or not) or the dict of delta()"""
+    if isinstance(delta,dict):
+        data = delta
+    else:
+        if not isinstance(delta,(bytes,bytearray)):
+            with open(delta,'rb') as f:
+                delta = f.read()
+        data = json.loads(gzip.decompress(delta) if delta[:2] == b'\x1f\x8b' else delta)
+    if data.get('format') != 'cloudiplookup-delta' or data.get('version') != DELTA_FORMAT_VERSION:
+        raise ValueError(f"invalid delta, expected the format cloudiplookup-delta version {DELTA_FORMAT_VERSION}")
+    return data
+
+def save_delta(delta:dict,filename):
+    """Saves the delta *delta* (a dict, see CloudIPDatabaseDiff.delta()) in *filename*, json compressed with gzip,
+    written to a temporary file and then renamed"""
+    with gzip.GzipFile(filename=filename+'.tmp',mode='wb',compresslevel=9,mtime=0) as f:
+        f.write(json.dumps(delta,ensure_ascii=False,separators=(',',':')).encode('utf-8'))
+    os.replace(filename+'.tmp',filename)
+
+
+def apply_delta(database,delta,verify=False,use_numpy=None)->tuple:
+    """Returns the (columns, strings) of *database* (a CloudIPDatabase) with the changes of *delta* (see load_delta()):
+    the same columns as a new update with the same networks.
+
+    The delta must have been created from the same networks: the fingerprint of *database*, saved in the database
+    file by the update, must be the 'base' of the delta, otherwise a ValueError is raised. Only the changed CIDRs are
+    patched: their rows are replaced and the columns are spliced around them, the intervals are built again over the
+    addresses of the changed CIDRs only, the posting lists of the inverted indexes only for the codes of the changed
+    rows and the prefilter only for their prefixes. The columns without changes are the ones of *database* (with a
+    memory-mapped database, memoryviews of its file). The result gets the fingerprint 'target' of the delta, with
+    *verify* = True it is also computed from the new columns and checked, which hashes all the columns.
+
+    The rows after a changed CIDR move, so the columns of rows (the intervals and the inverted indexes) get the new row
+    numbers: numpy renumbers them at once when it is installed, use *use_numpy* = False to force pure Python.
+    """
+    delta = load_delta(delta)
+    fingerprint = database.fingerprint
+    if fingerprint != delta['base']:
+        if fingerprint == delta['target']:
+            raise ValueError("the delta was already applied to this database")
+        raise ValueError("the delta was created from another database, load the whole database file")
+    np = _import_numpy() if use_numpy != False else None
+    if use_numpy == True and np is None:
+        raise Exception("Failed apply_delta() 'numpy' is not installed, use apply_delta(database,delta,use_numpy=False)")
+    columns, strings = _DatabasePatch(database,{_cidr_key(cidr):group for cidr, group in delta['networks'].items()},np).apply()
+    strings.update(databaseInfo=delta['databaseInfo'],fingerprint=delta['target'])
+    if verify == True and _columns_fingerprint(columns,strings) != delta['target']:
+        raise ValueError("the database created by the delta is not the database of the delta")
+    return columns, strings
+
+##──── PATCH OF THE COLUMNS OF A DATABASE ─────────────────────────────────────────────────────────────────────────────────────────
+##──── The columns are copied as bytes between the rows of the changed CIDRs, only the values of the new rows are Python objects ────
+def _splice(column,pieces:list,typecode=None)->array:
+    """Returns a new column with the *pieces*: slices (start, stop) of *column* (an array.array or a memoryview) and
+    lists of new values"""
+    spliced = array(typecode or (column.typecode if isinstance(column,array) else column.format))
+    sameWidth = spliced.itemsize == column.itemsize
+    for piece in pieces:
+        if piece.__class__ is tuple:
+            if piece[0] < piece[1]:
+                if sameWidth:
+                    spliced.frombytes(memoryview(column[piece[0]:piece[1]]).cast('B'))
+                else:
+                    spliced.fromlist(column[piece[0]:piece[1]].tolist())
+        else:
+            spliced.fromlist(piece)
+    return spliced
+
+def _bisect_ipv6(columnHi,columnLo,value:int,right=False)->int:
+    """bisect_left() (bisect_right() with *right*) of the 128 bits *value* in the sorted pairs of the columns hi and lo"""
+    hi, lo = value >> 64, value & 0xFFFFFFFFFFFFFFFF
+    low, high = bisect_left(columnHi,hi), bisect_right(columnHi,hi)
+    return bisect_right(columnLo,lo,low,high) if right else bisect_left(columnLo,lo,low,high)
+
+def _merge_ranges(ranges)->list:
+    """Merges the sorted ranges [(first, last), ...] that overlap or touch"""
+    merged = []
+    for first, last in ranges:
+        if merged and first <= merged[-1][1]+1:
+            merged[-1][1] = max(merged[-1][1],last)
+        else:
+            merged.append([first,last])
+    return merged
+
+class _DatabasePatch(object):
+    """The columns of a CloudIPDatabase with the rows of the CIDRs of *changes* ({(family, first_ip, netlength):
+    [attributions]}) replaced, see apply_delta(). The rows are in the same order as the update sorts them, so the
+    rows of a CIDR are contiguous and found by a binary search."""
+    def __init__(self, database, changes:dict, np=None):
+        self.db, self.columns, self.np = database, database.columns, np
+        stringCodes = [{value:code for code, value in enumerate(table,1)} for table in (database.indexProvider,database.indexServices,database.indexRegions,database.indexNetworkFeatures)]
+        ##──── The plan: (key, first old row, end old row, first new row, codes of the new rows) of each changed CIDR, in row order ───────
+        self.plan, shift, shiftIPv4 = [], 0, 0
+        oldIndex = (database.ipv4FirstIP,database.ipv6FirstHi,database.ipv6FirstLo,database.netLength,database.totalIPv4)
+        for key in sorted(changes):
+            firstRow, endRow = self._rows_of(oldIndex,key)
+            newRows = [tuple(self._code(stringCodes,pos,value) for pos, value in enumerate(values)) for values in changes[key]]
+            self.plan.append((key,firstRow,endRow,firstRow+shift,newRows))
+            shift += len(newRows)-(endRow-firstRow)
+            shiftIPv4 = shift if key[0] == 4 else shiftIPv4
+        self.tables = [list(codes) for codes in stringCodes]
+        self.totalRows, self.newTotalIPv4 = len(database)+shift, database.totalIPv4+shiftIPv4
+        self.shifted = any(len(newRows) != endRow-firstRow for key, firstRow, endRow, newRow, newRows in self.plan)
+        self.rowTypecode = 'H' if self.totalRows <= 0x10000 else 'I'
+        ##──── The new row of each old row, -1 for the replaced rows ─────────────────────────────────────────────────────────────────────
+        self.newRowOf, prev = [], 0
+        for key, firstRow, endRow, newRow, newRows in self.plan:
+            self.newRowOf.extend(range(newRow-(firstRow-prev),newRow))
+            self.newRowOf.extend(repeat(-1,endRow-firstRow))
+            prev = endRow
+        self.newRowOf.extend(range(prev+shift,len(database)+shift))
+        self.newRowOfArray = None
+        if np is not None and self.shifted == True:
+            self.newRowOfArray, prev = np.full(len(database),-1,dtype=np.int64), 0
+            for key, firstRow, endRow, newRow, newRows in self.plan:
+                self.newRowOfArray[prev:firstRow] = np.arange(newRow-(firstRow-prev),newRow)
+                prev = endRow
+            self.newRowOfArray[prev:] = np.arange(prev+shift,len(database)+shift)
+        ##──── The addresses of the changed CIDRs of each family, where the intervals and the prefilter change ──────────────────────────
+        self.ranges = {family:_merge_ranges((key[1],key[1]+(numIPsv4 if family == 4 else numIPsv6)[key[2]]-1) for key, *_ in self.plan if key[0] == family)
+                       for family in (4,6)}
+    @staticmethod
+    def _code(stringCodes:list,pos:int,value:str)->int:
+        ##──── The new strings are appended to the tables, the codes are numbered again in apply() ──────────────────────────────────────────
+        codes = stringCodes[pos]
+        if value not in codes:
+            codes[value] = len(codes)+1
+        return codes[value]
+    @staticmethod
+    def _rows_of(index:tuple,key:tuple)->tuple:
+        """The rows [first, end) of the CIDR *key* in the columns *index* (ipv4.first, ipv6.first.hi, ipv6.first.lo,
+        netlength, number of IPv4 rows), an empty range at the position of the CIDR if it has no rows"""
+        ipv4First, ipv6FirstHi, ipv6FirstLo, netLength, totalIPv4 = index
+        family, first_ip, netlength = key
+        if family == 4:
+            low, high = bisect_left(ipv4First,first_ip), bisect_right(ipv4First,first_ip)
+        else:
+            low, high = totalIPv4+_bisect_ipv6(ipv6FirstHi,ipv6FirstLo,first_ip), totalIPv4+_bisect_ipv6(ipv6FirstHi,ipv6FirstLo,first_ip,True)
+        return bisect_left(netLength,netlength,low,high), bisect_right(netLength,netlength,low,high)
+    def apply(self)->tuple:
+        columns = {}
+        self._network_columns(columns)
+        self.index, self.netlengths = (columns['ipv4.first'],columns['ipv6.first.hi'],columns['ipv6.first.lo'],columns['netlength'],self.newTotalIPv4), {}
+        for family in (4,6):
+            self._intervals(family,columns)
+        for pos, name in enumerate(('provider','services','regions')):
+            columns[f'ix.{name}.off'], columns[f'ix.{name}.row'] = self._inverted_index(pos,name)
+        self._prefilter(columns)
+        strings = {'indexProvider':self.tables[0],'indexServices':self.tables[1],'indexRegions':self.tables[2],'indexNetworkFeatures':self.tables[3]}
+        return {name:columns[name] for name in chain(self.columns,columns) if name in columns}, strings
+    def _splice_rows(self,column,value,family=None,typecode=None):
+        """*column* with the rows of the changed CIDRs replaced by value(key, codes) of their new rows. With *family* (4
+        or 6) *column* has the rows of that family only. A column without changes is returned as it is"""
+        offset = self.db.totalIPv4 if family == 6 else 0
+        pieces, prev = [], 0
+        for key, firstRow, endRow, newRow, newRows in self.plan:
+            if family is None or key[0] == family:
+                pieces.append((prev,firstRow-offset))
+                pieces.append([value(key,codes) for codes in newRows])
+                prev = endRow-offset
+        if not pieces and (typecode is None or typecode == (column.typecode if isinstance(column,array) else column.format)):
+            return column
+        pieces.append((prev,len(column)))
+        return _splice(column,pieces,typecode)
+    def _network_columns(self,columns:dict):
+        mask = 0xFFFFFFFFFFFFFFFF
+        columns['ipv4.first'] = self._splice_rows(self.columns['ipv4.first'],lambda key, codes: key[1],4)
+        columns['ipv4.last'] = self._splice_rows(self.columns['ipv4.last'],lambda key, codes: key[1]+numIPsv4[key[2]]-1,4)
+        columns['ipv6.first.hi'] = self._splice_rows(self.columns['ipv6.first.hi'],lambda key, codes: key[1] >> 64,6)
+        columns['ipv6.first.lo'] = self._splice_rows(self.columns['ipv6.first.lo'],lambda key, codes: key[1] & mask,6)
+        columns['ipv6.last.hi'] = self._splice_rows(self.columns['ipv6.last.hi'],lambda key, codes: (key[1]+numIPsv6[key[2]]-1) >> 64,6)
+        columns['ipv6.last.lo'] = self._splice_rows(self.columns['ipv6.last.lo'],lambda key, codes: (key[1]+numIPsv6[key[2]]-1) & mask,6)
+        columns['netlength'] = self._splice_rows(self.columns['netlength'],lambda key, codes: key[2])
+        ##──── The codes are numbered in the order they first appear in the rows, like the update. oldCodes maps each new code to ─────────
+        ##──── its code before the renumbering (the code of the database or of a new string) ───────────────────────────────────────────────
+        self.oldCodes = []
+        for pos, name in enumerate(('provider','services','regions','features')):
+            table = self.tables[pos]
+            codes = self._splice_rows(self.columns[name],lambda key, codes: codes[pos],typecode='B' if len(table) <= 0xFF else 'H')
+            if self.np is None:
+                oldCodes = list(dict.fromkeys(codes))
+            else:
+                values, firstRows = self.np.unique(self.np.frombuffer(codes,dtype=f"u{codes.itemsize}"),return_index=True)
+                oldCodes = values[self.np.argsort(firstRows)].tolist()
+            if len(oldCodes) != len(table) or oldCodes != list(range(1,len(table)+1)):
+                newCode = [0]*(len(table)+1)
+                for code, oldCode in enumerate(oldCodes,1):
+                    newCode[oldCode] = code
+                typecode = 'B' if len(oldCodes) <= 0xFF else 'H'
+                if typecode == 'B' and codes.itemsize == 1:
+                    codes = array('B',codes.tobytes().translate(bytes(newCode+[0]*(256-len(newCode)))))
+                elif self.np is None:
+                    codes = array(typecode,map(newCode.__getitem__,codes))
+                else:
+                    codes = array(typecode,self.np.array(newCode,dtype=f"u{array(typecode).itemsize}")[self.np.frombuffer(codes,dtype=f"u{codes.itemsize}")].tobytes())
+                self.tables[pos] = [table[oldCode-1] for oldCode in oldCodes]
+            columns[name] = codes
+            self.oldCodes.append(oldCodes)
+    def _new_rows(self,rows):
+        """The slice *rows* of a column of rows with the new row numbers. The replaced rows are not in it"""
+        itemsize = array(self.rowTypecode).itemsize
+        if self.shifted == False and rows.itemsize == itemsize:
+            return rows
+        if self.newRowOfArray is None:
+            return array(self.rowTypecode,map(self.newRowOf.__getitem__,rows))
+        return array(self.rowTypecode,self.newRowOfArray[self.np.frombuffer(rows,dtype=f"u{rows.itemsize}")].astype(f"u{itemsize}").tobytes())
+    def _range_intervals(self,family:int,lo:int,hi:int)->list:
+        """The intervals (start, end, row) of the addresses lo..hi with the new rows: _build_intervals() of the networks
+        that contain lo and of the networks that start in the range, clipped to the range"""
+        bits, numIPs = (32,numIPsv4) if family == 4 else (128,numIPsv6)
+        ipv4First, ipv6FirstHi, ipv6FirstLo, netLength, totalIPv4 = self.index
+        ##──── The networks that contain lo start at lo aligned to their netlength, only the netlengths of the family are searched ───────
+        if family not in self.netlengths:
+            self.netlengths[family] = sorted(set(bytes(netLength[0:totalIPv4] if family == 4 else netLength[totalIPv4:])))
+        rows = []
+        for netlength in self.netlengths[family]:
+            first_ip = lo & ~(numIPs[netlength]-1)
+            if first_ip == lo:
+                break
+            rows.extend(range(*self._rows_of(self.index,(family,first_ip,netlength))))
+        if family == 4:
+            rows.extend(range(bisect_left(ipv4First,lo),bisect_right(ipv4First,hi)))
+            firstIP = [ipv4First[row] for row in rows]
+        else:
+            rows.extend(range(totalIPv4+_bisect_ipv6(ipv6FirstHi,ipv6FirstLo,lo),totalIPv4+_bisect_ipv6(ipv6FirstHi,ipv6FirstLo,hi,True)))
+            firstIP = [ipv6FirstHi[row-totalIPv4] << 64 | ipv6FirstLo[row-totalIPv4] for row in rows]
+        lastIP = [first_ip+numIPs[netLength[row]]-1 for first_ip, row in zip(firstIP,rows)]
+        start, end, positions = _build_intervals(firstIP,lastIP)
+        return [(max(first_ip,lo),min(last_ip,hi),rows[pos]) for first_ip, last_ip, pos in zip(start,end,positions) if first_ip <= hi and last_ip >= lo]
+    def _intervals(self,family:int,columns:dict):
+        """The interval columns of *family*: the intervals outside the changed addresses are copied (with the new row
+        numbers), the ones of the changed addresses are built again. Adjacent intervals of the same row are merged, like
+        _build_intervals() does"""
+        names = ('ipv4.start','ipv4.end') if family == 4 else ('ipv6.start.hi','ipv6.start.lo','ipv6.end.hi','ipv6.end.lo')
+        old, oldRows, ranges = [self.columns[name] for name in names], self.columns[f'ipv{family}.row'], self.ranges[family]
+        if not ranges:
+            columns.update(zip(names,old))
+            columns[f'ipv{family}.row'] = self._new_rows(oldRows)
+            return
+        mask = 0xFFFFFFFFFFFFFFFF
+        out, outRows = [array('I' if family == 4 else 'Q') for name in names], array(self.rowTypecode)
+        if family == 4:
+            startAt, endAt = old[0].__getitem__, old[1].__getitem__
+            firstStartingFrom, firstEndingAfter = (lambda value: bisect_left(old[0],value)), (lambda value: bisect_right(old[1],value))
+            lastEnd = lambda: out[1][-1]
+            def setLastEnd(value):
+                out[1][-1] = value
+            def append(first_ip,last_ip):
+                out[0].append(first_ip), out[1].append(last_ip)
+        else:
+            startAt, endAt = (lambda pos: old[0][pos] << 64 | old[1][pos]), (lambda pos: old[2][pos] << 64 | old[3][pos])
+            firstStartingFrom = lambda value: _bisect_ipv6(old[0],old[1],value)
+            firstEndingAfter = lambda value: _bisect_ipv6(old[2],old[3],value,True)
+            lastEnd = lambda: out[2][-1] << 64 | out[3][-1]
+            def setLastEnd(value):
+                out[2][-1], out[3][-1] = value >> 64, value & mask
+            def append(first_ip,last_ip):
+                out[0].append(first_ip >> 64), out[1].append(first_ip & mask), out[2].append(last_ip >> 64), out[3].append(last_ip & mask)
+        def add(first_ip,last_ip,row):
+            if first_ip > last_ip:
+                return
+            if outRows and outRows[-1] == row and lastEnd()+1 == first_ip:
+                setLastEnd(last_ip)
+            else:
+                append(first_ip,last_ip)
+                outRows.append(row)
+        def add_old(first,stop,fromIP,toIP):
+            ##──── The old intervals [first, stop) clipped to the addresses fromIP..toIP, the ones in the middle are copied as bytes ──────
+            if first >= stop:
+                return
+            add(max(startAt(first),fromIP),min(endAt(first),toIP),self.newRowOf[oldRows[first]])
+            if stop-first > 2:
+                for column, oldColumn in zip(out,old):
+                    column.frombytes(memoryview(oldColumn[first+1:stop-1]).cast('B'))
+                outRows.extend(self._new_rows(oldRows[first+1:stop-1]))
+            if stop-first > 1:
+                add(startAt(stop-1),min(endAt(stop-1),toIP),self.newRowOf[oldRows[stop-1]])
+        prev, cursor = 0, 0
+        for lo, hi in ranges:
+            add_old(prev,firstStartingFrom(lo),cursor,lo-1)
+            for interval in self._range_intervals(family,lo,hi):
+                add(*interval)
+            prev, cursor = firstEndingAfter(hi), hi+1
+        add_old(prev,len(oldRows),cursor,(1 << (32 if family == 4 else 128))-1)
+        columns.update(zip(names,out))
+        columns[f'ipv{family}.row'] = outRows
+    def _inverted_index(self,pos:int,name:str)->tuple:
+        """The posting lists of the new codes: the ones of the codes without changed rows are copied (with the new row
+        numbers), the ones of the codes of the replaced or new rows are merged with the new rows"""
+        off, rows = self.columns[f'ix.{name}.off'], self.columns[f'ix.{name}.row']
+        column, totalOldCodes = self.columns[('provider','services','regions')[pos]], len(off)-2
+        changed, newRows = set(), {}
+        for key, firstRow, endRow, newRow, rowCodes in self.plan:
+            changed.update(column[firstRow:endRow])
+            for row, codes in enumerate(rowCodes,newRow):
+                newRows.setdefault(codes[pos],[]).append(row)
+        changed.update(newRows)
+        ##──── All rows are renumbered at once, the replaced rows (-1) are only in the posting lists of the changed codes ─────────────────
+        if self.shifted == False:
+            renumbered = signed = rows
+        elif self.newRowOfArray is None:
+            renumbered = signed = list(map(self.newRowOf.__getitem__,rows))
+        else:
+            signed = self.newRowOfArray[self.np.frombuffer(rows,dtype=f"u{rows.itemsize}")]
+            renumbered = memoryview(signed.astype(f"u{array(self.rowTypecode).itemsize}").tobytes()).cast(self.rowTypecode)
+        outOff, outRows = [0,0], array(self.rowTypecode)
+        for oldCode in self.oldCodes[pos]:
+            first, stop = (off[oldCode],off[oldCode+1]) if oldCode <= totalOldCodes else (0,0)
+            if oldCode in changed:
+                kept = signed[first:stop]
+                kept = kept[kept >= 0].tolist() if self.newRowOfArray is not None else [row for row in kept if row >= 0]
+                outRows.fromlist(sorted(kept+newRows.get(oldCode,[])))
+            elif renumbered.__class__ is list:
+                outRows.fromlist(renumbered[first:stop])
+            elif first < stop:
+                if renumbered.itemsize == outRows.itemsize:
+                    outRows.frombytes(memoryview(renumbered[first:stop]).cast('B'))
+                else:
+                    outRows.fromlist(renumbered[first:stop].tolist())
+            outOff.append(len(outRows))
+        return array('I',outOff), outRows
+    @staticmethod
+    def _covered_prefixes(firstEndingFrom,startAt,endAt,totalIntervals:int,shift:int,firstPrefix:int,lastPrefix:int):
+        """Yields the runs (first, last) of the prefixes firstPrefix..lastPrefix (the addresses >> *shift*) covered by the
+        intervals. A binary search finds the interval of the first prefix not seen yet, so each search covers at least
+        one prefix and the intervals of a big network are not all read"""
+        prefix = firstPrefix
+        while prefix <= lastPrefix:
+            pos = firstEndingFrom(prefix << shift)
+            if pos == totalIntervals or startAt(pos) >> shift > lastPrefix:
+                return
+            first, last = max(startAt(pos) >> shift,prefix), min(endAt(pos) >> shift,lastPrefix)
+            yield first, last
+            prefix = last+1
+    def _prefilter(self,columns:dict):
+        """The prefilter bits of the prefixes of the changed addresses are set again from the new intervals that overlap them"""
+        columns['pf.ipv4'], columns['pf.ipv6'], columns['pf.ipv6.bits'] = self.columns['pf.ipv4'], self.columns['pf.ipv6'], self.columns['pf.ipv6.bits']
+        if self.ranges[4]:
+            start, end = columns['ipv4.start'], columns['ipv4.end']
+            bitmap, shift = bytearray(self.columns['pf.ipv4']), 32-self.db.prefilterIPv4Bits
+            for lo, hi in self.ranges[4]:
+                firstPrefix, lastPrefix = lo >> shift, hi >> shift
+                for prefix in range(firstPrefix,lastPrefix+1):
+                    bitmap[prefix >> 3] &= ~(1 << (prefix & 7))
+                for first, last in self._covered_prefixes(lambda value: bisect_left(end,value),start.__getitem__,end.__getitem__,len(end),shift,firstPrefix,lastPrefix):
+                    for prefix in range(first,last+1):
+                        bitmap[prefix >> 3] |= 1 << (prefix & 7)
+            columns['pf.ipv4'] = array('B',bitmap)
+        if self.ranges[6]:
+            bits = self.db.prefilterIPv6Bits
+            shift = 128-bits
+            ##──── Without the IPv6 prefilter (a network covered too many prefixes) or with a new network that covers too many, the ───────
+            ##──── IPv6 prefilter is built from all networks, like the update ─────────────────────────────────────────────────────────────────
+            if bits == 0 or any((lo >> shift)+PREFILTER_IPV6_MAX_PREFIXES <= (hi >> shift) for lo, hi in self.ranges[6]):
+                prefilter = _build_prefilter((),(),columns['ipv6.first.hi'],columns['ipv6.last.hi'])
+                columns['pf.ipv6'], columns['pf.ipv6.bits'] = prefilter['pf.ipv6'], prefilter['pf.ipv6.bits']
+                return
+            startHi, startLo, endHi, endLo = columns['ipv6.start.hi'], columns['ipv6.start.lo'], columns['ipv6.end.hi'], columns['ipv6.end.lo']
+            prefixes = set(self.db.prefilterIPv6)
+            for lo, hi in self.ranges[6]:
+                firstPrefix, lastPrefix = lo >> shift, hi >> shift
+                prefixes.difference_update(range(firstPrefix,lastPrefix+1))
+                for first, last in self._covered_prefixes(lambda value: _bisect_ipv6(endHi,endLo,value),lambda pos: startHi[pos] << 64 | startLo[pos],
+                                                          lambda pos: endHi[pos] << 64 | endLo[pos],len(endHi),shift,firstPrefix,lastPrefix):
+                    prefixes.update(range(first,last+1))
+            columns['pf.ipv6'] = array('Q',sorted(prefixes))
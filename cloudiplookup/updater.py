@@ -0,0 +1,951 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+# -*- coding: utf-8 -*-
+"""
+Cloud IP Lookup - Updater: downloads the IP ranges of the cloud providers and creates the database files
+
+Imported only when an update runs (update_ip_ranges(), CloudIPLookup.update_database() or --update), the lookups
+don't pay for urllib and concurrent.futures. DATA_DIR and the DOWNLOAD_* settings are read from the module
+cloudiplookup.cloudiplookup on each call, so they can still be changed there.
+"""
+import os, json, gzip, pickle, re, time, codecs
+import urllib.request, urllib.error
+from array import array
+from datetime import datetime as dt
+from concurrent.futures import ThreadPoolExecutor
+import cloudiplookup.cloudiplookup as _core
+from cloudiplookup.cloudiplookup import (PROVIDERS_INFORMATION_FILE_NAME, OUTPUT_FILE_NAME, BINARY_FILE_NAME, DATABASE_VERSION, FEED_CACHE_DIR_NAME, DELTA_FILE_NAME,
+                                         numIPsv4, numIPsv6, ipv4_to_int, ipv6_to_hilo, log, logVerbose, logDebug, _logDebug, _logEmpty, logError,
+                                         elapsed_timer, timer, print_elapsed_time, json_default_formatter, _build_columns, _write_binary_file, _columns_fingerprint)
+
+_DEBUG = False
+
+##──── RAW-FEED CACHE OF THE PROVIDERS, USED FOR CONDITIONAL DOWNLOADS ──────────────────────────────────────────────────────────
+class FeedNotModified(Exception):
+    """Raised by download_file() and open_feed() when the server answers 304 Not Modified. The networks of the provider are in the feed cache."""
+
+class CloudIPFeedCache(object):
+    """The last raw feed of a provider, its ETag/Last-Modified headers and the networks parsed from it, kept in
+    DATA_DIR/cloudiplookup.feeds/ (files <name>.json, <name>.raw.gz and <name>.networks.gz).
+
+    The headers are saved only together with the parsed networks, so a conditional request is sent only if the
+    networks of the feed can be reused when the server answers 304 Not Modified.
+    """
+    def __init__(self, directory, name):
+        self.directory = directory
+        self.name = name
+        self._pending = {}
+        self._raw = None
+        try:
+            with open(self._path('.json'),'r') as f:
+                self.meta = json.load(f)
+        except Exception:
+            self.meta = {}
+    def _path(self,extension):
+        return os.path.join(self.directory,self.name+extension)
+    def _write(self,extension,data:bytes):
+        os.makedirs(self.directory,exist_ok=True)
+        with open(self._path(extension)+'.tmp','wb') as f:
+            f.write(data)
+        os.replace(self._path(extension)+'.tmp',self._path(extension))
+    def conditional_headers(self,url)->dict:
+        """Returns the If-None-Match/If-Modified-Since headers of *url* or an empty dict"""
+        if self.meta.get('url') != url or not os.path.exists(self._path('.networks.gz')):
+            return {}
+        headers = {}
+        if self.meta.get('etag'):
+            headers['If-None-Match'] = self.meta['etag']
+        if self.meta.get('last_modified'):
+            headers['If-Modified-Since'] = self.meta['last_modified']
+        return headers
+    def store_feed(self,url,raw:bytes,etag,last_modified):
+        """Saves the raw feed. The headers are saved later by store_networks()"""
+        self.open_raw().write(raw)
+        self.close_raw(url,etag,last_modified)
+    def open_raw(self):
+        """Returns a file to write the raw feed while it is downloaded, compressed on the fly. Saved by close_raw()"""
+        os.makedirs(self.directory,exist_ok=True)
+        rawFile = open(self._path('.raw.gz')+'.tmp','wb')
+        self._raw = (rawFile,gzip.GzipFile(filename='',mode='wb',fileobj=rawFile,mtime=0))
+        return self._raw[1]
+    def close_raw(self,url,etag,last_modified,commit=True):
+        """Saves the raw feed written in open_raw(), or removes it if *commit* is False (incomplete download)"""
+        rawFile, rawGzip = self._raw
+        self._raw = None
+        rawGzip.close()
+        rawFile.close()
+        if commit == False:
+            os.remove(self._path('.raw.gz')+'.tmp')
+            return
+        os.replace(self._path('.raw.gz')+'.tmp',self._path('.raw.gz'))
+        self._pending = {'url':url,'etag':etag,'last_modified':last_modified}
+    def store_networks(self,result):
+        """Saves the networks parsed by an update_ip_ranges_* function and the headers of the feed"""
+        self._write('.networks.gz',gzip.compress(pickle.dumps(result,pickle.HIGHEST_PROTOCOL),mtime=0))
+        self.meta = dict(self._pending,saved_at=dt.now().strftime("%Y-%m-%d %H:%M:%S"))
+        self._write('.json',json.dumps(self.meta,indent=3).encode())
+    def load_networks(self):
+        """Returns the networks saved by store_networks()"""
+        with gzip.open(self._path('.networks.gz'),'rb') as f:
+            result = pickle.load(f)
+        ##──── The networks saved by older versions are lists of dicts, the feed is downloaded again ────────────────────────────────────
+        if len(result) != 3 or not isinstance(result[1],CloudIPNetworkColumns):
+            raise ValueError("networks saved in an older format")
+        return result
+    def invalidate(self):
+        """Forgets the headers, the next download will not be conditional"""
+        self.meta = {}
+
+##──── A FEED BEING DOWNLOADED, READ IN CHUNKS ───────────────────────────────────────────────────────────────────────────────────
+class CloudIPFeedReader(object):
+    """The body of a provider feed, read incrementally from the socket (or from any binary file object) and
+    decompressed on the fly if the server sent it with gzip. Use chunks() for the streaming json parser
+    (iter_json_items()) or lines() for the text feeds, only one chunk of the feed is in memory at a time.
+
+    The chunks read are also written in the feed cache (compressed) and in *copy_to*, a file of the debug mode. The
+    raw feed is saved in the cache by close() only if the whole feed was read without errors: close() reads what the
+    parser left (ex: a new line after the json) and with *commit* = False (an error) the partial feed is removed.
+    """
+    def __init__(self, response, url, last_modified=None, etag=None, cache=None, copy_to=None):
+        self.url = url
+        self.last_modified = last_modified
+        self.etag = etag
+        self.bytes_read = 0
+        self._response = response
+        self._stream = response
+        if getattr(response,'headers',None) is not None and response.headers.get('Content-Encoding','').lower() == 'gzip':
+            self._stream = gzip.GzipFile(fileobj=response,mode='rb')
+        self._cache = cache
+        self._copies = []
+        if cache is not None:
+            self._copies.append(cache.open_raw())
+        if copy_to is not None:
+            self._copies.append(open(copy_to,'wb'))
+        self._eof = False
+    def __enter__(self):
+        return self
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close(commit=(exc_type is None))
+    def read(self,size=-1)->bytes:
+        """Reads up to *size* bytes of the feed (all the rest with -1), an empty bytes at the end"""
+        data = self._stream.read(size)
+        if not data or size < 0:
+            self._eof = True
+        self.bytes_read += len(data)
+        for copy in self._copies:
+            copy.write(data)
+        return data
+    def chunks(self,size=None):
+        """Yields the feed as strings of about *size* bytes (default FEED_CHUNK_SIZE). A utf-8 character split
+        between two reads is kept for the next chunk"""
+        size = size or _core.FEED_CHUNK_SIZE
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        while True:
+            data = self.read(size)
+            if not data:
+                break
+            yield decoder.decode(data)
+        yield decoder.decode(b'',final=True)
+    def lines(self,size=None):
+        """Yields the lines of the feed, without the new line character"""
+        pending = ""
+        for chunk in self.chunks(size):
+            lines = (pending+chunk).split("\n")
+            pending = lines.pop()
+            yield from lines
+        if pending:
+            yield pending
+    def close(self,commit=True):
+        """Closes the response. With the feed cache, saves the raw feed if *commit* and the whole feed was read"""
+        try:
+            if commit == True and self._copies:
+                while not self._eof and self.read(_core.FEED_CHUNK_SIZE):
+                    pass
+        except Exception:
+            commit = False
+        finally:
+            for copy in self._copies[1 if self._cache is not None else 0:]:
+                copy.close()
+            if self._cache is not None:
+                self._cache.close_raw(self.url,self.etag,self.last_modified_header,commit=(commit == True and self._eof))
+            self._copies = []
+            self._response.close()
+    @property
+    def last_modified_header(self):
+        """The Last-Modified header sent by the server, None if it only sent the Date"""
+        headers = getattr(self._response,'headers',None)
+        return headers.get('Last-Modified') if headers is not None else None
+
+##──── OPENS A FEED OF THE INTERNET FOR A STREAMING READ. RETURNS A CloudIPFeedReader OR None IF THE DOWNLOAD FAILED ─────────────
+##──── A real browser User agent is needed to download Digital Ocean files because it does not accept empty/curl user agent ──────
+##──── Network errors, timeouts and HTTP 429/5xx are retried *retries* times, waiting *backoff* seconds before the first retry and ──
+##──── doubling the wait on each new retry. Only the request is retried: an error while the body is read is raised by the reader ──
+##──── With a *cache* (CloudIPFeedCache) the request is conditional and raises FeedNotModified if the server answers 304 ────────
+def open_feed(url, user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/117.0.0.0 Safari/537.36", max_redirects=5,
+              timeout=None, retries=None, backoff=None, cache=None, copy_to=None):
+    timeout = _core.DOWNLOAD_TIMEOUT if timeout is None else timeout
+    retries = _core.DOWNLOAD_RETRIES if retries is None else retries
+    backoff = _core.DOWNLOAD_BACKOFF if backoff is None else backoff
+    redirects = attempt = 0
+    while redirects < max_redirects:
+        try:
+            headers = {'Accept-Encoding':'gzip'}
+            if user_agent:
+                headers['User-Agent'] = user_agent
+            if cache is not None:
+                headers.update(cache.conditional_headers(url))
+            req = urllib.request.Request(url, headers=headers)
+            response = urllib.request.urlopen(req,timeout=timeout)
+            if response.getcode() == 302:
+                url = response.headers['Location']
+                response.close()
+                redirects += 1
+                continue
+            last_modified = response.headers['Last-Modified'] if 'Last-Modified' in response.headers else None
+            if last_modified is None:
+                try:
+                    last_modified = response.headers['date'] if 'date' in response.headers else None
+                except:
+                    last_modified = dt.now()
+            return CloudIPFeedReader(response,url,last_modified,response.headers.get('ETag'),cache=cache,copy_to=copy_to)
+        except urllib.error.HTTPError as ERR:
+            if ERR.code == 304 and cache is not None:
+                raise FeedNotModified(url)
+            ##──── Other HTTP client errors (404, 403...) will not change with a retry ────────────────────────────────────────────────────────
+            if attempt >= retries or (ERR.code != 429 and ERR.code < 500):
+                logVerbose(f"Unable to download file ({url}): {str(ERR)}")
+                return None
+            logVerbose(f"Unable to download file ({url}): {str(ERR)} - retrying in {backoff*(2**attempt):.1f} sec")
+            time.sleep(backoff*(2**attempt))
+            attempt += 1
+        except (urllib.error.URLError, OSError) as ERR:
+            if attempt >= retries:
+                logVerbose(f"Unable to download file ({url}): {str(ERR)}")
+                return None
+            logVerbose(f"Unable to download file ({url}): {str(ERR)} - retrying in {backoff*(2**attempt):.1f} sec")
+            time.sleep(backoff*(2**attempt))
+            attempt += 1
+    logVerbose(f"Exceeded maximum redirects. {url}")
+    return None
+
+##──── DOWNLOAD A FILE FROM INTERNET. IF IT´S A JSON, RETURNS JSON OTHERWISE RETURNS A LIST OF STRINGS ───────────────────────────
+##──── Returns a tuple (data, last_modified) or (False, None). The whole file is in memory, the updater uses open_feed() ─────────
+def download_file(url, user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/117.0.0.0 Safari/537.36", max_redirects=5,
+                  timeout=None, retries=None, backoff=None, cache=None):
+    feed = open_feed(url,user_agent,max_redirects,timeout,retries,backoff,cache)
+    if feed is None:
+        return False, None
+    try:
+        with feed:
+            data = feed.read().decode('utf-8')
+    except (urllib.error.URLError, OSError) as ERR:
+        logVerbose(f"Unable to download file ({url}): {str(ERR)}")
+        return False, None
+    try:
+        json_data = json.loads(data)
+        return json_data, feed.last_modified
+    except json.JSONDecodeError:
+        return data.split("\n"), feed.last_modified
+
+##──── STREAMING JSON PARSER OF THE FEEDS. THE ITEMS OF THE BIG ARRAYS ARE DECODED ONE AT A TIME ────────────────────────────────
+_JSON_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_JSON_NUMBER_TAIL = re.compile(r'[0-9.eE+-]*')
+
+class _JSONStream(object):
+    """A json document read from an iterator of strings. Only the text not parsed yet is kept: at most the biggest
+    value decoded at once plus one chunk"""
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.pos = 0
+    def _fill(self)->bool:
+        ##──── Reads at least as much text as the buffer has left, so a big value is decoded after O(log n) attempts, not O(n) ───────
+        need = max(1,len(self.buffer)-self.pos)
+        parts, size = [self.buffer[self.pos:]], 0
+        for chunk in self._chunks:
+            parts.append(chunk)
+            size += len(chunk)
+            if size >= need:
+                break
+        self.buffer, self.pos = "".join(parts), 0
+        return size > 0
+    def peek(self)->str:
+        """Returns the next character that is not a whitespace, or an empty string at the end of the document"""
+        while True:
+            self.pos = _JSON_WHITESPACE.match(self.buffer,self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ""
+    def expect(self,char):
+        if self.peek() != char:
+            raise ValueError(f"invalid json feed, expected {char!r} and found {self.buffer[self.pos:self.pos+20]!r}")
+        self.pos += 1
+    def value(self):
+        """Decodes the next json value (an object, array, string, number...)"""
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self.buffer,self.pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            ##──── A number at the end of the text may continue in the next chunk, also after a '.', 'e' or sign (ex: '12.' + '5') ─────
+            if not isinstance(value,(dict,list,str)) and _JSON_NUMBER_TAIL.match(self.buffer,end).end() == len(self.buffer) and self._fill():
+                continue
+            self.pos = end
+            return value
+    def object_items(self,prefix,arrays):
+        self.expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            path = prefix+self.value()
+            self.expect(':')
+            if path in arrays and self.peek() == '[':
+                self.pos += 1
+                if self.peek() != ']':
+                    while True:
+                        yield path, self.value()
+                        if self.peek() != ',':
+                            break
+                        self.pos += 1
+                self.expect(']')
+            elif self.peek() == '{' and any(array.startswith(path+".") for array in arrays):
+                yield from self.object_items(path+".",arrays)
+            else:
+                yield path, self.value()
+            if self.peek() != ',':
+                break
+            self.pos += 1
+        self.expect('}')
+
+def iter_json_items(chunks,arrays=()):
+    """Parses a json object incrementally from an iterator of strings (ex: CloudIPFeedReader.chunks()) and yields
+    (path, value) pairs: one pair for each item of the arrays in *arrays* and one for each other member. The path of
+    a member of a nested object is joined with dots, ex: iter_json_items(chunks,['values','result.ipv4_cidrs']).
+    Only the item being decoded is in memory, not the whole document.
+    """
+    yield from _JSONStream(chunks).object_items("",frozenset(arrays))
+
+##################################################################################################################################
+
+                # # ##  ##   #  ### ###     ### ##      ##   #  ###  ## ###  ##
+                # # # # # # # #  #  #        #  # #     # # # # # # #   #   #
+                # # ##  # # ###  #  ##       #  ##      ##  ### # # # # ##   #
+                # # #   # # # #  #  #        #  #       # # # # # # # # #     #
+                ### #   ##  # #  #  ###     ### #       # # # # # #  ## ### ##
+
+##################################################################################################################################
+##──── RUNS AN update_ip_ranges_* FUNCTION WITH THE FEED CACHE. RETURNS (result, changed) ─────────────────────────────────────────
+def _update_provider(function,provider,download_url,cache_directory=None,**download_options):
+    if cache_directory is None:
+        return function(download_url,**download_options), True
+    cache = CloudIPFeedCache(cache_directory,provider)
+    try:
+        result = function(download_url,cache=cache,**download_options)
+    except FeedNotModified:
+        try:
+            result = cache.load_networks()
+            logVerbose(f"Updating {provider} - Not modified, using the networks of the feed cache")
+            return result, False
+        except Exception as ERR:
+            logVerbose(f"Updating {provider} - Failed to load the feed cache, downloading again - {str(ERR)}")
+            cache.invalidate()
+            result = function(download_url,cache=cache,**download_options)
+    if result:
+        cache.store_networks(result)
+        return result, True
+    ##──── The download failed, the networks of the last successful update are better than nothing ────────────────────────────────
+    try:
+        result = cache.load_networks()
+        logVerbose(f"Updating {provider} - Using the networks of the feed cache saved at {cache.meta.get('saved_at')}")
+        return result, False
+    except Exception:
+        return False, True
+
+##──── THE DATABASE FILES EXIST AND WERE SAVED AFTER THE NETWORKS OF THE FEED CACHE ─────────────────────────────────────────────
+def _database_is_up_to_date(cache_directory)->bool:
+    try:
+        databaseTime = min(os.path.getmtime(os.path.join(_core.DATA_DIR,filename)) for filename in (OUTPUT_FILE_NAME,BINARY_FILE_NAME))
+        networksTime = max(os.path.getmtime(os.path.join(cache_directory,filename)) for filename in os.listdir(cache_directory) if filename.endswith('.networks.gz'))
+        return databaseTime >= networksTime
+    except Exception:
+        return False
+
+#defupdate
+@print_elapsed_time
+def update_ip_ranges(verbose=False,debug=False,concurrency=None,timeout=None,retries=None,use_cache=True,delta=True):
+    """Downloads the IP ranges of all providers and creates the files cloudiplookup.dat.gz and cloudiplookup.dat.bin
+
+    The provider files are downloaded at the same time, *concurrency* files at once (default DOWNLOAD_CONCURRENCY).
+    Each file has its own *timeout* in seconds (default DOWNLOAD_TIMEOUT, or the key "timeout" of the provider in the
+    cloudiplookup.json file) and is retried *retries* times (default DOWNLOAD_RETRIES) after a network error.
+
+    With *use_cache* (default) the raw feeds, their ETag/Last-Modified headers and the parsed networks are kept in
+    DATA_DIR/cloudiplookup.feeds/. The next update sends conditional requests, the providers that answer 304 Not
+    Modified are not parsed again, and if no provider changed the database files are not rewritten.
+
+    With *delta* (default) the new database is compared with the previous cloudiplookup.dat.gz: the number of networks
+    added, removed and re-attributed is logged (verbose) and the delta is saved in DATA_DIR/cloudiplookup.delta.gz, to
+    be applied by the running processes with CloudIPLookup.apply_delta() (see cloudiplookup/delta.py).
+    Returns 0 on success or 1 on failure.
+    """
+    global _DEBUG
+    networks, databaseInfo = [], {}
+    concurrency = _core.DOWNLOAD_CONCURRENCY if concurrency is None else concurrency
+    _DEBUG = debug
+    logDebug.__code__ = _logDebug.__code__ if (verbose == True and debug == True) else _logEmpty.__code__
+    logVerbose.__code__ = _logEmpty.__code__ if (verbose == False) else log.__code__    
+    ##──── LOAD CLOUD SERVICE PROVIDERS INFORMATION FILE ─────────────────────────────────────────────────────────────────────────────
+    try:
+        with open(os.path.join(_core.DATA_DIR,PROVIDERS_INFORMATION_FILE_NAME),"r") as f:
+            infoFile = json.load(f)        
+    except Exception as ERR:
+        logError(f"Failed to open information file \"{str(os.path.join(_core.DATA_DIR,PROVIDERS_INFORMATION_FILE_NAME))}\": {str(ERR)}")
+        return 1
+    try:
+        with elapsed_timer() as elapsed:
+            ##──── Each cloud provider has its own file format, so it´s necessary a specific for each one ────────────────────────────────────
+            providers = [(update_ip_ranges_aws,'AWS','download_url'),
+                         (update_ip_ranges_azure,'AZURE','info_page'), # azure is different
+                         (update_ip_ranges_cloudflare,'CLOUDFLARE','download_url'),
+                         (update_ip_ranges_digital_ocean,'DIGITALOCEAN','download_url'),
+                         (update_ip_ranges_google_cloud,'GOOGLECLOUD','download_url'),
+                         (update_ip_ranges_google_services,'GOOGLESERVICES','download_url'),
+                         (update_ip_ranges_google_services,'GOOGLEBOT','download_url'),
+                         (update_ip_ranges_google_services,'GOOGLESSPECIALCRAWLERS','download_url'),
+                         (update_ip_ranges_google_services,'GOOGLESUSERTRIGGERED','download_url'),
+                         (update_ip_ranges_jdcloud,'JDCLOUD','download_url'), # cloudflare jdcloud china
+                         (update_ip_ranges_oracle_cloud,'ORACLE','download_url')]
+            ##──── The functions don't share any state, they return their networks and are merged below always in the same order ─────────
+            cacheDirectory = os.path.join(_core.DATA_DIR,FEED_CACHE_DIR_NAME) if use_cache == True else None
+            with ThreadPoolExecutor(max_workers=max(1,concurrency)) as executor:
+                futures = [executor.submit(_update_provider,function,provider,infoFile[provider][urlKey],cacheDirectory,
+                                           retries=retries,timeout=infoFile[provider].get('timeout',timeout))
+                           for function,provider,urlKey in providers]
+                results, changed = zip(*[future.result() for future in futures])
+            for result in results:
+                if result:
+                    name, providerNetworks, info = result
+                    networks.append(providerNetworks)
+                    databaseInfo[name] = info
+            logVerbose(f"Downloaded and parsed {len(results)} provider files, {concurrency} at once {timer(elapsed())}")
+    except Exception as ERR:
+        logDebug(f"Failed to update IP ranges - {str(ERR)}")
+        return 1
+    if not any(changed) and _DEBUG == False and _database_is_up_to_date(cacheDirectory):
+        logVerbose(f"Cloud IP Lookup is up to date, no provider changed since the last update {timer(elapsed())}")
+        return 0
+    with elapsed_timer() as elapsed_build:
+        ##──── The columns of all providers are sorted once by first IP (bigger networks first) and encoded in the same pass ──────────
+        columns, strings = _merge_network_columns(networks)
+        strings['databaseInfo'] = databaseInfo
+        strings['fingerprint'] = _columns_fingerprint(columns,strings)
+    logVerbose(f"Sorting and encoding {len(columns['netlength']):,d} IPv4 and IPv6 networks {timer(elapsed_build())}")
+    if _DEBUG == True:
+        with elapsed_timer() as elapsed_savefiles:
+            with open(os.path.join(_core.DATA_DIR,"cloudip.json"),"w") as f:
+                json.dump(_debug_networks(columns,strings),f,indent=3,sort_keys=False,ensure_ascii=False,default=json_default_formatter)
+            logDebug(f"Saving cloudip.json file {timer(elapsed_savefiles())}")
+            with open(os.path.join(_core.DATA_DIR,"cloudiplookup.dat.json"),"w") as f:
+                json.dump({'version':DATABASE_VERSION,'columns':{name:column.tolist() for name,column in columns.items()},'strings':strings},
+                          f,indent=3,sort_keys=False,ensure_ascii=False,default=json_default_formatter)
+            logDebug(f"Saving cloudiplookup.dat.json file {timer(elapsed_savefiles())}")
+    _save_database_files(columns,strings,_diff_previous_database(columns,strings) if delta == True else None)
+    logVerbose(f"Cloud IP Lookup updated with success! {timer(elapsed())}")
+    ##──── EXIT WITH SUCCESS ─────────────────────────────────────────────────────────────────────────────────────────────────────────
+    return 0
+
+#defupdatefromdelta
+@print_elapsed_time
+def update_from_delta(delta,verbose=False,verify=False)->int:
+    """Applies the delta *delta* (the name of a delta file, its bytes or a dict, see cloudiplookup.delta.load_delta()) to
+    the database files of DATA_DIR without downloading the provider feeds: the database of cloudiplookup.dat.gz (or
+    cloudiplookup.dat.bin) is patched and both files are saved again, with the delta in DATA_DIR/cloudiplookup.delta.gz.
+    The processes watching the files (CloudIPLookup.start_watcher()) apply the delta instead of loading the whole file,
+    with use_mmap=True they map the new file. With *verify* the fingerprint of the result is checked (see
+    cloudiplookup.delta.apply_delta()). Returns 0 on success or 1 on failure.
+    """
+    logVerbose.__code__ = _logEmpty.__code__ if (verbose == False) else log.__code__
+    try:
+        from cloudiplookup.delta import load_delta, load_database, apply_delta
+        with elapsed_timer() as elapsed:
+            delta = load_delta(delta)
+            gzipFile = os.path.join(_core.DATA_DIR,OUTPUT_FILE_NAME)
+            database = load_database(gzipFile if os.path.isfile(gzipFile) else os.path.join(_core.DATA_DIR,BINARY_FILE_NAME))
+            columns, strings = apply_delta(database,delta,verify)
+            ##──── The columns without changes of a memory-mapped database are memoryviews, pickle needs arrays ────────────────────────────
+            columns = {name:column if isinstance(column,array) else array(column.format,column.tobytes()) for name, column in columns.items()}
+        logVerbose(f"Applied the delta to {database.filename}: {len(delta['networks']):,d} networks changed {timer(elapsed())}")
+    except Exception as ERR:
+        logError(f"Failed to apply the delta - {str(ERR)}")
+        return 1
+    _save_database_files(columns,strings,{key:value for key, value in delta.items() if key != 'files'})
+    logVerbose(f"Cloud IP Lookup updated with success! {timer(elapsed())}")
+    return 0
+
+##──── COMPARES THE NEW DATABASE WITH THE PREVIOUS cloudiplookup.dat.gz AND RETURNS THE DELTA. A FAILURE DOESN'T FAIL THE UPDATE ───
+def _diff_previous_database(columns,strings):
+    previousFile = os.path.join(_core.DATA_DIR,OUTPUT_FILE_NAME)
+    if not os.path.isfile(previousFile):
+        return None
+    try:
+        from cloudiplookup.delta import diff_databases
+        with elapsed_timer() as elapsed:
+            diff = diff_databases(previousFile,_core.CloudIPDatabase(columns,strings))
+        logVerbose(f"Changes since the previous database: {len(diff.added):,d} networks added, {len(diff.removed):,d} removed and "
+                   f"{len(diff.reattributed):,d} re-attributed {timer(elapsed())}")
+        return diff.delta()
+    except Exception as ERR:
+        logVerbose(f"Failed to compare with the previous database {previousFile} - {str(ERR)}")
+        return None
+
+##──── SAVES cloudiplookup.dat.gz AND cloudiplookup.dat.bin IN TEMPORARY FILES AND RENAMES THEM. THE DELTA IS SAVED BEFORE THE ─────
+##──── RENAMES WITH THE SIZE AND MTIME OF THE NEW FILES: A WATCHER THAT SEES A NEW FILE FINDS ITS DELTA (see CloudIPLookup.start_watcher())
+def _save_database_files(columns:dict,strings:dict,delta=None):
+    files = {name:os.path.join(_core.DATA_DIR,name) for name in (OUTPUT_FILE_NAME,BINARY_FILE_NAME)}
+    with elapsed_timer() as elapsed_save_gzip:
+        with gzip.GzipFile(filename=files[OUTPUT_FILE_NAME]+'.tmp', mode='wb', compresslevel=9) as f:
+            pickle.dump({'version':DATABASE_VERSION,'columns':columns,'strings':strings},f,pickle.HIGHEST_PROTOCOL)
+        logVerbose(f"Saved file {files[OUTPUT_FILE_NAME]} {timer(elapsed_save_gzip())}")
+    with elapsed_timer() as elapsed_save_binary:
+        _write_binary_file(files[BINARY_FILE_NAME],columns,strings,rename=False)
+        logVerbose(f"Saved file {files[BINARY_FILE_NAME]} {timer(elapsed_save_binary())}")
+    if delta is not None:
+        try:
+            from cloudiplookup.delta import save_delta
+            delta['files'] = {name:[os.stat(filename+'.tmp').st_size,os.stat(filename+'.tmp').st_mtime_ns] for name, filename in files.items()}
+            save_delta(delta,os.path.join(_core.DATA_DIR,DELTA_FILE_NAME))
+            logVerbose(f"Saved file {os.path.join(_core.DATA_DIR,DELTA_FILE_NAME)} with {len(delta['networks']):,d} changed networks")
+        except Exception as ERR:
+            logVerbose(f"Failed to save the delta file {os.path.join(_core.DATA_DIR,DELTA_FILE_NAME)} - {str(ERR)}")
+    for filename in files.values():
+        os.replace(filename+'.tmp',filename)
+
+##──── PREFIX RECORDS OF THE FEEDS. EACH iter_prefixes_* FUNCTION READS A FEED INCREMENTALLY (A CloudIPFeedReader) AND YIELDS ─────
+##──── (cidr, region, service, network_features) TUPLES. THE OTHER MEMBERS OF THE JSON FEEDS (EX: THE DATES) GO TO *meta* ────────
+def iter_prefixes_aws(feed,meta:dict):
+    for path,item in iter_json_items(feed.chunks(),('prefixes','ipv6_prefixes')):
+        if path not in ('prefixes','ipv6_prefixes'):
+            meta[path] = item
+            continue
+        cidr, region, service, network_border_group = item.values()
+        region = network_border_group if region != network_border_group else region
+        yield cidr, region, service, ''
+
+def iter_prefixes_azure(feed,meta:dict):
+    for path,item in iter_json_items(feed.chunks(),('values',)):
+        if path != 'values':
+            meta[path] = item
+            continue
+        properties = item['properties']
+        service = properties['systemService']
+        try:
+            networkFeatures = ", ".join(properties['networkFeatures'])
+        except:
+            networkFeatures = ""
+        region = properties['region']
+        for cidr in properties['addressPrefixes']:
+            yield str(cidr), region, service, networkFeatures
+
+def iter_prefixes_google_cloud(feed,meta:dict):
+    for path,item in iter_json_items(feed.chunks(),('prefixes',)):
+        if path != 'prefixes':
+            meta[path] = item
+            continue
+        cidr = item['ipv4Prefix'] if item.get('ipv4Prefix',0) != 0 else item['ipv6Prefix']
+        yield str(cidr), item['scope'], item['service'], ''
+
+def iter_prefixes_google_services(feed,meta:dict,service:str):
+    for path,item in iter_json_items(feed.chunks(),('prefixes',)):
+        if path != 'prefixes':
+            meta[path] = item
+            continue
+        cidr = item['ipv4Prefix'] if item.get('ipv4Prefix',0) != 0 else item['ipv6Prefix']
+        yield str(cidr), '', service, ''
+
+def iter_prefixes_cloudflare(feed,meta:dict,region:str=''):
+    for path,item in iter_json_items(feed.chunks(),('result.ipv4_cidrs','result.ipv6_cidrs','result.jdcloud_cidrs')):
+        if path not in ('result.ipv4_cidrs','result.ipv6_cidrs','result.jdcloud_cidrs'):
+            meta[path] = item
+            continue
+        yield str(item), region, '', ''
+
+def iter_prefixes_oracle_cloud(feed,meta:dict):
+    for path,item in iter_json_items(feed.chunks(),('regions',)):
+        if path != 'regions':
+            meta[path] = item
+            continue
+        for cidr in item['cidrs']:
+            yield str(cidr['cidr']), item['region'], ', '.join(cidr['tags']), ''
+
+def iter_prefixes_digital_ocean(feed,meta:dict):
+    for line in feed.lines():
+        if line != "":
+            cidr, country_code, micro_region, city, unknown = line.split(",")
+            yield cidr, micro_region+" "+city, '', ''
+
+##──── THE NETWORKS OF A PROVIDER IN TYPED COLUMNS, FILLED FROM ITS PREFIX RECORDS ──────────────────────────────────────────────────
+class CloudIPNetworkColumns(object):
+    """The networks of a provider in typed columns, filled by extend() with the (cidr, region, service, features)
+    records of an iter_prefixes_* function: the first IP (32 bits for IPv4, a pair of 64 bits for IPv6) and the
+    netlength of each network in arrays, and its region, service and features as 3 codes of the string table
+    *strings*, where each string is stored once. No object is created per network. These columns are saved in the
+    feed cache and merged by _merge_network_columns() into the columns of the database.
+    """
+    def __init__(self, provider):
+        self.provider = provider
+        self.strings = []
+        self._codes = {}
+        self.total_ipv4 = self.total_ipv6 = 0
+        self.ipv4First, self.ipv4NetLength, self.ipv4Codes = array('I'), array('B'), array('I')
+        self.ipv6FirstHi, self.ipv6FirstLo, self.ipv6NetLength, self.ipv6Codes = array('Q'), array('Q'), array('B'), array('I')
+    def __len__(self):
+        return len(self.ipv4NetLength)+len(self.ipv6NetLength)
+    def _intern(self,value)->int:
+        code = self._codes.get(value)
+        if code is None:
+            code = self._codes[value] = len(self.strings)
+            self.strings.append(value)
+        return code
+    def extend(self,records):
+        """Appends the (cidr, region, service, features) *records*. Returns self"""
+        intern = self._intern
+        for cidr, region, service, networkFeatures in records:
+            first_ip, netlen = cidr.split("/")
+            netlen = int(netlen)
+            if first_ip.find(":") < 0:
+                self.ipv4First.append(ipv4_to_int(first_ip))
+                self.ipv4NetLength.append(netlen)
+                self.ipv4Codes.extend((intern(region),intern(service),intern(networkFeatures)))
+                self.total_ipv4 += numIPsv4[netlen]
+            else:
+                hi, lo = ipv6_to_hilo(first_ip)
+                self.ipv6FirstHi.append(hi)
+                self.ipv6FirstLo.append(lo)
+                self.ipv6NetLength.append(netlen)
+                self.ipv6Codes.extend((intern(region),intern(service),intern(networkFeatures)))
+                self.total_ipv6 += numIPsv6[netlen]
+        return self
+
+##──── MERGES THE NETWORKS OF ALL PROVIDERS IN THE COLUMNS OF THE DATABASE. RETURNS (columns, strings) ─────────────────────────────
+def _merge_network_columns(networks:list)->tuple:
+    """Concatenates the CloudIPNetworkColumns of all providers (in the order of *networks*), sorts each family with a
+    single sort of the positions by first IP and bigger networks first, and encodes the provider, service, region and
+    features of the sorted networks, numbered from 1 in the order they first appear (the IPv4 networks first). The
+    sort is stable, the same network from different sources keeps the order of *networks*.
+    """
+    stringIds = {}
+    ipv4First, ipv4NetLength, ipv4Provider, ipv4Codes = array('I'), array('B'), array('I'), array('I')
+    ipv6First, ipv6NetLength, ipv6Provider, ipv6Codes = [], array('B'), array('I'), array('I')
+    for column in networks:
+        ##──── The codes of each provider are translated to the ids of all strings, the same string has the same id ───────────────────
+        translate = [stringIds.setdefault(value,len(stringIds)) for value in column.strings]
+        providerId = stringIds.setdefault(column.provider,len(stringIds))
+        ipv4First.extend(column.ipv4First)
+        ipv4NetLength.extend(column.ipv4NetLength)
+        ipv4Provider.extend(array('I',[providerId])*len(column.ipv4NetLength))
+        ipv4Codes.extend(map(translate.__getitem__,column.ipv4Codes))
+        ipv6First.extend([hi << 64 | lo for hi, lo in zip(column.ipv6FirstHi,column.ipv6FirstLo)])
+        ipv6NetLength.extend(column.ipv6NetLength)
+        ipv6Provider.extend(array('I',[providerId])*len(column.ipv6NetLength))
+        ipv6Codes.extend(map(translate.__getitem__,column.ipv6Codes))
+    ##──── A single sort of the positions of each family, the columns are read in this order ─────────────────────────────────────────
+    ipv4Order = sorted(range(len(ipv4First)),key=[first_ip << 8 | netlen for first_ip, netlen in zip(ipv4First,ipv4NetLength)].__getitem__)
+    ipv6Order = sorted(range(len(ipv6First)),key=[first_ip << 8 | netlen for first_ip, netlen in zip(ipv6First,ipv6NetLength)].__getitem__)
+    sortedIds = lambda ipv4Ids, ipv6Ids: list(map(ipv4Ids.__getitem__,ipv4Order))+list(map(ipv6Ids.__getitem__,ipv6Order))
+    strings = list(stringIds)
+    encoded = [_encode_first_seen(ids,strings) for ids in (sortedIds(ipv4Provider,ipv6Provider),sortedIds(ipv4Codes[1::3],ipv6Codes[1::3]),
+                                                          sortedIds(ipv4Codes[0::3],ipv6Codes[0::3]),sortedIds(ipv4Codes[2::3],ipv6Codes[2::3]))]
+    (provider, indexProvider), (services, indexServices), (regions, indexRegions), (features, indexFeatures) = encoded
+    columns = _build_columns(array('I',map(ipv4First.__getitem__,ipv4Order)),list(map(ipv6First.__getitem__,ipv6Order)),
+                             sortedIds(ipv4NetLength,ipv6NetLength),provider,services,regions,features)
+    return columns, {'indexProvider':indexProvider,'indexServices':indexServices,'indexRegions':indexRegions,'indexNetworkFeatures':indexFeatures}
+
+##──── THE CODES OF A COLUMN OF STRING IDS, NUMBERED FROM 1 IN THE ORDER THEY FIRST APPEAR. RETURNS (codes, table of strings) ───────
+def _encode_first_seen(ids:list,strings:list)->tuple:
+    seen = list(dict.fromkeys(ids))
+    codes = [0]*len(strings)
+    for code, stringId in enumerate(seen,1):
+        codes[stringId] = code
+    return list(map(codes.__getitem__,ids)), [strings[stringId] for stringId in seen]
+
+##──── THE FILE OF THE DEBUG MODE WHERE THE RAW FEED IS COPIED WHILE IT IS READ, OR None ───────────────────────────────────────────
+def _debug_file(filename):
+    if _DEBUG == True:
+        outputFile = os.path.join(_core.DATA_DIR,filename)
+        logDebug(f"Saving ipranges to {outputFile}")
+        return outputFile
+    return None
+
+##──── THE SORTED NETWORKS OF THE DEBUG FILE cloudip.json: [first_ip, {provider, cidr, region, service, netlength, features}] ───────
+def _debug_networks(columns,strings)->dict:
+    database = _core.CloudIPDatabase(columns,strings)
+    def network(row):
+        return {'provider':database.indexProvider[database.provider[row]-1],'cidr':database.cidr(row),
+                'region':database.indexRegions[database.regions[row]-1],'service':database.indexServices[database.services[row]-1],
+                'netlength':database.netLength[row],'network_features':database.indexNetworkFeatures[database.features[row]-1]}
+    return {'ipv4':[(database.ipv4FirstIP[row],network(row)) for row in range(database.totalIPv4)],
+            'ipv6':[(database.ipv6FirstHi[pos] << 64 | database.ipv6FirstLo[pos],network(database.totalIPv4+pos)) for pos in range(len(database)-database.totalIPv4)]}
+
+##──── UPDATE AWS IP RANGES ──────────────────────────────────────────────────────────────────────────────────────────────────────
+@print_elapsed_time
+def update_ip_ranges_aws(download_url,**download_options):
+    try:
+        with elapsed_timer() as elapsed:
+            feed = open_feed(download_url,copy_to=_debug_file('ipranges-aws.json'),**download_options)
+            if feed is None:
+                logError(f"Updating AWS - FAILED to download IP ranges file from {download_url} {timer(elapsed())}")
+                return False
+            logVerbose(f"Updating AWS - Downloading IP ranges file {timer(elapsed())}")
+        with elapsed_timer() as elapsed:
+            meta = {}
+            with feed:
+                networks = CloudIPNetworkColumns('AWS').extend(iter_prefixes_aws(feed,meta))
+            try:
+                formatedDate = dt.strptime(meta['createDate'], "%Y-%m-%d-%H-%M-%S")
+                formatedDate = formatedDate.strftime("%Y-%m-%d %H:%M:%S")
+            except:
+                formatedDate = meta.get('createDate')
+            logVerbose(f"Updating AWS - Parsing IPv4 and IPv6 ranges updated at {formatedDate} ({feed.bytes_read:,d} bytes) {timer(elapsed())}")
+        info = {'last_updated':formatedDate,
+                'total_networks':len(networks),
+                'total_ipv4':networks.total_ipv4, 'total_ipv6':networks.total_ipv6}
+        return ("AWS",networks,info)
+    except FeedNotModified:
+        raise
+    except Exception as ERR:
+        logVerbose(f"Failed to update AWS IP ranges - {str(ERR)}")
+        return False
+    
+##──── UPDATE AZURE IP RANGES ──────────────────────────────────────────────────────────────────────────────────────────────────────
+@print_elapsed_time
+def update_ip_ranges_azure(info_page,**download_options):
+    try:
+        with elapsed_timer() as elapsed:
+            ##──── Azure changes the name og the file on each version, so is necessary to locate it ──────────────────────────────────────────
+            ##──── The page is read line by line until the link is found, it is small and always downloaded ─────────────────────────────────
+            rule = re.compile(r'.*(https?://[^"]*ServiceTags_Public[^"]*\.json)".*')
+            page = open_feed(info_page,**dict(download_options,cache=None))
+            if page is None:
+                logError(f"Updating AZURE - FAILED to download the information page {info_page} {timer(elapsed())}")
+                return False
+            with page:
+                url = next((linha for linha in page.lines() if (re.match(rule,linha))),False)
+            download_url = re.match(rule,url).group(1)
+            feed = open_feed(download_url,copy_to=_debug_file('ipranges-azure.json'),**download_options)
+            if feed is None:
+                logError(f"Updating AZURE - FAILED to download IP ranges file from {download_url} {timer(elapsed())}")
+                return False
+            logVerbose(f"Updating AZURE - Downloading IP ranges file {timer(elapsed())}")
+        with elapsed_timer() as elapsed:
+            meta = {}
+            with feed:
+                networks = CloudIPNetworkColumns('Azure').extend(iter_prefixes_azure(feed,meta))
+        try:
+            formatedDate = dt.strptime(feed.last_modified, "%a, %d %b %Y %H:%M:%S %Z")
+            formatedDate = formatedDate.strftime("%Y-%m-%d %H:%M:%S")
+        except:
+            formatedDate = feed.last_modified
+        logVerbose(f"Updating AZURE - Parsing IPv4 and IPv6 ranges updated at {formatedDate} ({feed.bytes_read:,d} bytes) {timer(elapsed())}")
+        info = {'last_updated':formatedDate,
+                'total_networks':len(networks),
+                'total_ipv4':networks.total_ipv4, 'total_ipv6':networks.total_ipv6}
+        return ("Azure",networks,info)
+    except FeedNotModified:
+        raise
+    except Exception as ERR:
+        logVerbose(f"Failed to update AZURE IP ranges - {str(ERR)}")
+        return False
+
+##──── UPDATE GOOGLE CLOUD PLATFORM IP RANGES ──────────────────────────────────────────────────────────────────────────────────────────────────────
+@print_elapsed_time
+def update_ip_ranges_google_cloud(download_url,**download_options):
+    try:
+        with elapsed_timer() as elapsed:
+            feed = open_feed(download_url,copy_to=_debug_file('ipranges-googlecloud.json'),**download_options)
+            if feed is None:
+                logError(f"Updating GOOGLE CLOUD - FAILED to download IP ranges file from {download_url} {timer(elapsed())}")
+                return False
+            logVerbose(f"Updating GOOGLE CLOUD - Downloading IP ranges file {timer(elapsed())}")
+        with elapsed_timer() as elapsed:
+            meta = {}
+            with feed:
+                networks = CloudIPNetworkColumns('Google Cloud Platform').extend(iter_prefixes_google_cloud(feed,meta))
+        try:
+            formatedDate = dt.strptime(meta['creationTime'], "%Y-%m-%dT%H:%M:%S.%f")
+            formatedDate = formatedDate.strftime("%Y-%m-%d %H:%M:%S")
+        except:
+            formatedDate = meta.get('creationTime')
+        logVerbose(f"Updating GOOGLE CLOUD - Parsing IPv4 and IPv6 ranges updated at {formatedDate} ({feed.bytes_read:,d} bytes) {timer(elapsed())}")
+        info = {'last_updated':formatedDate,
+                'total_networks':len(networks),
+                'total_ipv4':networks.total_ipv4, 'total_ipv6':networks.total_ipv6}
+        return ("Google Cloud",networks,info)
+    except FeedNotModified:
+        raise
+    except Exception as ERR:
+        logVerbose(f"Failed to update GOOGLE CLOUD PLATFORM IP ranges - {str(ERR)}")
+        return False
+
+##──── UPDATE GOOGLE CLOUD SERVICES IP RANGES ──────────────────────────────────────────────────────────────────────────────────────────────────────
+@print_elapsed_time
+def update_ip_ranges_google_services(download_url,**download_options):
+    try:
+        service = 'Google Bot' \
+                if download_url.find("googlebot") >= 0 else 'Google Special Crawlers' \
+                if download_url.find("special-crawlers") >= 0 else 'Google User Triggered Fetchers' \
+                if download_url.find("user-triggered") >= 0 else 'Google Services'
+        with elapsed_timer() as elapsed:
+            filename = download_url.split("/")[-1]
+            feed = open_feed(download_url,copy_to=_debug_file(f'ipranges-{filename}.json'),**download_options)
+            if feed is None:
+                logError(f"Updating GOOGLE {service.upper().replace('GOOGLE ','')} - FAILED to download IP ranges file from {download_url} {timer(elapsed())}")
+                return False
+            logVerbose(f"Updating GOOGLE {service.upper().replace('GOOGLE ','')} - Downloading IP ranges file {timer(elapsed())}")
+        with elapsed_timer() as elapsed:
+            meta = {}
+            with feed:
+                networks = CloudIPNetworkColumns("Google").extend(iter_prefixes_google_services(feed,meta,service.replace("Google ","")))
+        try:
+            formatedDate = dt.strptime(meta['creationTime'], "%Y-%m-%dT%H:%M:%S.%f")
+            formatedDate = formatedDate.strftime("%Y-%m-%d %H:%M:%S")
+        except:
+            formatedDate = meta.get('creationTime')
+        logVerbose(f"Updating GOOGLE {service.upper().replace('GOOGLE ','')} - Parsing IPv4 and IPv6 ranges updated at {formatedDate} ({feed.bytes_read:,d} bytes) {timer(elapsed())}")
+        info = {'last_updated':formatedDate,
+                'total_networks':len(networks),
+                'total_ipv4':networks.total_ipv4, 'total_ipv6':networks.total_ipv6}
+        return (service,networks,info)
+    except FeedNotModified:
+        raise
+    except Exception as ERR:
+        logVerbose(f"Failed to update GOOGLE {service.upper().replace('GOOGLE ','')} IP ranges - {str(ERR)}")
+        return False
+
+##──── UPDATE CLOUDFLARE IP RANGES ──────────────────────────────────────────────────────────────────────────────────────────────────────
+@print_elapsed_time
+def update_ip_ranges_cloudflare(download_url,**download_options):
+    try:
+        with elapsed_timer() as elapsed:
+            feed = open_feed(download_url,copy_to=_debug_file('ipranges-cloudflare.json'),**download_options)
+            if feed is None:
+                logError(f"Updating CLOUDFLARE - FAILED to download IP ranges file from {download_url} {timer(elapsed())}")
+                return False
+            logVerbose(f"Updating CLOUDFLARE - Downloading IP ranges file {timer(elapsed())}")
+        with elapsed_timer() as elapsed:
+            meta = {}
+            with feed:
+                networks = CloudIPNetworkColumns('Cloudflare').extend(iter_prefixes_cloudflare(feed,meta))
+        # Cloudflare has an API, so the date in header is always the current date time.
+        try:
+            formatedDate = dt.strptime(feed.last_modified, "%a, %d %b %Y %H:%M:%S %Z")
+            formatedDate = formatedDate.strftime("%Y-%m-%d %H:%M:%S")
+        except:
+            formatedDate = feed.last_modified
+        logVerbose(f"Updating CLOUDFLARE - Parsing IPv4 and IPv6 ranges updated at {formatedDate} ({feed.bytes_read:,d} bytes) {timer(elapsed())}")
+        info = {'last_updated':formatedDate,
+                'total_networks':len(networks),
+                'total_ipv4':networks.total_ipv4, 'total_ipv6':networks.total_ipv6}
+        return ("Cloudflare",networks,info)
+    except FeedNotModified:
+        raise
+    except Exception as ERR:
+        logVerbose(f"Failed to update CLOUDFLARE IP ranges - {str(ERR)}")
+        return False
+
+##──── UPDATE CLOUDFLARE IP RANGES ──────────────────────────────────────────────────────────────────────────────────────────────────────
+@print_elapsed_time
+def update_ip_ranges_jdcloud(download_url,**download_options):
+    try:
+        with elapsed_timer() as elapsed:
+            feed = open_feed(download_url,copy_to=_debug_file('ipranges-jdcloud.json'),**download_options)
+            if feed is None:
+                logError(f"Updating JD CLOUD - FAILED to download IP ranges file from {download_url} {timer(elapsed())}")
+                return False
+            logVerbose(f"Updating JD CLOUD - Downloading IP ranges file {timer(elapsed())}")
+        with elapsed_timer() as elapsed:
+            meta = {}
+            with feed:
+                networks = CloudIPNetworkColumns('JD Cloud').extend(iter_prefixes_cloudflare(feed,meta,region='China'))
+        # Cloudflare JD Cloud China has an API, so the date in header is always the current date time.
+        try:
+            formatedDate = dt.strptime(feed.last_modified, "%a, %d %b %Y %H:%M:%S %Z")
+            formatedDate = formatedDate.strftime("%Y-%m-%d %H:%M:%S")
+        except:
+            formatedDate = feed.last_modified
+        logVerbose(f"Updating JD CLOUD - Parsing IPv4 and IPv6 ranges updated at {formatedDate} ({feed.bytes_read:,d} bytes) {timer(elapsed())}")
+        info = {'last_updated':formatedDate,
+                'total_networks':len(networks),
+                'total_ipv4':networks.total_ipv4, 'total_ipv6':networks.total_ipv6}
+        return ("JD Cloud",networks,info)
+    except FeedNotModified:
+        raise
+    except Exception as ERR:
+        logVerbose(f"Failed to update JD CLOUD IP ranges - {str(ERR)}")
+        return False
+
+
+##──── UPDATE ORACLE CLOUD IP RANGES ──────────────────────────────────────────────────────────────────────────────────────────────────────
+@print_elapsed_time
+def update_ip_ranges_oracle_cloud(download_url,**download_options):
+    try:
+        with elapsed_timer() as elapsed:
+            feed = open_feed(download_url,copy_to=_debug_file('ipranges-oracle.json'),**download_options)
+            if feed is None:
+                logError(f"Updating ORACLE - FAILED to download IP ranges file from {download_url} {timer(elapsed())}")
+                return False
+            logVerbose(f"Updating ORACLE - Downloading IP ranges file {timer(elapsed())}")
+        with elapsed_timer() as elapsed:
+            meta = {}
+            with feed:
+                networks = CloudIPNetworkColumns('Oracle Cloud').extend(iter_prefixes_oracle_cloud(feed,meta))
+        try:
+            formatedDate = dt.strptime(meta['last_updated_timestamp'], "%Y-%m-%dT%H:%M:%S.%f")
+            formatedDate = formatedDate.strftime("%Y-%m-%d %H:%M:%S")
+        except:
+            formatedDate = meta.get('last_updated_timestamp')
+        logVerbose(f"Updating ORACLE - Parsing IPv4 and IPv6 ranges updated at {formatedDate} ({feed.bytes_read:,d} bytes) {timer(elapsed())}")
+        info = {'last_updated':formatedDate,
+                'total_networks':len(networks),
+                'total_ipv4':networks.total_ipv4, 'total_ipv6':networks.total_ipv6}
+        return ("Oracle Cloud",networks,info)
+    except FeedNotModified:
+        raise
+    except Exception as ERR:
+        logVerbose(f"Failed to update ORACLE CLOUD IP ranges - {str(ERR)}")
+        return False
+
+##──── UPDATE DIGITAL OCEAN IP RANGES ──────────────────────────────────────────────────────────────────────────────────────────────────────
+@print_elapsed_time
+def update_ip_ranges_digital_ocean(download_url,**download_options):
+    try:
+        with elapsed_timer() as elapsed:
+            feed = open_feed(download_url,copy_to=_debug_file('ipranges-digitalocean.csv'),**download_options)
+            if feed is None:
+                logError(f"Updating DIGITAL OCEAN - FAILED to download IP ranges file from {download_url} {timer(elapsed())}")
+                return False
+            logVerbose(f"Updating DIGITAL OCEAN - Downloading IP ranges file {timer(elapsed())}")
+        with elapsed_timer() as elapsed:
+            meta = {}
+            with feed:
+                networks = CloudIPNetworkColumns('Digital Ocean').extend(iter_prefixes_digital_ocean(feed,meta))
+        try:
+            formatedDate = dt.strptime(feed.last_modified, "%a, %d %b %Y %H:%M:%S %Z")
+            formatedDate = formatedDate.strftime("%Y-%m-%d %H:%M:%S")
+        except:
+            formatedDate = feed.last_modified
+        logVerbose(f"Updating DIGITAL OCEAN - Parsing IPv4 and IPv6 ranges updated at {formatedDate} ({feed.bytes_read:,d} bytes) {timer(elapsed())}")
+        info = {'last_updated':formatedDate,
+               'total_networks':len(networks),
+               'total_ipv4':networks.total_ipv4, 'total_ipv6':networks.total_ipv6}
+        return ("Digital Ocean",networks,info)
+    except FeedNotModified:
+        raise
+    except Exception as ERR:
+        logVerbose(f"Failed to update DIGITAL OCEAN IP ranges - {str(ERR)}")
+        return False
@@ -33,7 +33,7 @@ setup(
     keywords=['cloudiplookup','cloud ip lookup','geoip','aws','azure','gcp','pure-python','purepython','pure python','oracle cloud','oci','digitalocean','digital ocean'],
     package_dir = {'cloudiplookup': 'cloudiplookup'},
     package_data={
-        'cloudiplookup': ['cloudiplookup.py','cloudiplookup.dat.gz','cloudiplookup.json'],
+        'cloudiplookup': ['cloudiplookup.py','updater.py','cli.py','delta.py','cloudiplookup.dat.gz','cloudiplookup.json'],
     },
     scripts=[],
     install_requires=[],
@@ -76,7 +76,7 @@ setup(
     long_description_content_type='text/markdown',    
     entry_points={
         'console_scripts': [
-            'cloudiplookup = cloudiplookup.cloudiplookup:main_function'
+            'cloudiplookup = cloudiplookup.cli:main_function'
         ]
     },    
 )
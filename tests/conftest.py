@@ -0,0 +1,73 @@
+# encoding: utf-8
+# -*- coding: utf-8 -*-
+"""
+Cloud IP Lookup - Fixtures of the tests. Run with: python3 -m pytest tests/
+
+The provider feeds are served by the local HTTP stand-in of the benchmarks (benchmarks/feed_server.py), no internet.
+"""
+import os, sys, json, shutil, pytest
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),'benchmarks'))
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import cloudiplookup.cloudiplookup as cloudiplookup
+from feed_server import FeedServer, write_fixture_feeds, write_info_file
+
+@pytest.fixture
+def feeds_dir(tmp_path):
+    """A directory with the fixture feeds of all providers"""
+    feedsDir = str(tmp_path/'feeds')
+    write_fixture_feeds(feedsDir)
+    return feedsDir
+
+@pytest.fixture
+def data_dir(tmp_path,monkeypatch):
+    """An empty DATA_DIR, the updater and CloudIPLookup() use it during the test"""
+    dataDir = str(tmp_path/'data')
+    os.makedirs(dataDir)
+    monkeypatch.setattr(cloudiplookup,'DATA_DIR',dataDir)
+    return dataDir
+
+@pytest.fixture
+def feed_server(feeds_dir,data_dir):
+    """A FeedServer of the fixture feeds, with a cloudiplookup.json file in DATA_DIR pointing to it"""
+    with FeedServer(feeds_dir) as server:
+        write_info_file(data_dir,server.base_url)
+        yield server
+
+@pytest.fixture
+def package_dir(monkeypatch):
+    """DATA_DIR is the directory of the package, with the cloudiplookup.dat.gz file of the repository"""
+    packageDir = os.path.dirname(os.path.abspath(cloudiplookup.__file__))
+    monkeypatch.setattr(cloudiplookup,'DATA_DIR',packageDir)
+    return packageDir
+
+##──── Changes of the fixture feeds: an AWS network removed, one added (nested), one re-attributed and a new IPv6 network ──────────
+def change_feeds(feeds_dir):
+    with open(os.path.join(feeds_dir,'ip-ranges.json'),'r') as f:
+        feed = json.load(f)
+    feed['prefixes'] = [prefix for prefix in feed['prefixes'] if prefix['service'] != 'DYNAMODB']
+    feed['prefixes'].append({"ip_prefix":"52.94.8.0/24","region":"us-east-2","service":"S3","network_border_group":"us-east-2"})
+    feed['prefixes'][1]['service'] = 'ROUTE53'
+    feed['ipv6_prefixes'].append({"ipv6_prefix":"2600:9000:3000::/36","region":"GLOBAL","service":"S3","network_border_group":"GLOBAL"})
+    with open(os.path.join(feeds_dir,'ip-ranges.json'),'w') as f:
+        json.dump(feed,f)
+
+@pytest.fixture
+def updated(feed_server,feeds_dir,data_dir,tmp_path):
+    """The data_dir with the files of the fixture feeds and then of the changed feeds with the delta. Returns the data_dir,
+    a copy of the first files (old) and of the last files (new)"""
+    assert cloudiplookup.update_ip_ranges(use_cache=False) == 0
+    shutil.copytree(data_dir,str(tmp_path/'old'))
+    change_feeds(feeds_dir)
+    assert cloudiplookup.update_ip_ranges(use_cache=False) == 0
+    shutil.copytree(data_dir,str(tmp_path/'new'))
+    return data_dir, str(tmp_path/'old'), str(tmp_path/'new')
+
+@pytest.fixture
+def restore(data_dir):
+    """restore(directory) replaces the database files of DATA_DIR with the ones of *directory* (the old or new of
+    updated), with their mtime, like an update: written aside and renamed"""
+    def restore(directory):
+        for name in (cloudiplookup.OUTPUT_FILE_NAME,cloudiplookup.BINARY_FILE_NAME):
+            shutil.copy2(os.path.join(directory,name),os.path.join(data_dir,name+'.copy'))
+            os.replace(os.path.join(data_dir,name+'.copy'),os.path.join(data_dir,name))
+    return restore
@@ -0,0 +1,66 @@
+# encoding: utf-8
+# -*- coding: utf-8 -*-
+"""DataFrames: annotate() appends the categorical columns of lookup() to a pandas.DataFrame or a pyarrow Table"""
+import random, ipaddress, pytest
+import cloudiplookup.cloudiplookup as cloudiplookup
+
+pytest.importorskip('numpy')
+
+NAMES = ('cidr','region','cloud_provider','service')
+
+def frame_ips(db,seed:int)->list:
+    """IP addresses of networks (IPv4 and IPv6), random ones, invalid ones and None"""
+    rng = random.Random(seed)
+    ips = [cloudiplookup.int_to_ipv4(db.ipv4FirstIP[row]) if row < db.totalIPv4 else db.cidr(row).split("/")[0] for row in rng.sample(range(len(db)),500)]
+    ips += [cloudiplookup.int_to_ipv4(rng.getrandbits(32)) for _ in range(200)]+['not an ip','','::ffff:52.94.7.24',None]
+    rng.shuffle(ips)
+    return ips
+
+def expected(iplookup,ips:list)->dict:
+    """The columns of lookup() for each IP address, None for the IP addresses not found or invalid"""
+    results = [iplookup.lookup(ip) if ip is not None else None for ip in ips]
+    found = lambda result: result is not None and result.cloud_provider[:1] != "<"
+    return {name:[getattr(result,name) if found(result) else None for result in results] for name in NAMES}
+
+def values(pd,series)->list:
+    return [None if pd.isna(value) else value for value in series.tolist()]
+
+def test_pandas(package_dir):
+    pd = pytest.importorskip('pandas')
+    iplookup = cloudiplookup.CloudIPLookup()
+    ips = frame_ips(iplookup._db,17)
+    frame = pd.DataFrame({'client_ip':ips,'bytes':range(len(ips))})
+    annotated = iplookup.annotate(frame,'client_ip',prefix="src_",chunk_size=64)
+    assert list(annotated.columns) == ['client_ip','bytes']+['src_'+name for name in NAMES]
+    assert list(frame.columns) == ['client_ip','bytes']
+    columns = expected(iplookup,ips)
+    for name in NAMES:
+        assert isinstance(annotated['src_'+name].dtype,pd.CategoricalDtype)
+        assert values(pd,annotated['src_'+name]) == columns[name], name
+    assert annotated['src_cloud_provider'].cat.categories.tolist() == iplookup._db.indexProvider
+    ##──── An integer column of IPv4 addresses is used as it is ───────────────────────────────────────────────────────────────────
+    integers = [cloudiplookup.ipv4_to_int(ip) for ip in ips if ip and cloudiplookup.parse_ip(ip).__class__ is int and ':' not in ip]
+    annotated = iplookup.annotate(pd.DataFrame({'ip':integers}),'ip')
+    assert len(integers) > 500 and values(pd,annotated['cidr']) == expected(iplookup,integers)['cidr']
+
+def test_pyarrow(package_dir):
+    pa = pytest.importorskip('pyarrow')
+    iplookup = cloudiplookup.CloudIPLookup()
+    ips = frame_ips(iplookup._db,18)
+    table = pa.table({'client_ip':ips,'bytes':list(range(len(ips)))})
+    columns = expected(iplookup,ips)
+    for frame in (table,table.to_batches()[0]):
+        annotated = iplookup.annotate(frame,'client_ip',chunk_size=100)
+        assert annotated.schema.names == ['client_ip','bytes']+list(NAMES)
+        for name in NAMES:
+            assert pa.types.is_dictionary(annotated.column(name).type)
+            assert annotated.column(name).to_pylist() == columns[name], name
+    ##──── IPv6 addresses in an ipaddress column and an empty table ───────────────────────────────────────────────────────────────
+    packed = [ipaddress.ip_address(ip).packed for ip in ips if ip and cloudiplookup.parse_ip(ip) is not None]
+    annotated = iplookup.annotate(pa.table({'ip':pa.array(packed,type=pa.binary())}),'ip')
+    assert annotated.column('service').to_pylist() == expected(iplookup,[ipaddress.ip_address(ip) for ip in packed])['service']
+    assert iplookup.annotate(pa.table({'ip':pa.array([],type=pa.string())}),'ip').num_rows == 0
+
+def test_not_a_frame(package_dir):
+    with pytest.raises(TypeError):
+        cloudiplookup.CloudIPLookup().annotate({'ip':['52.94.7.24']},'ip')
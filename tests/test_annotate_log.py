@@ -0,0 +1,48 @@
+# encoding: utf-8
+# -*- coding: utf-8 -*-
+"""Access logs: annotate_log() adds provider, service and region to each line and keeps the order with many processes"""
+import io, os, random, pytest
+import cloudiplookup.cloudiplookup as cloudiplookup
+
+def access_log(db,count:int,seed:int)->list:
+    """Lines of an nginx access log numbered in order, with the IP addresses of networks, random ones and bad lines"""
+    rng = random.Random(seed)
+    ips = [cloudiplookup.int_to_ipv4(db.ipv4FirstIP[row]) for row in rng.sample(range(db.totalIPv4),200)]+['2600:9000:21e8:2600:1:5a19:8b40:93a1','-']
+    lines = []
+    for number in range(count):
+        ip = rng.choice(ips) if rng.random() < 0.7 else cloudiplookup.int_to_ipv4(rng.getrandbits(32))
+        lines.append(f'{ip} - - [18/Oct/2026:10:00:00 +0000] "GET /{number} HTTP/1.1" 200 {number} "-" "curl/8.0"\n')
+    lines[5] = "\n"
+    return lines
+
+def expected(iplookup,lines:list,separator="\t")->str:
+    out = []
+    for line in lines:
+        result = iplookup.lookup(line.split(" ",1)[0].strip())
+        values = (result.cloud_provider,result.service,result.region) if result.cloud_provider[:1] != "<" else ("-","-","-")
+        out.append(line.rstrip("\n")+separator+separator.join(value or "-" for value in values)+"\n")
+    return "".join(out)
+
+@pytest.mark.parametrize('processes',[1,2,3])
+def test_order_of_the_lines(package_dir,processes):
+    iplookup = cloudiplookup.CloudIPLookup()
+    lines = access_log(iplookup._db,5000,11)
+    output = io.StringIO()
+    stats = iplookup.annotate_log(iter(lines),output,processes=processes,chunk_size=37)
+    assert output.getvalue() == expected(iplookup,lines)
+    assert stats['lines'] == len(lines) == sum(worker['lines'] for worker in stats['workers'])
+    ##──── The chunks were annotated by the workers, not by this process ──────────────────────────────────────────────────────────
+    if processes > 1:
+        assert len(stats['workers']) > 1 and all(worker['pid'] != os.getpid() for worker in stats['workers'])
+
+def test_patterns_and_separator(package_dir):
+    iplookup = cloudiplookup.CloudIPLookup()
+    ips = [line.split(" ",1)[0] for line in access_log(iplookup._db,300,12) if line.strip()]
+    elb = [f"2026-10-18T10:00:00.000000Z my-elb {ip if ':' not in ip else '['+ip+']'}:51234 10.0.0.1:80 0.001 0.002 0.000 200 200 0 {number}\n" for number,ip in enumerate(ips)]
+    output = io.StringIO()
+    iplookup.annotate_log(elb,output,pattern='elb',processes=2,chunk_size=16,separator=" | ")
+    columns = [line[len(ip):] for ip,line in zip(ips,expected(iplookup,[ip+"\n" for ip in ips]," | ").splitlines(True))]
+    assert output.getvalue() == "".join(line.rstrip("\n")+tail for line,tail in zip(elb,columns))
+    output = io.StringIO()
+    iplookup.annotate_log(["client=52.94.7.24 status=200\n","client=none\n"],output,pattern=r'client=(\S+)',processes=1)
+    assert output.getvalue() == "client=52.94.7.24 status=200\tAWS\tDYNAMODB\t"+iplookup.lookup('52.94.7.24').region+"\nclient=none\t-\t-\t-\n"
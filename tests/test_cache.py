@@ -0,0 +1,67 @@
+# encoding: utf-8
+# -*- coding: utf-8 -*-
+"""Lookup cache: eviction of the least recently used entries, invalidation and the answers of CloudIPLookup(cache_size=N)"""
+import random, threading, ipaddress, pytest
+import cloudiplookup.cloudiplookup as cloudiplookup
+
+def test_least_recently_used_is_evicted():
+    cache = cloudiplookup.CloudIPLRUCache(3)
+    for key in (1,2,3):
+        cache.put(key,str(key))
+    ##──── get() and put() make an entry the most recently used one: 2 is the oldest after them ───────────────────────────────────
+    assert cache.get(1) == '1'
+    cache.put(3,'three')
+    cache.put(4,'4')
+    assert (cache.get(2),cache.get(1),cache.get(3),cache.get(4)) == (None,'1','three','4')
+    cache.put((0x2600,1),'6')
+    assert cache.get(1) is None and len(cache) == 3
+    assert cache.info() == {'hits':4,'misses':2,'evictions':2,'size':3,'capacity':3}
+    ##──── clear() removes the entries and keeps the counters ──────────────────────────────────────────────────────────────────────
+    cache.clear()
+    assert len(cache) == 0 and cache.get(3) is None
+    assert cache.info() == {'hits':4,'misses':3,'evictions':2,'size':0,'capacity':3}
+    for capacity in (0,-1):
+        with pytest.raises(ValueError):
+            cloudiplookup.CloudIPLRUCache(capacity)
+
+def test_many_threads():
+    cache, keys = cloudiplookup.CloudIPLRUCache(100), list(range(1000))
+    def run(seed):
+        rng = random.Random(seed)
+        for _ in range(5000):
+            key = rng.choice(keys)
+            if cache.get(key) is None:
+                cache.put(key,key)
+    threads = [threading.Thread(target=run,args=(seed,)) for seed in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    info = cache.info()
+    assert info['size'] == 100 and info['hits']+info['misses'] == 20000
+    ##──── Two threads may miss the same key and both put it: the second put() replaces the entry and evicts nothing ──────────────
+    assert 0 < info['evictions'] <= info['misses']-100
+    assert all(cache.get(key) in (None,key) for key in keys)
+
+def test_lookup_with_cache(package_dir):
+    cached, uncached = cloudiplookup.CloudIPLookup(cache_size=50), cloudiplookup.CloudIPLookup()
+    rng = random.Random(6)
+    ips = ['52.94.7.24','8.8.8.8','not an ip','2600:9000:21e8:2600:1:5a19:8b40:93a1']+[cloudiplookup.int_to_ipv4(rng.getrandbits(32)) for _ in range(200)]
+    ips += [cloudiplookup.int_to_ipv4(cached._db.ipv4FirstIP[row]) for row in rng.sample(range(cached._db.totalIPv4),200)]
+    answer = lambda iplookup, ip: {key:value for key,value in iplookup.lookup(ip).to_dict().items() if key != 'elapsed_time'}
+    for _ in range(2):
+        assert [answer(cached,ip) for ip in ips] == [answer(uncached,ip) for ip in ips]
+    info = cached.cache_info()
+    assert info['size'] == 50 and info['evictions'] > 300 and info['hits'] < 50
+    ##──── Different writings of the same IPv6 address and an ipaddress object share the entry ────────────────────────────────────
+    cached.cache_clear()
+    hits = cached.cache_info()['hits']
+    for ip in ('2600:9000:21e8:2600:1:5a19:8b40:93a1','2600:9000:21E8:2600:0001:5A19:8B40:93A1',ipaddress.ip_address('2600:9000:21e8:2600:1:5a19:8b40:93a1')):
+        assert answer(cached,ip)['cidr'] == answer(uncached,ip)['cidr']
+    assert cached.cache_info()['hits']-hits == 2 and cached.cache_info()['size'] == 1
+    ##──── An entry of another snapshot is ignored and replaced ───────────────────────────────────────────────────────────────────
+    key = cloudiplookup.parse_ip('52.94.7.24')
+    cached._cache.put(key,(cloudiplookup.CloudIPLookup()._db,0,'0.0.0.0/0','','stale',''))
+    assert answer(cached,'52.94.7.24') == answer(uncached,'52.94.7.24')
+    assert cached._cache.get(key)[0] is cached._db
+    assert cloudiplookup.CloudIPLookup().cache_info() == {}
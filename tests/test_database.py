@@ -0,0 +1,29 @@
+# encoding: utf-8
+# -*- coding: utf-8 -*-
+"""Columns of the database loaded from cloudiplookup.dat.gz"""
+import io, os, gzip, pickle
+from array import array
+import cloudiplookup.cloudiplookup as cloudiplookup
+
+def test_wide_columns_are_narrowed_at_load(package_dir):
+    filename = os.path.join(package_dir,cloudiplookup.OUTPUT_FILE_NAME)
+    with gzip.open(filename,'rb') as f:
+        data = pickle.load(f)
+    ##──── A file of the previous versions: 2 bytes per code and 4 bytes per row ──────────────────────────────────────────────────────
+    for name in ('provider','services','regions','features'):
+        data['columns'][name] = array('H',data['columns'][name])
+    for name in ('ipv4.row','ipv6.row'):
+        data['columns'][name] = array('I',data['columns'][name])
+    expected = {name:column.tolist() for name,column in data['columns'].items()}
+    database = cloudiplookup.CloudIPDatabase.from_pickle(io.BytesIO(pickle.dumps(data)),filename)
+    memory = database.memory_usage()
+    for name in ('provider','services','regions','features'):
+        assert memory[name] == len(database)
+    for name in ('ipv4.row','ipv6.row'):
+        assert database.columns[name].itemsize == 2
+    assert all(database.columns[name].tolist() == column for name,column in expected.items())
+
+def test_package_database_is_narrow(package_dir):
+    iplookup = cloudiplookup.CloudIPLookup()
+    assert iplookup._db.memory_usage()['provider'] == len(iplookup._db)
+    assert iplookup.lookup('52.94.7.24').to_dict()['service'] == 'DYNAMODB'
@@ -0,0 +1,165 @@
+# encoding: utf-8
+# -*- coding: utf-8 -*-
+"""Delta files: the patched snapshot has the columns of a full update, the fingerprint checks, mmap and the watcher"""
+import os, gzip, random, shutil, pytest
+import cloudiplookup.cloudiplookup as cloudiplookup
+from cloudiplookup.delta import network_groups, diff_databases, load_delta, apply_delta
+from cloudiplookup.updater import update_from_delta
+
+USE_NUMPY = [False] + ([None] if cloudiplookup._import_numpy() is not None else [])
+
+##──── The database of an update with the networks *groups* ({(family, first_ip, netlength): [attributions]}) ─────────────────────────
+def build_database(groups:dict)->cloudiplookup.CloudIPDatabase:
+    rows = [(key,attribution) for key in sorted(groups) for attribution in groups[key]]
+    tables = [{},{},{},{}]
+    codes = [[table.setdefault(attribution[pos],len(table)+1) for key, attribution in rows] for pos, table in enumerate(tables)]
+    columns = cloudiplookup._build_columns([key[1] for key, attribution in rows if key[0] == 4],[key[1] for key, attribution in rows if key[0] == 6],
+                                           [key[2] for key, attribution in rows],*codes)
+    strings = dict(zip(('indexProvider','indexServices','indexRegions','indexNetworkFeatures'),map(list,tables)),databaseInfo={})
+    return cloudiplookup.CloudIPDatabase(columns,strings)
+
+def mutate(groups:dict,rng:random.Random,changes:int)->dict:
+    """Removes, re-attributes and adds networks, the new ones nested in the existing networks or anywhere, with new strings"""
+    groups, keys = {key:list(group) for key, group in groups.items()}, sorted(groups)
+    for _ in range(changes):
+        family, first_ip, netlength = key = rng.choice(keys)
+        bits, dice = (32 if family == 4 else 128), rng.random()
+        if dice < 0.25:
+            groups.pop(key,None)
+        elif dice < 0.5 and key in groups:
+            groups[key] = [(provider,service+rng.choice(['','-NEW']),region,features) for provider, service, region, features in groups[key]][:rng.randint(1,2)]
+        elif dice < 0.8:
+            nested = min(bits,netlength+rng.randrange(8))
+            nestedFirst = (first_ip+rng.getrandbits(bits-netlength)) & ~((1 << (bits-nested))-1) if netlength < bits else first_ip
+            groups.setdefault((family,nestedFirst,nested),[]).append(('NEW PROVIDER','SERVICE',f'region-{rng.randrange(300)}',''))
+        else:
+            netlength = rng.randrange(8,33) if family == 4 else rng.randrange(20,65)
+            groups[(family,rng.getrandbits(bits) & ~((1 << (bits-netlength))-1),netlength)] = [('AWS','EC2','us-east-1','')]
+    return groups
+
+def same_columns(columns:dict,database)->bool:
+    return columns.keys() == database.columns.keys() and all(bytes(columns[name]) == bytes(column) and memoryview(columns[name]).format == column.typecode
+                                                             for name, column in database.columns.items())
+
+@pytest.mark.parametrize('use_numpy',USE_NUMPY)
+def test_patch_has_the_columns_of_the_update(package_dir,use_numpy):
+    groups = network_groups(cloudiplookup.CloudIPLookup()._db)
+    old, rng = build_database(groups), random.Random(25)
+    for changes in (1,5,60):
+        new = build_database(mutate(groups,rng,changes))
+        delta = diff_databases(old,new).delta()
+        columns, strings = apply_delta(old,delta,use_numpy=use_numpy)
+        assert same_columns(columns,new)
+        assert [strings[name] for name in ('indexProvider','indexServices','indexRegions','indexNetworkFeatures')] == \
+               [new.strings[name] for name in ('indexProvider','indexServices','indexRegions','indexNetworkFeatures')]
+        assert strings['fingerprint'] == delta['target'] == cloudiplookup._columns_fingerprint(columns,strings)
+
+def lookups(iplookup)->list:
+    return [(result.cidr,result.cloud_provider,result.service,result.region) for result in
+            map(iplookup.lookup,('52.94.7.24','52.94.8.1','52.94.9.1','3.2.35.70','2600:9000:3000::1','2600:9000:2000::1','8.8.8.8'))]
+
+def test_apply_delta_of_the_update(updated,restore):
+    data_dir, old_dir, new_dir = updated
+    deltaFile = os.path.join(data_dir,cloudiplookup.DELTA_FILE_NAME)
+    expected = lookups(cloudiplookup.CloudIPLookup())
+    restore(old_dir)
+    iplookup = cloudiplookup.CloudIPLookup(cache_size=10)
+    assert lookups(iplookup) != expected
+    iplookup.apply_delta(deltaFile,verify=True)
+    assert lookups(iplookup) == expected
+    assert iplookup._db.fingerprint == load_delta(deltaFile)['target']
+    with pytest.raises(ValueError,match="already applied"):
+        iplookup.apply_delta(deltaFile)
+    ##──── A delta of other networks is refused, the snapshot is kept ──────────────────────────────────────────────────────────────────
+    delta = load_delta(deltaFile)
+    delta['base'] = '0'*40
+    with pytest.raises(ValueError,match="another database"):
+        cloudiplookup.CloudIPLookup().apply_delta(delta)
+
+def test_verify(updated):
+    data_dir, old_dir, new_dir = updated
+    delta = load_delta(os.path.join(data_dir,cloudiplookup.DELTA_FILE_NAME))
+    delta['networks']['52.94.8.0/24'] = [["AWS","EC2","us-east-2",""]]
+    with gzip.open(os.path.join(old_dir,cloudiplookup.OUTPUT_FILE_NAME),'rb') as f:
+        old = cloudiplookup.CloudIPDatabase.from_pickle(f)
+    ##──── The fingerprint of the base is the one saved in the file, only verify=True hashes the new columns ─────────────────────────
+    assert old.strings['fingerprint'] == delta['base']
+    columns, strings = apply_delta(old,delta)
+    assert strings['fingerprint'] == delta['target']
+    with pytest.raises(ValueError,match="not the database of the delta"):
+        apply_delta(old,delta,verify=True)
+
+def test_mmap_maps_the_new_file(updated,restore):
+    data_dir, old_dir, new_dir = updated
+    expected = lookups(cloudiplookup.CloudIPLookup(use_mmap=True))
+    restore(old_dir)
+    iplookup = cloudiplookup.CloudIPLookup(use_mmap=True)
+    restore(new_dir)
+    ##──── The dat.bin file already has the networks of the delta: it is mapped, the columns are the pages of the new file ──────────
+    iplookup.apply_delta(os.path.join(data_dir,cloudiplookup.DELTA_FILE_NAME))
+    assert isinstance(iplookup._db,cloudiplookup.CloudIPMmapDatabase)
+    assert lookups(iplookup) == expected
+
+def test_mmap_patched_in_memory(updated,restore):
+    data_dir, old_dir, new_dir = updated
+    expected = lookups(cloudiplookup.CloudIPLookup(use_mmap=True))
+    restore(old_dir)
+    iplookup = cloudiplookup.CloudIPLookup(use_mmap=True)
+    iplookup.apply_delta(os.path.join(data_dir,cloudiplookup.DELTA_FILE_NAME))
+    assert not isinstance(iplookup._db,cloudiplookup.CloudIPMmapDatabase)
+    assert lookups(iplookup) == expected
+    ##──── The columns without changes are still memoryviews of the file ──────────────────────────────────────────────────────────────
+    assert isinstance(iplookup._db.columns['pf.ipv6.bits'],memoryview)
+    ##──── The next file is mapped by the watcher ──────────────────────────────────────────────────────────────────────────────────────
+    restore(new_dir)
+    iplookup._file_replaced(cloudiplookup._file_signature(iplookup._db.filename))
+    assert isinstance(iplookup._db,cloudiplookup.CloudIPMmapDatabase)
+
+def test_watcher_applies_the_delta(updated,restore,monkeypatch):
+    data_dir, old_dir, new_dir = updated
+    expected = lookups(cloudiplookup.CloudIPLookup())
+    restore(old_dir)
+    iplookup = cloudiplookup.CloudIPLookup()
+    reloads = []
+    monkeypatch.setattr(iplookup,'reload',lambda: reloads.append(1))
+    ##──── The new file is the target of the delta saved by the update: the delta is applied, the file is not loaded ────────────────
+    restore(new_dir)
+    signature = cloudiplookup._file_signature(iplookup._db.filename)
+    assert iplookup._file_replaced(signature) == True
+    assert (reloads,iplookup._db_signature,lookups(iplookup)) == ([],signature,expected)
+    ##──── The same networks in a file of another update (another mtime): the delta is not of this file, it is loaded ──────────────────
+    os.utime(iplookup._db.filename,ns=(signature[1]+1000,signature[1]+1000))
+    iplookup._file_replaced(cloudiplookup._file_signature(iplookup._db.filename))
+    assert reloads == [1]
+
+def test_watcher_adopts_the_file_of_the_delta_applied(updated,restore,monkeypatch):
+    data_dir, old_dir, new_dir = updated
+    restore(old_dir)
+    iplookup = cloudiplookup.CloudIPLookup()
+    iplookup.apply_delta(os.path.join(data_dir,cloudiplookup.DELTA_FILE_NAME))
+    snapshot, reloads = iplookup._db, []
+    monkeypatch.setattr(iplookup,'reload',lambda: reloads.append(1))
+    restore(new_dir)
+    signature = cloudiplookup._file_signature(iplookup._db.filename)
+    iplookup._file_replaced(signature)
+    assert (reloads,iplookup._db,iplookup._db_signature) == ([],snapshot,signature)
+
+def test_update_from_delta(updated,restore,tmp_path):
+    data_dir, old_dir, new_dir = updated
+    deltaFile = shutil.copy(os.path.join(data_dir,cloudiplookup.DELTA_FILE_NAME),str(tmp_path/'delta.gz'))
+    restore(old_dir)
+    iplookup = cloudiplookup.CloudIPLookup()
+    assert update_from_delta(deltaFile) == 0
+    ##──── The files have the columns and strings of the update ────────────────────────────────────────────────────────────────────────
+    with open(os.path.join(data_dir,cloudiplookup.BINARY_FILE_NAME),'rb') as f, open(os.path.join(new_dir,cloudiplookup.BINARY_FILE_NAME),'rb') as expected:
+        assert f.read() == expected.read()
+    with gzip.open(os.path.join(data_dir,cloudiplookup.OUTPUT_FILE_NAME),'rb') as f:
+        database = cloudiplookup.CloudIPDatabase.from_pickle(f)
+    with gzip.open(os.path.join(new_dir,cloudiplookup.OUTPUT_FILE_NAME),'rb') as f:
+        expected = cloudiplookup.CloudIPDatabase.from_pickle(f)
+    assert same_columns(database.columns,expected) and database.strings == expected.strings
+    assert update_from_delta(deltaFile) == 1
+    ##──── The delta saved with the files is applied by the watchers ───────────────────────────────────────────────────────────────────
+    iplookup.reload = None
+    assert iplookup._file_replaced(cloudiplookup._file_signature(iplookup._db.filename)) == True
+    assert lookups(iplookup) == lookups(cloudiplookup.CloudIPLookup())
@@ -0,0 +1,60 @@
+# encoding: utf-8
+# -*- coding: utf-8 -*-
+"""Concurrent downloads of the provider feeds: retries on HTTP 429/5xx, timeout and the same database at any concurrency"""
+import os, gzip, time
+import cloudiplookup.cloudiplookup as cloudiplookup
+from cloudiplookup.updater import download_file
+from feed_server import FeedServer, write_info_file
+
+def test_retry_after_500(feeds_dir):
+    with FeedServer(feeds_dir,failures=1,failure_status=500) as server:
+        data, lastModified = download_file(server.base_url+'/goog.json',retries=2,backoff=0)
+    assert server.requests['/goog.json'] == 2
+    assert data['prefixes'][0] == {"ipv4Prefix":"8.8.8.0/24"}
+    assert lastModified is not None
+
+def test_retry_after_429(feeds_dir):
+    with FeedServer(feeds_dir,failures=2,failure_status=429) as server:
+        data, lastModified = download_file(server.base_url+'/goog.json',retries=2,backoff=0)
+    assert server.requests['/goog.json'] == 3
+    assert len(data['prefixes']) == 3
+
+def test_retries_exhausted(feeds_dir):
+    with FeedServer(feeds_dir,failures=5,failure_status=503) as server:
+        assert download_file(server.base_url+'/goog.json',retries=2,backoff=0) == (False,None)
+    assert server.requests['/goog.json'] == 3
+
+def test_client_error_not_retried(feeds_dir):
+    with FeedServer(feeds_dir) as server:
+        assert download_file(server.base_url+'/missing.json',retries=2,backoff=0) == (False,None)
+    assert server.requests['/missing.json'] == 1
+
+def test_timeout(feeds_dir):
+    with FeedServer(feeds_dir,latency=1.0) as server:
+        startTime = time.perf_counter()
+        assert download_file(server.base_url+'/goog.json',timeout=0.2,retries=1,backoff=0) == (False,None)
+        elapsed = time.perf_counter()-startTime
+    assert server.requests['/goog.json'] == 2
+    assert elapsed < 1.0
+
+##──── The database files of an update, the gzip header of cloudiplookup.dat.gz has the time of the update ─────────────────────────
+def database_files(data_dir):
+    with gzip.open(os.path.join(data_dir,cloudiplookup.OUTPUT_FILE_NAME),'rb') as f:
+        pickled = f.read()
+    with open(os.path.join(data_dir,cloudiplookup.BINARY_FILE_NAME),'rb') as f:
+        return pickled, f.read()
+
+def test_same_database_at_any_concurrency(feeds_dir,tmp_path,monkeypatch):
+    results = {}
+    monkeypatch.setattr(cloudiplookup,'DOWNLOAD_BACKOFF',0.0)
+    with FeedServer(feeds_dir,latency=0.05,failures=1,failure_status=503) as server:
+        for concurrency in (1,8):
+            dataDir = str(tmp_path/f'data{concurrency}')
+            write_info_file(dataDir,server.base_url)
+            monkeypatch.setattr(cloudiplookup,'DATA_DIR',dataDir)
+            server.requests.clear()
+            assert cloudiplookup.update_ip_ranges(concurrency=concurrency,retries=1,timeout=5,use_cache=False) == 0
+            results[concurrency] = database_files(dataDir)
+    assert results[1] == results[8]
+    monkeypatch.setattr(cloudiplookup,'DATA_DIR',str(tmp_path/'data8'))
+    assert cloudiplookup.CloudIPLookup().lookup('52.94.7.24').to_dict()['cloud_provider'] == 'AWS'
@@ -0,0 +1,57 @@
+# encoding: utf-8
+# -*- coding: utf-8 -*-
+"""Conditional downloads with the feed cache: 304 Not Modified with the ETag and the cache when a download fails"""
+import os, json, pytest
+import cloudiplookup.cloudiplookup as cloudiplookup
+from cloudiplookup.updater import download_file, CloudIPFeedCache, FeedNotModified
+
+def test_etag_not_modified(feed_server,data_dir):
+    cache = CloudIPFeedCache(os.path.join(data_dir,cloudiplookup.FEED_CACHE_DIR_NAME),'GOOGLESERVICES')
+    url = feed_server.base_url+'/goog.json'
+    data, lastModified = download_file(url,cache=cache)
+    cache.store_networks(('Google',[],{}))
+    assert cache.conditional_headers(url)['If-None-Match'] == cache.meta['etag']
+    with pytest.raises(FeedNotModified):
+        download_file(url,cache=cache)
+    assert feed_server.stats['not_modified'] == 1
+    ##──── Another url of the same provider is not conditional ────────────────────────────────────────────────────────────────────
+    assert cache.conditional_headers(feed_server.base_url+'/googlebot.json') == {}
+
+def test_update_reuses_the_cache(feed_server,feeds_dir,data_dir):
+    databaseFile = os.path.join(data_dir,cloudiplookup.OUTPUT_FILE_NAME)
+    assert cloudiplookup.update_ip_ranges() == 0
+    firstRequests, lastChange = feed_server.stats['requests'], os.path.getmtime(databaseFile)
+    feed_server.stats.update(requests=0,not_modified=0,bytes_sent=0)
+    ##──── Nothing changed: only 304 responses (the Azure page has no networks, it is always downloaded) and no new files ────────
+    assert cloudiplookup.update_ip_ranges() == 0
+    assert feed_server.stats['requests'] == firstRequests
+    assert feed_server.stats['not_modified'] == firstRequests-1
+    assert os.path.getmtime(databaseFile) == lastChange
+    ##──── One provider changed: only its feed is downloaded and the database is rebuilt with it ─────────────────────────────────────
+    with open(os.path.join(feeds_dir,'cloud.json'),'r') as f:
+        feed = json.load(f)
+    feed['prefixes'].append({"ipv4Prefix":"34.0.0.0/24","service":"Google Cloud","scope":"us-east1"})
+    with open(os.path.join(feeds_dir,'cloud.json'),'w') as f:
+        json.dump(feed,f)
+    feed_server.stats.update(requests=0,not_modified=0,bytes_sent=0)
+    assert cloudiplookup.update_ip_ranges() == 0
+    assert feed_server.stats['not_modified'] == firstRequests-2
+    result = cloudiplookup.CloudIPLookup().lookup('34.0.0.10').to_dict()
+    assert (result['cloud_provider'],result['region']) == ('Google Cloud Platform','us-east1')
+    assert cloudiplookup.CloudIPLookup().lookup('8.8.8.8').to_dict()['cloud_provider'] == 'Google'
+
+def test_failed_download_uses_the_cache(feed_server,feeds_dir,data_dir):
+    assert cloudiplookup.update_ip_ranges() == 0
+    ##──── The AWS feed is gone (HTTP 404) and another provider changed, the database is rebuilt with the AWS networks of the cache ─
+    os.remove(os.path.join(feeds_dir,'ip-ranges.json'))
+    with open(os.path.join(feeds_dir,'goog.json'),'a') as f:
+        f.write("\n")
+    assert cloudiplookup.update_ip_ranges(retries=0) == 0
+    assert feed_server.requests['/ip-ranges.json'] == 2
+    result = cloudiplookup.CloudIPLookup().lookup('52.94.7.24').to_dict()
+    assert (result['cloud_provider'],result['service']) == ('AWS','DYNAMODB')
+
+def test_failed_download_without_cache(feed_server,feeds_dir,data_dir):
+    os.remove(os.path.join(feeds_dir,'ip-ranges.json'))
+    assert cloudiplookup.update_ip_ranges(retries=0,use_cache=False) == 0
+    assert cloudiplookup.CloudIPLookup().lookup('52.94.7.24').to_dict()['cloud_provider'] != 'AWS'
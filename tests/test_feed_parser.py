@@ -0,0 +1,51 @@
+# encoding: utf-8
+# -*- coding: utf-8 -*-
+"""Streaming parser of the json feeds: the same values as json.load() wherever the chunks are cut"""
+import os, json, random, pytest
+from cloudiplookup.updater import iter_json_items
+
+def array_paths(document:dict,prefix="")->list:
+    """The paths of the arrays of *document* (the nested objects are joined with dots), like the arrays of the updater"""
+    paths = []
+    for key, value in document.items():
+        if isinstance(value,list):
+            paths.append(prefix+key)
+        elif isinstance(value,dict):
+            paths.extend(array_paths(value,prefix+key+"."))
+    return paths
+
+def parse(text:str,size:int,arrays:list)->dict:
+    """Parses *text* in chunks of *size* characters and rebuilds the document with the (path, value) pairs"""
+    document = {path:[] for path in arrays}
+    for path, value in iter_json_items((text[pos:pos+size] for pos in range(0,len(text),size)),arrays):
+        if path in arrays:
+            document[path].append(value)
+        else:
+            document[path] = value
+    for path in sorted(document,key=len,reverse=True):
+        if "." in path:
+            parent, key = path.rsplit(".",1)
+            document.setdefault(parent,{})[key] = document.pop(path)
+    return document
+
+@pytest.mark.parametrize('size',[1,2,7])
+def test_fixture_feeds(feeds_dir,size):
+    names = [name for name in sorted(os.listdir(feeds_dir)) if name.endswith('.json')]
+    assert len(names) >= 8
+    for name in names:
+        with open(os.path.join(feeds_dir,name),'r') as f:
+            text = f.read()
+        expected = json.loads(text)
+        assert parse(text,size,array_paths(expected)) == expected, name
+
+def test_numbers_cut_anywhere():
+    rng = random.Random(23)
+    numbers = [12.5,-0.25,2.5e-3,1E+20,-7,0,123456789,3.0e10,-1.5E-7]+[rng.uniform(-1e6,1e6) for _ in range(50)]
+    text = json.dumps({"a":numbers,"b":{"c":[[1.5,2],{"d":-0.5e3}],"e":10.25},"f":[True,False,None,"1.5"],"g":2.5})
+    expected = json.loads(text)
+    for size in range(1,12):
+        assert parse(text,size,['a','b.c','f']) == expected, size
+
+def test_invalid_json():
+    with pytest.raises(ValueError):
+        list(iter_json_items(iter(['{"a":[12.', '.5]}']),('a',)))
@@ -0,0 +1,28 @@
+# encoding: utf-8
+# -*- coding: utf-8 -*-
+"""Lazy imports: "import cloudiplookup" and a lookup do not import the updater, the command line and their modules"""
+import os, sys, json, subprocess
+
+LAZY_MODULES = ('cloudiplookup.updater','cloudiplookup.cli','cloudiplookup.delta','urllib.request','concurrent.futures','argparse',
+                'asyncio','ctypes','datetime','numpy')
+
+def imported_modules(code:str)->dict:
+    """Runs *code* in a new interpreter and returns the modules of LAZY_MODULES imported by it and what it printed"""
+    packageParent = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    script = code+f"\nimport sys, json\nprint(json.dumps(sorted(name for name in {LAZY_MODULES!r} if name in sys.modules)))"
+    output = subprocess.run([sys.executable,"-c",script],capture_output=True,text=True,check=True,cwd=packageParent,
+                            env=dict(os.environ,PYTHONPATH=packageParent)).stdout.splitlines()
+    return {'modules':json.loads(output[-1]),'output':output[:-1]}
+
+def test_import_and_lookup(package_dir):
+    result = imported_modules(f"import cloudiplookup, cloudiplookup.cloudiplookup as core\ncore.DATA_DIR = {package_dir!r}\n"
+                              "print(cloudiplookup.CloudIPLookup().lookup('52.94.7.24').service)")
+    assert result == {'modules':[],'output':['DYNAMODB']}
+
+def test_updater_on_first_access():
+    result = imported_modules("import cloudiplookup, cloudiplookup.cloudiplookup as core, sys\n"
+                              "print('cloudiplookup.updater' in sys.modules)\n"
+                              "print(cloudiplookup.update_ip_ranges is core.update_ip_ranges is sys.modules['cloudiplookup.updater'].update_ip_ranges)")
+    assert result['output'] == ['False','True'] and 'cloudiplookup.updater' in result['modules'] and 'cloudiplookup.cli' not in result['modules']
+    result = imported_modules("import cloudiplookup.cloudiplookup as core\nprint(core.main_function.__module__)")
+    assert result['output'] == ['cloudiplookup.cli'] and 'argparse' in result['modules']
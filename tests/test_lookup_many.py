@@ -0,0 +1,56 @@
+# encoding: utf-8
+# -*- coding: utf-8 -*-
+"""Batch lookups: lookup_many() with numpy and in pure Python return the same columns as lookup() of each IP address"""
+import random, ipaddress, pytest
+import cloudiplookup.cloudiplookup as cloudiplookup
+
+np = pytest.importorskip('numpy')
+
+def batch_ips(db,count:int,seed:int)->list:
+    """Addresses inside the networks, at their edges, random ones, invalid ones and the other types accepted by parse_ip()"""
+    rng, ips = random.Random(seed), []
+    for row in rng.sample(range(len(db)),count):
+        if row < db.totalIPv4:
+            first, last = db.ipv4FirstIP[row], db.ipv4LastIP[row]
+            ips.extend(cloudiplookup.int_to_ipv4(key) for key in (first,last,rng.randint(first,last),min(last+1,0xFFFFFFFF)))
+        else:
+            pos = row-db.totalIPv4
+            first, last = (db.ipv6FirstHi[pos] << 64) | db.ipv6FirstLo[pos], (db.ipv6LastHi[pos] << 64) | db.ipv6LastLo[pos]
+            ips.extend(cloudiplookup.int_to_ipv6(key) for key in (first,last,rng.randint(first,last),last+1))
+    ips += [cloudiplookup.int_to_ipv4(rng.getrandbits(32)) for _ in range(count)]
+    ips += [cloudiplookup.int_to_ipv6((0x2 << 124) | rng.getrandbits(124)) for _ in range(count)]
+    ips += ['','not an ip','52.94.7.256','2600:9000::1::1',None,'::ffff:52.94.7.24','  52.94.7.24  ',cloudiplookup.ipv4_to_int('52.94.7.24'),
+            ipaddress.ip_address('52.94.7.24'),ipaddress.ip_address('2600:9000:21e8:2600:1:5a19:8b40:93a1'),ipaddress.ip_address('52.94.7.24').packed]
+    rng.shuffle(ips)
+    return ips
+
+def details(results)->list:
+    """The networks of the CloudIPDetail objects (lookup() gives the IP address as text, lookup_many() as it was given)"""
+    return [{key:value for key,value in detail.to_dict().items() if key not in ('ip','elapsed_time')} for detail in results]
+
+def columns(result)->tuple:
+    return tuple([int(value) for value in column] for column in (result.rows,result.provider,result.service,result.region,result.features))
+
+@pytest.mark.parametrize('engine',['bisect','trie'])
+def test_numpy_and_pure_python(package_dir,engine):
+    iplookup = cloudiplookup.CloudIPLookup(engine=engine)
+    ips = batch_ips(iplookup._db,2000,1)
+    withNumpy, pure = iplookup.lookup_many(ips,use_numpy=True), iplookup.lookup_many(ips,use_numpy=False)
+    assert isinstance(withNumpy.rows,np.ndarray) and not isinstance(pure.rows,np.ndarray)
+    assert columns(withNumpy) == columns(pure)
+    assert columns(withNumpy)[0] == list(map(iplookup.lookup_code,ips))
+    assert withNumpy.to_dict() == pure.to_dict()
+    assert details(withNumpy) == details(map(iplookup.lookup,ips))
+    ##──── The test has networks found, addresses not found and invalid ones ─────────────────────────────────────────────────────
+    rows = columns(pure)[0]
+    assert {cloudiplookup.ROW_NOT_FOUND,cloudiplookup.ROW_INVALID} < set(rows) and sum(1 for row in rows if row >= 0) > 2000
+
+def test_ipv4_strings_and_arrays(package_dir):
+    iplookup = cloudiplookup.CloudIPLookup()
+    ##──── Only IPv4 strings (the bulk conversion), a numpy array of integers and an empty list ───────────────────────────────────
+    ips = [ip for ip in batch_ips(iplookup._db,2000,2) if isinstance(ip,str) and cloudiplookup.parse_ip(ip).__class__ is int and ip.strip() == ip and ':' not in ip]
+    assert len(ips) > 2000
+    assert columns(iplookup.lookup_many(ips,use_numpy=True)) == columns(iplookup.lookup_many(ips,use_numpy=False))
+    keys = np.array([cloudiplookup.ipv4_to_int(ip) for ip in ips],dtype=np.uint32)
+    assert columns(iplookup.lookup_many(keys,use_numpy=True)) == columns(iplookup.lookup_many(keys,use_numpy=False)) == columns(iplookup.lookup_many(ips))
+    assert columns(iplookup.lookup_many([],use_numpy=True)) == columns(iplookup.lookup_many([],use_numpy=False)) == ([],)*5
@@ -0,0 +1,73 @@
+# encoding: utf-8
+# -*- coding: utf-8 -*-
+"""Typed network columns: CloudIPNetworkColumns merged by _merge_network_columns() give the columns of the old builder"""
+import random
+import cloudiplookup.cloudiplookup as cloudiplookup
+from cloudiplookup.updater import CloudIPNetworkColumns, _merge_network_columns
+
+def dict_builder(providers:list)->tuple:
+    """The builder of the versions before CloudIPNetworkColumns: a (first_ip, dict) per network, a sort by (first_ip,
+    netlength) and the codes numbered in the order they first appear. *providers* is a list of (provider, records)"""
+    cloudipv4, cloudipv6 = [], []
+    for provider, records in providers:
+        for cidr, region, service, networkFeatures in records:
+            first_ip, netlen = cidr.split("/")
+            network = {'provider':provider,'cidr':cidr,'region':region,'service':service,'netlength':int(netlen),'network_features':networkFeatures}
+            if first_ip.find(":") < 0:
+                cloudipv4.append((cloudiplookup.ipv4_to_int(first_ip),network))
+            else:
+                cloudipv6.append((cloudiplookup.ipv6_to_int(first_ip),network))
+    cloudipv4.sort(key=lambda x:(x[0],x[1]['netlength']))
+    cloudipv6.sort(key=lambda x:(x[0],x[1]['netlength']))
+    dicts = {'provider':{},'service':{},'region':{},'network_features':{}}
+    networksIPv4, networksIPv6 = [], []
+    for cloudipFamily, networks in ((cloudipv4,networksIPv4),(cloudipv6,networksIPv6)):
+        for key, val in cloudipFamily:
+            codes = [values.setdefault(val[name],len(values)+1) for name,values in dicts.items()]
+            networks.append((key,val['netlength'],*codes))
+    columns = cloudiplookup._build_database_columns(networksIPv4,networksIPv6)
+    strings = {'indexProvider':list(dicts['provider']),'indexServices':list(dicts['service']),'indexRegions':list(dicts['region']),
+               'indexNetworkFeatures':list(dicts['network_features'])}
+    return columns, strings
+
+def typed_builder(providers:list)->tuple:
+    return _merge_network_columns([CloudIPNetworkColumns(provider).extend(records) for provider, records in providers])
+
+def assert_same_columns(providers:list):
+    expectedColumns, expectedStrings = dict_builder(providers)
+    columns, strings = typed_builder(providers)
+    assert strings == expectedStrings
+    assert sorted(columns) == sorted(expectedColumns)
+    for name, column in expectedColumns.items():
+        assert columns[name].typecode == column.typecode and columns[name] == column, name
+
+def database_records(db)->list:
+    """The (provider, records) of the networks of a database, the providers in the order they first appear"""
+    providers = {}
+    for row in range(len(db)):
+        records = providers.setdefault(db.indexProvider[db.provider[row]-1],[])
+        records.append((db.cidr(row),db.indexRegions[db.regions[row]-1],db.indexServices[db.services[row]-1],db.indexNetworkFeatures[db.features[row]-1]))
+    return list(providers.items())
+
+def test_package_database(package_dir):
+    db = cloudiplookup.CloudIPLookup()._db
+    providers = database_records(db)
+    assert len(providers) == len(db.indexProvider) and sum(len(records) for provider, records in providers) == len(db)
+    ##──── The records of each provider shuffled, as in the feeds: the sort of the builders puts them back in the database order ──
+    rng = random.Random(24)
+    for provider, records in providers:
+        rng.shuffle(records)
+    assert_same_columns(providers)
+
+def test_duplicates_and_host_bits():
+    ##──── The same network in many providers and services, nested networks, CIDRs with host bits and empty strings ──────────────
+    rng = random.Random(2024)
+    networks = ['10.0.0.0/8','10.1.0.0/16','10.1.2.3/24','10.1.2.0/24','0.0.0.0/0','255.255.255.255/32','2600::/12','2600:1f00::1/24',
+                '2600:1f00::/24','::/0','ffff:ffff:ffff:ffff:ffff:ffff:ffff:ffff/128','::ffff:1.2.3.0/120']
+    providers = []
+    for provider in ('P1','P2','P1','P3'):
+        records = [(rng.choice(networks),rng.choice(('','r1','r2')),rng.choice(('','s1','s2','s3')),rng.choice(('','f1'))) for _ in range(200)]
+        providers.append((provider,records))
+    assert_same_columns(providers)
+    assert_same_columns([('P1',[])])
+    assert_same_columns([('P1',[('52.94.7.0/24','r','s','')]),('P2',[('2600:9000::/28','r','s','')])])
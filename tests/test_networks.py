@@ -0,0 +1,53 @@
+# encoding: utf-8
+# -*- coding: utf-8 -*-
+"""Inverted indexes: rows_where(), networks() and the --networks option, checked against the code columns of each row"""
+import sys, pytest
+import cloudiplookup.cloudiplookup as cloudiplookup
+from cloudiplookup.cli import main_function
+
+def brute_force(db,provider=None,service=None,region=None)->list:
+    """The rows whose names match the filters, reading the name of each row (names or lists of names, case insensitive)"""
+    names = lambda value: None if value is None else {name.lower() for name in ([value] if isinstance(value,str) else value)}
+    filters = [(names(value),decode,column) for value,decode,column in ((provider,db.indexProvider,db.provider),(service,db.indexServices,db.services),
+                                                                        (region,db.indexRegions,db.regions)) if value is not None]
+    return [row for row in range(len(db)) if all(decode[column[row]-1].lower() in wanted for wanted,decode,column in filters)]
+
+FILTERS = [{},{'provider':'AWS'},{'provider':'aws'},{'provider':'Google'},{'provider':'google cloud platform'},{'provider':['Azure','CLOUDFLARE']},
+           {'service':'EC2'},{'service':'ec2'},{'service':['S3','dynamodb','CloudFront']},{'region':'eu-west-1'},{'region':'GLOBAL'},
+           {'provider':'AWS','service':'EC2','region':'eu-west-1'},{'provider':'aws','service':['ec2','s3'],'region':['eu-west-1','US-EAST-1']},
+           {'provider':'Azure','service':'EC2'},{'provider':['AWS','Oracle Cloud'],'region':['us-ashburn-1','us-east-1']},
+           {'provider':'AWS','service':'EC2','region':None}]
+
+@pytest.mark.parametrize('filters',FILTERS)
+def test_rows_where(package_dir,filters):
+    iplookup = cloudiplookup.CloudIPLookup()
+    db = iplookup._db
+    rows = db.rows_where(**filters)
+    assert rows == brute_force(db,**filters)
+    assert iplookup.network_rows(**filters) == rows
+    assert list(iplookup.networks(**filters)) == [db.cidr(row) for row in rows]
+    ##──── The filters of a single provider, service or region must find networks, a mix of two providers and a service may not ───
+    if len(filters) == 1:
+        assert len(rows) > 0
+
+def test_case_insensitive_and_unknown_names(package_dir):
+    db = cloudiplookup.CloudIPLookup()._db
+    ec2 = db.rows_where(provider='AWS',service='EC2')
+    assert len(ec2) > 1000 and ec2 == sorted(ec2)
+    assert db.rows_where(provider='aWs',service=['eC2']) == db.rows_where(provider=['AWS','no such provider'],service='ec2') == ec2
+    assert all(db.indexServices[db.services[row]-1] == 'EC2' for row in ec2)
+    ##──── An unknown name finds nothing, also when another filter finds networks; an empty list is no value ────────────────────
+    for filters in ({'provider':'no such provider'},{'service':'EC3'},{'region':'mars-1'},{'provider':'AWS','region':'mars-1'},{'service':[]}):
+        assert db.rows_where(**filters) == []
+    assert db.rows_where() == db.rows_where(None,None,None) == list(range(len(db)))
+
+def test_cli_networks(package_dir,monkeypatch,capfd):
+    db = cloudiplookup.CloudIPLookup()._db
+    for argv, filters in ((['--networks','--provider','aws','--service','EC2, s3'],{'provider':['aws'],'service':['EC2','s3']}),
+                          (['-n','--provider','Azure','--region','westeurope'],{'provider':'Azure','region':'westeurope'}),
+                          (['-n','--service','no such service'],{'service':'no such service'})):
+        monkeypatch.setattr(sys,'argv',['cloudiplookup']+argv)
+        with pytest.raises(SystemExit) as exit:
+            main_function()
+        assert exit.value.code == 0
+        assert capfd.readouterr().out.splitlines() == [db.cidr(row) for row in brute_force(db,**filters)]
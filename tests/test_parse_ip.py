@@ -0,0 +1,39 @@
+# encoding: utf-8
+# -*- coding: utf-8 -*-
+"""parse_ip(): the IP addresses accepted and their keys, the ones rejected, checked against the ipaddress module"""
+import random, ipaddress, pytest
+import cloudiplookup.cloudiplookup as cloudiplookup
+
+ACCEPTED = [('52.94.7.24',0x345E0718),('0.0.0.0',0),('255.255.255.255',0xFFFFFFFF),
+            ('::',(0,0)),('::1',(0,1)),('2600:9000:21E8::',(0x2600900021E80000,0)),('2600:9000:21e8:0000::',(0x2600900021E80000,0)),
+            ('1:2:3:4:5:6:7:8',(0x0001000200030004,0x0005000600070008)),('1:2:3:4:5:6:1.2.3.4',(0x0001000200030004,0x0005000601020304)),
+            ('ffff:ffff:ffff:ffff:ffff:ffff:ffff:ffff',(0xFFFFFFFFFFFFFFFF,0xFFFFFFFFFFFFFFFF)),
+            ##──── The IPv4-mapped IPv6 addresses are the IPv4 address, the IPv4-compatible and IPv4-translated ones are not ──────────
+            ('::ffff:52.94.7.24',0x345E0718),('::FFFF:345e:718',0x345E0718),('::52.94.7.24',(0,0x345E0718)),('::ffff:0:52.94.7.24',(0,0xFFFF0000345E0718)),
+            ##──── Integers, packed bytes and ipaddress objects ──────────────────────────────────────────────────────────────────────
+            (0x345E0718,0x345E0718),(0,0),(0xFFFFFFFF,0xFFFFFFFF),(1 << 32,(0,1 << 32)),((1 << 128)-1,(0xFFFFFFFFFFFFFFFF,0xFFFFFFFFFFFFFFFF)),
+            ((0xFFFF << 32) | 0x345E0718,0x345E0718),(b'\x34\x5e\x07\x18',0x345E0718),(bytearray(16),(0,0)),(memoryview(b'\x34\x5e\x07\x18'),0x345E0718),
+            (ipaddress.ip_address('52.94.7.24'),0x345E0718),(ipaddress.ip_address('2600:9000:21e8::'),(0x2600900021E80000,0)),
+            (ipaddress.ip_address('::ffff:52.94.7.24'),0x345E0718)]
+
+REJECTED = ['','01.2.3.4','1.2.3','1.2.3.4.5','256.0.0.0','1.2.3.-4','0x1.2.3.4',' 1.2.3.4','1.2.3.4 ','1.2.3.4\n','１.2.3.4','52.94.7.24/32',
+            ':','2600::1::1','2600:0:0:0:0:0:0:0:1','2600:9000:21e8::g','fe80::1%eth0','[2600::1]','2600:9000::/28','not an ip',
+            -1,1 << 128,True,False,1.5,None,b'',b'\x01\x02\x03',bytes(17),['52.94.7.24'],ipaddress.ip_network('52.94.7.0/24')]
+
+@pytest.mark.parametrize('ipaddr,key',ACCEPTED,ids=repr)
+def test_accepted(ipaddr,key):
+    assert cloudiplookup.parse_ip(ipaddr) == key
+    assert cloudiplookup.parse_ip(cloudiplookup.key_to_ip(key)) == key
+
+@pytest.mark.parametrize('ipaddr',REJECTED,ids=repr)
+def test_rejected(ipaddr):
+    assert cloudiplookup.parse_ip(ipaddr) is None
+
+def test_same_as_ipaddress():
+    rng = random.Random(14)
+    for _ in range(5000):
+        address = ipaddress.ip_address(rng.getrandbits(32)) if rng.random() < 0.5 else ipaddress.ip_address(rng.getrandbits(128))
+        mapped = getattr(address,'ipv4_mapped',None)
+        key = int(mapped) if mapped is not None else int(address) if address.version == 4 else (int(address) >> 64,int(address) & 0xFFFFFFFFFFFFFFFF)
+        for ipaddr in (str(address),address.exploded,address.exploded.upper(),address.packed,address):
+            assert cloudiplookup.parse_ip(ipaddr) == key, ipaddr
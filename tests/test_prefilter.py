@@ -0,0 +1,66 @@
+# encoding: utf-8
+# -*- coding: utf-8 -*-
+"""Negative prefilter: the same rows as without it, the counters of stats=True and a snapshot without mutable state"""
+import random, pytest
+import cloudiplookup.cloudiplookup as cloudiplookup
+
+def edge_addresses(db)->list:
+    """The first and last IP addresses of each network and of each prefix of the prefilter, and their neighbours"""
+    ips = []
+    for row in range(len(db)):
+        first, last = network_range(db,row)
+        ips.extend((first-1,first,last,last+1))
+    ipv4Shift = 32-db.prefilterIPv4Bits
+    bitmap = bytes(db.prefilterIPv4)
+    for prefix in range(len(bitmap)*8):
+        if bitmap[prefix >> 3] & (1 << (prefix & 7)):
+            ips.extend(((prefix << ipv4Shift)-1,prefix << ipv4Shift,((prefix+1) << ipv4Shift)-1,(prefix+1) << ipv4Shift))
+    ipv6Shift = 128-db.prefilterIPv6Bits
+    for prefix in db.prefilterIPv6:
+        ips.extend(((prefix << ipv6Shift)-1,prefix << ipv6Shift,((prefix+1) << ipv6Shift)-1,(prefix+1) << ipv6Shift))
+    return [key_to_text(ip) for ip in ips if 0 <= ip < (1 << 128)]
+
+def network_range(db,row:int)->tuple:
+    if row < db.totalIPv4:
+        return db.ipv4FirstIP[row], db.ipv4LastIP[row]
+    pos = row-db.totalIPv4
+    return (db.ipv6FirstHi[pos] << 64) | db.ipv6FirstLo[pos], (db.ipv6LastHi[pos] << 64) | db.ipv6LastLo[pos]
+
+def key_to_text(ip:int)->str:
+    return cloudiplookup.int_to_ipv4(ip) if ip <= 0xFFFFFFFF else cloudiplookup.int_to_ipv6(ip)
+
+def random_addresses(db,count:int,seed:int)->list:
+    rng = random.Random(seed)
+    prefixes = sorted(db.prefilterIPv6)
+    ips = [cloudiplookup.int_to_ipv4(rng.getrandbits(32)) for _ in range(count)]
+    ips += [cloudiplookup.int_to_ipv6((1 << 32) | rng.getrandbits(128)) for _ in range(count)]
+    ##──── IPv6 addresses inside the prefixes of the prefilter, most of them in no network ──────────────────────────────────────────
+    ips += [cloudiplookup.int_to_ipv6((rng.choice(prefixes) << 96) | rng.getrandbits(96)) for _ in range(count)]
+    return ips
+
+@pytest.mark.parametrize('engine',['bisect','trie'])
+def test_same_rows_with_and_without_prefilter(package_dir,engine):
+    withPrefilter = cloudiplookup.CloudIPLookup(prefilter=True,engine=engine)
+    withoutPrefilter = cloudiplookup.CloudIPLookup(prefilter=False,engine=engine)
+    db = withPrefilter._db
+    assert db.prefilter == True and withoutPrefilter._db.prefilter == False
+    ips = edge_addresses(db)+random_addresses(db,20000,20)
+    rows = list(map(withPrefilter.lookup_code,ips))
+    assert rows == list(map(withoutPrefilter.lookup_code,ips))
+    assert [withPrefilter.lookup(ip).to_dict()['cidr'] for ip in ips[:5000]] == [withoutPrefilter.lookup(ip).to_dict()['cidr'] for ip in ips[:5000]]
+    ##──── The test finds networks, misses rejected by the prefilter and misses that passed it ───────────────────────────────────
+    rejected = sum(1 for ip in ips if not db.prefilter_passes(cloudiplookup.parse_ip(ip)))
+    assert min(sum(1 for row in rows if row >= 0),rejected,sum(1 for row in rows if row < 0)-rejected) > 100
+
+def test_counters_of_stats(package_dir):
+    iplookup = cloudiplookup.CloudIPLookup(stats=True)
+    assert not hasattr(iplookup._db,'prefilterCounters')
+    for ip in ('3.2.35.70','8.8.8.8','1.1.1.1','200.200.200.200','3.2.200.1','2600:9000:2000::1','2001:db8::1','not an ip'):
+        iplookup.lookup(ip)
+    info = iplookup.prefilter_info()
+    assert (info['rejected'],info['passed'],info['passed_missed']) == (3,4,1)
+    assert info['rejected']+info['passed_missed'] == iplookup.stats_info()['misses']
+    ##──── The counters are the ones of the CloudIPLookup, not of the snapshot: a reload keeps them ────────────────────────────────
+    iplookup.reload()
+    assert iplookup.prefilter_info()['rejected'] == 3
+    assert 'rejected' not in cloudiplookup.CloudIPLookup().prefilter_info()
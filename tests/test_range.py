@@ -0,0 +1,101 @@
+# encoding: utf-8
+# -*- coding: utf-8 -*-
+"""Range queries: rows_in_range() and lookup_range() return the networks that overlap a range, checked by brute force"""
+import random, ipaddress, pytest
+import cloudiplookup.cloudiplookup as cloudiplookup
+
+def network_ranges(db)->list:
+    """(first, last, ipv6) of each row of the database"""
+    ranges = [(db.ipv4FirstIP[row],db.ipv4LastIP[row],False) for row in range(db.totalIPv4)]
+    ranges += [((db.ipv6FirstHi[pos] << 64) | db.ipv6FirstLo[pos],(db.ipv6LastHi[pos] << 64) | db.ipv6LastLo[pos],True) for pos in range(len(db)-db.totalIPv4)]
+    return ranges
+
+def overlapping(ranges:list,first:int,last:int,ipv6:bool)->list:
+    ##──── The rows are sorted by first IP (bigger networks first): the overlapping rows in row order are sorted by first IP ─────────
+    return [row for row,(start,end,family) in enumerate(ranges) if start <= last and end >= first and family == ipv6]
+
+def queries(db,ranges:list,seed:int)->list:
+    """(first, last, ipv6) of CIDRs of every length around the networks, networks themselves, single addresses and random ranges"""
+    rng, result = random.Random(seed), []
+    for row in rng.sample(range(len(db)),40):
+        start, end, ipv6 = ranges[row]
+        bits = 128 if ipv6 else 32
+        address = rng.randint(start,end)
+        for length in (0,1,8,12,16,20,24,28,32,40,48,56,64,96,120,128):
+            if length <= bits:
+                hostmask = (1 << (bits-length))-1
+                result.append((address & ~hostmask,address | hostmask,ipv6))
+        result.extend(((start,end,ipv6),(address,address,ipv6),(start-1,start-1,ipv6),(end+1,end+1,ipv6),(start+1,end+rng.randrange(1 << 20),ipv6)))
+    for _ in range(100):
+        first = rng.getrandbits(32)
+        result.append((first,min(first+rng.getrandbits(rng.randrange(1,28)),0xFFFFFFFF),False))
+        first = (0x2 << 124) | rng.getrandbits(124)
+        result.append((first,first+rng.getrandbits(rng.randrange(1,100)),True))
+    return [(first,last,ipv6) for first,last,ipv6 in result if 0 <= first <= last < (1 << (128 if ipv6 else 32))]
+
+def test_rows_in_range(package_dir):
+    db = cloudiplookup.CloudIPLookup()._db
+    ranges = network_ranges(db)
+    found = 0
+    for first,last,ipv6 in queries(db,ranges,15):
+        rows = list(db.rows_in_range(first,last,ipv6))
+        assert rows == overlapping(ranges,first,last,ipv6), (first,last,ipv6)
+        found += len(rows)
+    assert found > 1000
+
+@pytest.fixture
+def fixture_lookup(feed_server,data_dir):
+    """A CloudIPLookup of the fixture feeds: 52.94.0.0/16 contains 52.94.7.0/24, 3.2.35.64/26 has two services..."""
+    assert cloudiplookup.update_ip_ranges(use_cache=False) == 0
+    return cloudiplookup.CloudIPLookup()
+
+def cidrs(result)->list:
+    return [(detail.cidr,detail.service) for detail in result]
+
+def test_containing_networks(fixture_lookup):
+    ##──── The networks that contain the range come first, the biggest first, then the ones that start inside it ──────────────────
+    assert cidrs(fixture_lookup.lookup_range('52.94.7.24')) == [('52.94.0.0/16','AMAZON'),('52.94.7.0/24','DYNAMODB')]
+    assert cidrs(fixture_lookup.lookup_range('52.94.0.0/16')) == [('52.94.0.0/16','AMAZON'),('52.94.7.0/24','DYNAMODB')]
+    assert cidrs(fixture_lookup.lookup_range('52.94.7.0/25')) == [('52.94.0.0/16','AMAZON'),('52.94.7.0/24','DYNAMODB')]
+    assert cidrs(fixture_lookup.lookup_range('52.94.8.0/24')) == [('52.94.0.0/16','AMAZON')]
+    assert cidrs(fixture_lookup.lookup_range('52.0.0.0/8')) == [('52.94.0.0/16','AMAZON'),('52.94.7.0/24','DYNAMODB')]
+    ##──── The same CIDR of two services is two networks ──────────────────────────────────────────────────────────────────────────
+    assert cidrs(fixture_lookup.lookup_range('3.2.35.100')) == [('3.2.35.64/26','AMAZON'),('3.2.35.64/26','EC2')]
+    assert [detail.cidr for detail in fixture_lookup.lookup_range('2600:9000:2fff::1')] == ['2600:9000::/28','2600:9000:2000::/36']
+    assert [detail.cidr for detail in fixture_lookup.lookup_range('2600:9000:3000::/36')] == ['2600:9000::/28']
+
+def test_overlap_at_the_edges(fixture_lookup):
+    ##──── A range overlaps a network when it has at least one of its addresses: the last one or the first one is enough ──────────
+    assert cidrs(fixture_lookup.lookup_range('52.93.255.255','52.94.0.0')) == [('52.94.0.0/16','AMAZON')]
+    assert cidrs(fixture_lookup.lookup_range('52.94.255.255','52.95.0.0')) == [('52.94.0.0/16','AMAZON')]
+    assert cidrs(fixture_lookup.lookup_range('52.94.6.255','52.94.7.0')) == [('52.94.0.0/16','AMAZON'),('52.94.7.0/24','DYNAMODB')]
+    assert cidrs(fixture_lookup.lookup_range('52.93.0.0','52.93.255.255')) == []
+    assert cidrs(fixture_lookup.lookup_range('52.95.0.0/16')) == []
+    assert [detail.cidr for detail in fixture_lookup.lookup_range('0.0.0.0/0')][:2] == ['3.2.35.64/26','3.2.35.64/26']
+    assert cidrs(fixture_lookup.lookup_range('255.255.255.255')) == []
+
+def test_lookup_range_inputs(fixture_lookup):
+    expected = cidrs(fixture_lookup.lookup_range('52.94.0.0/16'))
+    assert cidrs(fixture_lookup.lookup_range(ipaddress.ip_network('52.94.0.0/16'))) == expected
+    assert cidrs(fixture_lookup.lookup_range('52.94.0.0','52.94.255.255')) == expected
+    assert cidrs(fixture_lookup.lookup_range(ipaddress.ip_address('52.94.0.0'),ipaddress.ip_address('52.94.255.255'))) == expected
+    ##──── The host bits of a CIDR are ignored and an IPv4-mapped IPv6 CIDR is the IPv4 range ─────────────────────────────────────
+    assert cidrs(fixture_lookup.lookup_range('52.94.3.4/16')) == expected
+    assert cidrs(fixture_lookup.lookup_range('::ffff:52.94.0.0/112')) == expected
+    result = fixture_lookup.lookup_range('52.94.0.0','52.94.255.255')
+    assert result.query == '52.94.0.0-52.94.255.255' and next(result).ip == result.query
+    for invalid in (('52.94.0.0/33',),('52.94.0.0/x',),('not an ip/8',),('52.94.0.1','52.94.0.0'),('52.94.0.0','2600::'),('2600::/129',),('',)):
+        with pytest.raises(ValueError):
+            fixture_lookup.lookup_range(*invalid)
+
+def test_totals(fixture_lookup):
+    details = list(fixture_lookup.lookup_range('0.0.0.0/0'))
+    result = fixture_lookup.lookup_range('0.0.0.0/0')
+    for _ in range(3):
+        next(result)
+    assert result.networks == 3
+    totals = result.totals()
+    assert totals['networks'] == len(details) == sum(totals['providers'].values())
+    assert totals['providers']['AWS'] == sum(totals['services']['AWS'].values()) == sum(1 for detail in details if detail.cloud_provider == 'AWS')
+    assert totals['services']['AWS']['AMAZON'] == 2
+    assert repr(result).startswith("<CloudIPRangeResult of 0.0.0.0/0 ")
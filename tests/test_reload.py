@@ -0,0 +1,142 @@
+# encoding: utf-8
+# -*- coding: utf-8 -*-
+"""Snapshots: lookups running while reload() or the watcher swaps the database, the cache and the dicts of a snapshot"""
+import time, threading, concurrent.futures, pytest
+import cloudiplookup.cloudiplookup as cloudiplookup
+
+IPS = ('52.94.7.24','52.94.8.1','3.2.35.70','2600:9000:3000::1','8.8.8.8','1.1.1.1')
+
+def answers(iplookup)->tuple:
+    return tuple((result.cidr,result.cloud_provider,result.service) for result in map(iplookup.lookup,IPS))
+
+class LookupThreads(object):
+    """Threads that look up IPS over and over until stopped. Each answer must be the one of the old or of the new
+    database, and each lookup_many() the rows of one of them (a single snapshot)"""
+    def __init__(self, iplookup, old, new, count=4):
+        self.iplookup, self.stopEvent = iplookup, threading.Event()
+        self.old, self.new = old, new
+        self.seen, self.wrong = set(), []
+        self.threads = [threading.Thread(target=self.run,daemon=True) for _ in range(count)]
+    def run(self):
+        while not self.stopEvent.is_set():
+            for pos,answer in enumerate(answers(self.iplookup)):
+                if answer == self.old['answers'][pos] == self.new['answers'][pos]:
+                    continue
+                if answer not in (self.old['answers'][pos],self.new['answers'][pos]):
+                    self.wrong.append((IPS[pos],answer))
+                self.seen.add('old' if answer == self.old['answers'][pos] else 'new')
+            rows = self.iplookup.lookup_many(IPS).rows.tolist()
+            if rows not in (self.old['rows'],self.new['rows']):
+                self.wrong.append(('lookup_many',rows))
+    def __enter__(self):
+        for thread in self.threads:
+            thread.start()
+        return self
+    def __exit__(self, *args):
+        self.stopEvent.set()
+        for thread in self.threads:
+            thread.join()
+
+def expected(**options)->dict:
+    iplookup = cloudiplookup.CloudIPLookup(**options)
+    return {'answers':answers(iplookup),'rows':iplookup.lookup_many(IPS).rows.tolist()}
+
+def wait_for(condition,timeout=10.0)->bool:
+    deadline = time.monotonic()+timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+@pytest.mark.parametrize('use_mmap',[False,True])
+def test_lookups_during_reload(updated,restore,use_mmap):
+    data_dir, old_dir, new_dir = updated
+    new = expected(use_mmap=use_mmap)
+    restore(old_dir)
+    old = expected(use_mmap=use_mmap)
+    assert old['answers'] != new['answers'] and old['rows'] != new['rows']
+    iplookup = cloudiplookup.CloudIPLookup(use_mmap=use_mmap)
+    with LookupThreads(iplookup,old,new) as threads:
+        for _ in range(10):
+            for directory in (new_dir,old_dir):
+                restore(directory)
+                assert iplookup.reload() == True
+                time.sleep(0.005)
+    assert threads.wrong == []
+    assert threads.seen == {'old','new'}
+    assert answers(iplookup) == old['answers']
+
+@pytest.mark.parametrize('use_mmap',[False,True])
+def test_lookups_during_watcher_swap(updated,restore,use_mmap):
+    data_dir, old_dir, new_dir = updated
+    new = expected(use_mmap=use_mmap)
+    restore(old_dir)
+    old = expected(use_mmap=use_mmap)
+    iplookup = cloudiplookup.CloudIPLookup(use_mmap=use_mmap,watch_interval=0.02)
+    try:
+        with LookupThreads(iplookup,old,new) as threads:
+            ##──── The new files (a delta for the dat.gz) and the old ones again (not the files of the delta: loaded) ─────────────────
+            for directory, answer in ((new_dir,new),(old_dir,old),(new_dir,new)):
+                restore(directory)
+                assert wait_for(lambda: answers(iplookup) == answer['answers'])
+        assert threads.wrong == []
+    finally:
+        iplookup.stop_watcher()
+
+def test_cache_cleared_on_reload(updated,restore):
+    data_dir, old_dir, new_dir = updated
+    new = expected()
+    restore(old_dir)
+    old = expected()
+    iplookup = cloudiplookup.CloudIPLookup(cache_size=10)
+    assert answers(iplookup) == answers(iplookup) == old['answers']
+    assert iplookup.cache_info()['hits'] == len(IPS)
+    restore(new_dir)
+    iplookup.reload()
+    assert iplookup.cache_info()['size'] == 0
+    assert answers(iplookup) == new['answers']
+    ##──── An entry created with the previous snapshot, ex: by a lookup that was running during the swap, is ignored ────────────────
+    oldSnapshot = cloudiplookup.CloudIPLookup(cache_size=10)._db
+    restore(old_dir)
+    iplookup.reload()
+    assert answers(iplookup) == old['answers']
+    key = cloudiplookup.parse_ip('52.94.8.1')
+    iplookup._cache.put(key,(oldSnapshot,0,'0.0.0.0/0','','stale',''))
+    assert iplookup.lookup('52.94.8.1').cloud_provider != 'stale'
+
+def test_cache_cleared_by_the_watcher(updated,restore):
+    data_dir, old_dir, new_dir = updated
+    new = expected()
+    restore(old_dir)
+    iplookup = cloudiplookup.CloudIPLookup(cache_size=10,watch_interval=0.02)
+    try:
+        answers(iplookup)
+        restore(new_dir)
+        assert wait_for(lambda: iplookup._db.fingerprint == cloudiplookup.CloudIPLookup()._db.fingerprint)
+        assert answers(iplookup) == new['answers']
+    finally:
+        iplookup.stop_watcher()
+
+def test_snapshot_keeps_its_own_dicts(package_dir,monkeypatch):
+    db = cloudiplookup.CloudIPLookup()._db
+    columns = {name:column for name,column in db.columns.items() if not name.startswith(('ix.','pf.'))}
+    strings = {name:value for name,value in db.strings.items() if name != 'fingerprint'}
+    columnNames, stringNames = set(columns), set(strings)
+    ##──── The derived columns of an older file are added to the dicts of the snapshot, not to the ones given ───────────────────────
+    snapshot = cloudiplookup.CloudIPDatabase(columns,strings)
+    assert 'ix.provider.off' in snapshot.columns and 'pf.ipv4' in snapshot.columns
+    assert (set(columns),set(strings)) == (columnNames,stringNames)
+    with pytest.raises(AttributeError):
+        snapshot.columns = {}
+    ##──── The fingerprint of a file without it is computed once, also when many threads ask for it at the same time ────────────────
+    calls = []
+    def slow_fingerprint(columns,strings):
+        calls.append(1)
+        time.sleep(0.05)
+        return 'f'*40
+    monkeypatch.setattr(cloudiplookup,'_columns_fingerprint',slow_fingerprint)
+    with concurrent.futures.ThreadPoolExecutor(8) as executor:
+        assert list(executor.map(lambda _: snapshot.fingerprint,range(8))) == ['f'*40]*8
+    assert calls == [1]
+    assert 'fingerprint' not in strings
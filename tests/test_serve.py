@@ -0,0 +1,92 @@
+# encoding: utf-8
+# -*- coding: utf-8 -*-
+"""HTTP service: the size of the request bodies is checked before they are read"""
+import json, time, socket, asyncio, threading, ipaddress, concurrent.futures
+import cloudiplookup.cloudiplookup as cloudiplookup
+
+def exchange(requests:list,**options)->list:
+    """Sends the raw *requests* on one connection to a new CloudIPLookupServer, returns the raw responses until the
+    server closes the connection"""
+    async def run():
+        server = cloudiplookup.CloudIPLookupServer(cloudiplookup.CloudIPLookup(),port=0,**options)
+        await server.start()
+        reader, writer = await asyncio.open_connection(server.host,server.port)
+        for request in requests:
+            writer.write(request)
+        await writer.drain()
+        response = await asyncio.wait_for(reader.read(),timeout=5)
+        writer.close()
+        server._server.close()
+        return response.decode('utf-8')
+    return asyncio.run(run())
+
+def post(body:bytes,headers="")->bytes:
+    return (f"POST /lookup HTTP/1.1\r\nHost: localhost\r\n{headers}Content-Length: {len(body)}\r\n\r\n").encode()+body
+
+def test_batch_and_keep_alive(package_dir):
+    response = exchange([post(b'["52.94.7.24","8.8.8.8"]'),b"GET /lookup/8.8.8.8 HTTP/1.1\r\nConnection: close\r\n\r\n"])
+    first, second = response.split("HTTP/1.1 ")[1:]
+    assert first.startswith("200 ") and second.startswith("200 ")
+    assert [result['cloud_provider'] for result in json.loads(first.split("\r\n\r\n",1)[1])] == ['AWS','Google']
+
+def test_body_too_large(package_dir):
+    ##──── Only the headers are sent: the 413 comes before the body is read and the connection is closed ─────────────────────────
+    response = exchange([b"POST /lookup HTTP/1.1\r\nContent-Length: 10000000000\r\n\r\n"])
+    assert response.startswith("HTTP/1.1 413 ")
+    assert "Connection: close" in response
+    assert exchange([post(b'["52.94.7.24","8.8.8.8"]')],max_body=10).startswith("HTTP/1.1 413 ")
+
+def test_default_max_body(package_dir):
+    server = cloudiplookup.CloudIPLookupServer(cloudiplookup.CloudIPLookup(),max_batch=1000)
+    assert server.max_body == 1000*cloudiplookup.SERVE_BODY_BYTES_PER_IP
+
+def test_chunked_body_rejected(package_dir):
+    chunked = (b"POST /lookup HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n"
+               b"e\r\n[\"52.94.7.24\"]\r\n0\r\n\r\n"
+               b"GET /lookup/8.8.8.8 HTTP/1.1\r\n\r\n")
+    response = exchange([chunked])
+    assert response.startswith("HTTP/1.1 411 ")
+    assert response.count("HTTP/1.1 ") == 1
+
+def test_invalid_content_length(package_dir):
+    assert exchange([b"POST /lookup HTTP/1.1\r\nContent-Length: -1\r\n\r\n"]).startswith("HTTP/1.1 400 ")
+
+def test_too_many_ips(package_dir):
+    body = json.dumps(["8.8.8.8"]*11).encode()
+    response = exchange([post(body,"Connection: close\r\n")],max_batch=10)
+    assert response.startswith("HTTP/1.1 413 ")
+
+def request(server,data:bytes)->str:
+    """Sends *data* on a new connection and returns the response, until the server closes the connection"""
+    with socket.create_connection((server.host,server.port),timeout=30) as client:
+        client.sendall(data)
+        return b"".join(iter(lambda: client.recv(1 << 16),b"")).decode('utf-8')
+
+def test_get_answered_during_a_batch(package_dir):
+    """A batch of max_batch IP addresses runs in a thread: a GET sent while it is looked up is answered before it ends"""
+    iplookup, times = cloudiplookup.CloudIPLookup(), {}
+    started, lookup_many = threading.Event(), iplookup.lookup_many
+    def lookup_many_timed(*args,**kwargs):
+        started.set()
+        result = lookup_many(*args,**kwargs)
+        times['batch'] = time.perf_counter()
+        return result
+    iplookup.lookup_many = lookup_many_timed
+    ##──── The server runs in its own event loop and thread, like a service, the clients are plain sockets ──────────────────────────
+    loop = asyncio.new_event_loop()
+    server = cloudiplookup.CloudIPLookupServer(iplookup,port=0)
+    loop.run_until_complete(server.start())
+    threading.Thread(target=loop.run_forever,daemon=True).start()
+    try:
+        ips = [str(ipaddress.IPv4Address(0x34000000+i*97)) for i in range(cloudiplookup.SERVE_MAX_BATCH)]
+        with concurrent.futures.ThreadPoolExecutor(1) as executor:
+            batch = executor.submit(request,server,post(json.dumps(ips).encode(),"Connection: close\r\n"))
+            assert started.wait(10)
+            single = request(server,b"GET /lookup/8.8.8.8 HTTP/1.1\r\nConnection: close\r\n\r\n")
+            times['single'] = time.perf_counter()
+            results = json.loads(batch.result().split("\r\n\r\n",1)[1])
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+    assert json.loads(single.split("\r\n\r\n",1)[1])['cloud_provider'] == 'Google'
+    assert times['single'] < times['batch']
+    assert len(results) == cloudiplookup.SERVE_MAX_BATCH and results[-1]['ip'] == ips[-1]
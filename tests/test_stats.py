@@ -0,0 +1,62 @@
+# encoding: utf-8
+# -*- coding: utf-8 -*-
+"""Lookup counters of stats=True: stats_info() and its Prometheus text exposition format"""
+import re, pytest
+import cloudiplookup.cloudiplookup as cloudiplookup
+
+SAMPLE = re.compile(r'^(?P<name>[a-z_]+)(?:\{(?P<labels>(?:[a-z_]+="(?:[^"\\\n]|\\[\\"n])*",?)*)\})? (?P<value>\S+)$')
+LABEL = re.compile(r'([a-z_]+)="((?:[^"\\]|\\.)*)"')
+UNESCAPE = re.compile(r'\\(.)').sub
+
+def parse_prometheus(text:str)->tuple:
+    """The samples {(name, ((label, value), ...)): value} and the types {metric: type}, checking that each metric has its
+    HELP and TYPE lines before its samples"""
+    samples, types = {}, {}
+    assert text.endswith("\n") and "\n\n" not in text
+    for line in text.splitlines():
+        if line.startswith("# HELP "):
+            name = line.split()[2]
+        elif line.startswith("# TYPE "):
+            assert line.split()[2] == name and name not in types
+            types[name] = line.split()[3]
+        else:
+            match = SAMPLE.match(line)
+            assert match is not None, line
+            family = re.sub(r'_(bucket|sum|count)$','',match['name']) if match['name'] not in types else match['name']
+            assert family in types, line
+            labels = tuple((key,UNESCAPE(lambda escaped: "\n" if escaped[1] == "n" else escaped[1],value)) for key,value in LABEL.findall(match['labels'] or ''))
+            samples[(match['name'],labels)] = float(match['value'])
+    return samples, types
+
+def test_prometheus_output(package_dir):
+    iplookup = cloudiplookup.CloudIPLookup(stats=True)
+    assert cloudiplookup.CloudIPLookup().stats_prometheus() == "" and cloudiplookup.CloudIPLookup().stats_info() == {}
+    for ip in ('52.94.7.24','52.94.7.25','3.5.140.1','200.200.200.200','1.1.1.1','not an ip'):
+        iplookup.lookup(ip)
+    ##──── Results with a known latency and a service with the characters escaped in the labels ─────────────────────────────────
+    stats = iplookup._stats
+    stats.record(cloudiplookup.CloudIPDetail('1.2.3.4','1.2.3.0/24','r','Quoted "Cloud"','back\\slash\nnew line',elapsed_time=stats.buckets[0]))
+    stats.record(cloudiplookup.CloudIPDetail('1.2.3.4',cloud_provider='<internal lookup error>',elapsed_time=10.0))
+    samples, types = parse_prometheus(iplookup.stats_prometheus())
+    info = iplookup.stats_info()
+    assert types == {'cloudiplookup_lookups_total':'counter','cloudiplookup_hits_total':'counter','cloudiplookup_prefilter_misses_total':'counter',
+                     'cloudiplookup_lookup_duration_seconds':'histogram','cloudiplookup_networks':'gauge','cloudiplookup_memory_bytes':'gauge'}
+    assert {result:samples[('cloudiplookup_lookups_total',(('result',result),))] for result in ('hit','miss','invalid','error')} == \
+           {'hit':4,'miss':2,'invalid':1,'error':1} == {'hit':info['hits'],'miss':info['misses'],'invalid':info['invalid'],'error':info['errors']}
+    hits = {labels:value for (name,labels),value in samples.items() if name == 'cloudiplookup_hits_total'}
+    assert hits == {(('provider','AWS'),('service','DYNAMODB')):2,(('provider','AWS'),('service','EC2')):1,
+                    (('provider','Quoted "Cloud"'),('service','back\\slash\nnew line')):1}
+    assert samples[('cloudiplookup_prefilter_misses_total',(('prefilter','rejected'),))]+samples[('cloudiplookup_prefilter_misses_total',(('prefilter','passed'),))] == 2
+    ##──── The histogram is cumulative, a latency equal to a bound is in its bucket, +Inf is the count ───────────────────────────
+    buckets = [(labels[0][1],value) for (name,labels),value in samples.items() if name == 'cloudiplookup_lookup_duration_seconds_bucket']
+    assert [bound for bound,value in buckets] == [str(bound) for bound in cloudiplookup.STATS_LATENCY_BUCKETS]+['+Inf']
+    assert all(first <= second for (_,first),(_,second) in zip(buckets,buckets[1:]))
+    assert buckets[0][1] >= 1 and buckets[-1][1]-buckets[-2][1] >= 1 and buckets[-1][1] == samples[('cloudiplookup_lookup_duration_seconds_count',())] == 8
+    assert samples[('cloudiplookup_lookup_duration_seconds_sum',())] == pytest.approx(info['latency']['sum']) and info['latency']['sum'] > 10.0
+    assert samples[('cloudiplookup_networks',())] == len(iplookup._db)
+    assert {labels[0][1]:value for (name,labels),value in samples.items() if name == 'cloudiplookup_memory_bytes'} == info['memory']
+    ##──── stats_reset() sets the counters to zero ────────────────────────────────────────────────────────────────────────────────
+    iplookup.stats_reset()
+    samples, types = parse_prometheus(iplookup.stats_prometheus())
+    assert samples[('cloudiplookup_lookups_total',(('result','hit'),))] == 0 and samples[('cloudiplookup_lookup_duration_seconds_count',())] == 0
+    assert not any(name == 'cloudiplookup_hits_total' for name,labels in samples)
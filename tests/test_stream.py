@@ -0,0 +1,48 @@
+# encoding: utf-8
+# -*- coding: utf-8 -*-
+"""Streaming mode: lookup_stream() writes the answers of lookup() in jsonl, csv and tsv, in the order of the input"""
+import io, csv, json, random, pytest
+import cloudiplookup.cloudiplookup as cloudiplookup
+
+FIELDS = ('ip','cidr','region','cloud_provider','service')
+
+def input_lines(db,seed:int)->list:
+    """Lines of a file of IP addresses: networks of every provider, a service with a comma, misses, invalid and empty lines"""
+    rng = random.Random(seed)
+    rows = rng.sample(range(len(db)),300)+db.rows_where(service='OSN, OBJECT_STORAGE')[:3]
+    ips = [cloudiplookup.int_to_ipv4(db.ipv4FirstIP[row]) if row < db.totalIPv4 else db.cidr(row).split("/")[0] for row in rows]
+    ips += [cloudiplookup.int_to_ipv4(rng.getrandbits(32)) for _ in range(100)]+['not an ip','2600:9000::1::1','"quoted",ip']
+    rng.shuffle(ips)
+    return [ip+"\n" for ip in ips]+["\n","   \n","  52.94.7.24\t\n","8.8.8.8"]
+
+def expected(iplookup,lines:list)->list:
+    return [[iplookup.lookup(line.strip()).to_dict()[field] for field in FIELDS] for line in lines if line.strip()]
+
+def stream(iplookup,lines:list,output_format:str,**options)->str:
+    output = io.StringIO()
+    assert iplookup.lookup_stream(iter(lines),output,output_format,**options) == len([line for line in lines if line.strip()])
+    return output.getvalue()
+
+@pytest.mark.parametrize('output_format',['jsonl','csv','tsv'])
+def test_formats(package_dir,output_format):
+    iplookup = cloudiplookup.CloudIPLookup()
+    lines = input_lines(iplookup._db,10)
+    text = stream(iplookup,lines,output_format)
+    if output_format == 'jsonl':
+        records = [json.loads(line) for line in text.splitlines()]
+        assert all(list(record) == list(FIELDS) for record in records)
+        rows = [[record[field] for field in FIELDS] for record in records]
+    else:
+        rows = list(csv.reader(io.StringIO(text,newline=''),delimiter="\t" if output_format == 'tsv' else ","))
+        assert rows.pop(0) == list(FIELDS)
+    assert rows == expected(iplookup,lines)
+    assert any(row[4] == 'OSN, OBJECT_STORAGE' for row in rows)
+    ##──── The batches do not change the output, the header is optional ─────────────────────────────────────────────────────────
+    assert stream(iplookup,lines,output_format,batch_size=7) == text
+    assert stream(iplookup,lines,output_format,batch_size=1,header=False) == (text if output_format == 'jsonl' else text.split("\n",1)[1])
+
+def test_empty_input_and_invalid_format(package_dir):
+    iplookup = cloudiplookup.CloudIPLookup()
+    assert stream(iplookup,[],'jsonl') == "" and stream(iplookup,["\n"],'csv') == "ip,cidr,region,cloud_provider,service\n"
+    with pytest.raises(ValueError):
+        iplookup.lookup_stream(["8.8.8.8"],io.StringIO(),'xml')
@@ -0,0 +1,81 @@
+# encoding: utf-8
+# -*- coding: utf-8 -*-
+"""Multibit trie engine: the same rows as the binary search, with the default and other strides"""
+import random, pytest
+import cloudiplookup.cloudiplookup as cloudiplookup
+
+STRIDES = [(cloudiplookup.TRIE_STRIDES,cloudiplookup.TRIE_IPV6_STRIDES),((16,8,8),(16,8)),((6,6,6,6,8),(8,)),((12,),(12,12))]
+
+def network_edges(db)->list:
+    """The first and last IP address of each network and their neighbours, as integers (IPv6 above 32 bits)"""
+    keys = []
+    for row in range(len(db)):
+        if row < db.totalIPv4:
+            first, last = db.ipv4FirstIP[row], db.ipv4LastIP[row]
+        else:
+            pos = row-db.totalIPv4
+            first, last = (db.ipv6FirstHi[pos] << 64) | db.ipv6FirstLo[pos], (db.ipv6LastHi[pos] << 64) | db.ipv6LastLo[pos]
+        bits = 32 if row < db.totalIPv4 else 128
+        keys.extend(key for key in (first-1,first,first+1,last-1,last,last+1) if 0 <= key < (1 << bits))
+    return keys
+
+def find_all(db,keys:list,ipv6:bool)->list:
+    if ipv6:
+        return [db.find_ipv6(key >> 64,key & 0xFFFFFFFFFFFFFFFF) for key in keys]
+    return [db.find_ipv4(key) for key in keys if key <= 0xFFFFFFFF]
+
+@pytest.mark.parametrize('strides',STRIDES)
+def test_package_database(package_dir,strides):
+    trie = cloudiplookup.CloudIPLookup(engine='trie',trie_strides=strides[0],trie_ipv6_strides=strides[1],prefilter=False)
+    bisect = cloudiplookup.CloudIPLookup(prefilter=False)
+    assert trie._db.trieIPv4 is not None and (trie._db.trieIPv6 is not None) == (strides[1] is not None)
+    assert trie._db.trieIPv4.strides == strides[0]
+    rng = random.Random(19)
+    ipv4 = [key for key in network_edges(bisect._db) if key <= 0xFFFFFFFF]+[rng.getrandbits(32) for _ in range(20000)]
+    ipv6 = [key for key in network_edges(bisect._db) if key > 0xFFFFFFFF]+[(0x2 << 124) | rng.getrandbits(124) for _ in range(20000)]
+    ##──── Random IPv6 addresses inside the networks, where the trie does more than one level ────────────────────────────────────
+    ipv6 += [key | rng.getrandbits(64) for key in ipv6[:5000]]
+    assert find_all(trie._db,ipv4,False) == find_all(bisect._db,ipv4,False)
+    assert find_all(trie._db,ipv6,True) == find_all(bisect._db,ipv6,True)
+    ips = [cloudiplookup.int_to_ipv4(key) for key in ipv4[:3000]]+[cloudiplookup.int_to_ipv6(key) for key in ipv6[:3000]]
+    assert list(map(trie.lookup_code,ips)) == list(map(bisect.lookup_code,ips))
+
+def nested_database()->tuple:
+    """The columns and strings of networks nested up to 6 levels, siblings and single addresses, in both families"""
+    ipv4 = [('10.0.0.0',8),('10.1.0.0',16),('10.1.2.0',24),('10.1.2.128',25),('10.1.2.130',31),('10.1.2.131',32),('10.1.3.0',24),
+            ('10.255.255.255',32),('11.0.0.0',8),('192.168.0.0',16),('192.168.0.0',24),('192.168.255.0',24),('0.0.0.0',32),('255.255.255.255',32)]
+    ipv6 = [('2600::',12),('2600:1f00::',24),('2600:1f00:1::',48),('2600:1f00:1:2::',64),('2600:1f00:1:2::80',121),('2600:1f00:1:2::81',128),
+            ('2a05::',16),('2a05:d000::',25),('2a05:d07f:ffff:ffff::',64)]
+    networks = sorted([(cloudiplookup.ipv4_to_int(ip),netlength,4) for ip,netlength in ipv4]+[(cloudiplookup.ipv6_to_int(ip),netlength,6) for ip,netlength in ipv6],
+                      key=lambda network: (network[2],network[0],network[1]))
+    rows = range(1,len(networks)+1)
+    columns = cloudiplookup._build_columns([first for first,netlength,family in networks if family == 4],[first for first,netlength,family in networks if family == 6],
+                                           [netlength for first,netlength,family in networks],rows,rows,rows,[1]*len(networks))
+    strings = {'indexProvider':[str(row) for row in rows],'indexServices':[str(row) for row in rows],'indexRegions':[str(row) for row in rows],
+               'indexNetworkFeatures':[''],'databaseInfo':{}}
+    return columns, strings
+
+@pytest.mark.parametrize('strides',STRIDES+[((1,),(1,)),((24,8),(24,24,16))])
+def test_nested_networks(strides):
+    columns, strings = nested_database()
+    bisect = cloudiplookup.CloudIPDatabase(dict(columns),strings)
+    trie = cloudiplookup.CloudIPDatabase(dict(columns),strings,trie=strides)
+    rng, edges = random.Random(strides[0][0]), network_edges(bisect)
+    ipv4 = [key for key in edges if key <= 0xFFFFFFFF]+[(10 << 24) | rng.getrandbits(24) for _ in range(5000)]+[rng.getrandbits(32) for _ in range(5000)]
+    ipv6 = [key for key in edges if key > 0xFFFFFFFF]+[(0x2600 << 112) | rng.getrandbits(112) for _ in range(5000)]
+    ipv6 += [(0x26001f0000010002 << 64) | rng.getrandbits(8) for _ in range(500)]
+    rows = find_all(trie,ipv4,False)
+    assert rows == find_all(bisect,ipv4,False)
+    assert find_all(trie,ipv6,True) == find_all(bisect,ipv6,True)
+    ##──── The most specific network wins: 10.1.2.131/32 inside /31 inside /25 inside /24 inside /16 inside /8 ────────────────────
+    assert [bisect.cidr(trie.find_ipv4(cloudiplookup.ipv4_to_int(ip))) for ip in ('10.1.2.131','10.1.2.130','10.1.2.129','10.1.2.1','10.1.9.1','10.9.0.1')] == \
+           ['10.1.2.131/32','10.1.2.130/31','10.1.2.128/25','10.1.2.0/24','10.1.0.0/16','10.0.0.0/8']
+
+def test_invalid_strides(package_dir):
+    for strides in ((),(0,8),(25,7),(20,8,8)):
+        with pytest.raises(ValueError):
+            cloudiplookup.CloudIPLookup(engine='trie',trie_strides=strides)
+    with pytest.raises(ValueError):
+        cloudiplookup.CloudIPLookup(engine='trie',trie_ipv6_strides=(24,24,24))
+    with pytest.raises(ValueError):
+        cloudiplookup.CloudIPLookup(engine='radix')